@@ -0,0 +1 @@
+"""Banc de charge local des handlers HTTP contre un Cosmos DB simulé"""
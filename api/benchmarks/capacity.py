@@ -0,0 +1,312 @@
+"""
+Planificateur de capacité : coût en RU de chaque endpoint selon la taille des données.
+
+Pour chaque taille de jeu de données (votes et utilisateurs déjà en base),
+les handlers de `function_app` sont rejoués contre le Cosmos simulé du banc
+(`benchmarks.metered_cosmos`, coûts de `benchmarks.cost_model`) : appels, RU
+et latence par requête de chaque endpoint. Pour chaque mélange de trafic, le
+rapport projette ensuite les RU/s consommées au débit visé, la latence et le
+débit à provisionner. Un endpoint dont le coût croît avec les données est
+signalé : c'est une falaise à corriger avant un pic de trafic.
+
+Les lectures sont mesurées sans le cache de réponses du worker (pire cas :
+worker froid ou cache expiré) et sans instantanés.
+
+Usage (depuis le dossier api/) :
+    python -m benchmarks.capacity                               # 1k, 10k et 100k votes, mélanges prédéfinis
+    python -m benchmarks.capacity --sizes 1000 1000000 --rps 500
+    python -m benchmarks.capacity --mix getVotes=0.7,submitVote=0.3
+    python -m benchmarks.capacity --cost-model couts.json       # coûts unitaires relevés sur le compte
+"""
+
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import logging
+import math
+import sys
+import time
+import uuid
+
+from benchmarks import cost_model
+from benchmarks.metered_cosmos import Latency, MeteredCosmosClient
+from benchmarks.run import Recorder, make_sender
+from benchmarks.workloads import PASSWORD, _container, _seed_poll, _seed_users, provision
+from shared_code import auth_tokens, cosmos_pool, password_hashing, polls, rollups, votes
+from shared_code.cosmos_pool import ROLLUPS_CONTAINER, TALLIES_CONTAINER, VOTES_CONTAINER
+from shared_code.response_cache import votes_cache
+
+import function_app
+
+SIZES = (1_000, 10_000, 100_000)
+
+# Mélanges de trafic prédéfinis : endpoint → part des requêtes
+MIXES = {
+    "lecture": {"getVotes": 0.5, "getVoteStats": 0.35, "getVoteTimeseries": 0.1, "submitVote": 0.05},
+    "scrutin": {"submitVote": 0.4, "getVoteStats": 0.3, "getVotes": 0.2, "loginUser": 0.1},
+    "inscriptions": {"createUser": 0.4, "loginUser": 0.3, "submitVote": 0.2, "getVotes": 0.1},
+}
+
+# Élasticité du coût à la taille des données au-delà de laquelle un endpoint est signalé
+# (0,25 : 10 fois plus de données coûtent 1,8 fois plus de RU par requête)
+CLIFF_ELASTICITY = 0.25
+
+# Débit minimum d'un container provisionné et d'un maximum en autoscale (RU/s)
+MIN_PROVISIONED_RU = 400
+MIN_AUTOSCALE_RU = 1000
+
+# Compaction de l'historique avant la mesure : les votes synthétiques datent du 1er janvier 2025
+COMPACTION_TIME = datetime.datetime(2025, 1, 2)
+
+
+async def _get_votes(send, index, dataset):
+    await send(function_app.getVotes, 'GET', 'votes')
+
+
+async def _get_vote_stats(send, index, dataset):
+    await send(function_app.getVoteStats, 'GET', 'votes/stats')
+
+
+async def _get_vote_timeseries(send, index, dataset):
+    await send(function_app.getVoteTimeseries, 'GET', 'votes/timeseries',
+               params={"bucket": "hour", "since": "2025-01-01T00:00:00", "until": "2025-01-01T23:00:00"})
+
+
+async def _submit_vote(send, index, dataset):
+    user_id = dataset["voters"][index]
+    token = auth_tokens.issue({"id": user_id, "pseudo": user_id})
+    await send(function_app.submitVote, 'POST', 'vote', {"choice": "oui" if index % 3 else "non"},
+               headers={"Authorization": f"Bearer {token}"})
+
+
+async def _create_user(send, index, dataset):
+    email = f"{uuid.uuid4().hex}@example.com"
+    await send(function_app.createUser, 'POST', 'user', {"pseudo": email[:8], "email": email, "password": PASSWORD})
+
+
+async def _login_user(send, index, dataset):
+    await send(function_app.loginUser, 'POST', 'login',
+               {"email": f"user{index % dataset['size']}@example.com", "password": PASSWORD})
+
+
+# Endpoints mesurés, lectures d'abord (les écritures ajoutent des votes et des utilisateurs)
+ENDPOINTS = {
+    "getVotes": _get_votes,
+    "getVoteStats": _get_vote_stats,
+    "getVoteTimeseries": _get_vote_timeseries,
+    "submitVote": _submit_vote,
+    "createUser": _create_user,
+    "loginUser": _login_user,
+}
+
+
+async def seed(client, size, requests):
+    """Base en service : `size` votes (compteur et historique compacté à jour) et des votants pour la mesure"""
+    _seed_poll(client)
+    password_hash = await password_hashing.hasher.hash_password(PASSWORD)
+    user_ids = _seed_users(client, size + requests + 1, password_hash)
+
+    documents = [
+        votes.vote_document(
+            polls.DEFAULT_POLL_ID,
+            user_id,
+            "oui" if i % 3 else "non",
+            f"2025-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+            pseudo=f"user{i}"
+        )
+        for i, user_id in enumerate(user_ids[:size])
+    ]
+    _container(client, VOTES_CONTAINER).seed(*documents)
+
+    counts = {"oui": 0, "non": 0}
+    for document in documents:
+        counts[document["choice"]] += 1
+    _container(client, TALLIES_CONTAINER).seed({"id": polls.DEFAULT_POLL_ID, **counts, "total": size})
+
+    rollups_container = _container(client, ROLLUPS_CONTAINER)
+    rollups_container.seed(*(
+        rollups.rollup_document(polls.DEFAULT_POLL_ID, 'minute', start, minute_counts)
+        for start, minute_counts in rollups.count_by_minute(documents).items()
+    ))
+    await rollups.compact(rollups_container, polls.DEFAULT_POLL_ID, now=COMPACTION_TIME)
+
+    return {"size": size, "voters": user_ids[size:]}
+
+
+async def measure_size(size, requests=10, latency_ms=5.0, jitter=0.5, partitions=4, bcrypt_rounds=4, seed_value=0):
+    """Rapport (appels, RU, latences par requête) de chaque endpoint sur un jeu de `size` votes"""
+    client = MeteredCosmosClient(Latency(latency_ms, jitter, seed_value), partitions)
+    previous_pool, previous_hasher = cosmos_pool.pool, password_hashing.hasher
+    cosmos_pool.pool = cosmos_pool.CosmosPool(client_factory=lambda: client)
+    password_hashing.hasher = password_hashing.PasswordHasher(rounds=bcrypt_rounds)
+    votes_cache.invalidate()
+    polls.clear_cache()
+
+    try:
+        provision(client)
+        dataset = await seed(client, size, requests)
+        # Documents du jeu hors du ramasse-miettes : ses passages ne parcourent plus toute la base simulée
+        gc.collect()
+        gc.freeze()
+
+        reports = {}
+        for name, scenario in ENDPOINTS.items():
+            # Première requête non mesurée : sondage mémorisé et handles de containers résolus
+            votes_cache.invalidate()
+            await scenario(make_sender(Recorder()), requests, dataset)
+
+            recorder = Recorder()
+            send = make_sender(recorder)
+            start = time.perf_counter()
+            for index in range(requests):
+                votes_cache.invalidate()
+                await scenario(send, index, dataset)
+            reports[name] = recorder.report(time.perf_counter() - start)
+        return reports
+    finally:
+        gc.unfreeze()
+        cosmos_pool.pool, password_hashing.hasher = previous_pool, previous_hasher
+        votes_cache.invalidate()
+        polls.clear_cache()
+
+
+def elasticity(costs):
+    """Élasticité du coût à la taille des données entre la plus petite et la plus grande taille.
+
+    `costs` : taille → RU par requête. 0 : coût constant ; 1 : coût proportionnel aux données.
+    """
+    (small, small_cost), (large, large_cost) = min(costs.items()), max(costs.items())
+    if large == small or small_cost <= 0 or large_cost <= 0:
+        return 0.0
+    return math.log(large_cost / small_cost) / math.log(large / small)
+
+
+def scaling(results):
+    """Élasticité de chaque endpoint et endpoints signalés (coût croissant avec les données)"""
+    report = {}
+    for name in ENDPOINTS:
+        value = round(elasticity({size: reports[name]["ru_per_request"] for size, reports in results.items()}), 2)
+        report[name] = {"elasticity": value, "cliff": value >= CLIFF_ELASTICITY}
+    return report
+
+
+def parse_mix(value):
+    """Mélange `getVotes=0.7,submitVote=0.3` (parts normalisées à 1)"""
+    mix = {}
+    for entry in value.split(','):
+        name, _, share = entry.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint: {name}")
+        mix[name] = float(share)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Mix shares must add up to a positive value")
+    return {name: share / total for name, share in mix.items()}
+
+
+def project(reports, mix, rps, headroom=1.3):
+    """Projection d'un mélange de trafic à `rps` requêtes par seconde sur les mesures d'une taille"""
+    total = sum(mix.values())
+    shares = {name: share / total for name, share in mix.items()}
+    ru_per_request = sum(share * reports[name]["ru_per_request"] for name, share in shares.items())
+    ru_per_second = ru_per_request * rps
+    needed = ru_per_second * headroom
+    return {
+        "ru_per_request": round(ru_per_request, 2),
+        "ru_per_second": round(ru_per_second, 1),
+        "provisioned_ru": max(MIN_PROVISIONED_RU, math.ceil(needed / 100) * 100),
+        "autoscale_max_ru": max(MIN_AUTOSCALE_RU, math.ceil(needed / 1000) * 1000),
+        "p50_ms": round(sum(share * reports[name]["p50_ms"] for name, share in shares.items()), 2),
+        "p95_ms": max(reports[name]["p95_ms"] for name in shares),
+    }
+
+
+def plan(results, mixes, rps, headroom=1.3):
+    """Projection de chaque mélange pour chaque taille mesurée"""
+    return {
+        mix_name: {size: project(reports, mix, rps, headroom) for size, reports in results.items()}
+        for mix_name, mix in mixes.items()
+    }
+
+
+def format_report(results, scaling_report, projections, rps):
+    """Tableaux texte : coût par endpoint et taille, puis projection de chaque mélange"""
+    lines = [f"{'endpoint':<18} {'votes':>9} {'appels/req':>10} {'RU/req':>8} {'p50 ms':>8} {'p95 ms':>8}"]
+    for name in ENDPOINTS:
+        for size, reports in results.items():
+            report = reports[name]
+            lines.append(
+                f"{name:<18} {size:>9} {report['cosmos_calls_per_request']:>10} {report['ru_per_request']:>8} "
+                f"{report['p50_ms']:>8} {report['p95_ms']:>8}"
+            )
+        marker = "  <- coût croissant avec les données" if scaling_report[name]["cliff"] else ""
+        lines.append(f"{'':<18} élasticité {scaling_report[name]['elasticity']}{marker}")
+
+    lines.append("")
+    lines.append(f"{'mélange':<14} {'votes':>9} {'RU/req':>8} {f'RU/s @{rps}':>12} {'provisionné':>12} "
+                 f"{'autoscale':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for mix_name, by_size in projections.items():
+        for size, projection in by_size.items():
+            lines.append(
+                f"{mix_name:<14} {size:>9} {projection['ru_per_request']:>8} {projection['ru_per_second']:>12} "
+                f"{projection['provisioned_ru']:>12} {projection['autoscale_max_ru']:>10} "
+                f"{projection['p50_ms']:>8} {projection['p95_ms']:>8}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Planificateur de capacité Cosmos DB")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="votes en base")
+    parser.add_argument('--mix', action='append', default=None,
+                        help="mélange prédéfini (%s) ou `endpoint=part,...` ; répétable" % ', '.join(MIXES))
+    parser.add_argument('--rps', type=float, default=100, help="requêtes par seconde visées")
+    parser.add_argument('--headroom', type=float, default=1.3, help="marge appliquée au débit à provisionner")
+    parser.add_argument('--requests', type=int, default=10, help="requêtes mesurées par endpoint et par taille")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="latence moyenne d'un aller-retour Cosmos")
+    parser.add_argument('--jitter', type=float, default=0.5, help="gigue relative de la latence (0 à 1)")
+    parser.add_argument('--partitions', type=int, default=4, help="partitions physiques simulées")
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help="coût bcrypt pendant la mesure")
+    parser.add_argument('--cost-model', metavar='PATH', help="coûts unitaires en JSON (`{\"CREATE_RU\": 6.2}`)")
+    parser.add_argument('--json', action='store_true', help="sortie JSON")
+    parser.add_argument('--verbose', action='store_true', help="affiche les journaux des handlers")
+    args = parser.parse_args(argv)
+
+    # Les journaux des handlers noieraient le rapport
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    mixes = {}
+    for value in args.mix or list(MIXES):
+        try:
+            mixes[value] = MIXES[value] if value in MIXES else parse_mix(value)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.cost_model:
+        with open(args.cost_model, encoding='utf-8') as f:
+            try:
+                cost_model.configure(json.load(f))
+            except ValueError as e:
+                parser.error(str(e))
+
+    results = {
+        size: asyncio.run(measure_size(size, args.requests, args.latency_ms, args.jitter, args.partitions,
+                                       args.bcrypt_rounds))
+        for size in sorted(args.sizes)
+    }
+    scaling_report = scaling(results)
+    projections = plan(results, mixes, args.rps, args.headroom)
+
+    if args.json:
+        print(json.dumps({"rps": args.rps, "results": results, "scaling": scaling_report,
+                          "projections": projections}, indent=2))
+    else:
+        print(format_report(results, scaling_report, projections, args.rps))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Modèle approximatif du coût en RU des opérations Cosmos DB.
+
+Les valeurs reprennent les ordres de grandeur publiés pour l'indexation par
+défaut (lecture ponctuelle d'1 Ko ≈ 1 RU, écriture d'1 Ko ≈ 5 à 6 RU). Elles
+servent à comparer des variantes entre elles, pas à prévoir la facture ;
+`configure` les remplace par des coûts relevés sur le compte (en-tête
+`x-ms-request-charge`) pour le planificateur de capacité.
+"""
+
+import json
+import math
+
+# Coûts unitaires par tranche d'1 Ko de document
+POINT_READ_RU = 1.0
+CREATE_RU = 5.7
+REPLACE_RU = 10.7
+PATCH_RU = 10.0
+DELETE_RU = 5.5
+
+# Requêtes : coût fixe, par partition physique interrogée et par document renvoyé
+QUERY_BASE_RU = 2.3
+QUERY_PARTITION_RU = 1.0
+QUERY_ITEM_RU = 0.1
+
+# Coût unitaire (nom de la constante) d'une opération d'écriture selon son type
+WRITE_RU = {
+    'create_item': 'CREATE_RU',
+    'upsert_item': 'REPLACE_RU',
+    'replace_item': 'REPLACE_RU',
+    'patch_item': 'PATCH_RU',
+    'delete_item': 'DELETE_RU',
+}
+
+# Coûts unitaires modifiables par `configure`
+UNIT_COSTS = ('POINT_READ_RU', 'CREATE_RU', 'REPLACE_RU', 'PATCH_RU', 'DELETE_RU',
+              'QUERY_BASE_RU', 'QUERY_PARTITION_RU', 'QUERY_ITEM_RU')
+
+
+def configure(overrides):
+    """Remplace des coûts unitaires (`{"CREATE_RU": 6.2, ...}`) et retourne les valeurs remplacées"""
+    unknown = sorted(set(overrides) - set(UNIT_COSTS))
+    if unknown:
+        raise ValueError(f"Unknown cost model entries: {', '.join(unknown)}")
+    previous = {name: globals()[name] for name in overrides}
+    globals().update({name: float(value) for name, value in overrides.items()})
+    return previous
+
+
+def document_kb(document):
+    """Taille d'un document en tranches d'1 Ko (au moins une)"""
+    if document is None:
+        return 1
+    return max(1, math.ceil(len(json.dumps(document, default=str).encode('utf-8')) / 1024))
+
+
+def point_read_ru(document):
+    return POINT_READ_RU * document_kb(document)
+
+
+def write_ru(operation, document):
+    return globals()[WRITE_RU[operation]] * document_kb(document)
+
+
+def query_ru(item_count, partitions=1):
+    """Coût d'une requête renvoyant `item_count` documents sur `partitions` partitions"""
+    return QUERY_BASE_RU + QUERY_PARTITION_RU * (partitions - 1) + QUERY_ITEM_RU * item_count
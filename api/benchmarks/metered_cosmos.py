@@ -0,0 +1,239 @@
+"""
+Cosmos DB simulé pour le banc de charge : le faux client en mémoire des tests,
+avec une latence injectée à chaque aller-retour et un compteur d'appels et de
+RU attribué à la requête HTTP en cours.
+"""
+
+import asyncio
+import contextvars
+import random
+import time
+
+from benchmarks import cost_model
+from tests.fake_cosmos import FakeCosmosClient
+
+
+class Meter:
+    """Appels Cosmos et RU simulées consommés, et temps passé dans le simulateur lui-même"""
+
+    __slots__ = ('calls', 'ru', 'simulator_s')
+
+    def __init__(self):
+        self.calls = 0
+        self.ru = 0.0
+        self.simulator_s = 0.0
+
+    def charge(self, ru):
+        self.calls += 1
+        self.ru += ru
+
+
+# Compteur de la requête HTTP en cours (None hors requête : amorçage, préparation)
+current_meter = contextvars.ContextVar('current_meter', default=None)
+
+
+class Latency:
+    """Latence simulée d'un aller-retour : moyenne ± gigue uniforme, et nombre d'allers-retours"""
+
+    def __init__(self, mean_ms=5.0, jitter=0.5, seed=None):
+        self.mean = mean_ms / 1000
+        self.jitter = jitter
+        self.round_trips = 0
+        self._random = random.Random(seed)
+
+    async def wait(self):
+        self.round_trips += 1
+        if self.mean > 0:
+            await asyncio.sleep(self.mean * self._random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+def _charge(ru):
+    meter = current_meter.get()
+    if meter is not None:
+        meter.charge(ru)
+
+
+def _run_query(run):
+    """Exécute une requête du faux Cosmos (balayage en Python de tous les documents) hors de la latence mesurée"""
+    start = time.perf_counter()
+    try:
+        return run()
+    finally:
+        meter = current_meter.get()
+        if meter is not None:
+            meter.simulator_s += time.perf_counter() - start
+
+
+class _MeteredPage:
+    """Page de résultats déjà matérialisée"""
+
+    def __init__(self, items):
+        self._items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _MeteredPageIterator:
+    """Itérateur de pages : chaque page coûte un aller-retour"""
+
+    def __init__(self, pages, latency, partitions):
+        self._pages = pages
+        self._latency = latency
+        self._partitions = partitions
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self._latency.wait()
+        page = await self._pages.__anext__()
+        items = [item async for item in page]
+        _charge(cost_model.query_ru(len(items), self._partitions))
+        return _MeteredPage(items)
+
+
+class _MeteredPaged:
+    """Résultat de requête dont la lecture est facturée"""
+
+    def __init__(self, paged, latency, partitions):
+        self._paged = paged
+        self._latency = latency
+        self._partitions = partitions
+
+    def by_page(self, continuation_token=None):
+        return _MeteredPageIterator(self._paged.by_page(continuation_token), self._latency, self._partitions)
+
+    async def _iterate(self):
+        async for page in self.by_page():
+            async for item in page:
+                yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class MeteredContainer:
+    """Container simulé : latence et facturation autour du faux container"""
+
+    def __init__(self, container, latency, partitions):
+        self._container = container
+        self._latency = latency
+        self._partitions = partitions
+        self.id = container.id
+
+    def seed(self, *bodies):
+        self._container.seed(*bodies)
+
+    async def read_item(self, item, partition_key, **kwargs):
+        await self._latency.wait()
+        try:
+            document = await self._container.read_item(item, partition_key, **kwargs)
+        except Exception:
+            _charge(cost_model.POINT_READ_RU)
+            raise
+        _charge(cost_model.point_read_ru(document))
+        return document
+
+    async def _write(self, operation, *args, **kwargs):
+        await self._latency.wait()
+        try:
+            document = await getattr(self._container, operation)(*args, **kwargs)
+        except Exception:
+            _charge(cost_model.POINT_READ_RU)
+            raise
+        _charge(cost_model.write_ru(operation, document))
+        return document
+
+    async def create_item(self, body, **kwargs):
+        return await self._write('create_item', body, **kwargs)
+
+    async def upsert_item(self, body, **kwargs):
+        return await self._write('upsert_item', body, **kwargs)
+
+    async def replace_item(self, item, body, **kwargs):
+        return await self._write('replace_item', item, body, **kwargs)
+
+    async def patch_item(self, item, partition_key, patch_operations, **kwargs):
+        return await self._write('patch_item', item, partition_key, patch_operations, **kwargs)
+
+    async def delete_item(self, item, partition_key, **kwargs):
+        return await self._write('delete_item', item, partition_key, **kwargs)
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None, **kwargs):
+        paged = _run_query(lambda: self._container.query_items(query, parameters, partition_key, max_item_count, **kwargs))
+        return _MeteredPaged(paged, self._latency, 1 if partition_key is not None else self._partitions)
+
+    def read_feed_ranges(self, **kwargs):
+        return self._container.read_feed_ranges(**kwargs)
+
+    def query_items_change_feed(self, **kwargs):
+        return _MeteredPaged(self._container.query_items_change_feed(**kwargs), self._latency, 1)
+
+
+class MeteredDatabase:
+    """Base simulée retournant des containers facturés"""
+
+    def __init__(self, database, latency, partitions):
+        self._database = database
+        self._latency = latency
+        self._partitions = partitions
+        self._containers = {}
+
+    def _wrap(self, container):
+        if container.id not in self._containers:
+            self._containers[container.id] = MeteredContainer(container, self._latency, self._partitions)
+        return self._containers[container.id]
+
+    async def create_container_if_not_exists(self, id, partition_key, **kwargs):
+        await self._latency.wait()
+        return self._wrap(await self._database.create_container_if_not_exists(id, partition_key, **kwargs))
+
+    def get_container_client(self, container):
+        return self._wrap(self._database.get_container_client(container))
+
+    async def read(self):
+        await self._latency.wait()
+        return await self._database.read()
+
+
+class MeteredCosmosClient:
+    """Client simulé : faux Cosmos en mémoire, latence injectée et RU comptées.
+
+    `partitions` est le nombre de partitions physiques supposé pour facturer
+    les requêtes inter-partitions.
+    """
+
+    def __init__(self, latency=None, partitions=4):
+        self._client = FakeCosmosClient()
+        self._latency = latency or Latency()
+        self._partitions = partitions
+        self._databases = {}
+
+    async def create_database_if_not_exists(self, id, **kwargs):
+        await self._latency.wait()
+        return self.get_database_client(id)
+
+    def get_database_client(self, database):
+        if database not in self._databases:
+            self._databases[database] = MeteredDatabase(
+                self._client.get_database_client(database), self._latency, self._partitions
+            )
+        return self._databases[database]
+
+    def container(self, database, id, partition_key_path):
+        """Crée ou retourne un container simulé sans latence (préparation des données)"""
+        return self.get_database_client(database)._wrap(self._client.container(database, id, partition_key_path))
+
+    async def close(self):
+        pass
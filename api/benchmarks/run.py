@@ -0,0 +1,226 @@
+"""
+Banc de charge local des handlers HTTP contre un Cosmos DB simulé.
+
+Les handlers de `function_app` sont appelés dans le processus, avec un faux
+Cosmos en mémoire qui ajoute une latence à chaque aller-retour et compte les
+appels et les RU simulées de chaque requête.
+
+Usage (depuis le dossier api/) :
+    python -m benchmarks.run                              # toutes les charges
+    python -m benchmarks.run --workload poll --clients 50
+    python -m benchmarks.run --save-baseline              # enregistre benchmarks/baseline.json
+    python -m benchmarks.run --compare                    # compare à la référence enregistrée
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+import azure.functions as func
+
+from benchmarks.metered_cosmos import Latency, Meter, MeteredCosmosClient, current_meter
+from benchmarks.workloads import WORKLOADS, provision
+from shared_code import cosmos_pool, password_hashing, polls
+from shared_code.response_cache import votes_cache
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Indicateurs comparés à la référence (une hausse est une régression)
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'cosmos_calls_per_request', 'ru_per_request')
+
+
+def percentile(sorted_values, fraction):
+    """Percentile par rang le plus proche d'une liste triée"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Mesures d'une charge : latences, statuts, appels et RU par requête"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.calls = 0
+        self.ru = 0.0
+
+    def record(self, elapsed, status, meter):
+        # Le balayage des requêtes par le faux Cosmos n'est pas une latence de Cosmos DB
+        self.latencies.append(max(0.0, elapsed - meter.simulator_s))
+        self.statuses[status] += 1
+        self.calls += meter.calls
+        self.ru += meter.ru
+
+    def record_deferred(self, meter):
+        """Ajoute les appels et RU d'un travail différé, répartis sur les requêtes"""
+        self.calls += meter.calls
+        self.ru += meter.ru
+
+    def report(self, wall_time):
+        count = len(self.latencies)
+        latencies = sorted(latency * 1000 for latency in self.latencies)
+        return {
+            "requests": count,
+            "rps": round(count / wall_time, 1) if wall_time else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "cosmos_calls_per_request": round(self.calls / count, 2) if count else 0.0,
+            "ru_per_request": round(self.ru / count, 2) if count else 0.0,
+            "statuses": {str(status): n for status, n in sorted(self.statuses.items())},
+        }
+
+
+def make_sender(recorder):
+    """Fonction d'envoi mesurant chaque appel de handler"""
+
+    async def send(handler, method, route, body=None, params=None, headers=None):
+        request = func.HttpRequest(
+            method=method,
+            url=f'http://localhost:7071/api/{route}',
+            body=json.dumps(body).encode('utf-8') if body is not None else b'',
+            params=params or {},
+            headers=headers or {}
+        )
+        meter = Meter()
+        token = current_meter.set(meter)
+        start = time.perf_counter()
+        try:
+            response = await handler.build().get_user_function()(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_meter.reset(token)
+        recorder.record(elapsed, response.status_code, meter)
+        return response
+
+    return send
+
+
+async def run_workload(name, clients=20, requests=20, latency_ms=5.0, jitter=0.5,
+                       partitions=4, seed_votes=1000, bcrypt_rounds=4, seed=0):
+    """Exécute une charge sur un Cosmos simulé neuf et retourne son rapport"""
+    client = MeteredCosmosClient(Latency(latency_ms, jitter, seed), partitions)
+    previous_pool, previous_hasher = cosmos_pool.pool, password_hashing.hasher
+    cosmos_pool.pool = cosmos_pool.CosmosPool(client_factory=lambda: client)
+    password_hashing.hasher = password_hashing.PasswordHasher(rounds=bcrypt_rounds)
+    votes_cache.invalidate()
+    polls.clear_cache()
+
+    try:
+        provision(client)
+        workload = WORKLOADS[name]()
+        await workload.setup(client, clients, requests, seed_votes)
+
+        recorder = Recorder()
+        send = make_sender(recorder)
+        start = time.perf_counter()
+        await asyncio.gather(*(workload.client(send, index, requests) for index in range(clients)))
+        wall_time = time.perf_counter() - start
+
+        if hasattr(workload, 'finish'):
+            meter = Meter()
+            token = current_meter.set(meter)
+            try:
+                await workload.finish(client)
+            finally:
+                current_meter.reset(token)
+            recorder.record_deferred(meter)
+        return recorder.report(wall_time)
+    finally:
+        cosmos_pool.pool, password_hashing.hasher = previous_pool, previous_hasher
+        votes_cache.invalidate()
+        polls.clear_cache()
+
+
+def compare(results, baseline):
+    """Écart relatif (%) de chaque indicateur par rapport à la référence"""
+    deltas = {}
+    for name, report in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference:
+            continue
+        deltas[name] = {
+            metric: round((report[metric] - reference[metric]) / reference[metric] * 100, 1)
+            for metric in COMPARED_METRICS
+            if reference.get(metric)
+        }
+    return deltas
+
+
+def format_table(results, deltas=None):
+    """Tableau texte des rapports, avec l'écart à la référence s'il est connu"""
+    lines = [f"{'charge':<8} {'req':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+             f"{'appels/req':>10} {'RU/req':>8}  statuts"]
+    for name, report in results.items():
+        lines.append(
+            f"{name:<8} {report['requests']:>6} {report['rps']:>8} {report['p50_ms']:>8} "
+            f"{report['p95_ms']:>8} {report['p99_ms']:>8} {report['cosmos_calls_per_request']:>10} "
+            f"{report['ru_per_request']:>8}  {report['statuses']}"
+        )
+        for metric, delta in (deltas or {}).get(name, {}).items():
+            lines.append(f"{'':<8} {metric}: {delta:+.1f}%")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge local des handlers HTTP")
+    parser.add_argument('--workload', choices=sorted(WORKLOADS) + ['all'], default='all')
+    parser.add_argument('--clients', type=int, default=20, help="clients simultanés")
+    parser.add_argument('--requests', type=int, default=20, help="requêtes par client")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="latence moyenne d'un aller-retour Cosmos")
+    parser.add_argument('--jitter', type=float, default=0.5, help="gigue relative de la latence (0 à 1)")
+    parser.add_argument('--partitions', type=int, default=4, help="partitions physiques simulées")
+    parser.add_argument('--seed-votes', type=int, default=1000, help="votes préexistants pour la charge poll")
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help="coût bcrypt pendant le banc")
+    parser.add_argument('--seed', type=int, default=0, help="graine de la latence simulée")
+    parser.add_argument('--save-baseline', nargs='?', const=BASELINE_PATH, metavar='PATH',
+                        help="enregistre les résultats comme référence")
+    parser.add_argument('--compare', nargs='?', const=BASELINE_PATH, metavar='PATH',
+                        help="compare les résultats à une référence enregistrée")
+    parser.add_argument('--json', action='store_true', help="sortie JSON")
+    parser.add_argument('--verbose', action='store_true', help="affiche les journaux des handlers")
+    args = parser.parse_args(argv)
+
+    # Les journaux des handlers noieraient le rapport
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    settings = {
+        "clients": args.clients,
+        "requests": args.requests,
+        "latency_ms": args.latency_ms,
+        "jitter": args.jitter,
+        "partitions": args.partitions,
+        "seed_votes": args.seed_votes,
+        "bcrypt_rounds": args.bcrypt_rounds,
+        "seed": args.seed,
+    }
+    names = sorted(WORKLOADS) if args.workload == 'all' else [args.workload]
+    results = {name: asyncio.run(run_workload(name, **settings)) for name in names}
+
+    deltas = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            deltas = compare(results, json.load(f))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+            f.write('\n')
+
+    if args.json:
+        print(json.dumps({"settings": settings, "results": results, "deltas": deltas}, indent=2))
+    else:
+        print(format_table(results, deltas))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
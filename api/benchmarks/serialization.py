@@ -0,0 +1,122 @@
+"""
+Micro-banc de la sérialisation des réponses de `GET /votes`.
+
+Pour des pages de votes synthétiques (10 000, 100 000 et 1 000 000 votes par
+défaut), mesure le temps CPU de la mise en forme et de la sérialisation d'une
+réponse, puis la taille du corps, brut et compressé en gzip :
+
+- `objets-json` : un objet par vote, module `json` par défaut (avant `shared_code.serialization`)
+- `objets` : un objet par vote, sérialiseur de l'API (orjson s'il est installé)
+- `colonnes` : format colonnes (`Accept: application/vnd.bayrou.columnar+json`), sérialiseur de l'API
+
+Usage (depuis le dossier api/) :
+    python -m benchmarks.serialization                        # 10k, 100k et 1M votes
+    python -m benchmarks.serialization --sizes 10000 --repeat 10
+    JSON_SERIALIZER=json python -m benchmarks.serialization   # sans orjson
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+
+from shared_code import serialization, tally, user_join
+from shared_code.polls import DEFAULT_CHOICES, DEFAULT_QUESTION
+
+SIZES = (10_000, 100_000, 1_000_000)
+
+
+def _json_dumps(value):
+    return json.dumps(value).encode('utf-8')
+
+
+# Format : (votes en colonnes, sérialiseur)
+FORMATS = {
+    "objets-json": (False, _json_dumps),
+    "objets": (False, serialization.dumps),
+    "colonnes": (True, serialization.dumps),
+}
+
+
+def synthetic_votes(count):
+    """Votes tels que projetés par la requête de GET /votes, pseudos dénormalisés"""
+    return [
+        {
+            "id": f"{i:08x}-0000-4000-8000-{i:012x}",
+            "user_id": f"{i:08x}-0000-4000-8000-{i:012x}",
+            "pseudo": f"user{i}",
+            "choice": DEFAULT_CHOICES[i % 3 == 0],
+            "created_at": f"2025-01-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{(i * 7) % 60:02d}.{i % 1_000_000:06d}"
+        }
+        for i in range(count)
+    ]
+
+
+def render(votes, columnar, dumps):
+    """Corps d'une page de GET /votes, mis en forme comme `function_app.render_votes_page`"""
+    counts = {choice: 0 for choice in DEFAULT_CHOICES}
+    counts["total"] = len(votes)
+    if columnar:
+        page_votes = user_join.columnar_votes(votes, {})
+    else:
+        page_votes = user_join.enrich_votes(votes, {}, DEFAULT_QUESTION)
+    return dumps({
+        "votes": page_votes,
+        "stats": tally.compute_stats(counts, DEFAULT_CHOICES),
+        "poll_id": "bayrou",
+        "question": DEFAULT_QUESTION,
+        "continuation": None
+    })
+
+
+def measure(size, repeat=3):
+    """Temps CPU (meilleur de `repeat`) et taille du corps de chaque format pour `size` votes"""
+    votes = synthetic_votes(size)
+    results = {}
+    for name, (columnar, dumps) in FORMATS.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            body = render(votes, columnar, dumps)
+            timings.append(time.process_time() - start)
+        results[name] = {
+            "cpu_ms": round(min(timings) * 1000, 1),
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, compresslevel=6)),
+        }
+    return results
+
+
+def format_table(results):
+    """Tableau texte des mesures, avec le gain relatif au format `objets-json`"""
+    lines = [f"{'votes':>9} {'format':<12} {'CPU ms':>9} {'octets':>12} {'gzip':>11} {'CPU':>7} {'octets':>7}"]
+    for size, formats in results.items():
+        reference = formats["objets-json"]
+        for name, report in formats.items():
+            lines.append(
+                f"{size:>9} {name:<12} {report['cpu_ms']:>9} {report['bytes']:>12} {report['gzip_bytes']:>11} "
+                f"{report['cpu_ms'] / reference['cpu_ms']:>6.0%} {report['bytes'] / reference['bytes']:>7.0%}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-banc de la sérialisation de GET /votes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="votes par réponse")
+    parser.add_argument('--repeat', type=int, default=3, help="mesures par format (la meilleure est gardée)")
+    parser.add_argument('--json', action='store_true', help="sortie JSON")
+    args = parser.parse_args(argv)
+
+    results = {size: measure(size, args.repeat) for size in args.sizes}
+
+    if args.json:
+        print(json.dumps({"serializer": serialization.backend(), "results": results}, indent=2))
+    else:
+        print(f"sérialiseur : {serialization.backend()}")
+        print(format_table(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
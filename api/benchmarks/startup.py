@@ -0,0 +1,185 @@
+"""
+Mesure du démarrage à froid des handlers HTTP.
+
+Chaque démarrage se fait dans un interpréteur neuf, comme un worker du plan
+Consommation : durée d'import de `function_app`, puis durée et allers-retours
+Cosmos de la première requête (client Cosmos, handles de containers, imports
+différés) et d'une seconde requête sur le worker chaud. Cosmos est simulé
+comme dans `benchmarks.run`, avec une latence fixe par aller-retour.
+
+Usage (depuis le dossier api/) :
+    python -m benchmarks.startup                          # 5 démarrages par route
+    python -m benchmarks.startup --route votes --runs 10 --latency-ms 20
+    python -m benchmarks.startup --provision              # avec COSMOS_AUTO_PROVISION=1, pour comparer
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules importés par cosmos_pool.create_client pour le vrai client
+CLIENT_MODULES = ('aiohttp', 'azure.core.pipeline.transport', 'azure.cosmos.aio')
+
+PASSWORD = "benchmark-password"
+
+# Route : (handler, méthode, chemin, corps de la première requête, corps de la seconde)
+ROUTES = {
+    "votes": ('getVotes', 'GET', 'votes', None, None),
+    "vote": ('submitVote', 'POST', 'vote', {"user_id": "u0", "choice": "oui"}, {"user_id": "u1", "choice": "non"}),
+    "login": ('loginUser', 'POST', 'login',
+              {"email": "user0@example.com", "password": PASSWORD},
+              {"email": "user1@example.com", "password": PASSWORD}),
+    "health": ('healthCheck', 'GET', 'health', None, None),
+}
+
+
+def _seed(client):
+    """Base déjà provisionnée : sondage historique, deux utilisateurs, un vote et son compteur"""
+    import bcrypt
+
+    from benchmarks.workloads import provision
+    from shared_code import cosmos_pool, email_index, polls, votes
+
+    def container(name):
+        return client.container(cosmos_pool.DATABASE_NAME, name, cosmos_pool.CONTAINERS[name])
+
+    provision(client)
+    container(cosmos_pool.POLLS_CONTAINER).seed(polls.default_poll())
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=4)).decode('utf-8')
+    for i in range(2):
+        email = f"user{i}@example.com"
+        container(cosmos_pool.USERS_CONTAINER).seed(
+            {"id": f"u{i}", "pseudo": f"user{i}", "email": email, "password_hash": password_hash}
+        )
+        container(cosmos_pool.EMAILS_CONTAINER).seed({"id": email_index.email_key(email), "email": email, "user_id": f"u{i}"})
+    container(cosmos_pool.VOTES_CONTAINER).seed(votes.vote_document(polls.DEFAULT_POLL_ID, "u9", "oui", "2025-01-01T00:00:00", pseudo="user9"))
+    container(cosmos_pool.TALLIES_CONTAINER).seed({"id": polls.DEFAULT_POLL_ID, "oui": 1, "non": 0, "total": 1})
+
+
+def measure_once(route, latency_ms):
+    """Un démarrage dans le processus courant (qui ne doit pas avoir importé function_app)"""
+    logging.basicConfig(level=logging.CRITICAL)
+
+    start = time.perf_counter()
+    import function_app
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import azure.functions as func
+
+    from benchmarks.metered_cosmos import Latency, MeteredCosmosClient
+    from shared_code import cosmos_pool, password_hashing
+
+    latency = Latency(latency_ms, jitter=0)
+    client = MeteredCosmosClient(latency)
+    _seed(client)
+
+    def client_factory():
+        for module in CLIENT_MODULES:
+            importlib.import_module(module)
+        return client
+
+    cosmos_pool.pool = cosmos_pool.CosmosPool(client_factory=client_factory)
+    password_hashing.hasher = password_hashing.PasswordHasher(rounds=4)
+
+    handler_name, method, path, first_body, second_body = ROUTES[route]
+    handler = getattr(function_app, handler_name).build().get_user_function()
+
+    def request(body):
+        return func.HttpRequest(
+            method=method,
+            url=f'http://localhost:7071/api/{path}',
+            body=json.dumps(body).encode('utf-8') if body is not None else b''
+        )
+
+    async def scenario():
+        timings = []
+        for body in (first_body, second_body):
+            round_trips = latency.round_trips
+            start = time.perf_counter()
+            response = await handler(request(body))
+            timings.append({
+                "ms": (time.perf_counter() - start) * 1000,
+                "round_trips": latency.round_trips - round_trips,
+                "status": response.status_code
+            })
+        return timings
+
+    first, warm = asyncio.run(scenario())
+    return {
+        "import_ms": round(import_ms, 1),
+        "first_request_ms": round(first["ms"], 1),
+        "first_request_round_trips": first["round_trips"],
+        "warm_request_ms": round(warm["ms"], 1),
+        "warm_request_round_trips": warm["round_trips"],
+        "statuses": [first["status"], warm["status"]],
+    }
+
+
+def measure(route, runs=5, latency_ms=10.0, provision=False):
+    """Démarre `runs` interpréteurs neufs et retourne les médianes de leurs mesures"""
+    env = {**os.environ, "COSMOS_AUTO_PROVISION": "1" if provision else "0"}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.startup', '--child', '--route', route, '--latency-ms', str(latency_ms)],
+            cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output))
+
+    report = {
+        metric: round(statistics.median(sample[metric] for sample in samples), 1)
+        for metric in samples[0] if metric != "statuses"
+    }
+    report["statuses"] = sorted({status for sample in samples for status in sample["statuses"]})
+    return report
+
+
+def format_table(results):
+    """Tableau texte des médianes par route"""
+    lines = [f"{'route':<8} {'import ms':>10} {'1re req ms':>11} {'allers-ret.':>11} "
+             f"{'req chaude ms':>14} {'allers-ret.':>11}  statuts"]
+    for route, report in results.items():
+        lines.append(
+            f"{route:<8} {report['import_ms']:>10} {report['first_request_ms']:>11} "
+            f"{report['first_request_round_trips']:>11} {report['warm_request_ms']:>14} "
+            f"{report['warm_request_round_trips']:>11}  {report['statuses']}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure du démarrage à froid des handlers HTTP")
+    parser.add_argument('--route', choices=sorted(ROUTES) + ['all'], default='all')
+    parser.add_argument('--runs', type=int, default=5, help="démarrages mesurés par route")
+    parser.add_argument('--latency-ms', type=float, default=10.0, help="latence d'un aller-retour Cosmos")
+    parser.add_argument('--provision', action='store_true',
+                        help="crée la base et les containers au premier accès (COSMOS_AUTO_PROVISION=1)")
+    parser.add_argument('--json', action='store_true', help="sortie JSON")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure_once(args.route, args.latency_ms)))
+        return 0
+
+    routes = sorted(ROUTES) if args.route == 'all' else [args.route]
+    results = {route: measure(route, args.runs, args.latency_ms, args.provision) for route in routes}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
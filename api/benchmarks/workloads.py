@@ -0,0 +1,198 @@
+"""
+Charges de travail du banc : chaque charge prépare ses données puis fournit
+le scénario exécuté par chacun des N clients simulés.
+
+Un scénario reçoit `send(handler, method, route, body, params, headers)`
+(qui mesure et enregistre chaque appel), l'indice du client et le nombre de
+requêtes à envoyer. Une charge peut aussi fournir `finish(client)`, travail
+différé exécuté après les requêtes dont les appels et RU leur sont imputés.
+"""
+
+import os
+import tempfile
+import uuid
+
+from shared_code import auth_tokens, change_feed, cosmos_pool, email_index, password_hashing, polls, snapshots, vote_queue, votes
+from shared_code.cosmos_pool import EMAILS_CONTAINER, POLLS_CONTAINER, ROLLUPS_CONTAINER, TALLIES_CONTAINER, USERS_CONTAINER, VOTES_CONTAINER
+
+import function_app
+
+PASSWORD = "benchmark-password"
+
+
+def _container(client, name):
+    return client.container(cosmos_pool.DATABASE_NAME, name, cosmos_pool.CONTAINERS[name])
+
+
+def provision(client):
+    """Crée tous les containers de l'API, comme `scripts.bootstrap_cosmos` au déploiement"""
+    for name in cosmos_pool.CONTAINERS:
+        _container(client, name)
+
+
+def _seed_users(client, count, password_hash=None):
+    """Insère `count` utilisateurs u0..u{count-1}, indexés par email, et retourne leurs identifiants"""
+    users = _container(client, USERS_CONTAINER)
+    emails = _container(client, EMAILS_CONTAINER)
+    user_ids = [f"u{i}" for i in range(count)]
+    for i, user_id in enumerate(user_ids):
+        email = f"user{i}@example.com"
+        emails.seed({"id": email_index.email_key(email), "email": email, "user_id": user_id})
+        users.seed({
+            "id": user_id,
+            "pseudo": f"user{i}",
+            "email": email,
+            "password_hash": password_hash or "",
+            "created_at": f"2025-01-01T00:00:{i % 60:02d}"
+        })
+    return user_ids
+
+
+def _seed_poll(client):
+    """Insère le sondage historique, comme dans une base déjà en service"""
+    _container(client, POLLS_CONTAINER).seed(polls.default_poll())
+
+
+class Signup:
+    """Rafale d'inscriptions (hachage bcrypt et contrôle d'unicité de l'email)"""
+
+    name = "signup"
+
+    async def setup(self, client, clients, requests, seed_votes):
+        pass
+
+    async def client(self, send, index, requests):
+        for _ in range(requests):
+            email = f"{uuid.uuid4().hex}@example.com"
+            await send(function_app.createUser, 'POST', 'user',
+                       {"pseudo": email[:8], "email": email, "password": PASSWORD})
+
+
+class Login:
+    """Rafale de connexions d'utilisateurs existants"""
+
+    name = "login"
+
+    async def setup(self, client, clients, requests, seed_votes):
+        password_hash = await password_hashing.hasher.hash_password(PASSWORD)
+        self.count = max(1, clients)
+        _seed_users(client, self.count, password_hash)
+
+    async def client(self, send, index, requests):
+        for i in range(requests):
+            await send(function_app.loginUser, 'POST', 'login',
+                       {"email": f"user{(index + i) % self.count}@example.com", "password": PASSWORD})
+
+
+class Vote:
+    """Tempête de votes : chaque utilisateur vote une fois, avec le jeton reçu à la connexion"""
+
+    name = "vote"
+
+    async def setup(self, client, clients, requests, seed_votes):
+        _seed_poll(client)
+        self.user_ids = _seed_users(client, clients * requests)
+
+    async def client(self, send, index, requests):
+        for i in range(requests):
+            user_id = self.user_ids[index * requests + i]
+            token = auth_tokens.issue({"id": user_id, "pseudo": user_id})
+            await send(function_app.submitVote, 'POST', 'vote',
+                       {"choice": "oui" if i % 3 else "non"},
+                       headers={"Authorization": f"Bearer {token}"})
+
+
+class QueuedVote(Vote):
+    """Tempête de votes en écriture différée : réponses 202, votes écrits par lots au vidage de la file"""
+
+    name = "queued"
+
+    async def setup(self, client, clients, requests, seed_votes):
+        await super().setup(client, clients, requests, seed_votes)
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous = vote_queue.WRITE_BEHIND, vote_queue.queue
+        vote_queue.WRITE_BEHIND = True
+        vote_queue.queue = vote_queue.LocalQueue(os.path.join(self.directory.name, 'votes.sqlite3'))
+
+    async def finish(self, client):
+        try:
+            await vote_queue.drain(
+                await cosmos_pool.get_container(VOTES_CONTAINER),
+                await cosmos_pool.get_container(USERS_CONTAINER),
+                await cosmos_pool.get_container(TALLIES_CONTAINER),
+                rollups_container=await cosmos_pool.get_container(ROLLUPS_CONTAINER)
+            )
+        finally:
+            vote_queue.WRITE_BEHIND, vote_queue.queue = self.previous
+            self.directory.cleanup()
+
+
+class ChangeFeedVote(Vote):
+    """Tempête de votes réduits à leur insertion : compteur et historique mis à jour par le flux de modifications"""
+
+    name = "feed"
+
+    async def setup(self, client, clients, requests, seed_votes):
+        await super().setup(client, clients, requests, seed_votes)
+        self.previous = change_feed.CHANGE_FEED
+        change_feed.CHANGE_FEED = True
+        # Baux des plages posés avant la charge, comme sur une base déjà en service
+        await function_app.processChangeFeed.build().get_user_function()(None)
+
+    async def finish(self, client):
+        try:
+            await function_app.processChangeFeed.build().get_user_function()(None)
+        finally:
+            change_feed.CHANGE_FEED = self.previous
+
+
+class Poll:
+    """Sondage de GET /votes par N clients, avec If-None-Match comme un navigateur"""
+
+    name = "poll"
+
+    async def setup(self, client, clients, requests, seed_votes):
+        _seed_poll(client)
+        user_ids = _seed_users(client, seed_votes)
+        votes_container = _container(client, VOTES_CONTAINER)
+        for i, user_id in enumerate(user_ids):
+            votes_container.seed(votes.vote_document(
+                polls.DEFAULT_POLL_ID,
+                user_id,
+                "oui" if i % 3 else "non",
+                f"2025-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+                pseudo=f"user{i}"
+            ))
+
+    async def client(self, send, index, requests):
+        etag = None
+        for _ in range(requests):
+            response = await send(function_app.getVotes, 'GET', 'votes',
+                                  headers={"If-None-Match": etag} if etag else None)
+            etag = response.headers.get("ETag") or etag
+
+
+class SnapshotPoll(Poll):
+    """Sondage de GET /votes servi depuis l'instantané précompressé (gzip), sans If-None-Match"""
+
+    name = "snapshot"
+
+    async def setup(self, client, clients, requests, seed_votes):
+        await super().setup(client, clients, requests, seed_votes)
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous = snapshots.SNAPSHOTS_ENABLED, snapshots.store
+        snapshots.SNAPSHOTS_ENABLED = True
+        snapshots.store = snapshots.LocalBlobStore(self.directory.name)
+        body, tally_etag = await function_app.render_votes_snapshot(polls.DEFAULT_POLL_ID)
+        await snapshots.publish(polls.DEFAULT_POLL_ID, body, tally_etag)
+
+    async def client(self, send, index, requests):
+        for _ in range(requests):
+            await send(function_app.getVotes, 'GET', 'votes', headers={"Accept-Encoding": "gzip"})
+
+    async def finish(self, client):
+        snapshots.SNAPSHOTS_ENABLED, snapshots.store = self.previous
+        self.directory.cleanup()
+
+
+WORKLOADS = {workload.name: workload for workload in (Signup, Login, Vote, QueuedVote, ChangeFeedVote, Poll, SnapshotPoll)}
@@ -1,53 +1,198 @@
 import azure.functions as func
+import asyncio
 import datetime
-import json
+import functools
 import logging
+import math
+import time
 import uuid
 import os
-import bcrypt
-from azure.cosmos import CosmosClient, PartitionKey, exceptions
+from azure.cosmos import exceptions
+
+from shared_code import auth_tokens, bulk, change_feed, cosmos_pool, email_index, password_hashing, polls, resilience, rollups, serialization, snapshots, tally, telemetry, user_join, vote_feed, vote_queue, votes
+from shared_code.cosmos_pool import EMAILS_CONTAINER, LEASES_CONTAINER, POLLS_CONTAINER, ROLLUPS_CONTAINER, TALLIES_CONTAINER, USERS_CONTAINER, VOTES_CONTAINER
+from shared_code.response_cache import etag_matches, votes_cache
 
 app = func.FunctionApp()
 
-# Configuration Cosmos DB
-COSMOS_URL = os.environ.get('COSMOS_URL', '')
-COSMOS_KEY = os.environ.get('COSMOS_KEY', '')
-DATABASE_NAME = 'BayrouMeterDB'
-USERS_CONTAINER = 'users'
-VOTES_CONTAINER = 'votes'
+# Export OpenTelemetry éventuel (TELEMETRY_EXPORTER)
+telemetry.configure()
 
-def get_cosmos_client():
-    """Initialise le client Cosmos DB"""
-    return CosmosClient(COSMOS_URL, COSMOS_KEY)
+# Clé de signature des jetons vérifiée au démarrage du worker
+auth_tokens.check_configuration()
 
-def get_database(client):
-    """Récupère ou crée la base de données"""
-    try:
-        return client.get_database_client(DATABASE_NAME)
-    except exceptions.CosmosResourceNotFoundError:
-        return client.create_database(DATABASE_NAME)
+# Pagination de GET /votes
+VOTES_DEFAULT_LIMIT = int(os.environ.get('VOTES_DEFAULT_LIMIT', '100'))
+VOTES_MAX_LIMIT = int(os.environ.get('VOTES_MAX_LIMIT', '1000'))
+VOTES_PAGE_QUERY = "SELECT c.id, c.user_id, c.pseudo, c.choice, c.created_at FROM c ORDER BY c.created_at DESC"
 
-def get_container(database, container_name, partition_key_path):
-    """Récupère ou crée un container"""
+async def read_or_none(container, item_id, partition_key):
+    """Lecture ponctuelle retournant None si le document n'existe pas"""
     try:
-        return database.get_container_client(container_name)
+        return await container.read_item(item=item_id, partition_key=partition_key)
     except exceptions.CosmosResourceNotFoundError:
-        return database.create_container(
-            id=container_name,
-            partition_key=PartitionKey(path=partition_key_path)
+        return None
+
+async def get_poll(poll_id):
+    """Sondage demandé (sondage historique par défaut), ou None s'il n'existe pas"""
+    with telemetry.phase('poll'):
+        return await polls.get_poll(
+            await cosmos_pool.get_container(POLLS_CONTAINER),
+            poll_id or polls.DEFAULT_POLL_ID
         )
 
+def poll_not_found():
+    """Réponse 404 d'un sondage inconnu"""
+    return func.HttpResponse(
+        serialization.dumps({"error": "Poll not found"}),
+        mimetype="application/json",
+        status_code=404
+    )
+
+async def fetch_votes_page(votes_container, users_container, poll_id, limit, continuation):
+    """Charge une page de votes d'un sondage (pseudos compris) et résout les pseudos manquants"""
+    # Récupérer une page de votes limitée aux partitions du sondage (seuls les champs utiles sont projetés)
+    with telemetry.phase('votes_query'):
+        pager = votes_container.query_items(
+            query=VOTES_PAGE_QUERY,
+            partition_key=votes.poll_partition(poll_id),
+            max_item_count=limit
+        ).by_page(continuation)
+        page = await anext(pager, None)
+        page_votes = [vote async for vote in page] if page is not None else []
+
+    # Votes antérieurs à la dénormalisation : pseudos résolus en quelques requêtes groupées
+    pseudos = {}
+    missing = user_join.missing_pseudos(page_votes)
+    if missing:
+        with telemetry.phase('pseudos'):
+            pseudos = await user_join.fetch_pseudos(users_container, missing)
+    return page_votes, pager.continuation_token, pseudos
+
+async def render_votes_page(poll, limit, continuation, columnar=False):
+    """Corps JSON d'une page de votes d'un sondage (votes enrichis ou en colonnes, statistiques), et compteur lu"""
+    # Récupérer les containers depuis le pool partagé
+    votes_container, users_container, tallies_container = await asyncio.gather(
+        cosmos_pool.get_container(VOTES_CONTAINER),
+        cosmos_pool.get_container(USERS_CONTAINER),
+        cosmos_pool.get_container(TALLIES_CONTAINER)
+    )
+
+    # Charger la page de votes et lire le compteur simultanément
+    (page_votes, next_continuation, pseudos), tally_doc = await asyncio.gather(
+        fetch_votes_page(votes_container, users_container, poll["id"], limit, continuation),
+        tally.read_tally(tallies_container, votes_container, poll["id"], poll["choices"])
+    )
+
+    # Enrichir les votes avec les informations utilisateur, ou les ranger en colonnes
+    # (si l'utilisateur n'existe plus, on garde le vote mais sans les infos utilisateur)
+    if columnar:
+        page_votes = user_join.columnar_votes(page_votes, pseudos)
+    else:
+        page_votes = user_join.enrich_votes(page_votes, pseudos, poll["question"])
+
+    # Statistiques lues depuis le compteur matérialisé
+    stats = tally.compute_stats(tally_doc, poll["choices"])
+
+    with telemetry.phase('serialize'):
+        body = serialization.dumps({
+            "votes": page_votes,
+            "stats": stats,
+            "poll_id": poll["id"],
+            "question": poll["question"],
+            "continuation": next_continuation
+        })
+    return body, tally_doc
+
+async def render_votes_snapshot(poll_id):
+    """Instantané de la première page de GET /votes d'un sondage et ETag du compteur dont il dérive"""
+    body, tally_doc = await render_votes_page(await get_poll(poll_id), VOTES_DEFAULT_LIMIT, None)
+    return body, tally_doc.get("_etag")
+
+def schedule_snapshot(poll_id):
+    """Planifie le calcul (regroupé) de l'instantané d'un sondage"""
+    snapshots.publisher.schedule(poll_id, functools.partial(render_votes_snapshot, poll_id))
+
+def votes_changed(poll_ids):
+    """Après l'écriture de votes : vide le cache, réveille les flux et planifie les instantanés"""
+    votes_cache.invalidate()
+    for poll_id in poll_ids:
+        vote_feed.feeds.notify(poll_id)
+        if snapshots.SNAPSHOTS_ENABLED:
+            schedule_snapshot(poll_id)
+
+def snapshot_response(req, body, encoding, etag):
+    """Réponse servie depuis un instantané précompressé, ou 304 si le client est à jour"""
+    headers = {"ETag": etag, "Cache-Control": votes_cache.cache_control(), "Vary": "Accept, Accept-Encoding"}
+
+    if etag_matches(req.headers.get('If-None-Match'), etag):
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    if encoding != snapshots.IDENTITY:
+        headers["Content-Encoding"] = encoding
+    return func.HttpResponse(
+        body,
+        mimetype="application/json",
+        status_code=200,
+        headers=headers
+    )
+
+async def error_response(error, context):
+    """Réponse d'une erreur inattendue : 503 avec Retry-After si Cosmos est saturé, 500 sinon"""
+    retry_after = resilience.unavailable_retry_after(error)
+    if retry_after is not None:
+        logging.warning(f"{context}: Cosmos DB unavailable ({str(error)})")
+        return resilience.overloaded(retry_after)
+
+    logging.error(f"{context}: {str(error)}")
+    await cosmos_pool.pool.handle_error(error)
+    return func.HttpResponse(
+        serialization.dumps({"error": "Internal server error"}),
+        mimetype="application/json",
+        status_code=500
+    )
+
+def auth_not_configured():
+    """Réponse 503 tant que la clé de signature des jetons manque (avant toute écriture)"""
+    return func.HttpResponse(
+        serialization.dumps({"error": "Authentication is not configured"}),
+        mimetype="application/json",
+        status_code=503
+    )
+
+def cached_json_response(req, entry, mimetype=serialization.JSON_MEDIA_TYPE, vary=None):
+    """Réponse JSON portant ETag et Cache-Control, ou 304 si le client est à jour"""
+    headers = {"ETag": entry.etag, "Cache-Control": votes_cache.cache_control()}
+    if vary:
+        headers["Vary"] = vary
+
+    if etag_matches(req.headers.get('If-None-Match'), entry.etag):
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    return func.HttpResponse(
+        entry.body,
+        mimetype=mimetype,
+        status_code=200,
+        headers=headers
+    )
+
 @app.route(route="user", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
-def createUser(req: func.HttpRequest) -> func.HttpResponse:
+@telemetry.traced
+@resilience.guarded()
+async def createUser(req: func.HttpRequest) -> func.HttpResponse:
     """Endpoint POST /user pour créer un utilisateur (pseudo + email + password)"""
     logging.info('Processing POST /user request')
 
+    # Sans clé de signature, aucun compte n'est créé (son jeton ne pourrait pas être délivré)
+    if not auth_tokens.configured():
+        return auth_not_configured()
+
     try:
         # Récupérer les données JSON de la requête
         req_body = req.get_json()
         if not req_body:
             return func.HttpResponse(
-                json.dumps({"error": "Request body is required"}),
+                serialization.dumps({"error": "Request body is required"}),
                 mimetype="application/json",
                 status_code=400
             )
@@ -56,71 +201,185 @@ def createUser(req: func.HttpRequest) -> func.HttpResponse:
         email = req_body.get('email')
         password = req_body.get('password')
 
-        if not pseudo or not email or not password:
+        if not all(isinstance(value, str) and value for value in (pseudo, email, password)):
             return func.HttpResponse(
-                json.dumps({"error": "Pseudo, email and password are required"}),
+                serialization.dumps({"error": "Pseudo, email and password are required"}),
                 mimetype="application/json",
                 status_code=400
             )
 
-        # Initialiser Cosmos DB
-        client = get_cosmos_client()
-        database = get_database(client)
-        users_container = get_container(database, USERS_CONTAINER, "/id")
-
-        # Hash du mot de passe
-        password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password_bytes, salt)
+        # Récupérer les containers depuis le pool partagé
+        users_container, emails_container = await asyncio.gather(
+            cosmos_pool.get_container(USERS_CONTAINER),
+            cosmos_pool.get_container(EMAILS_CONTAINER)
+        )
 
-        # Créer l'utilisateur
+        # Réserver l'email dans l'index (avant le hachage, coûteux) : 409 s'il est déjà pris
         user_id = str(uuid.uuid4())
-        user_doc = {
-            "id": user_id,
-            "pseudo": pseudo,
-            "email": email,
-            "password_hash": hashed_password.decode('utf-8'),
-            "created_at": datetime.datetime.utcnow().isoformat()
-        }
-
-        # Vérifier si l'email existe déjà
-        query = f"SELECT * FROM c WHERE c.email = '{email}'"
-        existing_users = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-        
-        if existing_users:
+        with telemetry.phase('email_reserve'):
+            reserved = await email_index.reserve(emails_container, users_container, email, user_id)
+        if not reserved:
             return func.HttpResponse(
-                json.dumps({"error": "Email already exists"}),
+                serialization.dumps({"error": "Email already exists"}),
                 mimetype="application/json",
                 status_code=409
             )
 
-        # Insérer l'utilisateur
-        users_container.create_item(body=user_doc)
+        try:
+            # Hash du mot de passe sur le pool bcrypt borné
+            with telemetry.phase('hash'):
+                hashed_password = await password_hashing.hasher.hash_password(password)
+
+            # Créer l'utilisateur
+            user_doc = {
+                "id": user_id,
+                "pseudo": pseudo,
+                "email": email,
+                "password_hash": hashed_password,
+                "created_at": datetime.datetime.utcnow().isoformat()
+            }
+
+            # Jeton signé avant l'insertion : un échec de signature ne laisse pas de compte créé
+            token = auth_tokens.issue(user_doc)
+
+            # Insérer l'utilisateur
+            with telemetry.phase('insert'):
+                await users_container.create_item(body=user_doc)
+        except Exception:
+            # Libérer l'email réservé si l'utilisateur n'a pas pu être créé
+            await email_index.release(emails_container, email)
+            raise
 
         return func.HttpResponse(
-            json.dumps({
+            serialization.dumps({
                 "status": "success",
                 "user": {
                     "id": user_id,
                     "pseudo": pseudo,
                     "email": email
-                }
+                },
+                "token": token
             }),
             mimetype="application/json",
             status_code=201
         )
 
+    except password_hashing.HashingPoolSaturated:
+        logging.warning('Password hashing pool saturated')
+        return func.HttpResponse(
+            serialization.dumps({"error": "Service temporarily overloaded, please retry"}),
+            mimetype="application/json",
+            status_code=503,
+            headers={"Retry-After": str(password_hashing.HASH_RETRY_AFTER)}
+        )
+
     except Exception as e:
-        logging.error(f"Error creating user: {str(e)}")
+        return await error_response(e, "Error creating user")
+
+@app.route(route="users/bulk", methods=["POST"], auth_level=func.AuthLevel.ADMIN)
+@telemetry.traced
+@resilience.guarded()
+async def createUsersBulk(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint POST /users/bulk important des utilisateurs au format NDJSON (un utilisateur par ligne), clé maître requise"""
+    logging.info('Processing POST /users/bulk request')
+
+    # Corps reçu en entier par l'hôte Functions : taille et nombre de lignes plafonnés
+    body = req.get_body()
+    size_error = bulk.size_error(body)
+    if size_error:
+        return func.HttpResponse(
+            serialization.dumps({"error": size_error}),
+            mimetype="application/json",
+            status_code=413
+        )
+
+    try:
+        # Récupérer les containers depuis le pool partagé
+        users_container, emails_container = await asyncio.gather(
+            cosmos_pool.get_container(USERS_CONTAINER),
+            cosmos_pool.get_container(EMAILS_CONTAINER)
+        )
+
+        results = await bulk.ingest_users(body, users_container, emails_container)
+
         return func.HttpResponse(
-            json.dumps({"error": "Internal server error"}),
+            serialization.dumps({"summary": bulk.summarize(results), "results": results}),
             mimetype="application/json",
-            status_code=500
+            status_code=200
         )
 
+    except Exception as e:
+        return await error_response(e, "Error importing users")
+
+@app.route(route="polls", methods=["POST"], auth_level=func.AuthLevel.ADMIN)
+@telemetry.traced
+@resilience.guarded()
+async def createPoll(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint POST /polls pour créer un sondage (question + choix, "oui"/"non" par défaut), clé maître requise"""
+    logging.info('Processing POST /polls request')
+
+    try:
+        # Récupérer les données JSON de la requête
+        req_body = req.get_json()
+        if not req_body:
+            return func.HttpResponse(
+                serialization.dumps({"error": "Request body is required"}),
+                mimetype="application/json",
+                status_code=400
+            )
+
+        try:
+            poll = await polls.create_poll(
+                await cosmos_pool.get_container(POLLS_CONTAINER),
+                req_body.get('question'),
+                req_body.get('choices')
+            )
+        except polls.InvalidPoll as e:
+            return func.HttpResponse(
+                serialization.dumps({"error": str(e)}),
+                mimetype="application/json",
+                status_code=400
+            )
+
+        # La liste des sondages en cache de ce worker est périmée
+        votes_cache.invalidate()
+
+        return func.HttpResponse(
+            serialization.dumps({"status": "success", "poll": poll}),
+            mimetype="application/json",
+            status_code=201
+        )
+
+    except Exception as e:
+        return await error_response(e, "Error creating poll")
+
+@app.route(route="polls", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@telemetry.traced
+@resilience.guarded()
+async def listPolls(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint GET /polls retournant les sondages, du plus récent au plus ancien"""
+    logging.info('Processing GET /polls request')
+
+    try:
+        entry = votes_cache.get(("polls",))
+
+        if entry is None:
+            generation = votes_cache.generation
+            body = serialization.dumps({
+                "polls": await polls.list_polls(await cosmos_pool.get_container(POLLS_CONTAINER))
+            })
+            entry = votes_cache.set(("polls",), body, generation)
+
+        return cached_json_response(req, entry)
+
+    except Exception as e:
+        return await error_response(e, "Error listing polls")
+
 @app.route(route="vote", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
-def submitVote(req: func.HttpRequest) -> func.HttpResponse:
-    """Endpoint POST /vote pour exprimer un choix (Oui ou Non)"""
+@telemetry.traced
+@resilience.guarded()
+async def submitVote(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint POST /vote pour exprimer un choix dans un sondage (par défaut le sondage historique)"""
     logging.info('Processing POST /vote request')
 
     try:
@@ -128,186 +387,436 @@ def submitVote(req: func.HttpRequest) -> func.HttpResponse:
         req_body = req.get_json()
         if not req_body:
             return func.HttpResponse(
-                json.dumps({"error": "Request body is required"}),
+                serialization.dumps({"error": "Request body is required"}),
                 mimetype="application/json",
                 status_code=400
             )
 
-        user_id = req_body.get('user_id')
-        choice = req_body.get('choice')  # "oui" ou "non"
+        # Jeton signé : l'identité est vérifiée par calcul, sans lecture de l'utilisateur
+        claims = None
+        token = auth_tokens.bearer_token(req.headers.get('Authorization'))
+        if token is not None and not auth_tokens.configured():
+            return auth_not_configured()
+        if token is not None:
+            try:
+                claims = auth_tokens.verify(token)
+            except auth_tokens.InvalidToken as e:
+                return func.HttpResponse(
+                    serialization.dumps({"error": str(e)}),
+                    mimetype="application/json",
+                    status_code=401,
+                    headers={"WWW-Authenticate": "Bearer"}
+                )
+            if req_body.get('user_id') not in (None, claims["sub"]):
+                return func.HttpResponse(
+                    serialization.dumps({"error": "user_id does not match the token"}),
+                    mimetype="application/json",
+                    status_code=403
+                )
+        elif auth_tokens.AUTH_REQUIRE_TOKEN:
+            return func.HttpResponse(
+                serialization.dumps({"error": "Authentication token is required"}),
+                mimetype="application/json",
+                status_code=401,
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+
+        user_id = claims["sub"] if claims else req_body.get('user_id')
+        choice = req_body.get('choice')  # un des choix du sondage, "oui" ou "non" par défaut
 
-        if not user_id or not choice:
+        if not user_id or not isinstance(choice, str) or not choice:
             return func.HttpResponse(
-                json.dumps({"error": "Both user_id and choice are required"}),
+                serialization.dumps({"error": "Both user_id and choice are required"}),
                 mimetype="application/json",
                 status_code=400
             )
 
-        if choice.lower() not in ['oui', 'non']:
+        # Résoudre le sondage (mémorisé par le worker)
+        poll = await get_poll(req_body.get('poll_id'))
+        if poll is None:
+            return poll_not_found()
+
+        choice = choice.lower()
+        if choice not in poll["choices"]:
             return func.HttpResponse(
-                json.dumps({"error": "Choice must be 'oui' or 'non'"}),
+                serialization.dumps({"error": f"Choice must be one of {', '.join(repr(c) for c in poll['choices'])}"}),
                 mimetype="application/json",
                 status_code=400
             )
 
-        # Initialiser Cosmos DB
-        client = get_cosmos_client()
-        database = get_database(client)
-        users_container = get_container(database, USERS_CONTAINER, "/id")
-        votes_container = get_container(database, VOTES_CONTAINER, "/user_id")
+        vote = {
+            "id": votes.vote_id(user_id),
+            "poll_id": poll["id"],
+            "user_id": user_id,
+            "choice": choice,
+            "question": poll["question"]
+        }
 
-        # Vérifier que l'utilisateur existe
-        try:
-            users_container.read_item(item=user_id, partition_key=user_id)
-        except exceptions.CosmosResourceNotFoundError:
+        # Écriture différée : le vote est déposé dans la file, écrit par flushVoteQueue
+        if vote_queue.WRITE_BEHIND:
+            with telemetry.phase('enqueue'):
+                await vote_queue.enqueue(vote_queue.vote_message(poll["id"], user_id, choice))
             return func.HttpResponse(
-                json.dumps({"error": "User not found"}),
+                serialization.dumps({"status": "accepted", "vote": vote}),
                 mimetype="application/json",
-                status_code=404
+                status_code=202
             )
 
-        # Vérifier si l'utilisateur a déjà voté
-        query = f"SELECT * FROM c WHERE c.user_id = '{user_id}'"
-        existing_votes = list(votes_container.query_items(query=query, enable_cross_partition_query=True))
-        
-        if existing_votes:
+        # Récupérer les containers depuis le pool partagé
+        users_container, votes_container = await asyncio.gather(
+            cosmos_pool.get_container(USERS_CONTAINER),
+            cosmos_pool.get_container(VOTES_CONTAINER)
+        )
+
+        # Vérifier que l'utilisateur existe (lecture ponctuelle), sauf si un jeton signé l'atteste
+        if claims is None:
+            with telemetry.phase('user_check'):
+                user = await read_or_none(users_container, user_id, user_id)
+
+            if user is None:
+                return func.HttpResponse(
+                    serialization.dumps({"error": "User not found"}),
+                    mimetype="application/json",
+                    status_code=404
+                )
+
+        # Créer le vote : son identifiant dérive de l'utilisateur, un second vote au même sondage est refusé par Cosmos
+        pseudo = claims["pseudo"] if claims else user["pseudo"]
+        created_at = datetime.datetime.utcnow().isoformat()
+        vote_doc = votes.vote_document(poll["id"], user_id, choice, created_at, pseudo)
+
+        try:
+            with telemetry.phase('insert'):
+                await votes_container.create_item(body=vote_doc)
+        except exceptions.CosmosResourceExistsError:
             return func.HttpResponse(
-                json.dumps({"error": "User has already voted"}),
+                serialization.dumps({"error": "User has already voted"}),
                 mimetype="application/json",
                 status_code=409
             )
 
-        # Créer le vote
-        vote_id = str(uuid.uuid4())
-        vote_doc = {
-            "id": vote_id,
-            "user_id": user_id,
-            "choice": choice.lower(),
-            "question": "Est-ce que François Bayrou nous manque ?",
-            "created_at": datetime.datetime.utcnow().isoformat()
-        }
+        # Sans flux de modifications : compteur, historique et caches mis à jour ici (sinon par processChangeFeed)
+        if not change_feed.CHANGE_FEED:
+            # Mettre à jour le compteur et la minute du vote en parallèle (une dérive éventuelle est corrigée
+            # par la réconciliation et par scripts.rebuild_vote_rollups)
+            tallies_container, rollups_container = await asyncio.gather(
+                cosmos_pool.get_container(TALLIES_CONTAINER),
+                cosmos_pool.get_container(ROLLUPS_CONTAINER)
+            )
+            with telemetry.phase('tally'):
+                tally_error, rollup_error = await asyncio.gather(
+                    tally.record_vote(tallies_container, choice, tally_id=poll["id"]),
+                    rollups.record_votes(rollups_container, poll["id"], [vote_doc]),
+                    return_exceptions=True
+                )
+            if isinstance(tally_error, Exception):
+                logging.error(f"Error updating vote tally: {str(tally_error)}")
+            if isinstance(rollup_error, Exception):
+                logging.error(f"Error updating vote rollups: {str(rollup_error)}")
 
-        # Insérer le vote
-        votes_container.create_item(body=vote_doc)
+            # Les lectures en cache de ce worker ne reflètent plus les votes
+            votes_changed([poll["id"]])
 
         return func.HttpResponse(
-            json.dumps({
-                "status": "success",
-                "vote": {
-                    "id": vote_id,
-                    "user_id": user_id,
-                    "choice": choice.lower(),
-                    "question": "Est-ce que François Bayrou nous manque ?"
-                }
-            }),
+            serialization.dumps({"status": "success", "vote": vote}),
             mimetype="application/json",
             status_code=201
         )
 
     except Exception as e:
-        logging.error(f"Error submitting vote: {str(e)}")
+        return await error_response(e, "Error submitting vote")
+
+@app.route(route="votes/bulk", methods=["POST"], auth_level=func.AuthLevel.ADMIN)
+@telemetry.traced
+@resilience.guarded()
+async def submitVotesBulk(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint POST /votes/bulk important des votes au format NDJSON (un vote par ligne) dans un sondage, clé maître requise"""
+    logging.info('Processing POST /votes/bulk request')
+
+    # Corps reçu en entier par l'hôte Functions : taille et nombre de lignes plafonnés
+    body = req.get_body()
+    size_error = bulk.size_error(body)
+    if size_error:
+        return func.HttpResponse(
+            serialization.dumps({"error": size_error}),
+            mimetype="application/json",
+            status_code=413
+        )
+
+    try:
+        # Récupérer les containers depuis le pool partagé
+        votes_container, users_container, tallies_container, rollups_container = await asyncio.gather(
+            cosmos_pool.get_container(VOTES_CONTAINER),
+            cosmos_pool.get_container(USERS_CONTAINER),
+            cosmos_pool.get_container(TALLIES_CONTAINER),
+            cosmos_pool.get_container(ROLLUPS_CONTAINER)
+        )
+
+        poll = await get_poll(req.params.get('poll_id'))
+        if poll is None:
+            return poll_not_found()
+
+        # Flux de modifications : seuls les votes sont écrits ici
+        if change_feed.CHANGE_FEED:
+            tallies_container = rollups_container = None
+
+        results = await bulk.ingest_votes(
+            body, poll, votes_container, users_container, tallies_container, rollups_container
+        )
+
+        # Les lectures en cache de ce worker ne reflètent plus les votes
+        if not change_feed.CHANGE_FEED:
+            votes_changed([poll["id"]])
+
         return func.HttpResponse(
-            json.dumps({"error": "Internal server error"}),
+            serialization.dumps({"summary": bulk.summarize(results), "results": results}),
             mimetype="application/json",
-            status_code=500
+            status_code=200
         )
 
+    except Exception as e:
+        return await error_response(e, "Error importing votes")
+
 @app.route(route="votes", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
-def getVotes(req: func.HttpRequest) -> func.HttpResponse:
-    """Endpoint GET /votes retournant la liste des votes avec stats"""
+@telemetry.traced
+@resilience.guarded()
+async def getVotes(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint GET /votes retournant la liste des votes d'un sondage avec stats"""
     logging.info('Processing GET /votes request')
 
+    # Taille de page et curseur de pagination
+    try:
+        limit = int(req.params.get('limit', VOTES_DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= VOTES_MAX_LIMIT:
+        return func.HttpResponse(
+            serialization.dumps({"error": f"limit must be an integer between 1 and {VOTES_MAX_LIMIT}"}),
+            mimetype="application/json",
+            status_code=400
+        )
+    continuation = req.params.get('continuation') or None
+    poll_id = req.params.get('poll_id') or polls.DEFAULT_POLL_ID
+
+    # Format colonnes demandé par l'en-tête Accept
+    columnar = serialization.accepts_columnar(req.headers.get('Accept'))
+    mimetype = serialization.COLUMNAR_MEDIA_TYPE if columnar else serialization.JSON_MEDIA_TYPE
+
     try:
-        # Initialiser Cosmos DB
-        client = get_cosmos_client()
-        database = get_database(client)
-        votes_container = get_container(database, VOTES_CONTAINER, "/user_id")
-        users_container = get_container(database, USERS_CONTAINER, "/id")
+        # Première page servie depuis son instantané précompressé : une lecture de blob
+        use_snapshot = (snapshots.SNAPSHOTS_ENABLED and not columnar
+                        and continuation is None and limit == VOTES_DEFAULT_LIMIT)
+        if use_snapshot:
+            with telemetry.phase('snapshot'):
+                snapshot = await snapshots.read(poll_id, req.headers.get('Accept-Encoding'))
+            if snapshot is not None:
+                return snapshot_response(req, *snapshot)
 
-        # Récupérer tous les votes
-        votes_query = "SELECT * FROM c ORDER BY c.created_at DESC"
-        votes = list(votes_container.query_items(query=votes_query, enable_cross_partition_query=True))
+        # Réponse déjà calculée par ce worker il y a moins de quelques secondes
+        cache_key = ("votes", poll_id, limit, continuation, columnar)
+        entry = votes_cache.get(cache_key)
 
-        # Enrichir les votes avec les informations utilisateur
-        enriched_votes = []
-        stats = {"oui": 0, "non": 0, "total": 0}
+        if entry is None:
+            generation = votes_cache.generation
 
-        for vote in votes:
-            try:
-                # Récupérer les infos utilisateur
-                user = users_container.read_item(item=vote['user_id'], partition_key=vote['user_id'])
-                
-                enriched_vote = {
-                    "id": vote['id'],
-                    "user": {
-                        "id": vote['user_id'],
-                        "pseudo": user['pseudo']
-                    },
-                    "choice": vote['choice'],
-                    "question": vote['question'],
-                    "created_at": vote['created_at']
-                }
-                enriched_votes.append(enriched_vote)
-                
-                # Calculer les stats
-                if vote['choice'] == 'oui':
-                    stats["oui"] += 1
-                elif vote['choice'] == 'non':
-                    stats["non"] += 1
-                stats["total"] += 1
-                
-            except exceptions.CosmosResourceNotFoundError:
-                # Si l'utilisateur n'existe plus, on garde le vote mais sans les infos utilisateur
-                enriched_vote = {
-                    "id": vote['id'],
-                    "user": {
-                        "id": vote['user_id'],
-                        "pseudo": "Utilisateur supprimé"
-                    },
-                    "choice": vote['choice'],
-                    "question": vote['question'],
-                    "created_at": vote['created_at']
-                }
-                enriched_votes.append(enriched_vote)
-                stats["total"] += 1
-
-        # Calculer les pourcentages
-        if stats["total"] > 0:
-            stats["oui_percentage"] = round((stats["oui"] / stats["total"]) * 100, 1)
-            stats["non_percentage"] = round((stats["non"] / stats["total"]) * 100, 1)
-        else:
-            stats["oui_percentage"] = 0
-            stats["non_percentage"] = 0
+            poll = await get_poll(poll_id)
+            if poll is None:
+                return poll_not_found()
+
+            body, _ = await render_votes_page(poll, limit, continuation, columnar)
+            entry = votes_cache.set(cache_key, body, generation)
+
+            # Pas encore d'instantané pour ce sondage : le calculer pour les lecteurs suivants
+            if use_snapshot:
+                schedule_snapshot(poll["id"])
+
+        return cached_json_response(req, entry, mimetype, vary="Accept")
+
+    except exceptions.CosmosHttpResponseError as e:
+        if e.status_code == 400 and continuation:
+            return func.HttpResponse(
+                serialization.dumps({"error": "Invalid continuation token"}),
+                mimetype="application/json",
+                status_code=400
+            )
+        return await error_response(e, "Error getting votes")
+
+    except Exception as e:
+        return await error_response(e, "Error getting votes")
+
+@app.route(route="votes/stats", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@telemetry.traced
+@resilience.guarded()
+async def getVoteStats(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint GET /votes/stats retournant les statistiques d'un sondage depuis son compteur matérialisé"""
+    logging.info('Processing GET /votes/stats request')
 
+    poll_id = req.params.get('poll_id') or polls.DEFAULT_POLL_ID
+
+    try:
+        entry = votes_cache.get(("stats", poll_id))
+
+        if entry is None:
+            generation = votes_cache.generation
+
+            poll = await get_poll(poll_id)
+            if poll is None:
+                return poll_not_found()
+
+            tallies_container = await cosmos_pool.get_container(TALLIES_CONTAINER)
+            votes_container = await cosmos_pool.get_container(VOTES_CONTAINER)
+            tally_doc = await tally.read_tally(tallies_container, votes_container, poll_id, poll["choices"])
+
+            body = serialization.dumps({
+                "stats": tally.compute_stats(tally_doc, poll["choices"]),
+                "poll_id": poll_id,
+                "question": poll["question"]
+            })
+            entry = votes_cache.set(("stats", poll_id), body, generation)
+
+        return cached_json_response(req, entry)
+
+    except Exception as e:
+        return await error_response(e, "Error getting vote stats")
+
+@app.route(route="votes/timeseries", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@telemetry.traced
+@resilience.guarded()
+async def getVoteTimeseries(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint GET /votes/timeseries retournant les votes d'un sondage par minute, heure ou jour"""
+    logging.info('Processing GET /votes/timeseries request')
+
+    granularity = req.params.get('bucket', 'hour')
+    since, until = req.params.get('since'), req.params.get('until')
+    try:
+        start, end = rollups.series_range(granularity, since, until)
+    except ValueError as e:
         return func.HttpResponse(
-            json.dumps({
-                "votes": enriched_votes,
-                "stats": stats,
-                "question": "Est-ce que François Bayrou nous manque ?"
-            }),
+            serialization.dumps({"error": str(e)}),
             mimetype="application/json",
-            status_code=200
+            status_code=400
         )
+    poll_id = req.params.get('poll_id') or polls.DEFAULT_POLL_ID
+
+    try:
+        cache_key = ("timeseries", poll_id, granularity, since, until)
+        entry = votes_cache.get(cache_key)
+
+        if entry is None:
+            generation = votes_cache.generation
+
+            poll = await get_poll(poll_id)
+            if poll is None:
+                return poll_not_found()
+
+            # Lecture des tranches agrégées : un document par tranche, quel que soit le nombre de votes
+            with telemetry.phase('rollups'):
+                series = await rollups.timeseries(
+                    await cosmos_pool.get_container(ROLLUPS_CONTAINER),
+                    poll_id, granularity, start, end, poll["choices"]
+                )
+
+            body = serialization.dumps({
+                "series": series,
+                "bucket": granularity,
+                "since": start.isoformat(),
+                "until": end.isoformat(),
+                "poll_id": poll_id,
+                "question": poll["question"]
+            })
+            entry = votes_cache.set(cache_key, body, generation)
+
+        return cached_json_response(req, entry)
 
     except Exception as e:
-        logging.error(f"Error getting votes: {str(e)}")
+        return await error_response(e, "Error getting vote timeseries")
+
+@app.route(route="votes/changes", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@telemetry.traced
+@resilience.guarded(max_concurrency=vote_feed.FEED_MAX_CLIENTS)
+async def getVoteChanges(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint GET /votes/changes (long-poll) retournant les votes d'un sondage postérieurs au curseur `since`"""
+    logging.info('Processing GET /votes/changes request')
+
+    # Curseur du client (absent : renvoyer le curseur courant) et durée d'attente maximum
+    since = req.params.get('since')
+    try:
+        wait = float(req.params.get('wait', vote_feed.FEED_MAX_WAIT))
+        # `nan` traverserait min/max et l'attente ne finirait jamais
+        if not math.isfinite(wait):
+            raise ValueError(wait)
+        wait = min(max(wait, 0), vote_feed.FEED_MAX_WAIT)
+    except ValueError:
         return func.HttpResponse(
-            json.dumps({"error": "Internal server error"}),
+            serialization.dumps({"error": "wait must be a number of seconds"}),
             mimetype="application/json",
-            status_code=500
+            status_code=400
         )
 
+    try:
+        # Récupérer les containers depuis le pool partagé
+        votes_container, users_container, tallies_container = await asyncio.gather(
+            cosmos_pool.get_container(VOTES_CONTAINER),
+            cosmos_pool.get_container(USERS_CONTAINER),
+            cosmos_pool.get_container(TALLIES_CONTAINER)
+        )
+
+        poll = await get_poll(req.params.get('poll_id'))
+        if poll is None:
+            return poll_not_found()
+
+        feed = vote_feed.feeds.get(poll)
+        deadline = time.monotonic() + wait
+        changes = []
+
+        # Attendre de nouveaux votes, en partageant les rafraîchissements entre clients du worker
+        while True:
+            await feed.refresh(votes_container, users_container, tallies_container)
+            if since is None:
+                break
+
+            changes = feed.changes_since(since)
+            if changes is None:
+                # Client trop en retard pour le tampon : lecture directe
+                changes = await vote_feed.fetch_since(votes_container, users_container, poll, since)
+
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                break
+            await feed.wait(min(remaining, feed.poll_interval))
+
+        cursor = changes[-1]['created_at'] if changes else (since if since is not None else feed.cursor)
+
+        return func.HttpResponse(
+            serialization.dumps({
+                "votes": changes,
+                "stats": feed.stats,
+                "cursor": cursor
+            }),
+            mimetype="application/json",
+            status_code=200,
+            headers={"Cache-Control": "no-store"}
+        )
+
+    except Exception as e:
+        return await error_response(e, "Error getting vote changes")
+
 @app.route(route="login", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
-def loginUser(req: func.HttpRequest) -> func.HttpResponse:
+@telemetry.traced
+@resilience.guarded()
+async def loginUser(req: func.HttpRequest) -> func.HttpResponse:
     """Endpoint POST /login pour connecter un utilisateur existant"""
     logging.info('Processing POST /login request')
 
+    if not auth_tokens.configured():
+        return auth_not_configured()
+
     try:
         # Récupérer les données JSON de la requête
         req_body = req.get_json()
         if not req_body:
             return func.HttpResponse(
-                json.dumps({"error": "Request body is required"}),
+                serialization.dumps({"error": "Request body is required"}),
                 mimetype="application/json",
                 status_code=400
             )
@@ -315,66 +824,247 @@ def loginUser(req: func.HttpRequest) -> func.HttpResponse:
         email = req_body.get('email')
         password = req_body.get('password')
 
-        if not email or not password:
+        if not all(isinstance(value, str) and value for value in (email, password)):
             return func.HttpResponse(
-                json.dumps({"error": "Email and password are required"}),
+                serialization.dumps({"error": "Email and password are required"}),
                 mimetype="application/json",
                 status_code=400
             )
 
-        # Initialiser Cosmos DB
-        client = get_cosmos_client()
-        database = get_database(client)
-        users_container = get_container(database, USERS_CONTAINER, "/id")
+        # Récupérer les containers depuis le pool partagé
+        users_container, emails_container = await asyncio.gather(
+            cosmos_pool.get_container(USERS_CONTAINER),
+            cosmos_pool.get_container(EMAILS_CONTAINER)
+        )
+
+        # Chercher l'utilisateur par email : lecture de l'index puis de l'utilisateur
+        with telemetry.phase('lookup'):
+            user_id = await email_index.lookup_user_id(emails_container, users_container, email)
+            user = await read_or_none(users_container, user_id, user_id) if user_id else None
 
-        # Chercher l'utilisateur par email
-        query = f"SELECT * FROM c WHERE c.email = '{email}'"
-        users = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-        
-        if not users:
+        if user is None:
             return func.HttpResponse(
-                json.dumps({"error": "Invalid email or password"}),
+                serialization.dumps({"error": "Invalid email or password"}),
                 mimetype="application/json",
                 status_code=401
             )
 
-        user = users[0]  # Premier utilisateur trouvé
-        
         # Vérifier le mot de passe
         stored_password_hash = user.get('password_hash')
         
         if not stored_password_hash:
             return func.HttpResponse(
-                json.dumps({"error": "Invalid email or password"}),
+                serialization.dumps({"error": "Invalid email or password"}),
                 mimetype="application/json",
                 status_code=401
             )
         
-        # Vérifier le mot de passe
-        if not bcrypt.checkpw(password.encode('utf-8'), stored_password_hash.encode('utf-8')):
+        # Vérifier le mot de passe sur le pool bcrypt borné
+        with telemetry.phase('verify'):
+            valid = await password_hashing.hasher.verify_password(password, stored_password_hash)
+        if not valid:
             return func.HttpResponse(
-                json.dumps({"error": "Invalid email or password"}),
+                serialization.dumps({"error": "Invalid email or password"}),
                 mimetype="application/json",
                 status_code=401
             )
 
+        # Mettre à niveau le hachage si le coût configuré a changé
+        if password_hashing.hasher.needs_rehash(stored_password_hash):
+            try:
+                await users_container.patch_item(
+                    item=user['id'],
+                    partition_key=user['id'],
+                    patch_operations=[{
+                        "op": "set",
+                        "path": "/password_hash",
+                        "value": await password_hashing.hasher.hash_password(password)
+                    }]
+                )
+            except Exception as e:
+                logging.warning(f"Error upgrading password hash: {str(e)}")
+
         return func.HttpResponse(
-            json.dumps({
+            serialization.dumps({
                 "status": "success",
                 "user": {
                     "id": user['id'],
                     "pseudo": user['pseudo'],
                     "email": user['email']
-                }
+                },
+                "token": auth_tokens.issue(user)
             }),
             mimetype="application/json",
             status_code=200
         )
 
-    except Exception as e:
-        logging.error(f"Error logging in user: {str(e)}")
+    except password_hashing.HashingPoolSaturated:
+        logging.warning('Password hashing pool saturated')
         return func.HttpResponse(
-            json.dumps({"error": "Internal server error"}),
+            serialization.dumps({"error": "Service temporarily overloaded, please retry"}),
             mimetype="application/json",
-            status_code=500
-        )
\ No newline at end of file
+            status_code=503,
+            headers={"Retry-After": str(password_hashing.HASH_RETRY_AFTER)}
+        )
+
+    except Exception as e:
+        return await error_response(e, "Error logging in user")
+
+@app.route(route="health", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@telemetry.traced
+async def healthCheck(req: func.HttpRequest) -> func.HttpResponse:
+    """Endpoint GET /health vérifiant la connexion Cosmos DB du worker"""
+    health = await cosmos_pool.pool.health_check()
+
+    return func.HttpResponse(
+        serialization.dumps(health),
+        mimetype="application/json",
+        status_code=200 if health["status"] == "healthy" else 503
+    )
+
+
+@app.timer_trigger(schedule="0 0 * * * *", arg_name="timer", run_on_startup=False)
+async def reconcileTally(timer: func.TimerRequest) -> None:
+    """Tâche planifiée vérifiant le compteur de chaque sondage contre un recomptage complet"""
+    logging.info('Running vote tally reconciliation')
+
+    votes_container, tallies_container, polls_container = await asyncio.gather(
+        cosmos_pool.get_container(VOTES_CONTAINER),
+        cosmos_pool.get_container(TALLIES_CONTAINER),
+        cosmos_pool.get_container(POLLS_CONTAINER)
+    )
+
+    for poll in await polls.list_polls(polls_container):
+        # Un sondage en échec n'empêche pas la vérification des suivants
+        try:
+            result = await tally.reconcile(
+                votes_container,
+                tallies_container,
+                tally_id=poll["id"],
+                choices=poll["choices"],
+                fix=True
+            )
+        except Exception as e:
+            logging.error(f"Vote tally reconciliation failed for poll {poll['id']}: {str(e)}")
+            continue
+        if result["fixed"] and result["drift"]:
+            logging.warning(f"Vote tally drift corrected for poll {poll['id']}: {result['drift']}")
+        elif result["drift"]:
+            logging.info(f"Vote tally drift of poll {poll['id']} not confirmed, left for the next run: {result['drift']}")
+
+
+@app.timer_trigger(schedule="0 */15 * * * *", arg_name="timer", run_on_startup=False)
+async def compactVoteRollups(timer: func.TimerRequest) -> None:
+    """Tâche planifiée agrégeant l'historique des votes (minutes terminées en heures, heures en jours)"""
+    # Cosmos saturé : la compaction attend la fermeture du disjoncteur
+    if resilience.breaker.retry_after() is not None:
+        logging.warning('Vote rollups compaction skipped: Cosmos DB circuit breaker is open')
+        return
+
+    rollups_container, polls_container = await asyncio.gather(
+        cosmos_pool.get_container(ROLLUPS_CONTAINER),
+        cosmos_pool.get_container(POLLS_CONTAINER)
+    )
+
+    for poll in await polls.list_polls(polls_container):
+        result = await rollups.compact(rollups_container, poll["id"])
+        if any(result["folded"].values()) or result["purged"]:
+            logging.info(f"Vote rollups compacted: {result}")
+
+
+@app.timer_trigger(schedule=vote_queue.VOTE_FLUSH_SCHEDULE, arg_name="timer", run_on_startup=False)
+async def flushVoteQueue(timer: func.TimerRequest) -> None:
+    """Tâche planifiée écrivant dans Cosmos les votes en attente (écriture différée)"""
+    if not vote_queue.WRITE_BEHIND:
+        return
+
+    # Cosmos saturé : les votes restent dans la file (sans compter de remise) jusqu'à la fermeture du disjoncteur
+    if resilience.breaker.retry_after() is not None:
+        logging.warning('Vote queue flush skipped: Cosmos DB circuit breaker is open')
+        return
+
+    votes_container, users_container, tallies_container, rollups_container = await asyncio.gather(
+        cosmos_pool.get_container(VOTES_CONTAINER),
+        cosmos_pool.get_container(USERS_CONTAINER),
+        cosmos_pool.get_container(TALLIES_CONTAINER),
+        cosmos_pool.get_container(ROLLUPS_CONTAINER)
+    )
+
+    # Flux de modifications : seuls les votes sont écrits ici
+    if change_feed.CHANGE_FEED:
+        tallies_container = rollups_container = None
+
+    result = await vote_queue.drain(
+        votes_container,
+        users_container,
+        tallies_container,
+        time_budget=vote_queue.VOTE_FLUSH_TIME_BUDGET,
+        rollups_container=rollups_container
+    )
+    if result["received"]:
+        logging.info(f"Vote queue flushed: {result}")
+
+    # Les lectures en cache de ce worker ne reflètent plus les votes
+    if result["created"] and not change_feed.CHANGE_FEED:
+        votes_changed(result["polls"])
+
+
+@app.timer_trigger(schedule=change_feed.CHANGE_FEED_SCHEDULE, arg_name="timer", run_on_startup=False)
+async def processChangeFeed(timer: func.TimerRequest) -> None:
+    """Tâche planifiée mettant à jour les vues dérivées depuis le flux de modifications des votes et utilisateurs"""
+    if not change_feed.CHANGE_FEED:
+        return
+
+    # Cosmos saturé : les plages reprennent à leur dernier point de reprise après la fermeture du disjoncteur
+    if resilience.breaker.retry_after() is not None:
+        logging.warning('Change feed processing skipped: Cosmos DB circuit breaker is open')
+        return
+
+    votes_container, users_container, tallies_container, rollups_container, leases_container = await asyncio.gather(
+        cosmos_pool.get_container(VOTES_CONTAINER),
+        cosmos_pool.get_container(USERS_CONTAINER),
+        cosmos_pool.get_container(TALLIES_CONTAINER),
+        cosmos_pool.get_container(ROLLUPS_CONTAINER),
+        cosmos_pool.get_container(LEASES_CONTAINER)
+    )
+
+    async def project_votes(changes, lease):
+        poll_ids = await change_feed.project_votes(
+            changes, lease, tallies_container, rollups_container, leases_container
+        )
+        # Les lectures en cache de ce worker ne reflètent plus les votes
+        if poll_ids:
+            votes_changed(poll_ids)
+
+    async def propagate_pseudos(changes, lease):
+        await change_feed.propagate_pseudos(changes, lease['id'], votes_container)
+
+    results = await asyncio.gather(
+        change_feed.ChangeFeedProcessor('votes', project_votes).run(votes_container, leases_container),
+        change_feed.ChangeFeedProcessor('users', propagate_pseudos).run(users_container, leases_container)
+    )
+    for result in results:
+        if result["changes"]:
+            logging.info(f"Change feed processed: {result}")
+
+
+@app.timer_trigger(schedule=snapshots.VOTES_SNAPSHOT_SCHEDULE, arg_name="timer", run_on_startup=False)
+async def refreshVoteSnapshots(timer: func.TimerRequest) -> None:
+    """Tâche planifiée recalculant les instantanés dont le compteur a changé (votes des autres workers) ou bientôt expirés"""
+    if not snapshots.SNAPSHOTS_ENABLED or resilience.breaker.retry_after() is not None:
+        return
+
+    tallies_container = await cosmos_pool.get_container(TALLIES_CONTAINER)
+    for poll_id in await asyncio.to_thread(snapshots.snapshot_polls):
+        # Un sondage en échec n'empêche pas le rafraîchissement des suivants
+        try:
+            tally_doc = await read_or_none(tallies_container, poll_id, poll_id)
+            current_etag = tally_doc.get("_etag") if tally_doc else None
+            if not await asyncio.to_thread(snapshots.needs_refresh, poll_id, current_etag):
+                continue
+            body, tally_etag = await render_votes_snapshot(poll_id)
+            await snapshots.publish(poll_id, body, tally_etag)
+        except Exception as e:
+            logging.error(f"Votes snapshot refresh failed for poll {poll_id}: {str(e)}")
+            continue
+        logging.info(f"Votes snapshot of poll {poll_id} refreshed")
@@ -0,0 +1 @@
+"""Outils en ligne de commande pour l'exploitation de l'API Bayrou Meter"""
@@ -0,0 +1,46 @@
+"""
+Ajoute à l'index `emails` les utilisateurs créés avant son introduction.
+
+Usage (depuis le dossier api/) :
+    python -m scripts.backfill_email_index            # compte les utilisateurs absents de l'index
+    python -m scripts.backfill_email_index --apply    # complète l'index
+
+Une fois l'index complet, le repli sur une requête `users` peut être
+désactivé avec EMAIL_INDEX_LEGACY_FALLBACK=0.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from shared_code import cosmos_pool, email_index
+from shared_code.cosmos_pool import EMAILS_CONTAINER, USERS_CONTAINER
+
+
+async def run(apply):
+    """Complète l'index puis ferme le client Cosmos"""
+    try:
+        return await email_index.backfill(
+            await cosmos_pool.get_container(USERS_CONTAINER),
+            await cosmos_pool.get_container(EMAILS_CONTAINER),
+            apply=apply
+        )
+    finally:
+        await cosmos_pool.pool.reset()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remplissage de l'index des emails")
+    parser.add_argument('--apply', action='store_true', help="écrit les entrées manquantes au lieu de les compter")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.apply))
+    print(json.dumps(result, indent=2))
+
+    # Code de sortie non nul si des comptes partagent un même email normalisé
+    return 1 if result["conflicts"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Recopie le pseudo de leur auteur sur les votes écrits avant sa dénormalisation.
+
+Usage (depuis le dossier api/) :
+    python -m scripts.backfill_vote_pseudos                       # compte les votes sans pseudo
+    python -m scripts.backfill_vote_pseudos --apply               # complète les votes
+    python -m scripts.backfill_vote_pseudos --apply --ru-per-second 200
+    python -m scripts.backfill_vote_pseudos --apply --restart     # ignore le point de reprise
+
+Avec --apply, l'état est enregistré après chaque page dans le fichier de
+reprise (--checkpoint) : une exécution interrompue reprend là où elle s'était
+arrêtée. Le fichier est supprimé à la fin du parcours.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from shared_code import cosmos_pool, votes
+from shared_code.cosmos_pool import USERS_CONTAINER, VOTES_CONTAINER
+
+DEFAULT_CHECKPOINT = 'backfill_vote_pseudos.checkpoint.json'
+
+
+def load_checkpoint(path):
+    """État enregistré par une exécution interrompue, ou None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    """Enregistre l'état de façon atomique (fichier temporaire puis renommage)"""
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+async def run(apply, checkpoint_path, restart, ru_per_second):
+    """Complète les votes puis ferme le client Cosmos"""
+    checkpoint = None if restart or not apply else load_checkpoint(checkpoint_path)
+    try:
+        result = await votes.backfill_pseudos(
+            await cosmos_pool.get_container(VOTES_CONTAINER),
+            await cosmos_pool.get_container(USERS_CONTAINER),
+            apply=apply,
+            checkpoint=checkpoint,
+            save=(lambda state: save_checkpoint(checkpoint_path, state)) if apply else None,
+            ru_per_second=ru_per_second
+        )
+    finally:
+        await cosmos_pool.pool.reset()
+
+    if apply and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return {**result, "resumed": checkpoint is not None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remplissage des pseudos des votes")
+    parser.add_argument('--apply', action='store_true', help="écrit les pseudos au lieu de compter les votes")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="fichier de reprise")
+    parser.add_argument('--restart', action='store_true', help="ignore le fichier de reprise")
+    parser.add_argument('--ru-per-second', type=float, default=None, help="débit maximum de RU consommées")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.apply, args.checkpoint, args.restart, args.ru_per_second))
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
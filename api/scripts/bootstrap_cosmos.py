@@ -0,0 +1,40 @@
+"""
+Crée la base `BayrouMeterDB` et les containers de l'API s'ils n'existent pas.
+
+Usage (depuis le dossier api/) :
+    python -m scripts.bootstrap_cosmos
+
+À lancer une fois par déploiement (idempotent) : l'API ne crée plus la base
+ni les containers sur le chemin des requêtes, sauf avec
+COSMOS_AUTO_PROVISION=1.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from shared_code import cosmos_pool
+
+
+async def run():
+    """Crée la base et les containers puis ferme le client Cosmos"""
+    try:
+        return {
+            "database": cosmos_pool.DATABASE_NAME,
+            "containers": await cosmos_pool.pool.provision()
+        }
+    finally:
+        await cosmos_pool.pool.reset()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Création de la base et des containers Cosmos DB")
+    parser.parse_args(argv)
+
+    print(json.dumps(asyncio.run(run()), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
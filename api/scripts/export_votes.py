@@ -0,0 +1,77 @@
+"""
+Recompte les votes d'un sondage par choix et par jour, hors de l'API, et les exporte en colonnes.
+
+Le recomptage est comparé au compteur servi par l'API : code de sortie non
+nul en cas d'écart (voir `scripts.reconcile_tally --fix` pour le corriger).
+
+Usage (depuis le dossier api/) :
+    python -m scripts.export_votes                                  # recomptage du sondage historique
+    python -m scripts.export_votes --poll <id>                      # autre sondage
+    python -m scripts.export_votes --output votes.parquet           # export Parquet (pyarrow requis)
+    python -m scripts.export_votes --output votes.arrow --days      # export Arrow IPC, détail par jour
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from azure.cosmos import exceptions
+
+from shared_code import cosmos_pool, polls, vote_export
+from shared_code.cosmos_pool import POLLS_CONTAINER, TALLIES_CONTAINER, VOTES_CONTAINER
+
+
+async def run(poll_id, output, page_size):
+    """Lance le recomptage (et l'export), le compare au compteur puis ferme le client Cosmos"""
+    try:
+        poll = await polls.get_poll(await cosmos_pool.get_container(POLLS_CONTAINER), poll_id)
+        if poll is None:
+            raise SystemExit(f"Unknown poll: {poll_id}")
+        result = await vote_export.export_votes(
+            await cosmos_pool.get_container(VOTES_CONTAINER),
+            poll_id,
+            poll["choices"],
+            path=output,
+            page_size=page_size
+        )
+
+        tallies_container = await cosmos_pool.get_container(TALLIES_CONTAINER)
+        try:
+            tally = await tallies_container.read_item(item=poll_id, partition_key=poll_id)
+        except exceptions.CosmosResourceNotFoundError:
+            tally = {}
+        expected = {key: result["stats"][key] for key in list(poll["choices"]) + ["total"]}
+        result["drift"] = {key: value - tally.get(key, 0) for key, value in expected.items() if value != tally.get(key, 0)}
+        return result
+    finally:
+        await cosmos_pool.pool.reset()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recomptage et export en colonnes des votes")
+    parser.add_argument('--poll', default=polls.DEFAULT_POLL_ID, help="sondage à recompter")
+    parser.add_argument('--output', metavar='PATH', help="fichier d'export (.parquet, .arrow ou .ipc)")
+    parser.add_argument('--page-size', type=int, default=None, help="votes lus par page")
+    parser.add_argument('--days', action='store_true', help="affiche le détail par jour")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        if vote_export.pyarrow is None:
+            parser.error("pyarrow is required to write Parquet or Arrow files")
+        try:
+            vote_export.file_format(args.output)
+        except ValueError as e:
+            parser.error(str(e))
+
+    result = asyncio.run(run(args.poll, args.output, args.page_size))
+    if not args.days:
+        result.pop("days")
+    print(json.dumps(result, indent=2))
+
+    # Code de sortie non nul si le compteur s'écarte du recomptage
+    return 1 if result["drift"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Écrit dans Cosmos les votes en attente dans la file d'écriture différée.
+
+Usage (depuis le dossier api/) :
+    python -m scripts.flush_vote_queue                 # vide la file
+    python -m scripts.flush_vote_queue --count         # nombre de messages en file et en file poison
+
+La file est celle du worker : la file Azure Storage de VOTE_QUEUE_CONNECTION,
+sinon le fichier SQLite local (VOTE_QUEUE_PATH).
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from shared_code import cosmos_pool, vote_queue
+from shared_code.cosmos_pool import ROLLUPS_CONTAINER, TALLIES_CONTAINER, USERS_CONTAINER, VOTES_CONTAINER
+
+
+async def run():
+    """Vide la file puis ferme le client Cosmos"""
+    try:
+        return await vote_queue.drain(
+            await cosmos_pool.get_container(VOTES_CONTAINER),
+            await cosmos_pool.get_container(USERS_CONTAINER),
+            await cosmos_pool.get_container(TALLIES_CONTAINER),
+            rollups_container=await cosmos_pool.get_container(ROLLUPS_CONTAINER)
+        )
+    finally:
+        await cosmos_pool.pool.reset()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vidage de la file d'écriture différée des votes")
+    parser.add_argument('--count', action='store_true', help="affiche le nombre de messages sans vider la file")
+    args = parser.parse_args(argv)
+
+    if args.count:
+        print(json.dumps({"queued": vote_queue.queue.count(), "poison": vote_queue.queue.poison.count()}, indent=2))
+        return 0
+
+    result = asyncio.run(run())
+    print(json.dumps(result, indent=2))
+
+    # Code de sortie non nul si des votes restent en file
+    return 1 if result["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Recopie les votes de l'ancien container `votes` (partitionné par `/user_id`)
+dans le container `poll_votes` partitionné par sondage et par utilisateur.
+
+Usage (depuis le dossier api/) :
+    python -m scripts.migrate_votes_to_polls            # compte les votes à recopier
+    python -m scripts.migrate_votes_to_polls --apply    # recopie puis réaligne le compteur
+    python -m scripts.migrate_votes_to_polls --apply --restart   # ignore le point de reprise
+
+Les votes sont rattachés au sondage historique (`--poll` pour en choisir un
+autre). Avec --apply, l'état est enregistré après chaque page dans le
+fichier de reprise (--checkpoint) : une exécution interrompue reprend là où
+elle s'était arrêtée, et le fichier est supprimé à la fin du parcours. La
+migration peut être relancée : les votes déjà recopiés sont comptés comme
+doublons. L'ancien container est laissé intact et peut être supprimé une
+fois la migration vérifiée.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from scripts.backfill_vote_pseudos import load_checkpoint, save_checkpoint
+from shared_code import cosmos_pool, polls, tally, votes
+from shared_code.cosmos_pool import LEGACY_VOTES_CONTAINER, POLLS_CONTAINER, TALLIES_CONTAINER, VOTES_CONTAINER
+
+DEFAULT_CHECKPOINT = 'migrate_votes_to_polls.checkpoint.json'
+
+
+async def run(poll_id, apply, checkpoint_path, restart, ru_per_second):
+    """Lance la migration, réaligne le compteur du sondage puis ferme le client Cosmos"""
+    checkpoint = None if restart or not apply else load_checkpoint(checkpoint_path)
+    try:
+        poll = await polls.get_poll(await cosmos_pool.get_container(POLLS_CONTAINER), poll_id)
+        if poll is None:
+            raise SystemExit(f"Unknown poll: {poll_id}")
+
+        votes_container = await cosmos_pool.get_container(VOTES_CONTAINER)
+        result = await votes.migrate_to_polls(
+            await cosmos_pool.get_container(LEGACY_VOTES_CONTAINER),
+            votes_container,
+            poll_id=poll_id,
+            apply=apply,
+            checkpoint=checkpoint,
+            save=(lambda state: save_checkpoint(checkpoint_path, state)) if apply else None,
+            ru_per_second=ru_per_second
+        )
+        if apply:
+            reconciled = await tally.reconcile(
+                votes_container,
+                await cosmos_pool.get_container(TALLIES_CONTAINER),
+                tally_id=poll_id,
+                choices=poll["choices"],
+                fix=True
+            )
+            result["tally"] = reconciled["expected"]
+            # Écart non confirmé (votes reçus pendant la migration) : relancer scripts.reconcile_tally --fix
+            result["tally_fixed"] = reconciled["fixed"] or not reconciled["drift"]
+    finally:
+        await cosmos_pool.pool.reset()
+
+    if apply and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return {**result, "resumed": checkpoint is not None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migration des votes vers le container partitionné par sondage")
+    parser.add_argument('--poll', default=polls.DEFAULT_POLL_ID, help="sondage auquel rattacher les votes")
+    parser.add_argument('--apply', action='store_true', help="recopie les votes au lieu de les compter")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="fichier de reprise")
+    parser.add_argument('--restart', action='store_true', help="ignore le fichier de reprise")
+    parser.add_argument('--ru-per-second', type=float, default=None, help="débit maximum de RU consommées")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.poll, args.apply, args.checkpoint, args.restart, args.ru_per_second))
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
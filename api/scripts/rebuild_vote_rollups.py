@@ -0,0 +1,54 @@
+"""
+Reconstruit l'historique agrégé d'un sondage (`vote_rollups`) depuis ses votes.
+
+À lancer après la mise en place de l'historique (votes antérieurs), ou si les
+tranches ont dérivé (mise à jour perdue après une erreur). Les minutes sont
+recomptées depuis les votes ; la compaction suivante les agrège de nouveau.
+
+Usage (depuis le dossier api/) :
+    python -m scripts.rebuild_vote_rollups                  # compte les votes et minutes du sondage historique
+    python -m scripts.rebuild_vote_rollups --poll <id>      # autre sondage
+    python -m scripts.rebuild_vote_rollups --apply          # remplace les tranches puis les compacte
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from shared_code import cosmos_pool, polls, rollups
+from shared_code.cosmos_pool import POLLS_CONTAINER, ROLLUPS_CONTAINER, VOTES_CONTAINER
+
+
+async def run(poll_id, apply):
+    """Lance la reconstruction (puis la compaction) et ferme le client Cosmos"""
+    try:
+        poll = await polls.get_poll(await cosmos_pool.get_container(POLLS_CONTAINER), poll_id)
+        if poll is None:
+            raise SystemExit(f"Unknown poll: {poll_id}")
+        rollups_container = await cosmos_pool.get_container(ROLLUPS_CONTAINER)
+        result = await rollups.rebuild(
+            await cosmos_pool.get_container(VOTES_CONTAINER),
+            rollups_container,
+            poll_id,
+            apply=apply
+        )
+        if apply:
+            result["compaction"] = await rollups.compact(rollups_container, poll_id)
+        return result
+    finally:
+        await cosmos_pool.pool.reset()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruction de l'historique agrégé des votes")
+    parser.add_argument('--poll', default=polls.DEFAULT_POLL_ID, help="sondage à reconstruire")
+    parser.add_argument('--apply', action='store_true', help="remplace les tranches existantes")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(asyncio.run(run(args.poll, args.apply)), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
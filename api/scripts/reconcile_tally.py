@@ -0,0 +1,51 @@
+"""
+Vérifie le compteur d'un sondage contre un recomptage complet de ses votes.
+
+Usage (depuis le dossier api/) :
+    python -m scripts.reconcile_tally                  # vérification du sondage historique
+    python -m scripts.reconcile_tally --poll <id>      # vérification d'un autre sondage
+    python -m scripts.reconcile_tally --fix            # corrige le compteur en cas d'écart
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from shared_code import cosmos_pool, polls, tally
+from shared_code.cosmos_pool import POLLS_CONTAINER, TALLIES_CONTAINER, VOTES_CONTAINER
+
+
+async def run(poll_id, fix):
+    """Lance la réconciliation puis ferme le client Cosmos"""
+    try:
+        poll = await polls.get_poll(await cosmos_pool.get_container(POLLS_CONTAINER), poll_id)
+        if poll is None:
+            raise SystemExit(f"Unknown poll: {poll_id}")
+        return await tally.reconcile(
+            await cosmos_pool.get_container(VOTES_CONTAINER),
+            await cosmos_pool.get_container(TALLIES_CONTAINER),
+            tally_id=poll_id,
+            choices=poll["choices"],
+            fix=fix
+        )
+    finally:
+        await cosmos_pool.pool.reset()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Réconciliation du compteur de votes")
+    parser.add_argument('--poll', default=polls.DEFAULT_POLL_ID, help="sondage à vérifier")
+    parser.add_argument('--fix', action='store_true', help="corrige le compteur en cas d'écart")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.poll, args.fix))
+    result.pop("tally")
+    print(json.dumps(result, indent=2))
+
+    # Code de sortie non nul si un écart subsiste
+    return 1 if result["drift"] and not result["fixed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Code partagé entre les fonctions de l'API Bayrou Meter"""
@@ -0,0 +1,140 @@
+"""
+Jetons d'authentification signés (JWT HS256).
+
+`createUser` et `loginUser` délivrent un jeton qui porte l'identifiant et le
+pseudo de l'utilisateur, signé par HMAC-SHA256 avec AUTH_TOKEN_SECRET. Le
+jeton se suffit à lui-même : `POST /vote` le vérifie par un simple calcul de
+signature, sans lecture de l'utilisateur dans Cosmos.
+
+Un jeton reste valide jusqu'à son expiration (AUTH_TOKEN_TTL), même si
+l'utilisateur est supprimé entre-temps.
+
+AUTH_TOKEN_SECRET est obligatoire dans Azure : sans lui, aucun jeton n'est
+délivré ni accepté. L'absence de clé est journalisée au démarrage du worker
+(`check_configuration`) et les handlers la vérifient avant toute écriture
+(`configured`). Une clé aléatoire propre au worker n'est tirée qu'en dehors
+d'Azure ou avec `AZURE_FUNCTIONS_ENVIRONMENT=Development` (développement
+local, tests).
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+
+# Clé de signature partagée par tous les workers
+AUTH_TOKEN_SECRET = os.environ.get('AUTH_TOKEN_SECRET', '')
+
+# Durée de validité des jetons (secondes)
+AUTH_TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', '86400'))
+
+# POST /vote refuse les requêtes sans jeton (sinon `user_id` du corps, vérifié par lecture)
+AUTH_REQUIRE_TOKEN = os.environ.get('AUTH_REQUIRE_TOKEN', '0').lower() in ('1', 'true', 'yes')
+
+HEADER = {"alg": "HS256", "typ": "JWT"}
+
+_generated_secret = None
+
+
+class InvalidToken(ValueError):
+    """Jeton mal formé, mal signé ou expiré"""
+
+
+def _development():
+    """Exécution hors d'Azure (tests, scripts) ou sous Core Tools (`func start`)"""
+    return (not os.environ.get('WEBSITE_INSTANCE_ID')
+            or os.environ.get('AZURE_FUNCTIONS_ENVIRONMENT', '').lower() == 'development')
+
+
+def configured():
+    """Jetons utilisables : AUTH_TOKEN_SECRET défini, ou clé propre au worker en développement"""
+    return bool(AUTH_TOKEN_SECRET) or _development()
+
+
+def check_configuration():
+    """Vérification au démarrage du worker : l'absence de clé dans Azure est journalisée"""
+    if not configured():
+        logging.error("AUTH_TOKEN_SECRET is not set: signup, login and token votes are refused until it is configured")
+    return configured()
+
+
+def _secret():
+    """Clé de signature ; à défaut, en développement seulement, une clé aléatoire propre au worker"""
+    global _generated_secret
+    if AUTH_TOKEN_SECRET:
+        return AUTH_TOKEN_SECRET.encode('utf-8')
+    if not configured():
+        # Une clé par worker ferait échouer les jetons au hasard de l'instance qui les reçoit
+        raise RuntimeError("AUTH_TOKEN_SECRET must be set: refusing to sign or verify tokens with a per-worker key")
+    if _generated_secret is None:
+        logging.warning("AUTH_TOKEN_SECRET is not set: tokens are only valid on this worker")
+        _generated_secret = secrets.token_bytes(32)
+    return _generated_secret
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(segment):
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+
+def _sign(signing_input):
+    return _encode(hmac.new(_secret(), signing_input, hashlib.sha256).digest()).encode('ascii')
+
+
+def issue(user, ttl=None, now=None):
+    """Jeton signé d'un utilisateur (`id` et `pseudo`)"""
+    issued_at = int(now if now is not None else time.time())
+    claims = {
+        "sub": user["id"],
+        "pseudo": user["pseudo"],
+        "iat": issued_at,
+        "exp": issued_at + (ttl or AUTH_TOKEN_TTL)
+    }
+    signing_input = (
+        _encode(json.dumps(HEADER, separators=(',', ':')).encode('utf-8')) + '.'
+        + _encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    )
+    return f"{signing_input}.{_sign(signing_input.encode('ascii')).decode('ascii')}"
+
+
+def verify(token, now=None):
+    """Contenu d'un jeton valide (`sub`, `pseudo`, `iat`, `exp`) ; lève InvalidToken sinon"""
+    # Jeton reçu d'un client : ASCII obligatoire, signature comparée en octets
+    try:
+        header_segment, claims_segment, signature = token.encode('ascii').split(b'.')
+    except (AttributeError, UnicodeError, ValueError):
+        raise InvalidToken("Malformed token")
+
+    if not hmac.compare_digest(signature, _sign(header_segment + b'.' + claims_segment)):
+        raise InvalidToken("Invalid token signature")
+
+    try:
+        header = json.loads(_decode(header_segment))
+        claims = json.loads(_decode(claims_segment))
+    except ValueError:
+        raise InvalidToken("Malformed token")
+    if (not isinstance(header, dict) or header.get("alg") != HEADER["alg"]
+            or not isinstance(claims, dict) or not claims.get("sub")
+            or not isinstance(claims.get("exp", 0), (int, float))):
+        raise InvalidToken("Malformed token")
+
+    if claims.get("exp", 0) <= (now if now is not None else time.time()):
+        raise InvalidToken("Token expired")
+    return claims
+
+
+def bearer_token(authorization):
+    """Jeton d'un en-tête `Authorization: Bearer <jeton>`, ou None"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
@@ -0,0 +1,269 @@
+"""
+Import en masse de votes et d'utilisateurs au format NDJSON.
+
+L'hôte Functions transmet le corps en entier : il n'est pas lu en flux mais
+gardé en mémoire, d'où sa taille plafonnée (BULK_MAX_BYTES, BULK_MAX_ITEMS
+lignes). Il est ensuite parcouru ligne par ligne et traité par lots : chaque
+lot est validé en quelques requêtes groupées (utilisateurs existants, emails
+déjà pris), puis écrit par `create_item` simultanés dans une limite de
+concurrence. Chaque document a sa propre clé de partition (un vote par
+utilisateur et par sondage, un utilisateur par identifiant) : aucun lot
+transactionnel n'est possible. Chaque ligne reçoit son propre résultat
+(statut HTTP et identifiant ou erreur).
+"""
+
+import asyncio
+import datetime
+import io
+import itertools
+import json
+import logging
+import os
+import uuid
+
+from azure.cosmos import exceptions
+
+from shared_code import email_index, password_hashing, rollups, tally, user_join, votes
+
+# Lignes traitées par lot, taille et lignes acceptées par requête, écritures simultanées
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', '100'))
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', str(4 * 1024 * 1024)))
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '10000'))
+BULK_MAX_CONCURRENCY = int(os.environ.get('BULK_MAX_CONCURRENCY', '8'))
+
+
+def iter_ndjson(body):
+    """Parcourt un corps NDJSON déjà en mémoire, ligne par ligne : (ligne, objet, erreur)"""
+    for line_number, line in enumerate(io.BytesIO(body), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield line_number, None, "Invalid JSON"
+            continue
+        if not isinstance(item, dict):
+            yield line_number, None, "Each line must be a JSON object"
+            continue
+        yield line_number, item, None
+
+
+def count_items(body):
+    """Nombre de lignes non vides d'un corps NDJSON"""
+    return sum(1 for line in io.BytesIO(body) if line.strip())
+
+
+def size_error(body):
+    """Erreur si le corps dépasse BULK_MAX_BYTES octets ou BULK_MAX_ITEMS lignes ; None sinon"""
+    if len(body) > BULK_MAX_BYTES:
+        return f"At most {BULK_MAX_BYTES} bytes per request"
+    if count_items(body) > BULK_MAX_ITEMS:
+        return f"At most {BULK_MAX_ITEMS} lines per request"
+    return None
+
+
+def batches(iterable, size):
+    """Découpe un itérable en listes de `size` éléments au plus"""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def result(line, status, **fields):
+    """Résultat d'une ligne"""
+    return {"line": line, "status": status, **fields}
+
+
+def summarize(results):
+    """Nombre de lignes par statut"""
+    summary = {}
+    for item in results:
+        summary[str(item["status"])] = summary.get(str(item["status"]), 0) + 1
+    return summary
+
+
+async def _create(container, document, semaphore):
+    """Crée un document ; statut HTTP de l'écriture"""
+    async with semaphore:
+        try:
+            await container.create_item(body=document)
+        except exceptions.CosmosHttpResponseError as e:
+            return e.status_code
+    return 201
+
+
+async def create_many(container, documents, max_concurrency=None):
+    """Crée des documents par écritures simultanées (BULK_MAX_CONCURRENCY) ; retourne le statut HTTP de chacun"""
+    semaphore = asyncio.Semaphore(max_concurrency or BULK_MAX_CONCURRENCY)
+    return list(await asyncio.gather(*(_create(container, document, semaphore) for document in documents)))
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def _is_text(value):
+    """Chaîne non vide (les champs d'une ligne peuvent être de n'importe quel type JSON)"""
+    return isinstance(value, str) and value != ''
+
+
+async def ingest_votes(body, poll, votes_container, users_container, tallies_container, rollups_container=None):
+    """Importe des votes `{"user_id", "choice"}` dans un sondage ; un résultat par ligne.
+
+    La date d'un vote est celle de l'import : une ligne qui fournit `created_at` est refusée.
+    Sans `tallies_container` ni `rollups_container` (flux de modifications), seuls les votes sont écrits.
+    """
+    results = []
+    choices = poll['choices']
+    choice_error = f"user_id and choice ({', '.join(repr(choice) for choice in choices)}) are required"
+
+    for batch in batches(iter_ndjson(body), BULK_BATCH_SIZE):
+        candidates = []
+        seen = set()
+        for line, item, error in batch:
+            if error:
+                results.append(result(line, 400, error=error))
+                continue
+            user_id, choice = item.get('user_id'), item.get('choice')
+            if not _is_text(user_id) or not isinstance(choice, str) or choice.lower() not in choices:
+                results.append(result(line, 400, error=choice_error))
+                continue
+            if 'created_at' in item:
+                results.append(result(line, 400, error="created_at is set by the server"))
+                continue
+            choice = choice.lower()
+            if user_id in seen:
+                results.append(result(line, 409, error="User has already voted"))
+                continue
+            seen.add(user_id)
+            candidates.append((line, votes.vote_document(poll['id'], user_id, choice, _now())))
+
+        # Utilisateurs du lot (et leurs pseudos, recopiés sur les votes) résolus en quelques requêtes groupées
+        existing = await user_join.fetch_pseudos(users_container, [doc['user_id'] for _, doc in candidates])
+        accepted = []
+        for line, doc in candidates:
+            if doc['user_id'] in existing:
+                doc['pseudo'] = existing[doc['user_id']]
+                accepted.append((line, doc))
+            else:
+                results.append(result(line, 404, error="User not found"))
+
+        statuses = await create_many(votes_container, [doc for _, doc in accepted])
+
+        # Une seule mise à jour du compteur par lot
+        counts = dict.fromkeys(choices, 0)
+        created = []
+        for (line, doc), status in zip(accepted, statuses):
+            if status == 201:
+                counts[doc['choice']] += 1
+                created.append(doc)
+                results.append(result(line, 201, id=doc['id']))
+            else:
+                results.append(result(line, status, error="User has already voted" if status == 409 else "Write failed"))
+        if tallies_container is not None:
+            try:
+                await tally.record_votes(tallies_container, counts, tally_id=poll['id'])
+            except Exception as e:
+                # Une dérive éventuelle est corrigée par la réconciliation
+                logging.error(f"Error updating vote tally: {str(e)}")
+        if rollups_container is not None:
+            try:
+                await rollups.record_votes(rollups_container, poll['id'], created)
+            except Exception as e:
+                # Une dérive éventuelle est corrigée par scripts.rebuild_vote_rollups
+                logging.error(f"Error updating vote rollups: {str(e)}")
+
+    return sorted(results, key=lambda item: item["line"])
+
+
+async def _hash(item, semaphore):
+    """Hachage d'un mot de passe, hachage bcrypt fourni par l'import, ou None si le pool est saturé"""
+    if item.get('password_hash'):
+        return item['password_hash']
+    async with semaphore:
+        try:
+            return await password_hashing.hasher.hash_password(item['password'])
+        except password_hashing.HashingPoolSaturated:
+            return None
+
+
+async def ingest_users(body, users_container, emails_container):
+    """Importe des utilisateurs `{"pseudo", "email", "password" | "password_hash"}` ; un résultat par ligne"""
+    results = []
+    # Un hachage par thread du pool : l'import n'occupe pas la file d'attente des inscriptions
+    hash_slots = asyncio.Semaphore(max(1, password_hashing.HASH_WORKERS))
+
+    for batch in batches(iter_ndjson(body), BULK_BATCH_SIZE):
+        candidates = []
+        seen = set()
+        for line, item, error in batch:
+            if error:
+                results.append(result(line, 400, error=error))
+                continue
+            if not _is_text(item.get('pseudo')) or not _is_text(item.get('email')) or not (
+                _is_text(item.get('password')) or item.get('password_hash')
+            ):
+                results.append(result(line, 400, error="Pseudo, email and password are required"))
+                continue
+            if item.get('password_hash') is not None and not password_hashing.is_bcrypt_hash(item['password_hash']):
+                results.append(result(line, 400, error="password_hash must be a bcrypt hash"))
+                continue
+            key = email_index.email_key(item['email'])
+            if key in seen:
+                results.append(result(line, 409, error="Email already exists"))
+                continue
+            seen.add(key)
+            candidates.append((line, item))
+
+        # Réservation des emails du lot dans l'index
+        user_ids = [str(uuid.uuid4()) for _ in candidates]
+        reserved = await email_index.reserve_many(
+            emails_container, users_container,
+            [(item['email'], user_id) for (_, item), user_id in zip(candidates, user_ids)]
+        )
+
+        accepted = []
+        for (line, item), user_id, ok in zip(candidates, user_ids, reserved):
+            if ok:
+                accepted.append((line, item, user_id))
+            else:
+                results.append(result(line, 409, error="Email already exists"))
+
+        created = set()
+        try:
+            hashes = await asyncio.gather(*(_hash(item, hash_slots) for _, item, _ in accepted))
+            writable = []
+            for (line, item, user_id), password_hash in zip(accepted, hashes):
+                if password_hash is None:
+                    await email_index.release(emails_container, item['email'])
+                    results.append(result(line, 503, error="Service temporarily overloaded, please retry"))
+                    continue
+                writable.append((line, item, {
+                    "id": user_id,
+                    "pseudo": item['pseudo'],
+                    "email": item['email'],
+                    "password_hash": password_hash,
+                    "created_at": _now()
+                }))
+
+            statuses = await create_many(users_container, [doc for _, _, doc in writable])
+
+            for (line, item, doc), status in zip(writable, statuses):
+                if status == 201:
+                    created.add(doc['id'])
+                    results.append(result(line, 201, id=doc['id']))
+                else:
+                    # Compensation : l'email réservé est libéré
+                    await email_index.release(emails_container, item['email'])
+                    results.append(result(line, status, error="Write failed"))
+        except Exception:
+            # Erreur inattendue (hachage, écriture) : aucun email du lot ne reste réservé sans compte
+            await asyncio.gather(
+                *(email_index.release(emails_container, item['email'])
+                  for _, item, user_id in accepted if user_id not in created),
+                return_exceptions=True
+            )
+            raise
+
+    return sorted(results, key=lambda item: item["line"])
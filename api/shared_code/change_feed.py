@@ -0,0 +1,369 @@
+"""
+Vues dérivées mises à jour par le flux de modifications (change feed) Cosmos.
+
+Avec CHANGE_FEED=1, POST /vote (ainsi que l'import et l'écriture différée)
+n'écrit que le vote : le compteur, l'historique par minutes, les caches et
+instantanés sont mis à jour de façon asynchrone par la tâche planifiée
+`processChangeFeed`, qui lit les modifications des containers `poll_votes`
+et `users` :
+- chaque plage du flux (`read_feed_ranges`, une par partition physique) est
+  traitée en parallèle, sous un bail (container `leases`) qui mémorise son
+  point de reprise et le worker qui la traite : plusieurs workers se
+  répartissent les plages, un bail expiré est repris par un autre worker ;
+- le point de reprise n'avance qu'après le traitement du lot : un lot
+  interrompu est relu ;
+- les traitements sont idempotents : un document dérivé retient, par plage,
+  le `_lsn` du dernier changement appliqué, mis à jour dans la même écriture
+  conditionnelle (ETag), et un lot relu n'est pas compté deux fois.
+
+Le flux ne distingue pas une création d'une mise à jour, et un vote modifié
+(pseudo recopié) avant d'être lu n'y apparaît que sous sa version modifiée.
+Chaque vote est donc compté à sa première lecture, quelle que soit sa
+version : un marqueur (`counted.<sondage>.<vote>`, container `leases`), créé
+avant la mise à jour des vues, retient le bail et le `_lsn` du changement qui
+l'a compté. Le même changement relu (lot interrompu) est rejoué, puis écarté
+par `applied_lsn` ; une version ultérieure du vote est ignorée. Les votes
+créés avant la pose du bail de leur plage (`started_at`, départ `now`) sont
+déjà comptés par les vues. Un lot en échec, relu après la modification d'un
+de ses votes, peut laisser ce vote non compté jusqu'à la réconciliation du
+compteur. Les utilisateurs modifiés voient leur pseudo recopié sur leurs votes.
+
+Les marqueurs expirent après CHANGE_FEED_MARKER_TTL (champ `ttl`, le
+container `leases` étant créé avec une durée de vie par défaut de -1). Un
+vote est lu pour la première fois au plus tard deux retards de traitement
+après sa création ou la pose du bail : un vote lu plus de
+CHANGE_FEED_MARKER_TTL après la plus récente de ces deux dates est donc
+déjà compté, et ignoré sans marqueur, tant que le retard du flux reste
+inférieur à la moitié de cette durée.
+
+Le déclencheur `@app.cosmos_db_trigger` n'est pas utilisé :
+- il transmet les documents sans la plage ni le bail qui les a lus, alors que
+  l'idempotence repose sur l'identifiant du bail (`applied_lsn`, marqueurs) ;
+- il continue à lire le flux pendant que le disjoncteur Cosmos est ouvert ;
+- il ne s'exécute que dans l'hôte Functions avec l'extension Cosmos DB, alors
+  que ce lecteur tourne aussi contre le Cosmos simulé des tests et benchmarks.
+"""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+from shared_code import rollups, user_join, votes
+
+# Vues dérivées mises à jour par le flux de modifications plutôt qu'à l'écriture
+CHANGE_FEED = os.environ.get('CHANGE_FEED', '0').lower() in ('1', 'true', 'yes')
+
+# Lecture du flux toutes les 5 secondes ; désactivé, la tâche ne se réveille qu'une fois par heure
+CHANGE_FEED_SCHEDULE = "*/5 * * * * *" if CHANGE_FEED else "0 0 * * * *"
+
+# Changements lus par page, durée d'un bail, temps maximum d'une exécution de la tâche (secondes)
+CHANGE_FEED_BATCH_SIZE = int(os.environ.get('CHANGE_FEED_BATCH_SIZE', '100'))
+CHANGE_FEED_LEASE_SECONDS = int(os.environ.get('CHANGE_FEED_LEASE_SECONDS', '30'))
+CHANGE_FEED_TIME_BUDGET = float(os.environ.get('CHANGE_FEED_TIME_BUDGET', '4'))
+
+# Durée de vie des marqueurs de votes comptés (secondes), à garder au-delà du double du retard maximum du flux
+CHANGE_FEED_MARKER_TTL = int(os.environ.get('CHANGE_FEED_MARKER_TTL', str(7 * 24 * 3600)))
+
+# Point de départ d'une plage sans bail : `now` (vues déjà à jour) ou `beginning` (tout l'historique)
+CHANGE_FEED_START = os.environ.get('CHANGE_FEED_START', 'now').lower()
+
+# Nombre de tentatives en cas de mise à jour concurrente d'un document dérivé (HTTP 412)
+MAX_CONFLICT_RETRIES = 10
+
+# Identifiant de ce worker dans les baux
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class ProjectionConflictError(Exception):
+    """Le document dérivé n'a pas pu être mis à jour malgré les tentatives"""
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def range_key(feed_range):
+    """Identifiant stable d'une plage du flux (dont la représentation est opaque)"""
+    return hashlib.sha1(json.dumps(feed_range, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def start_time():
+    """Point de départ d'une plage sans point de reprise, au format du SDK"""
+    return 'Beginning' if CHANGE_FEED_START == 'beginning' else 'Now'
+
+
+async def apply_once(container, doc_id, partition_key, source, changes, update, new_document):
+    """Applique `update(doc, changes)` aux seuls changements de la plage `source` pas encore reçus.
+
+    Le document retient le `_lsn` du dernier changement appliqué de chaque
+    plage (`applied_lsn`), écrit avec le résultat par une écriture
+    conditionnelle (ETag) : un lot relu après une reprise est ignoré. Le
+    document est créé par `new_document()` s'il n'existe pas.
+    """
+    for attempt in range(MAX_CONFLICT_RETRIES):
+        try:
+            current = await container.read_item(item=doc_id, partition_key=partition_key)
+        except exceptions.CosmosResourceNotFoundError:
+            current = None
+
+        doc = current if current is not None else new_document()
+        applied = doc.get("applied_lsn", {}).get(source, 0)
+        fresh = [change for change in changes if change['_lsn'] > applied]
+        if not fresh:
+            return current
+        update(doc, fresh)
+        doc.setdefault("applied_lsn", {})[source] = max(change['_lsn'] for change in fresh)
+        doc["updated_at"] = _now()
+
+        try:
+            if current is None:
+                return await container.create_item(body=doc)
+            return await container.replace_item(
+                item=doc_id,
+                body=doc,
+                etag=current['_etag'],
+                match_condition=MatchConditions.IfNotModified
+            )
+        except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceExistsError):
+            # Document modifié par une autre plage : petite attente aléatoire puis nouvel essai
+            await asyncio.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+
+    raise ProjectionConflictError(f"Could not apply changes to {doc_id}")
+
+
+def marker_id(vote):
+    """Identifiant du marqueur d'un vote compté (l'identifiant d'un vote n'est unique que dans son sondage)"""
+    return f"counted.{vote['poll_id']}.{vote['id']}"
+
+
+async def _claim(markers_container, vote, source):
+    """Réserve le comptage d'un vote pour ce changement ; False si un autre changement l'a déjà compté"""
+    claim = {"source": source, "lsn": vote['_lsn']}
+    try:
+        await markers_container.create_item(body={
+            "id": marker_id(vote), **claim, "created_at": _now(), "ttl": CHANGE_FEED_MARKER_TTL
+        })
+        return True
+    except exceptions.CosmosResourceExistsError:
+        marker = await markers_container.read_item(item=marker_id(vote), partition_key=marker_id(vote))
+    # Même changement relu après un lot interrompu : `apply_once` écarte ce qui a déjà été appliqué
+    return {"source": marker.get("source"), "lsn": marker.get("lsn")} == claim
+
+
+async def first_deliveries(markers_container, changes, lease, now=None):
+    """Votes du lot lus pour la première fois par la plage de `lease`.
+
+    Sont écartés sans marqueur les votes créés avant `lease['started_at']`
+    (départ `now`) et ceux dont la création et la pose du bail datent de plus
+    de CHANGE_FEED_MARKER_TTL, dont le marqueur a pu expirer.
+    """
+    started_at = lease.get('started_at') or ''
+    counted_before = ((now or datetime.datetime.utcnow()) - datetime.timedelta(seconds=CHANGE_FEED_MARKER_TTL)).isoformat()
+    candidates = [
+        change for change in changes
+        if 'choice' in change and change['created_at'] >= started_at
+        and max(change['created_at'], lease.get('created_at') or '') >= counted_before
+    ]
+    claimed = await asyncio.gather(*(_claim(markers_container, change, lease['id']) for change in candidates))
+    return [change for change, first in zip(candidates, claimed) if first]
+
+
+def _by(changes, key):
+    groups = {}
+    for change in changes:
+        groups.setdefault(key(change), []).append(change)
+    return groups
+
+
+def _add_votes(target, changes):
+    for change in changes:
+        target[change['choice']] = target.get(change['choice'], 0) + 1
+        target["total"] = target.get("total", 0) + 1
+
+
+async def project_tallies(tallies_container, changes, source):
+    """Ajoute les votes au compteur de leur sondage (une écriture par sondage)"""
+    await asyncio.gather(*(
+        apply_once(
+            tallies_container, poll_id, poll_id, source, poll_votes,
+            _add_votes,
+            lambda poll_id=poll_id: {"id": poll_id}
+        )
+        for poll_id, poll_votes in _by(changes, lambda change: change['poll_id']).items()
+    ))
+
+
+async def project_rollups(rollups_container, changes, source):
+    """Ajoute les votes à la minute de leur date de création (une écriture par minute)"""
+    groups = _by(
+        changes,
+        lambda change: (change['poll_id'], rollups.bucket_start(change['created_at']))
+    )
+    await asyncio.gather(*(
+        apply_once(
+            rollups_container, rollups.rollup_id('minute', start), poll_id, source, minute_votes,
+            lambda doc, fresh: _add_votes(doc["counts"], fresh),
+            lambda poll_id=poll_id, start=start: rollups.rollup_document(poll_id, 'minute', start, {})
+        )
+        for (poll_id, start), minute_votes in groups.items()
+    ))
+
+
+async def project_votes(changes, lease, tallies_container, rollups_container, markers_container, now=None):
+    """Met à jour compteurs et historique des votes lus pour la première fois ; retourne les sondages concernés"""
+    source = lease['id']
+    fresh = await first_deliveries(markers_container, changes, lease, now)
+    await asyncio.gather(
+        project_tallies(tallies_container, fresh, source),
+        project_rollups(rollups_container, fresh, source)
+    )
+    return sorted({change['poll_id'] for change in fresh})
+
+
+async def propagate_pseudos(changes, source, votes_container):
+    """Recopie le pseudo des utilisateurs modifiés sur leurs votes qui portent un autre pseudo"""
+    pseudos = {user['id']: user.get('pseudo') for user in changes if 'id' in user}
+    stale = []
+    for ids in user_join.chunked(list(pseudos), user_join.JOIN_CHUNK_SIZE):
+        rows = votes_container.query_items(
+            query="SELECT c.id, c.poll_id, c.user_id, c.pseudo FROM c WHERE ARRAY_CONTAINS(@ids, c.user_id)",
+            parameters=[{"name": "@ids", "value": ids}],
+            enable_cross_partition_query=True
+        )
+        stale.extend([row async for row in rows if row.get('pseudo') != pseudos[row['user_id']]])
+
+    budget = votes.RequestUnitBudget(None)
+    semaphore = asyncio.Semaphore(votes.BACKFILL_MAX_CONCURRENCY)
+    patched = await asyncio.gather(*(
+        votes.patch_pseudo(votes_container, row, pseudos[row['user_id']], budget, semaphore)
+        for row in stale
+    ))
+    return sum(patched)
+
+
+class ChangeFeedProcessor:
+    """Lecteur du flux de modifications d'un container, plage par plage, sous bail.
+
+    `handler(changes, lease)` reçoit chaque lot de changements d'une plage
+    avec son bail (`lease['id']` identifie la plage, `lease['created_at']` la
+    pose du bail et `lease['started_at']` le début de sa lecture avec un
+    départ `now`) et doit être idempotent : un lot
+    dont le point de reprise n'a pas été enregistré est relu.
+    """
+
+    def __init__(self, name, handler, batch_size=None, lease_seconds=None, worker_id=None, clock=time.time):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size or CHANGE_FEED_BATCH_SIZE
+        self.lease_seconds = lease_seconds or CHANGE_FEED_LEASE_SECONDS
+        self.worker_id = worker_id or WORKER_ID
+        self._clock = clock
+
+    def lease_id(self, feed_range):
+        return f"{self.name}.{range_key(feed_range)}"
+
+    async def _write_lease(self, leases, lease, **changes):
+        """Réécrit le bail s'il n'a pas changé depuis sa lecture ; None s'il a été pris par un autre worker"""
+        body = {**lease, **changes, "updated_at": _now()}
+        try:
+            return await leases.replace_item(
+                item=lease['id'],
+                body=body,
+                etag=lease['_etag'],
+                match_condition=MatchConditions.IfNotModified
+            )
+        except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceNotFoundError):
+            return None
+
+    async def acquire(self, leases, feed_range):
+        """Prend le bail d'une plage s'il est libre, expiré ou déjà à ce worker ; None sinon"""
+        lease_id = self.lease_id(feed_range)
+        expires_at = self._clock() + self.lease_seconds
+        try:
+            lease = await leases.read_item(item=lease_id, partition_key=lease_id)
+        except exceptions.CosmosResourceNotFoundError:
+            try:
+                return await leases.create_item(body={
+                    "id": lease_id,
+                    "processor": self.name,
+                    "feed_range": feed_range,
+                    "continuation": None,
+                    "created_at": _now(),
+                    "started_at": _now() if start_time() == 'Now' else None,
+                    "owner": self.worker_id,
+                    "expires_at": expires_at,
+                    "updated_at": _now()
+                })
+            except exceptions.CosmosResourceExistsError:
+                return None
+
+        if lease.get("owner") not in (None, self.worker_id) and lease.get("expires_at", 0) > self._clock():
+            return None
+        return await self._write_lease(leases, lease, owner=self.worker_id, expires_at=expires_at)
+
+    async def _read_batch(self, source, lease):
+        """Lit une page de changements depuis le point de reprise du bail ; (changements, nouveau point)"""
+        if lease.get("continuation"):
+            options = {"continuation": lease["continuation"]}
+        else:
+            options = {"feed_range": lease["feed_range"], "start_time": start_time()}
+        pages = source.query_items_change_feed(max_item_count=self.batch_size, **options).by_page()
+        try:
+            page = await pages.__anext__()
+            changes = [change async for change in page]
+        except StopAsyncIteration:
+            changes = []
+        return changes, pages.continuation_token or lease.get("continuation")
+
+    async def _process_range(self, source, leases, feed_range, deadline, totals):
+        lease = await self.acquire(leases, feed_range)
+        if lease is None:
+            return
+        totals["leased"] += 1
+        try:
+            while True:
+                changes, continuation = await self._read_batch(source, lease)
+                if changes:
+                    await self.handler(changes, lease)
+                    totals["changes"] += len(changes)
+                if continuation != lease.get("continuation"):
+                    # Point de reprise enregistré après le traitement ; bail perdu : la plage est laissée
+                    lease = await self._write_lease(
+                        leases, lease, continuation=continuation, expires_at=self._clock() + self.lease_seconds
+                    )
+                    if lease is None:
+                        logging.warning(f"Change feed lease of {self.name} lost during processing")
+                        return
+                    totals["checkpoints"] += 1
+                if len(changes) < self.batch_size or time.monotonic() >= deadline:
+                    return
+        finally:
+            if lease is not None:
+                await self._write_lease(leases, lease, owner=None, expires_at=0)
+
+    async def run(self, source, leases, time_budget=None):
+        """Traite en parallèle les plages du flux de `source` jusqu'à épuisement ou `time_budget` (secondes)"""
+        deadline = time.monotonic() + (CHANGE_FEED_TIME_BUDGET if time_budget is None else time_budget)
+        feed_ranges = [feed_range async for feed_range in source.read_feed_ranges()]
+        totals = {"processor": self.name, "ranges": len(feed_ranges), "leased": 0, "changes": 0, "checkpoints": 0,
+                  "failed": 0}
+        outcomes = await asyncio.gather(
+            *(self._process_range(source, leases, feed_range, deadline, totals) for feed_range in feed_ranges),
+            return_exceptions=True
+        )
+        # Une plage en échec est relue depuis son dernier point de reprise à l'exécution suivante
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logging.error(f"Change feed processing of {self.name} failed: {str(outcome)}")
+                totals["failed"] += 1
+        return totals
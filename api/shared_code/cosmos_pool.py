@@ -0,0 +1,239 @@
+"""
+Pool de connexions Cosmos DB partagé entre les invocations d'un même worker.
+
+Le client asynchrone Cosmos (session HTTP, handshake TLS, métadonnées du
+compte) est créé une seule fois par processus puis réutilisé par tous les
+handlers. Les handles de containers sont mis en cache et recréés si le client
+est invalidé (clé tournée, endpoint injoignable...).
+
+Pour raccourcir les démarrages à froid, le client asynchrone (aiohttp et
+azure.cosmos.aio) n'est importé qu'à sa première utilisation, et la base et
+les containers ne sont pas créés sur le chemin des requêtes : ils le sont une
+fois par `python -m scripts.bootstrap_cosmos` au déploiement. Les handles
+sont alors obtenus sans aller-retour réseau. `COSMOS_AUTO_PROVISION=1`
+rétablit la création au premier accès (développement local).
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from azure.core.exceptions import ServiceRequestError
+from azure.cosmos import exceptions
+
+from shared_code import resilience, telemetry
+
+# Configuration Cosmos DB
+COSMOS_URL = os.environ.get('COSMOS_URL', '')
+COSMOS_KEY = os.environ.get('COSMOS_KEY', '')
+DATABASE_NAME = 'BayrouMeterDB'
+USERS_CONTAINER = 'users'
+VOTES_CONTAINER = 'poll_votes'
+TALLIES_CONTAINER = 'tallies'
+EMAILS_CONTAINER = 'emails'
+POLLS_CONTAINER = 'polls'
+ROLLUPS_CONTAINER = 'vote_rollups'
+LEASES_CONTAINER = 'leases'
+
+# Ancien container des votes, lu seulement par la migration vers `poll_votes`
+LEGACY_VOTES_CONTAINER = 'votes'
+
+# Clé de partition de chaque container utilisé par l'API (liste : clé hiérarchique)
+CONTAINERS = {
+    USERS_CONTAINER: '/id',
+    VOTES_CONTAINER: ['/poll_id', '/user_id'],
+    TALLIES_CONTAINER: '/id',
+    EMAILS_CONTAINER: '/id',
+    POLLS_CONTAINER: '/id',
+    ROLLUPS_CONTAINER: '/poll_id',
+    LEASES_CONTAINER: '/id',
+    LEGACY_VOTES_CONTAINER: '/user_id',
+}
+
+# Options de création propres à certains containers : expiration des documents selon leur champ `ttl`
+# (marqueurs du flux de modifications), sans durée de vie par défaut
+CONTAINER_OPTIONS = {
+    LEASES_CONTAINER: {"default_ttl": -1},
+}
+
+# Création de la base et des containers au premier accès (sinon : scripts.bootstrap_cosmos)
+AUTO_PROVISION = os.environ.get('COSMOS_AUTO_PROVISION', '0').lower() in ('1', 'true', 'yes')
+
+# Réglages de connexion (surchargeables par variables d'environnement)
+POOL_MAXSIZE = int(os.environ.get('COSMOS_POOL_MAXSIZE', '100'))
+POOL_PER_HOST = int(os.environ.get('COSMOS_POOL_PER_HOST', '0'))
+KEEPALIVE_TIMEOUT = float(os.environ.get('COSMOS_KEEPALIVE_TIMEOUT', '60'))
+CONNECTION_TIMEOUT = int(os.environ.get('COSMOS_CONNECTION_TIMEOUT', '10'))
+PREFERRED_LOCATIONS = [
+    location.strip()
+    for location in os.environ.get('COSMOS_PREFERRED_LOCATIONS', '').split(',')
+    if location.strip()
+]
+
+# Tentatives du SDK après un 429 (0 : rejouées par `resilience`, avec gigue et disjoncteur)
+SDK_THROTTLE_RETRIES = int(os.environ.get('COSMOS_SDK_THROTTLE_RETRIES', '0'))
+
+# Codes HTTP qui imposent de recréer le client (clé invalide ou révoquée)
+RESET_STATUS_CODES = {401, 403}
+
+
+def create_client():
+    """Crée un client Cosmos DB asynchrone avec un pool de connexions HTTP dimensionné"""
+    # Imports différés : le client asynchrone n'est chargé qu'au premier accès à Cosmos
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.cosmos.aio import CosmosClient
+    from azure.cosmos.documents import ConnectionPolicy, RetryOptions
+
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=POOL_MAXSIZE,
+            limit_per_host=POOL_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT
+        ),
+        cookie_jar=aiohttp.DummyCookieJar(),
+        auto_decompress=False,
+        trust_env=True
+    )
+
+    connection_policy = ConnectionPolicy()
+    connection_policy.RetryOptions = RetryOptions(max_retry_attempt_count=SDK_THROTTLE_RETRIES)
+
+    return CosmosClient(
+        COSMOS_URL,
+        COSMOS_KEY,
+        transport=AioHttpTransport(session=session, session_owner=True),
+        connection_policy=connection_policy,
+        connection_timeout=CONNECTION_TIMEOUT,
+        preferred_locations=PREFERRED_LOCATIONS or None
+    )
+
+
+def partition_key(path):
+    """Définition de la clé de partition d'un container (hiérarchique si plusieurs chemins)"""
+    from azure.cosmos import PartitionKey
+
+    if isinstance(path, list):
+        return PartitionKey(path=path, kind='MultiHash')
+    return PartitionKey(path=path)
+
+
+def should_reset(error):
+    """Indique si une erreur doit provoquer la recréation du client"""
+    if isinstance(error, exceptions.CosmosHttpResponseError):
+        return error.status_code in RESET_STATUS_CODES
+    return isinstance(error, ServiceRequestError)
+
+
+class CosmosPool:
+    """Registre paresseux du client Cosmos et des containers, partagé par le processus"""
+
+    def __init__(self, client_factory=None, auto_provision=None):
+        self._client_factory = client_factory or create_client
+        self._auto_provision = AUTO_PROVISION if auto_provision is None else auto_provision
+        self._lock = asyncio.Lock()
+        self._client = None
+        self._database = None
+        self._containers = {}
+
+    def get_client(self):
+        """Retourne le client partagé, créé au premier appel"""
+        if self._client is None:
+            logging.info('Creating shared Cosmos DB client')
+            self._client = self._client_factory()
+        return self._client
+
+    async def get_database(self):
+        """Retourne la base de données (créée si nécessaire en mode COSMOS_AUTO_PROVISION)"""
+        if self._database is None:
+            async with self._lock:
+                if self._database is None:
+                    with telemetry.phase('cosmos_init'):
+                        if self._auto_provision:
+                            self._database = await self.get_client().create_database_if_not_exists(DATABASE_NAME)
+                        else:
+                            self._database = self.get_client().get_database_client(DATABASE_NAME)
+        return self._database
+
+    async def get_container(self, container_name):
+        """Retourne le handle du container, résolu une fois par processus"""
+        container = self._containers.get(container_name)
+        if container is None:
+            database = await self.get_database()
+            async with self._lock:
+                container = self._containers.get(container_name)
+                if container is None:
+                    with telemetry.phase('cosmos_init'):
+                        if self._auto_provision:
+                            container = await database.create_container_if_not_exists(
+                                id=container_name,
+                                partition_key=partition_key(CONTAINERS[container_name]),
+                                **CONTAINER_OPTIONS.get(container_name, {})
+                            )
+                        else:
+                            container = database.get_container_client(container_name)
+                    container = self._containers[container_name] = resilience.ResilientContainer(
+                        telemetry.InstrumentedContainer(container)
+                    )
+        return container
+
+    async def provision(self):
+        """Crée la base et tous les containers s'ils n'existent pas (étape de déploiement)"""
+        database = await self.get_client().create_database_if_not_exists(DATABASE_NAME)
+        for container_name, path in CONTAINERS.items():
+            options = CONTAINER_OPTIONS.get(container_name, {})
+            container = await database.create_container_if_not_exists(
+                id=container_name, partition_key=partition_key(path), **options
+            )
+            if 'default_ttl' in options and 'defaultTtl' not in await container.read():
+                # Container créé avant l'activation de l'expiration de ses documents
+                await database.replace_container(container, partition_key=partition_key(path), **options)
+        return sorted(CONTAINERS)
+
+    async def reset(self):
+        """Oublie le client et les containers pour forcer leur recréation"""
+        client = self._client
+        self._client = None
+        self._database = None
+        self._containers = {}
+        if client is not None:
+            try:
+                await client.close()
+            except Exception as e:
+                logging.warning(f"Error closing Cosmos DB client: {str(e)}")
+
+    async def handle_error(self, error):
+        """Recrée les handles si l'erreur indique un client inutilisable"""
+        if should_reset(error):
+            logging.warning(f"Resetting Cosmos DB client after error: {str(error)}")
+            await self.reset()
+            return True
+        return False
+
+    async def health_check(self):
+        """Vérifie que le client partagé joint bien la base de données"""
+        start = time.perf_counter()
+        try:
+            await (await self.get_database()).read()
+        except Exception as e:
+            # Le détail (compte, requête) est journalisé, jamais renvoyé à l'appelant anonyme
+            logging.error(f"Cosmos DB health check failed: {str(e)}")
+            await self.handle_error(e)
+            return {"status": "unhealthy"}
+
+        return {
+            "status": "healthy",
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "containers": sorted(self._containers),
+            "circuit_breaker": resilience.breaker.state
+        }
+
+
+# Instance partagée par toutes les invocations du worker
+pool = CosmosPool()
+
+
+async def get_container(container_name):
+    """Raccourci vers le container du pool partagé"""
+    return await pool.get_container(container_name)
@@ -0,0 +1,167 @@
+"""
+Index des emails : container `emails` dont l'identifiant est l'email normalisé.
+
+Chaque document `{id: email normalisé, user_id}` pointe vers son utilisateur.
+La connexion se fait en deux lectures ponctuelles (email puis utilisateur) et
+l'unicité des emails à l'inscription est garantie par la clé primaire de
+l'index (409 à la création) au lieu d'une requête sur tout le container
+`users`.
+
+Les utilisateurs créés avant l'index y sont ajoutés par
+`scripts.backfill_email_index`, étape du déploiement. Le temps de ce
+remplissage seulement, EMAIL_INDEX_LEGACY_FALLBACK=1 ajoute une requête
+paramétrée sur tout `users` en repli (inscriptions, connexions inconnues).
+"""
+
+import asyncio
+import os
+from urllib.parse import quote
+
+from azure.cosmos import exceptions
+
+# Repli sur une requête `users` pour les comptes absents de l'index (avant son remplissage uniquement)
+LEGACY_FALLBACK = os.environ.get('EMAIL_INDEX_LEGACY_FALLBACK', '0').lower() in ('1', 'true', 'yes')
+
+LEGACY_QUERY = "SELECT c.id FROM c WHERE c.email = @email"
+LEGACY_MANY_QUERY = "SELECT c.email FROM c WHERE ARRAY_CONTAINS(@emails, c.email)"
+
+
+def normalize_email(email):
+    """Forme canonique d'un email (espaces retirés, minuscules)"""
+    return email.strip().lower()
+
+
+def email_key(email):
+    """Identifiant Cosmos de l'entrée d'index d'un email.
+
+    Les caractères interdits dans un id Cosmos (`/`, `\\`, `?`, `#`) sont
+    échappés en pourcentage.
+    """
+    return quote(normalize_email(email), safe="@.+-_!$&'*=^`{|}~")
+
+
+async def _legacy_user_id(users_container, email):
+    """Recherche un utilisateur absent de l'index par requête paramétrée"""
+    rows = users_container.query_items(
+        query=LEGACY_QUERY,
+        parameters=[{"name": "@email", "value": email}],
+        enable_cross_partition_query=True
+    )
+    async for row in rows:
+        return row['id']
+    return None
+
+
+async def reserve(emails_container, users_container, email, user_id):
+    """Réserve un email pour un utilisateur ; retourne False s'il est déjà pris"""
+    try:
+        await emails_container.create_item(body={
+            "id": email_key(email),
+            "email": normalize_email(email),
+            "user_id": user_id
+        })
+    except exceptions.CosmosResourceExistsError:
+        return False
+
+    # Compte antérieur à l'index portant déjà cet email
+    if LEGACY_FALLBACK and await _legacy_user_id(users_container, email):
+        await release(emails_container, email)
+        return False
+    return True
+
+
+async def reserve_many(emails_container, users_container, pairs):
+    """Réserve plusieurs emails `(email, user_id)` ; retourne pour chacun s'il a été réservé.
+
+    Les comptes antérieurs à l'index sont vérifiés par une seule requête pour
+    tout le lot.
+    """
+
+    async def _create(email, user_id):
+        try:
+            await emails_container.create_item(body={
+                "id": email_key(email),
+                "email": normalize_email(email),
+                "user_id": user_id
+            })
+            return True
+        except exceptions.CosmosResourceExistsError:
+            return False
+
+    reserved = list(await asyncio.gather(*(_create(email, user_id) for email, user_id in pairs)))
+
+    if LEGACY_FALLBACK and any(reserved):
+        candidates = [email for (email, _), ok in zip(pairs, reserved) if ok]
+        rows = users_container.query_items(
+            query=LEGACY_MANY_QUERY,
+            parameters=[{"name": "@emails", "value": candidates}],
+            enable_cross_partition_query=True
+        )
+        taken = {row['email'] async for row in rows}
+        for index, (email, _) in enumerate(pairs):
+            if reserved[index] and email in taken:
+                await release(emails_container, email)
+                reserved[index] = False
+
+    return reserved
+
+
+async def release(emails_container, email):
+    """Libère la réservation d'un email (compensation d'une inscription échouée)"""
+    try:
+        await emails_container.delete_item(item=email_key(email), partition_key=email_key(email))
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+
+
+async def lookup_user_id(emails_container, users_container, email):
+    """Identifiant de l'utilisateur propriétaire d'un email, ou None"""
+    key = email_key(email)
+    try:
+        entry = await emails_container.read_item(item=key, partition_key=key)
+        return entry['user_id']
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    if LEGACY_FALLBACK:
+        return await _legacy_user_id(users_container, email)
+    return None
+
+
+async def backfill(users_container, emails_container, apply=False):
+    """Ajoute à l'index les utilisateurs qui n'y figurent pas.
+
+    Les utilisateurs sont parcourus par date de création : si deux comptes
+    partagent le même email normalisé, le plus ancien garde l'entrée et les
+    autres sont signalés dans `conflicts`. Sans `apply`, se contente de compter.
+    """
+    rows = users_container.query_items(
+        query="SELECT c.id, c.email, c.created_at FROM c ORDER BY c.created_at ASC",
+        enable_cross_partition_query=True
+    )
+    result = {"users": 0, "indexed": 0, "missing": 0, "conflicts": [], "applied": apply}
+
+    async for user in rows:
+        if not user.get('email'):
+            continue
+        result["users"] += 1
+        key = email_key(user['email'])
+        try:
+            entry = await emails_container.read_item(item=key, partition_key=key)
+        except exceptions.CosmosResourceNotFoundError:
+            entry = None
+
+        if entry is not None:
+            if entry['user_id'] != user['id']:
+                result["conflicts"].append(user['id'])
+            continue
+
+        result["missing"] += 1
+        if apply:
+            await emails_container.create_item(body={
+                "id": key,
+                "email": normalize_email(user['email']),
+                "user_id": user['id']
+            })
+            result["indexed"] += 1
+
+    return result
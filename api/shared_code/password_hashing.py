@@ -0,0 +1,83 @@
+"""
+Hachage bcrypt sur un pool de threads borné.
+
+bcrypt libère le GIL pendant le calcul : les hachages et vérifications
+s'exécutent sur un pool de taille fixe, avec une limite de tâches en attente,
+et les handlers les attendent sans bloquer la boucle d'événements. Quand le
+pool est saturé, l'appel échoue immédiatement (HTTP 503) plutôt que
+d'affamer les autres routes.
+"""
+
+import asyncio
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# Facteur de coût bcrypt des nouveaux hachages
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+
+# Threads de hachage et nombre maximum de tâches en cours ou en attente
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '16'))
+
+# Délai suggéré aux clients (en-tête Retry-After) quand le pool est saturé
+HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', '1'))
+
+_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class HashingPoolSaturated(Exception):
+    """Le pool de hachage n'accepte plus de tâches"""
+
+
+def is_bcrypt_hash(value):
+    """Indique si une valeur a la forme d'un hachage bcrypt"""
+    return isinstance(value, str) and _COST_RE.match(value) is not None
+
+
+class PasswordHasher:
+    """Hache et vérifie les mots de passe sur un pool de threads borné"""
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(queue_limit)
+
+    def submit(self, fn, *args):
+        """Soumet une tâche au pool, ou lève HashingPoolSaturated s'il est plein"""
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolSaturated("Password hashing pool is saturated")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def hash_password(self, password):
+        """Hache un mot de passe avec le coût courant sans bloquer la boucle d'événements"""
+        return await asyncio.wrap_future(self.submit(self._hash, password))
+
+    async def verify_password(self, password, password_hash):
+        """Vérifie un mot de passe contre son hachage sans bloquer la boucle d'événements"""
+        return await asyncio.wrap_future(self.submit(self._verify, password, password_hash))
+
+    def needs_rehash(self, password_hash):
+        """Indique si un hachage a été calculé avec un autre coût que le coût courant"""
+        match = _COST_RE.match(password_hash)
+        return match is None or int(match.group(1)) != self.rounds
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    @staticmethod
+    def _verify(password, password_hash):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+# Pool partagé par toutes les invocations du worker
+hasher = PasswordHasher()
@@ -0,0 +1,135 @@
+"""
+Sondages : une question et ses choix par document du container `polls`.
+
+Un sondage est immuable une fois créé : chaque worker garde en mémoire les
+sondages déjà lus, si bien que la résolution d'un sondage ne coûte un point
+read qu'une fois par worker. Le sondage historique (`bayrou`) est créé à sa
+première lecture, ce qui garde les clients qui ne précisent pas de sondage
+fonctionnels.
+"""
+
+import asyncio
+import datetime
+import os
+import re
+import uuid
+
+from azure.cosmos import exceptions
+
+# Sondage historique, utilisé quand la requête ne précise pas de sondage
+DEFAULT_POLL_ID = 'bayrou'
+DEFAULT_QUESTION = "Est-ce que François Bayrou nous manque ?"
+DEFAULT_CHOICES = ('oui', 'non')
+
+# Limites d'un sondage créé par POST /polls
+POLL_MAX_CHOICES = int(os.environ.get('POLL_MAX_CHOICES', '10'))
+POLL_MAX_QUESTION_LENGTH = int(os.environ.get('POLL_MAX_QUESTION_LENGTH', '300'))
+
+# Un choix sert aussi de nom de champ dans le compteur du sondage
+CHOICE_RE = re.compile(r"^[^\W_][\w\- ]{0,49}$")
+RESERVED_CHOICES = {'id', 'total', 'updated_at'}
+
+LIST_QUERY = "SELECT c.id, c.question, c.choices, c.created_at FROM c ORDER BY c.created_at DESC"
+
+# Sondages déjà lus par ce worker, et lectures en cours (une seule par sondage)
+_polls = {}
+_loading = {}
+
+
+class InvalidPoll(ValueError):
+    """Question ou choix invalides"""
+
+
+def default_poll():
+    """Document du sondage historique"""
+    return {
+        "id": DEFAULT_POLL_ID,
+        "question": DEFAULT_QUESTION,
+        "choices": list(DEFAULT_CHOICES),
+        "created_at": "2025-01-01T00:00:00"
+    }
+
+
+def public(poll):
+    """Champs d'un sondage exposés par l'API (sans les champs système)"""
+    return {key: poll[key] for key in ("id", "question", "choices", "created_at")}
+
+
+def clear_cache():
+    """Oublie les sondages mémorisés par le worker"""
+    _polls.clear()
+    _loading.clear()
+
+
+def validate(question, choices=None):
+    """Normalise la question et les choix d'un nouveau sondage ; lève InvalidPoll"""
+    if not isinstance(question, str) or not question.strip():
+        raise InvalidPoll("question is required")
+    question = question.strip()
+    if len(question) > POLL_MAX_QUESTION_LENGTH:
+        raise InvalidPoll(f"question must be at most {POLL_MAX_QUESTION_LENGTH} characters")
+
+    if choices is None:
+        return question, list(DEFAULT_CHOICES)
+    if not isinstance(choices, list) or not all(isinstance(choice, str) for choice in choices):
+        raise InvalidPoll("choices must be a list of strings")
+    choices = [choice.strip().lower() for choice in choices]
+    if not 2 <= len(choices) <= POLL_MAX_CHOICES:
+        raise InvalidPoll(f"A poll needs between 2 and {POLL_MAX_CHOICES} choices")
+    if len(set(choices)) != len(choices):
+        raise InvalidPoll("choices must be distinct")
+    for choice in choices:
+        if not CHOICE_RE.match(choice) or choice in RESERVED_CHOICES:
+            raise InvalidPoll(f"Invalid choice: {choice!r}")
+    return question, choices
+
+
+async def _load(polls_container, poll_id):
+    """Lit le sondage (ou crée le sondage historique) et le mémorise"""
+    try:
+        poll = await polls_container.read_item(item=poll_id, partition_key=poll_id)
+    except exceptions.CosmosResourceNotFoundError:
+        if poll_id != DEFAULT_POLL_ID:
+            return None
+        # Sondage historique : créé à la première lecture
+        try:
+            poll = await polls_container.create_item(body=default_poll())
+        except exceptions.CosmosResourceExistsError:
+            poll = await polls_container.read_item(item=poll_id, partition_key=poll_id)
+
+    poll = _polls[poll_id] = public(poll)
+    return poll
+
+
+async def get_poll(polls_container, poll_id):
+    """Sondage `poll_id`, lu une fois par worker, ou None s'il n'existe pas"""
+    poll = _polls.get(poll_id)
+    if poll is not None:
+        return poll
+
+    # Les requêtes simultanées d'un worker froid partagent la même lecture
+    task = _loading.get(poll_id)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = _loading[poll_id] = asyncio.ensure_future(_load(polls_container, poll_id))
+        task.add_done_callback(lambda done: _loading.pop(poll_id, None) if _loading.get(poll_id) is done else None)
+    return await asyncio.shield(task)
+
+
+async def create_poll(polls_container, question, choices=None):
+    """Crée un sondage après validation (InvalidPoll si la question ou les choix sont invalides)"""
+    question, choices = validate(question, choices)
+    poll = await polls_container.create_item(body={
+        "id": str(uuid.uuid4()),
+        "question": question,
+        "choices": choices,
+        "created_at": datetime.datetime.utcnow().isoformat()
+    })
+    poll = _polls[poll["id"]] = public(poll)
+    return poll
+
+
+async def list_polls(polls_container):
+    """Tous les sondages, du plus récent au plus ancien, sondage historique compris"""
+    await get_poll(polls_container, DEFAULT_POLL_ID)
+    rows = polls_container.query_items(query=LIST_QUERY, enable_cross_partition_query=True)
+    return [poll async for poll in rows]
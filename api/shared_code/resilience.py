@@ -0,0 +1,377 @@
+"""
+Résilience face à la saturation de Cosmos DB.
+
+- Les appels des containers du pool sont rejoués après un 429 : le délai suit
+  l'indication `x-ms-retry-after-ms` de Cosmos (à défaut, un délai doublé à
+  chaque tentative), augmenté d'une gigue pour désynchroniser les requêtes du
+  worker. Une indication plus longue que COSMOS_THROTTLE_MAX_DELAY n'est pas
+  attendue : la requête échoue aussitôt (503) et le client est invité à
+  revenir plus tard. Le SDK ne rejoue plus lui-même les 429
+  (COSMOS_SDK_THROTTLE_RETRIES, voir `cosmos_pool`).
+- Un disjoncteur partagé par le worker s'ouvre après CIRCUIT_BREAKER_THRESHOLD
+  échecs de saturation consécutifs (429 persistant, 503, 408, erreur réseau).
+  Pendant CIRCUIT_BREAKER_OPEN_SECONDS, les handlers répondent immédiatement
+  503 avec Retry-After, sans solliciter Cosmos ; un seul appel d'essai passe
+  ensuite et referme le disjoncteur s'il aboutit.
+- Chaque handler HTTP décoré par `guarded` est borné en requêtes simultanées
+  et, si configuré, en débit (seau à jetons). Au-delà, la requête est refusée
+  immédiatement (503 ou 429, avec Retry-After) plutôt que d'ajouter de la
+  charge à un Cosmos déjà saturé.
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import os
+import random
+import time
+
+import azure.functions as func
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from azure.cosmos import exceptions
+
+from shared_code import serialization, telemetry
+
+# Tentatives après un 429, délai de base (secondes, doublé à chaque tentative) et délai maximum attendu
+THROTTLE_MAX_RETRIES = int(os.environ.get('COSMOS_THROTTLE_MAX_RETRIES', '3'))
+THROTTLE_BASE_DELAY = float(os.environ.get('COSMOS_THROTTLE_BASE_DELAY', '0.05'))
+THROTTLE_MAX_DELAY = float(os.environ.get('COSMOS_THROTTLE_MAX_DELAY', '2.0'))
+
+# Gigue ajoutée au délai (fraction du délai, tirée entre 0 et cette valeur)
+THROTTLE_JITTER = float(os.environ.get('COSMOS_THROTTLE_JITTER', '0.5'))
+
+# Échecs de saturation consécutifs qui ouvrent le disjoncteur, et durée d'ouverture (secondes)
+BREAKER_THRESHOLD = int(os.environ.get('CIRCUIT_BREAKER_THRESHOLD', '5'))
+BREAKER_OPEN_SECONDS = float(os.environ.get('CIRCUIT_BREAKER_OPEN_SECONDS', '5'))
+
+# Limites par défaut d'un handler : requêtes simultanées, débit (requêtes/s, 0 : illimité) et rafale
+ENDPOINT_MAX_CONCURRENCY = int(os.environ.get('ENDPOINT_MAX_CONCURRENCY', '64'))
+ENDPOINT_RATE_LIMIT = float(os.environ.get('ENDPOINT_RATE_LIMIT', '0'))
+ENDPOINT_RATE_BURST = int(os.environ.get('ENDPOINT_RATE_BURST', '0'))
+
+# Limites propres à certains handlers : "submitVote=32:100,getVotes=256" (simultanées[:débit])
+ENDPOINT_LIMITS = os.environ.get('ENDPOINT_LIMITS', '')
+
+THROTTLED = 429
+RETRY_AFTER_MS_HEADER = 'x-ms-retry-after-ms'
+
+# Codes HTTP de Cosmos qui traduisent une saturation (comptés par le disjoncteur)
+SATURATION_STATUS_CODES = {408, 429, 503}
+
+
+class CircuitOpen(Exception):
+    """Le disjoncteur est ouvert : Cosmos n'est pas sollicité"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Cosmos DB circuit breaker is open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def retry_after_hint(error):
+    """Délai demandé par Cosmos (secondes, `x-ms-retry-after-ms`), ou None"""
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return int(headers[RETRY_AFTER_MS_HEADER]) / 1000
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_throttled(error):
+    """Indique si une erreur est un 429 de Cosmos"""
+    return isinstance(error, exceptions.CosmosHttpResponseError) and error.status_code == THROTTLED
+
+
+def is_saturation(error):
+    """Indique si une erreur traduit une saturation de Cosmos plutôt qu'une réponse métier"""
+    if isinstance(error, exceptions.CosmosHttpResponseError):
+        return error.status_code in SATURATION_STATUS_CODES
+    return isinstance(error, (ServiceRequestError, ServiceResponseError, asyncio.TimeoutError))
+
+
+def throttle_delay(error, attempt, max_retries=None, rng=random):
+    """Délai avant de rejouer un appel limité (429), ou None s'il ne faut pas le rejouer"""
+    max_retries = THROTTLE_MAX_RETRIES if max_retries is None else max_retries
+    if not is_throttled(error) or attempt >= max_retries:
+        return None
+
+    hint = retry_after_hint(error)
+    if hint is not None and hint > THROTTLE_MAX_DELAY:
+        return None
+    delay = hint if hint is not None else min(THROTTLE_BASE_DELAY * 2 ** attempt, THROTTLE_MAX_DELAY)
+    # Jamais avant le délai demandé par Cosmos
+    return delay * (1 + rng.uniform(0, THROTTLE_JITTER))
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert, partagé par les appels Cosmos du worker"""
+
+    def __init__(self, threshold=None, open_seconds=None, clock=time.monotonic):
+        self.threshold = BREAKER_THRESHOLD if threshold is None else threshold
+        self.open_seconds = BREAKER_OPEN_SECONDS if open_seconds is None else open_seconds
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        return 'open' if self._clock() - self._opened_at < self.open_seconds else 'half-open'
+
+    def retry_after(self):
+        """Secondes avant la fermeture possible du disjoncteur, ou None s'il laisse passer les appels"""
+        if self._opened_at is None:
+            return None
+        remaining = self._opened_at + self.open_seconds - self._clock()
+        if remaining > 0:
+            return remaining
+        # Semi-ouvert : les appels attendent l'issue de l'appel d'essai
+        return self.open_seconds if self._probing else None
+
+    def acquire(self):
+        """Autorise un appel (True s'il s'agit de l'appel d'essai) ou lève CircuitOpen"""
+        retry_after = self.retry_after()
+        if retry_after is not None:
+            raise CircuitOpen(retry_after)
+        if self._opened_at is not None:
+            self._probing = True
+            return True
+        return False
+
+    def release(self, probe, outcome):
+        """Enregistre l'issue d'un appel : True (réponse de Cosmos), False (saturation), None (inconnue)"""
+        if probe:
+            self._probing = False
+        if outcome is True:
+            if self._opened_at is not None:
+                logging.info('Cosmos DB circuit breaker closed')
+            self._failures = 0
+            self._opened_at = None
+        elif outcome is False:
+            self._failures += 1
+            if probe or (self._opened_at is None and self._failures >= self.threshold):
+                logging.warning(f"Cosmos DB circuit breaker opened after {self._failures} saturation errors")
+                self._opened_at = self._clock()
+
+
+async def call(operation, circuit=None, max_retries=None, sleep=None):
+    """Exécute `operation()` (un appel Cosmos) derrière le disjoncteur, en rejouant les 429"""
+    circuit = circuit or breaker
+    sleep = sleep or asyncio.sleep
+    probe = circuit.acquire()
+    outcome = None
+    try:
+        attempt = 0
+        while True:
+            try:
+                result = await operation()
+            except Exception as error:
+                delay = throttle_delay(error, attempt, max_retries)
+                if delay is None:
+                    outcome = not is_saturation(error)
+                    raise
+                attempt += 1
+                telemetry.record_retry()
+                await sleep(delay)
+            else:
+                outcome = True
+                return result
+    finally:
+        circuit.release(probe, outcome)
+
+
+def unavailable_retry_after(error):
+    """Délai (secondes entières) à proposer au client si l'erreur traduit une saturation, sinon None"""
+    if isinstance(error, CircuitOpen):
+        seconds = error.retry_after
+    elif is_saturation(error):
+        seconds = retry_after_hint(error) or breaker.retry_after() or 1
+    else:
+        return None
+    return max(1, math.ceil(seconds))
+
+
+class _ResilientPageIterator:
+    """Itérateur de pages dont chaque page est lue derrière le disjoncteur"""
+
+    def __init__(self, pages):
+        self._pages = pages
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # Une page refusée par Cosmos n'avance pas le curseur : elle peut être relue
+        return await call(self._pages.__anext__)
+
+
+class _ResilientPaged:
+    """Résultat de requête lu page par page derrière le disjoncteur"""
+
+    def __init__(self, paged):
+        self._paged = paged
+
+    def by_page(self, continuation_token=None):
+        return _ResilientPageIterator(self._paged.by_page(continuation_token))
+
+    async def _iterate(self):
+        async for page in self.by_page():
+            async for item in page:
+                yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class ResilientContainer:
+    """Container dont chaque appel passe par `call` ; les autres attributs sont délégués"""
+
+    def __init__(self, container):
+        self._container = container
+
+    def __getattr__(self, name):
+        return getattr(self._container, name)
+
+    async def _call(self, operation, *args, **kwargs):
+        return await call(lambda: getattr(self._container, operation)(*args, **kwargs))
+
+    async def read_item(self, *args, **kwargs):
+        return await self._call('read_item', *args, **kwargs)
+
+    async def create_item(self, *args, **kwargs):
+        return await self._call('create_item', *args, **kwargs)
+
+    async def upsert_item(self, *args, **kwargs):
+        return await self._call('upsert_item', *args, **kwargs)
+
+    async def replace_item(self, *args, **kwargs):
+        return await self._call('replace_item', *args, **kwargs)
+
+    async def patch_item(self, *args, **kwargs):
+        return await self._call('patch_item', *args, **kwargs)
+
+    async def delete_item(self, *args, **kwargs):
+        return await self._call('delete_item', *args, **kwargs)
+
+    async def execute_item_batch(self, *args, **kwargs):
+        return await self._call('execute_item_batch', *args, **kwargs)
+
+    def query_items(self, *args, **kwargs):
+        return _ResilientPaged(self._container.query_items(*args, **kwargs))
+
+    def query_items_change_feed(self, *args, **kwargs):
+        return _ResilientPaged(self._container.query_items_change_feed(*args, **kwargs))
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `burst` en réserve"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst or math.ceil(rate))
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+
+    def take(self):
+        """Prend un jeton : 0 s'il y en avait un, sinon le délai avant le prochain (secondes)"""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+def parse_limits(value):
+    """Limites par handler de ENDPOINT_LIMITS : {nom: (simultanées, débit ou None)}"""
+    limits = {}
+    for entry in value.split(','):
+        name, _, spec = entry.partition('=')
+        if not name.strip() or not spec.strip():
+            continue
+        concurrency, _, rate = spec.partition(':')
+        limits[name.strip()] = (int(concurrency), float(rate) if rate.strip() else None)
+    return limits
+
+
+class EndpointGuard:
+    """Limites d'un handler : requêtes simultanées et débit"""
+
+    def __init__(self, name, max_concurrency, rate_per_second=0, burst=None, clock=time.monotonic):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.bucket = TokenBucket(rate_per_second, burst, clock) if rate_per_second else None
+
+    def admit(self):
+        """Réponse de refus (disjoncteur, débit ou simultanéité), ou None si la requête est admise"""
+        retry_after = breaker.retry_after()
+        if retry_after is not None:
+            return overloaded(retry_after)
+
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait:
+                logging.warning(f"{self.name}: rate limit exceeded")
+                return func.HttpResponse(
+                    serialization.dumps({"error": "Too many requests, please retry"}),
+                    mimetype="application/json",
+                    status_code=429,
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))}
+                )
+
+        if self.max_concurrency and self.active >= self.max_concurrency:
+            logging.warning(f"{self.name}: {self.active} requests in flight, request shed")
+            return overloaded(1)
+        return None
+
+
+def overloaded(retry_after):
+    """Réponse 503 invitant le client à revenir après `retry_after` secondes"""
+    return func.HttpResponse(
+        serialization.dumps({"error": "Service temporarily overloaded, please retry"}),
+        mimetype="application/json",
+        status_code=503,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def guarded(max_concurrency=None, rate_per_second=None, burst=None):
+    """Décorateur des handlers HTTP : disjoncteur, débit et simultanéité (ENDPOINT_LIMITS prioritaire)"""
+
+    def decorate(handler):
+        concurrency, rate = parse_limits(ENDPOINT_LIMITS).get(handler.__name__, (None, None))
+        guard = guards[handler.__name__] = EndpointGuard(
+            handler.__name__,
+            concurrency if concurrency is not None else max_concurrency or ENDPOINT_MAX_CONCURRENCY,
+            rate if rate is not None else rate_per_second or ENDPOINT_RATE_LIMIT,
+            burst or ENDPOINT_RATE_BURST or None
+        )
+
+        @functools.wraps(handler)
+        async def wrapper(req):
+            rejection = guard.admit()
+            if rejection is not None:
+                return rejection
+            guard.active += 1
+            try:
+                return await handler(req)
+            finally:
+                guard.active -= 1
+
+        return wrapper
+
+    return decorate
+
+
+# Disjoncteur partagé par toutes les invocations du worker, et limites de chaque handler
+breaker = CircuitBreaker()
+guards = {}
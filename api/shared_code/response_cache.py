@@ -0,0 +1,111 @@
+"""
+Cache de réponses en mémoire, à durée de vie courte, pour les lectures chaudes.
+
+Chaque entrée conserve le corps JSON déjà sérialisé et son ETag fort : des
+sondages identiques ne coûtent ni requête Cosmos ni sérialisation, et un client
+qui renvoie `If-None-Match` reçoit un 304 sans corps. Le cache est vidé par
+les écritures du worker ; le TTL borne le retard sur les écritures des autres
+workers.
+
+Les clés dépendent de paramètres choisis par le client (continuation, limite,
+bornes de dates) : le nombre d'entrées est borné (les moins récemment
+utilisées sont évincées) et les entrées expirées sont retirées au passage.
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+
+# Durée de vie des réponses en cache (secondes) et nombre maximum d'entrées
+RESPONSE_CACHE_TTL = float(os.environ.get('VOTES_CACHE_TTL', '3'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('VOTES_CACHE_MAX_ENTRIES', '1000'))
+
+
+def make_etag(body):
+    """Calcule un ETag fort à partir du corps de la réponse"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Indique si l'en-tête If-None-Match désigne la représentation courante"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+class CacheEntry:
+    """Réponse sérialisée et ses métadonnées de cache"""
+
+    __slots__ = ('body', 'etag', 'expires_at')
+
+    def __init__(self, body, ttl):
+        self.body = body
+        self.etag = make_etag(body)
+        self.expires_at = time.monotonic() + ttl
+
+
+class ResponseCache:
+    """Cache clé → réponse sérialisée, invalidé en bloc par les écritures"""
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Retourne l'entrée encore valide pour cette clé, sinon None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _evict(self, now):
+        """Retire les entrées expirées, puis les moins récemment utilisées au-delà de `max_entries`"""
+        # Parcours complet (au plus `max_entries` entrées, une fois par réponse calculée) :
+        # l'ordre d'utilisation n'est pas celui d'expiration
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key, body, generation=None):
+        """Enregistre une réponse calculée pendant la génération `generation`.
+
+        Si une écriture a invalidé le cache entre-temps, la réponse est renvoyée
+        sans être conservée pour ne pas réintroduire des données périmées.
+        """
+        entry = CacheEntry(body, self.ttl)
+        with self._lock:
+            if generation is None or generation == self.generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._evict(time.monotonic())
+        return entry
+
+    def invalidate(self):
+        """Vide le cache après une écriture"""
+        with self._lock:
+            self.generation += 1
+            self._entries = collections.OrderedDict()
+
+    def cache_control(self):
+        """Valeur de l'en-tête Cache-Control associée au TTL"""
+        return f"public, max-age={int(self.ttl)}"
+
+
+# Cache partagé des lectures de votes du worker
+votes_cache = ResponseCache()
@@ -0,0 +1,316 @@
+"""
+Historique des votes agrégé par tranches de temps.
+
+Chaque vote incrémente le document de sa minute (container `vote_rollups`,
+partitionné par sondage) par une mise à jour partielle atomique (`incr`) :
+ni lecture préalable ni conflit d'ETag entre workers. La compaction (`compact`,
+tâche planifiée `compactVoteRollups`) agrège les minutes terminées en heures et
+les heures en jours, puis purge les tranches fines au-delà de leur rétention :
+une série temporelle lit un document par tranche, quel que soit le nombre de votes.
+
+Le document `compaction` d'un sondage indique jusqu'où chaque granularité a
+été agrégée (`folded_until`) : une série en heures lit les heures avant ce
+point et les minutes après, sans compter deux fois un vote. Une minute
+modifiée après son agrégation (vote en retard, import daté) est repérée par
+son `_ts` et son heure recalculée à la compaction suivante.
+"""
+
+import asyncio
+import datetime
+import os
+import time
+
+from azure.cosmos import exceptions
+
+from shared_code.votes import poll_partition
+
+# Granularités, de la plus fine à la plus grossière
+GRANULARITIES = ('minute', 'hour', 'day')
+SPANS = {
+    'minute': datetime.timedelta(minutes=1),
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1),
+}
+
+# Délai avant l'agrégation d'une tranche terminée (secondes), pour les votes en retard
+ROLLUP_COMPACTION_DELAY = int(os.environ.get('ROLLUP_COMPACTION_DELAY', '300'))
+
+# Rétention des minutes (heures) et des heures (jours) une fois agrégées ; les jours sont gardés
+ROLLUP_MINUTE_RETENTION = int(os.environ.get('ROLLUP_MINUTE_RETENTION', '48'))
+ROLLUP_HOUR_RETENTION = int(os.environ.get('ROLLUP_HOUR_RETENTION', '90'))
+
+# Tranches d'une série sans `since`, et au plus par série
+TIMESERIES_DEFAULT_BUCKETS = int(os.environ.get('TIMESERIES_DEFAULT_BUCKETS', '60'))
+TIMESERIES_MAX_BUCKETS = int(os.environ.get('TIMESERIES_MAX_BUCKETS', '1500'))
+
+# Suppressions simultanées pendant la purge
+ROLLUP_MAX_CONCURRENCY = 16
+
+# Identifiant du document d'état de la compaction d'un sondage
+STATE_ID = 'compaction'
+
+# Recouvrement (secondes) de la détection des tranches modifiées, pour les décalages d'horloge avec Cosmos
+_TS_OVERLAP = 60
+
+_MIN_START = ''
+_MAX_START = datetime.datetime.max.isoformat()
+
+
+def parse_time(value):
+    """Date ISO 8601 ramenée en UTC sans fuseau, comme les dates des votes ; ValueError si invalide"""
+    moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def floor(moment, granularity):
+    """Début de la tranche de `granularity` qui contient `moment`"""
+    moment = moment.replace(second=0, microsecond=0)
+    if granularity in ('hour', 'day'):
+        moment = moment.replace(minute=0)
+    if granularity == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def bucket_start(value, granularity='minute'):
+    """Début (ISO 8601) de la tranche d'une date ISO 8601"""
+    return floor(parse_time(value), granularity).isoformat()
+
+
+def rollup_id(granularity, start):
+    return f"{granularity}:{start}"
+
+
+def rollup_document(poll_id, granularity, start, counts):
+    """Document d'une tranche : compteurs par choix et `total`"""
+    return {
+        "id": rollup_id(granularity, start),
+        "poll_id": poll_id,
+        "granularity": granularity,
+        "start": start,
+        "counts": dict(counts)
+    }
+
+
+def _pointer(key):
+    """Chemin JSON d'un compteur (les choix sont libres : `~` et `/` échappés)"""
+    return '/counts/' + key.replace('~', '~0').replace('/', '~1')
+
+
+def _add(total, counts):
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def count_by_minute(documents):
+    """Votes (`choice`, `created_at`) comptés par minute : début de la minute → compteurs"""
+    buckets = {}
+    for doc in documents:
+        _add(buckets.setdefault(bucket_start(doc['created_at']), {}), {doc['choice']: 1, "total": 1})
+    return buckets
+
+
+async def add_counts(container, poll_id, granularity, start, counts):
+    """Ajoute des votes à une tranche par une mise à jour partielle atomique, en créant son document au besoin"""
+    operations = [{"op": "incr", "path": _pointer(key), "value": value} for key, value in counts.items()]
+    doc_id = rollup_id(granularity, start)
+    try:
+        return await container.patch_item(item=doc_id, partition_key=poll_id, patch_operations=operations)
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    try:
+        return await container.create_item(body=rollup_document(poll_id, granularity, start, counts))
+    except exceptions.CosmosResourceExistsError:
+        # Créé entre-temps par un autre worker
+        return await container.patch_item(item=doc_id, partition_key=poll_id, patch_operations=operations)
+
+
+async def record_votes(container, poll_id, documents):
+    """Ajoute des votes aux minutes de leur date de création : une mise à jour par minute concernée"""
+    await asyncio.gather(*(
+        add_counts(container, poll_id, 'minute', start, counts)
+        for start, counts in count_by_minute(documents).items()
+    ))
+
+
+async def read_state(container, poll_id):
+    """État de la compaction d'un sondage (vide avant la première compaction)"""
+    try:
+        return await container.read_item(item=STATE_ID, partition_key=poll_id)
+    except exceptions.CosmosResourceNotFoundError:
+        return {"id": STATE_ID, "poll_id": poll_id, "folded_until": {}, "purged_until": {}, "compacted_at": 0}
+
+
+async def _query(container, poll_id, granularity, start, end, changed_since=None):
+    """Tranches de `granularity` commençant dans [start, end), éventuellement modifiées depuis `changed_since`"""
+    query = "SELECT * FROM c WHERE c.granularity = @granularity AND c.start >= @start AND c.start < @end"
+    parameters = [
+        {"name": "@granularity", "value": granularity},
+        {"name": "@start", "value": start},
+        {"name": "@end", "value": end}
+    ]
+    if changed_since is not None:
+        query += " AND c._ts >= @since"
+        parameters.append({"name": "@since", "value": changed_since})
+    rows = container.query_items(query=query, parameters=parameters, partition_key=poll_id)
+    return [doc async for doc in rows]
+
+
+def series_range(granularity, since=None, until=None, now=None):
+    """Bornes [début, fin) d'une série, de la tranche de `since` à celle de `until` incluse ; ValueError si invalide"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"bucket must be one of {', '.join(GRANULARITIES)}")
+    span = SPANS[granularity]
+    try:
+        # Par défaut, jusqu'à la tranche en cours incluse
+        end = floor(parse_time(until) if until else (now or datetime.datetime.utcnow()), granularity) + span
+        start = floor(parse_time(since), granularity) if since else end - TIMESERIES_DEFAULT_BUCKETS * span
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("since and until must be ISO 8601 dates")
+    if start >= end:
+        raise ValueError("since must be before until")
+    if (end - start) / span > TIMESERIES_MAX_BUCKETS:
+        raise ValueError(f"At most {TIMESERIES_MAX_BUCKETS} buckets per series")
+    return start, end
+
+
+async def timeseries(container, poll_id, granularity, start, end, choices):
+    """Compteurs de chaque tranche de [start, end), tranches vides comprises, en O(tranches) documents lus"""
+    folded = (await read_state(container, poll_id))["folded_until"]
+    level = GRANULARITIES.index(granularity)
+    since, until = start.isoformat(), end.isoformat()
+
+    # Chaque granularité couvre la période que la suivante n'a pas encore agrégée
+    reads = []
+    for index in range(level, -1, -1):
+        lower = since if index == level else folded.get(GRANULARITIES[index + 1], _MIN_START)
+        upper = folded.get(GRANULARITIES[index], _MIN_START) if index > 0 else _MAX_START
+        lower, upper = max(lower, since), min(upper, until)
+        if lower < upper:
+            reads.append(_query(container, poll_id, GRANULARITIES[index], lower, upper))
+
+    totals = {}
+    for docs in await asyncio.gather(*reads):
+        for doc in docs:
+            _add(totals.setdefault(bucket_start(doc['start'], granularity), {}), doc['counts'])
+
+    series = []
+    moment = start
+    while moment < end:
+        key = moment.isoformat()
+        counts = totals.get(key, {})
+        series.append({"start": key, **{choice: counts.get(choice, 0) for choice in choices}, "total": counts.get("total", 0)})
+        moment += SPANS[granularity]
+    return series
+
+
+async def _fold(container, poll_id, fine, coarse, state, cutoff):
+    """Recalcule les tranches `coarse` dont une tranche `fine` a changé ; retourne le nombre de tranches écrites"""
+    changed = await _query(container, poll_id, fine, _MIN_START, cutoff, changed_since=state["compacted_at"])
+    purged_until = state["purged_until"].get(fine, _MIN_START)
+
+    dirty = set()
+    for doc in changed:
+        bucket = bucket_start(doc['start'], coarse)
+        if bucket < purged_until:
+            # Tranche fine recréée après la purge de ses voisines : ajoutée à la tranche agrégée puis supprimée
+            await add_counts(container, poll_id, coarse, bucket, doc['counts'])
+            await container.delete_item(item=doc['id'], partition_key=poll_id)
+        else:
+            dirty.add(bucket)
+    if not dirty:
+        return 0
+
+    # Tranches agrégées recalculées en entier depuis leurs tranches fines, toutes présentes
+    sums = {bucket: {} for bucket in dirty}
+    for doc in await _query(container, poll_id, fine, min(dirty), cutoff):
+        bucket = bucket_start(doc['start'], coarse)
+        if bucket in sums:
+            _add(sums[bucket], doc['counts'])
+    await asyncio.gather(*(
+        container.upsert_item(body=rollup_document(poll_id, coarse, bucket, counts))
+        for bucket, counts in sums.items()
+    ))
+    return len(sums)
+
+
+async def _purge(container, poll_id, granularity, horizon):
+    """Supprime les tranches de `granularity` antérieures à `horizon` ; retourne leur nombre"""
+    expired = await _query(container, poll_id, granularity, _MIN_START, horizon)
+    semaphore = asyncio.Semaphore(ROLLUP_MAX_CONCURRENCY)
+
+    async def delete(doc):
+        async with semaphore:
+            try:
+                await container.delete_item(item=doc['id'], partition_key=poll_id)
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+
+    await asyncio.gather(*(delete(doc) for doc in expired))
+    return len(expired)
+
+
+async def compact(container, poll_id, now=None):
+    """Agrège les tranches terminées dans la granularité suivante, puis purge les tranches fines expirées"""
+    now = now or datetime.datetime.utcnow()
+    started = int(time.time())
+    state = await read_state(container, poll_id)
+    retentions = {
+        'minute': datetime.timedelta(hours=ROLLUP_MINUTE_RETENTION),
+        'hour': datetime.timedelta(days=ROLLUP_HOUR_RETENTION)
+    }
+    result = {"poll_id": poll_id, "folded": {}, "purged": {}}
+
+    for fine, coarse in zip(GRANULARITIES, GRANULARITIES[1:]):
+        cutoff = floor(now - datetime.timedelta(seconds=ROLLUP_COMPACTION_DELAY), coarse).isoformat()
+        result["folded"][coarse] = await _fold(container, poll_id, fine, coarse, state, cutoff)
+        state["folded_until"][coarse] = max(state["folded_until"].get(coarse, _MIN_START), cutoff)
+
+        horizon = min(floor(now - retentions[fine], coarse).isoformat(), state["folded_until"][coarse])
+        if horizon > state["purged_until"].get(fine, _MIN_START):
+            result["purged"][fine] = await _purge(container, poll_id, fine, horizon)
+            state["purged_until"][fine] = horizon
+
+    state["compacted_at"] = started - _TS_OVERLAP
+    await container.upsert_item(body=state)
+    return result
+
+
+async def rebuild(votes_container, rollups_container, poll_id, apply=False):
+    """Recompte les minutes d'un sondage depuis ses votes et remplace ses tranches (O(votes), à la main).
+
+    Les votes enregistrés pendant le recomptage peuvent manquer à leur minute :
+    lancer la reconstruction dans une période calme.
+    """
+    rows = votes_container.query_items(
+        query="SELECT c.choice, c.created_at FROM c",
+        partition_key=poll_partition(poll_id)
+    )
+    minutes = count_by_minute([row async for row in rows])
+    existing = await _query(rollups_container, poll_id, 'minute', _MIN_START, _MAX_START)
+    coarse = [doc for granularity in GRANULARITIES[1:]
+              for doc in await _query(rollups_container, poll_id, granularity, _MIN_START, _MAX_START)]
+    result = {
+        "poll_id": poll_id,
+        "votes": sum(counts["total"] for counts in minutes.values()),
+        "minutes": len(minutes),
+        "replaced": len(existing) + len(coarse),
+        "applied": apply
+    }
+    if not apply:
+        return result
+
+    # Anciennes tranches et état supprimés : la compaction suivante repart des minutes recomptées
+    stale = [doc for doc in existing if doc['start'] not in minutes] + coarse
+    for doc in stale:
+        await rollups_container.delete_item(item=doc['id'], partition_key=poll_id)
+    try:
+        await rollups_container.delete_item(item=STATE_ID, partition_key=poll_id)
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    for start, counts in minutes.items():
+        await rollups_container.upsert_item(body=rollup_document(poll_id, 'minute', start, counts))
+    return result
@@ -0,0 +1,70 @@
+"""
+Sérialisation JSON des réponses et format colonnes de `GET /votes`.
+
+`dumps` produit directement les octets du corps : avec `orjson` s'il est
+installé (plusieurs fois plus rapide que le module `json`, sortie UTF-8
+compacte), sinon avec le module standard configuré pour une sortie
+identique (sans espaces, sans échappement des caractères non ASCII).
+
+Le format colonnes est choisi par l'en-tête `Accept`
+(`application/vnd.bayrou.columnar+json`) : les votes y sont des tableaux
+parallèles (identifiants, pseudos, choix, dates) au lieu d'un objet par vote
+répétant les noms de champs, l'utilisateur et la question.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel
+    orjson = None
+
+# Sérialiseur : `auto` (orjson s'il est installé), `orjson` ou `json`
+JSON_SERIALIZER = os.environ.get('JSON_SERIALIZER', 'auto').lower()
+
+JSON_MEDIA_TYPE = 'application/json'
+COLUMNAR_MEDIA_TYPE = 'application/vnd.bayrou.columnar+json'
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def backend():
+    """Sérialiseur utilisé : `orjson` ou `json`"""
+    if JSON_SERIALIZER == 'json' or orjson is None:
+        return 'json'
+    return 'orjson'
+
+
+def dumps(value):
+    """Corps JSON compact (octets UTF-8)"""
+    if backend() == 'orjson':
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return _encoder.encode(value).encode('utf-8')
+
+
+def loads(data):
+    """Valeur d'un document JSON (octets ou chaîne)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def accepts_columnar(accept):
+    """Indique si l'en-tête `Accept` préfère le format colonnes au JSON par objets"""
+    weights = {}
+    for entry in (accept or '').split(','):
+        media_type, _, params = entry.strip().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[media_type.strip().lower()] = weight
+
+    # Seule une demande explicite donne le format colonnes (pas `*/*`)
+    columnar = weights.get(COLUMNAR_MEDIA_TYPE, 0.0)
+    return columnar > 0 and columnar >= weights.get(JSON_MEDIA_TYPE, 0.0)
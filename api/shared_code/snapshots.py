@@ -0,0 +1,412 @@
+"""
+Instantanés précompressés de la première page de `GET /votes`.
+
+Avec VOTES_SNAPSHOTS=1, la réponse par défaut de `GET /votes` d'un sondage
+(statistiques et derniers votes) est calculée une fois après chaque série de
+votes puis enregistrée dans un stockage de blobs, déjà compressée en gzip et,
+si le paquet `brotli` est installé, en Brotli. Un lecteur coûte alors une
+lecture de blob dans l'encodage qu'il accepte, sans requête Cosmos ni
+sérialisation.
+
+La régénération est regroupée : les votes reçus pendant VOTES_SNAPSHOT_DEBOUNCE
+secondes ne donnent qu'un calcul, et un vote reçu pendant le calcul en
+déclenche un nouveau. Les votes écrits par les autres workers sont rattrapés
+par la tâche planifiée `refreshVoteSnapshots`, qui compare l'ETag du compteur
+à celui enregistré avec l'instantané.
+
+La tâche planifiée ne s'exécute que sur une instance : les instantanés sont
+donc enregistrés dans un conteneur Azure Blob Storage partagé par toutes les
+instances (`AzureBlobStore`, VOTES_SNAPSHOT_CONNECTION, paquet optionnel
+`azure-storage-blob`). Dans Azure, sans ce stockage, les instantanés restent
+désactivés. Chaque instantané porte aussi sa date de calcul et n'est plus
+servi au-delà de VOTES_SNAPSHOT_MAX_AGE secondes ; la réponse est alors
+calculée et un nouvel instantané planifié.
+
+`LocalBlobStore` reprend la même interface et la sémantique d'un conteneur
+Blob Storage (un blob par encodage, écrit d'un bloc, avec son encodage et ses
+métadonnées, relu en une seule lecture) et en tient lieu en local et dans les
+tests.
+
+Les calculs planifiés après un vote s'exécutent en tâche de fond : leurs
+erreurs sont journalisées et l'instantané manqué est rattrapé par la tâche
+planifiée.
+"""
+
+import asyncio
+import functools
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+try:
+    import brotli
+except ImportError:  # Brotli est optionnel
+    brotli = None
+
+try:
+    from azure.storage.blob import ContainerClient
+except ImportError:  # azure-storage-blob est optionnel (nécessaire seulement pour le stockage partagé)
+    ContainerClient = None
+
+from shared_code.response_cache import make_etag
+
+# Compte de stockage des instantanés, partagé par toutes les instances (obligatoire dans Azure), et conteneur
+VOTES_SNAPSHOT_CONNECTION = os.environ.get('VOTES_SNAPSHOT_CONNECTION', '')
+VOTES_SNAPSHOT_CONTAINER = os.environ.get('VOTES_SNAPSHOT_CONTAINER', 'snapshots')
+
+
+def snapshots_enabled():
+    """Instantanés demandés (VOTES_SNAPSHOTS) et stockage utilisable : Blob Storage dans Azure, dossier local sinon"""
+    if os.environ.get('VOTES_SNAPSHOTS', '0').lower() not in ('1', 'true', 'yes'):
+        return False
+    if VOTES_SNAPSHOT_CONNECTION:
+        if ContainerClient is None:
+            logging.error("VOTES_SNAPSHOTS ignored: VOTES_SNAPSHOT_CONNECTION requires the azure-storage-blob package")
+            return False
+        return True
+    if os.environ.get('WEBSITE_INSTANCE_ID'):
+        logging.error("VOTES_SNAPSHOTS ignored: VOTES_SNAPSHOT_CONNECTION must name a storage account shared by every instance")
+        return False
+    return True
+
+
+# Instantanés de GET /votes (première page de chaque sondage)
+SNAPSHOTS_ENABLED = snapshots_enabled()
+
+# Dossier des blobs locaux (sans VOTES_SNAPSHOT_CONNECTION : développement et tests)
+VOTES_SNAPSHOT_PATH = os.environ.get(
+    'VOTES_SNAPSHOT_PATH',
+    os.path.join(tempfile.gettempdir(), 'bayrou-snapshots')
+)
+
+# Délai de regroupement des votes avant le calcul d'un instantané (secondes)
+VOTES_SNAPSHOT_DEBOUNCE = float(os.environ.get('VOTES_SNAPSHOT_DEBOUNCE', '1'))
+
+# Intervalle de la tâche de rafraîchissement (secondes) ; désactivée, elle ne se réveille qu'une fois par heure
+VOTES_SNAPSHOT_REFRESH_INTERVAL = 10
+VOTES_SNAPSHOT_SCHEDULE = (
+    f"*/{VOTES_SNAPSHOT_REFRESH_INTERVAL} * * * * *" if SNAPSHOTS_ENABLED else "0 0 * * * *"
+)
+
+# Âge maximum d'un instantané servi (secondes) : deux rafraîchissements par défaut
+VOTES_SNAPSHOT_MAX_AGE = float(os.environ.get('VOTES_SNAPSHOT_MAX_AGE', str(2 * VOTES_SNAPSHOT_REFRESH_INTERVAL)))
+
+# Niveaux de compression (calculés une fois par instantané : compression maximum)
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+IDENTITY = 'identity'
+
+# Suffixe du blob de chaque encodage
+_SUFFIXES = {IDENTITY: '', 'gzip': '.gz', 'br': '.br'}
+
+_POLL_ID_RE = re.compile(r"^[\w-]{1,64}$")
+_BLOB_NAME_RE = re.compile(r"^[\w-]+(/[\w.-]+)*$")
+
+
+def encodings():
+    """Encodages produits pour chaque instantané, du préféré au moins préféré"""
+    return (('br',) if brotli is not None else ()) + ('gzip', IDENTITY)
+
+
+def compress(body, encoding):
+    """Corps compressé dans l'encodage demandé"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def negotiate(accept_encoding, available):
+    """Encodage de `available` (par ordre de préférence) accepté par `Accept-Encoding`, ou None"""
+    weights = {}
+    for entry in (accept_encoding or '').split(','):
+        coding, _, params = entry.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+
+    def accepted(coding):
+        if coding in weights:
+            return weights[coding] > 0
+        if '*' in weights:
+            return weights['*'] > 0
+        # identity est acceptable sauf refus explicite
+        return coding == IDENTITY
+
+    def weight(coding):
+        # identity implicite : en dernier recours
+        return weights.get(coding, weights.get('*', 0.001))
+
+    candidates = [coding for coding in available if accepted(coding)]
+    if not candidates:
+        return None
+    return max(candidates, key=weight)
+
+
+def blob_name(poll_id, encoding=IDENTITY):
+    """Nom du blob d'un instantané ; ValueError pour un identifiant de sondage inattendu"""
+    if not isinstance(poll_id, str) or not _POLL_ID_RE.match(poll_id):
+        raise ValueError(f"Invalid poll id for a snapshot: {poll_id!r}")
+    return f"votes/{poll_id}.json{_SUFFIXES[encoding]}"
+
+
+def variant_etag(etag, encoding):
+    """ETag d'un encodage : chaque encodage est une représentation distincte"""
+    if encoding == IDENTITY:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+class Blob:
+    """Contenu d'un blob, son encodage et ses métadonnées"""
+
+    __slots__ = ('data', 'content_encoding', 'metadata')
+
+    def __init__(self, data, content_encoding=None, metadata=None):
+        self.data = data
+        self.content_encoding = content_encoding
+        self.metadata = metadata or {}
+
+
+class LocalBlobStore:
+    """Blobs dans des fichiers : une ligne d'en-tête JSON (encodage, métadonnées) puis le contenu"""
+
+    def __init__(self, directory=VOTES_SNAPSHOT_PATH):
+        self.directory = directory
+
+    def _path(self, name):
+        if not _BLOB_NAME_RE.match(name):
+            raise ValueError(f"Invalid blob name: {name!r}")
+        return os.path.join(self.directory, *name.split('/'))
+
+    def put(self, name, data, content_encoding=None, metadata=None):
+        """Écrit un blob d'un bloc : un lecteur voit l'ancienne ou la nouvelle version, jamais un mélange"""
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = json.dumps({"content_encoding": content_encoding, "metadata": metadata or {}}).encode('utf-8')
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header + b'\n' + data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def get(self, name):
+        """Blob `name` en une lecture, ou None s'il n'existe pas"""
+        try:
+            with open(self._path(name), 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        header, _, data = raw.partition(b'\n')
+        header = json.loads(header)
+        return Blob(data, header["content_encoding"], header["metadata"])
+
+    def list(self, prefix=''):
+        """Noms des blobs commençant par `prefix`"""
+        names = []
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if file_name.startswith('.upload-'):
+                    continue
+                relative = os.path.relpath(os.path.join(root, file_name), self.directory)
+                name = relative.replace(os.sep, '/')
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+
+def _container_client(connection, name):
+    """Client du conteneur de blobs `name`"""
+    if ContainerClient is None:
+        raise RuntimeError("azure-storage-blob is required with VOTES_SNAPSHOT_CONNECTION")
+    return ContainerClient.from_connection_string(connection, container_name=name)
+
+
+class AzureBlobStore:
+    """Blobs dans un conteneur Azure Blob Storage partagé par toutes les instances, avec l'interface de `LocalBlobStore`"""
+
+    # Encodage gardé dans les métadonnées : le client HTTP ne décompresse pas le blob à sa lecture
+    ENCODING_METADATA = 'content_encoding'
+
+    def __init__(self, connection=None, container=VOTES_SNAPSHOT_CONTAINER, client_factory=None):
+        self.connection = connection or VOTES_SNAPSHOT_CONNECTION
+        self.container = container
+        self._client_factory = client_factory or _container_client
+        self._client = None
+
+    def _container(self):
+        # Conteneur créé au premier accès (idempotent)
+        if self._client is None:
+            client = self._client_factory(self.connection, self.container)
+            try:
+                client.create_container()
+            except ResourceExistsError:
+                pass
+            self._client = client
+        return self._client
+
+    def put(self, name, data, content_encoding=None, metadata=None):
+        """Écrit un blob en une requête : un lecteur voit l'ancienne ou la nouvelle version, jamais un mélange"""
+        if not _BLOB_NAME_RE.match(name):
+            raise ValueError(f"Invalid blob name: {name!r}")
+        # Les métadonnées de blob sont des chaînes : une valeur absente n'est pas enregistrée
+        metadata = {key: value for key, value in (metadata or {}).items() if value is not None}
+        if content_encoding is not None:
+            metadata[self.ENCODING_METADATA] = content_encoding
+        self._container().upload_blob(name, data, overwrite=True, metadata=metadata)
+
+    def get(self, name):
+        """Blob `name` en une lecture, ou None s'il n'existe pas"""
+        try:
+            downloader = self._container().download_blob(name)
+        except ResourceNotFoundError:
+            return None
+        data = downloader.readall()
+        metadata = dict(downloader.properties.metadata or {})
+        content_encoding = metadata.pop(self.ENCODING_METADATA, None)
+        return Blob(data, content_encoding, metadata)
+
+    def list(self, prefix=''):
+        """Noms des blobs commençant par `prefix`"""
+        return sorted(blob.name for blob in self._container().list_blobs(name_starts_with=prefix))
+
+
+def make_store():
+    """Stockage des instantanés : Blob Storage avec VOTES_SNAPSHOT_CONNECTION, sinon dossier local"""
+    if VOTES_SNAPSHOT_CONNECTION:
+        return AzureBlobStore()
+    return LocalBlobStore()
+
+
+def _write(store, poll_id, body, source_etag):
+    """Compresse et écrit les blobs d'un instantané (exécuté hors de la boucle d'événements)"""
+    etag = make_etag(body)
+    metadata = {"etag": etag, "source_etag": source_etag, "generated_at": str(time.time())}
+    # Identité en dernier : sa présence signale un instantané complet
+    for encoding in encodings():
+        store.put(
+            blob_name(poll_id, encoding),
+            compress(body, encoding),
+            content_encoding=None if encoding == IDENTITY else encoding,
+            metadata=metadata
+        )
+    return etag
+
+
+async def publish(poll_id, body, source_etag=None, snapshot_store=None):
+    """Enregistre l'instantané d'un sondage dans tous les encodages ; retourne son ETag"""
+    return await asyncio.to_thread(_write, snapshot_store or store, poll_id, body, source_etag)
+
+
+async def read(poll_id, accept_encoding, snapshot_store=None):
+    """(corps, encodage, ETag) de l'instantané dans un encodage accepté, ou None"""
+    encoding = negotiate(accept_encoding, encodings())
+    if encoding is None:
+        return None
+    try:
+        name = blob_name(poll_id, encoding)
+    except ValueError:
+        return None
+    blob = await asyncio.to_thread((snapshot_store or store).get, name)
+    if blob is None or _age(blob) > VOTES_SNAPSHOT_MAX_AGE:
+        return None
+    return blob.data, encoding, variant_etag(blob.metadata["etag"], encoding)
+
+
+def _age(blob):
+    """Âge d'un instantané en secondes (infini sans date de calcul)"""
+    try:
+        return time.time() - float(blob.metadata["generated_at"])
+    except (KeyError, TypeError, ValueError):
+        return float('inf')
+
+
+def source_etag(poll_id, snapshot_store=None):
+    """ETag du compteur au moment du calcul de l'instantané, ou None"""
+    blob = (snapshot_store or store).get(blob_name(poll_id))
+    return blob.metadata.get("source_etag") if blob is not None else None
+
+
+def needs_refresh(poll_id, current_etag, snapshot_store=None):
+    """Indique si l'instantané d'un sondage dérive d'un autre compteur ou expirera avant le prochain rafraîchissement"""
+    blob = (snapshot_store or store).get(blob_name(poll_id))
+    if blob is None or blob.metadata.get("source_etag") != current_etag:
+        return True
+    return _age(blob) > VOTES_SNAPSHOT_MAX_AGE - VOTES_SNAPSHOT_REFRESH_INTERVAL
+
+
+def snapshot_polls(snapshot_store=None):
+    """Sondages qui ont un instantané"""
+    return [
+        name[len('votes/'):-len('.json')]
+        for name in (snapshot_store or store).list('votes/')
+        if name.endswith('.json')
+    ]
+
+
+class SnapshotPublisher:
+    """Régénération regroupée des instantanés : au plus un calcul en cours par sondage"""
+
+    def __init__(self, debounce=VOTES_SNAPSHOT_DEBOUNCE):
+        self.debounce = debounce
+        self._tasks = {}
+        self._dirty = set()
+
+    def schedule(self, poll_id, render):
+        """Demande un nouvel instantané ; `render()` retourne (corps, ETag du compteur)"""
+        self._dirty.add(poll_id)
+        task = self._tasks.get(poll_id)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return task
+
+        task = self._tasks[poll_id] = asyncio.ensure_future(self._run(poll_id, render))
+        task.add_done_callback(functools.partial(self._done, poll_id))
+        return task
+
+    def _done(self, poll_id, task):
+        """Fin d'un calcul en tâche de fond : oublié, et son erreur éventuelle journalisée plutôt que perdue"""
+        if self._tasks.get(poll_id) is task:
+            self._tasks.pop(poll_id)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Votes snapshot task of poll {poll_id} failed: {task.exception()!r}")
+
+    async def _run(self, poll_id, render):
+        while poll_id in self._dirty:
+            await asyncio.sleep(self.debounce)
+            self._dirty.discard(poll_id)
+            try:
+                body, tally_etag = await render()
+                await publish(poll_id, body, tally_etag)
+            except Exception as e:
+                # Instantané rattrapé au prochain vote ou par refreshVoteSnapshots
+                logging.error(f"Error publishing votes snapshot of poll {poll_id}: {str(e)}")
+
+    async def wait(self):
+        """Attend la fin des calculs en cours (tests, arrêt du worker)"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+
+# Stockage et régénération des instantanés du worker
+store = make_store()
+publisher = SnapshotPublisher()
@@ -0,0 +1,212 @@
+"""
+Décompte matérialisé des votes.
+
+Un document compteur par sondage (identifiant du sondage) est incrémenté à
+chaque vote par une mise à jour partielle (`patch_item`, opérations `incr`
+atomiques côté serveur : ni lecture préalable ni conflit entre workers) : les
+statistiques se lisent en un seul point read, quel que soit le nombre de
+votes. `reconcile` recompte les votes du sondage par requêtes d'agrégat
+limitées à ses partitions et corrige le compteur, par un incrément, en cas de
+dérive confirmée par deux recomptages. Cette confirmation (qui attend
+RECONCILE_CONFIRM_DELAY) n'a lieu que dans la réconciliation planifiée et
+les scripts : `read_tally` se contente de créer un compteur absent.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+
+from azure.cosmos import exceptions
+
+from shared_code.polls import DEFAULT_CHOICES, DEFAULT_POLL_ID
+from shared_code.votes import poll_partition
+
+# Compteur et choix du sondage historique
+DEFAULT_TALLY_ID = DEFAULT_POLL_ID
+CHOICES = DEFAULT_CHOICES
+
+# Opérations au plus par mise à jour partielle Cosmos
+PATCH_MAX_OPERATIONS = 10
+
+# Délai entre les deux recomptages qui doivent confirmer un écart avant sa correction (secondes)
+RECONCILE_CONFIRM_DELAY = float(os.environ.get('RECONCILE_CONFIRM_DELAY', '5'))
+
+
+# Initialisations de compteurs en cours sur ce worker (une seule par compteur)
+_seeding = {}
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+async def _patch(container, doc_id, partition_key, operations):
+    """Applique les opérations par mises à jour partielles d'au plus PATCH_MAX_OPERATIONS opérations (une seule en général)"""
+    doc = None
+    for index in range(0, len(operations), PATCH_MAX_OPERATIONS):
+        doc = await container.patch_item(item=doc_id, partition_key=partition_key,
+                                         patch_operations=operations[index:index + PATCH_MAX_OPERATIONS])
+    return doc
+
+
+async def increment_counters(container, doc_id, increments, partition_key=None, defaults=None):
+    """Incrémente des compteurs d'un document par une mise à jour partielle atomique.
+
+    Le document est créé s'il n'existe pas encore ; créé entre-temps par un
+    autre worker (409), il reçoit la mise à jour partielle.
+    """
+    partition_key = doc_id if partition_key is None else partition_key
+    operations = [{"op": "set", "path": "/updated_at", "value": _now()}]
+    operations += [{"op": "incr", "path": f"/{key}", "value": value} for key, value in increments.items()]
+    try:
+        return await _patch(container, doc_id, partition_key, operations)
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+    try:
+        return await container.create_item(body={"id": doc_id, **(defaults or {}), **increments, "updated_at": _now()})
+    except exceptions.CosmosResourceExistsError:
+        return await _patch(container, doc_id, partition_key, operations)
+
+
+async def record_vote(tallies_container, choice, tally_id=DEFAULT_TALLY_ID):
+    """Ajoute un vote au compteur"""
+    return await increment_counters(tallies_container, tally_id, {choice: 1, "total": 1})
+
+
+async def record_votes(tallies_container, counts, tally_id=DEFAULT_TALLY_ID):
+    """Ajoute plusieurs votes au compteur en une seule mise à jour (`counts` : choix → nombre)"""
+    increments = {choice: count for choice, count in counts.items() if count}
+    if not increments:
+        return None
+    increments["total"] = sum(increments.values())
+    return await increment_counters(tallies_container, tally_id, increments)
+
+
+async def seed(votes_container, tallies_container, tally_id=DEFAULT_TALLY_ID, choices=CHOICES):
+    """Crée le compteur absent depuis un recomptage, sans attente ni correction.
+
+    Un compteur créé entre-temps par un vote est retourné tel quel : son
+    écart éventuel est corrigé par la réconciliation planifiée.
+    """
+    expected = await count_votes(votes_container, tally_id, choices)
+    try:
+        return await tallies_container.create_item(body={"id": tally_id, **expected, "updated_at": _now()})
+    except exceptions.CosmosResourceExistsError:
+        return await _read(tallies_container, tally_id)
+
+
+async def read_tally(tallies_container, votes_container, tally_id=DEFAULT_TALLY_ID, choices=CHOICES):
+    """Lit le compteur, en l'initialisant par un recomptage s'il n'existe pas"""
+    try:
+        return await tallies_container.read_item(item=tally_id, partition_key=tally_id)
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+
+    # Les lectures simultanées d'un compteur absent partagent le même recomptage
+    task = _seeding.get(tally_id)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        logging.info(f"Tally {tally_id} not found, seeding it from a full count")
+        task = _seeding[tally_id] = asyncio.ensure_future(seed(votes_container, tallies_container, tally_id, choices))
+        task.add_done_callback(lambda done: _seeding.pop(tally_id, None) if _seeding.get(tally_id) is done else None)
+    return await asyncio.shield(task)
+
+
+def compute_stats(tally, choices=CHOICES):
+    """Construit le bloc `stats` (compteurs et pourcentages) à partir du compteur"""
+    stats = {choice: tally.get(choice, 0) for choice in choices}
+    stats["total"] = tally.get("total", 0)
+
+    # Calculer les pourcentages
+    for choice in choices:
+        if stats["total"] > 0:
+            stats[f"{choice}_percentage"] = round((stats[choice] / stats["total"]) * 100, 1)
+        else:
+            stats[f"{choice}_percentage"] = 0
+    return stats
+
+
+async def _count(votes_container, poll_id, query, parameters=None):
+    """Exécute une requête `SELECT VALUE COUNT(1)` sur les votes d'un sondage et somme les résultats partiels"""
+    rows = votes_container.query_items(query=query, parameters=parameters, partition_key=poll_partition(poll_id))
+    return sum([count async for count in rows])
+
+
+async def count_votes(votes_container, poll_id=DEFAULT_TALLY_ID, choices=CHOICES):
+    """Recompte les votes d'un sondage par choix avec des requêtes d'agrégat exécutées simultanément"""
+    keys = list(choices) + ["total"]
+    counts = await asyncio.gather(
+        *(
+            _count(
+                votes_container,
+                poll_id,
+                "SELECT VALUE COUNT(1) FROM c WHERE c.choice = @choice",
+                [{"name": "@choice", "value": choice}]
+            )
+            for choice in choices
+        ),
+        _count(votes_container, poll_id, "SELECT VALUE COUNT(1) FROM c")
+    )
+    return dict(zip(keys, counts))
+
+
+async def _read(tallies_container, tally_id):
+    try:
+        return await tallies_container.read_item(item=tally_id, partition_key=tally_id)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+
+async def _measure(votes_container, tallies_container, tally_id, choices):
+    """Recomptage encadré par deux lectures du compteur : (attendu, compteur, écart, compteur inchangé pendant le recomptage)"""
+    before = await _read(tallies_container, tally_id)
+    expected = await count_votes(votes_container, tally_id, choices)
+    tally = await _read(tallies_container, tally_id)
+
+    actual = {key: (tally or {}).get(key, 0) for key in expected}
+    drift = {key: expected[key] - actual[key] for key in expected if expected[key] != actual[key]}
+    stable = (before or {}).get('_etag') == (tally or {}).get('_etag')
+    return expected, actual, drift, tally, stable
+
+
+async def reconcile(votes_container, tallies_container, tally_id=DEFAULT_TALLY_ID, fix=False, choices=CHOICES,
+                    confirm_delay=None):
+    """Compare le compteur à un recomptage complet et le corrige si demandé.
+
+    Le recomptage n'est pas atomique avec le compteur : un vote compté par l'un
+    et pas encore par l'autre crée un faux écart transitoire. Un écart n'est
+    donc corrigé que s'il se retrouve à l'identique dans deux recomptages
+    séparés de `confirm_delay` secondes, chacun pendant lequel le compteur n'a
+    pas changé. La correction est appliquée comme un incrément (mise à jour
+    partielle) : les votes comptés entre-temps par le compteur sont conservés.
+    L'attente de confirmation réserve `fix=True` à la tâche planifiée et aux
+    scripts, jamais au chemin d'une requête.
+    """
+    confirm_delay = RECONCILE_CONFIRM_DELAY if confirm_delay is None else confirm_delay
+    expected, actual, drift, tally, stable = await _measure(votes_container, tallies_container, tally_id, choices)
+    fixed = False
+
+    if fix and tally is None:
+        # Compteur absent : créé depuis le recomptage, sauf s'il vient d'être créé par un vote
+        try:
+            tally = await tallies_container.create_item(body={"id": tally_id, **expected, "updated_at": _now()})
+            fixed = True
+        except exceptions.CosmosResourceExistsError:
+            tally = await _read(tallies_container, tally_id)
+    elif fix and drift:
+        await asyncio.sleep(confirm_delay)
+        _, _, confirmed, _, confirmed_stable = await _measure(votes_container, tallies_container, tally_id, choices)
+        if stable and confirmed_stable and confirmed == drift:
+            tally = await increment_counters(tallies_container, tally_id, drift)
+            fixed = True
+        else:
+            logging.info(f"Tally {tally_id} drift {drift} not confirmed by a second count ({confirmed}), left as is")
+
+    return {
+        "tally_id": tally_id,
+        "expected": expected,
+        "actual": actual,
+        "drift": drift,
+        "fixed": fixed,
+        "tally": tally
+    }
@@ -0,0 +1,308 @@
+"""
+Instrumentation des requêtes : durée des phases, appels Cosmos et RU consommées.
+
+Chaque handler décoré par `traced` ouvre un relevé propre à la requête :
+- les phases délimitées par `phase(...)` y ajoutent leur durée ;
+- les containers du pool, enveloppés par `InstrumentedContainer`, y ajoutent
+  chaque aller-retour Cosmos avec sa durée, sa charge (`x-ms-request-charge`)
+  et ses tentatives après 429.
+
+Le relevé est renvoyé dans l'en-tête `Server-Timing`, résumé dans les
+journaux et, si OpenTelemetry est installé et `TELEMETRY_EXPORTER` défini,
+exporté sous forme de spans (`azure` : Azure Monitor, `console` : sortie
+standard).
+"""
+
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import time
+
+try:
+    from opentelemetry import trace
+except ImportError:  # OpenTelemetry est optionnel
+    trace = None
+
+# Exportateur des spans : 'azure', 'console' ou vide (pas d'export)
+TELEMETRY_EXPORTER = os.environ.get('TELEMETRY_EXPORTER', '').strip().lower()
+
+REQUEST_CHARGE_HEADER = 'x-ms-request-charge'
+RETRY_COUNT_HEADER = 'x-ms-throttle-retry-count'
+
+_tracer = None
+
+
+def configure():
+    """Installe l'exportateur OpenTelemetry choisi par TELEMETRY_EXPORTER"""
+    global _tracer
+    if not TELEMETRY_EXPORTER or _tracer is not None:
+        return
+    if trace is None:
+        logging.warning(f"TELEMETRY_EXPORTER={TELEMETRY_EXPORTER} ignored: opentelemetry is not installed")
+        return
+
+    if TELEMETRY_EXPORTER == 'azure':
+        from azure.monitor.opentelemetry import configure_azure_monitor
+        configure_azure_monitor()
+    elif TELEMETRY_EXPORTER == 'console':
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter, SimpleSpanProcessor
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(ConsoleSpanExporter()))
+        trace.set_tracer_provider(provider)
+    else:
+        logging.warning(f"Unknown TELEMETRY_EXPORTER: {TELEMETRY_EXPORTER}")
+        return
+
+    _tracer = trace.get_tracer('bayrou-meter-api')
+
+
+def _span(name, attributes=None):
+    """Span OpenTelemetry courant, ou contexte vide si l'export est désactivé"""
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+class RequestMetrics:
+    """Relevé d'une requête : phases, appels Cosmos, RU et tentatives"""
+
+    def __init__(self):
+        self.phases = []
+        self.cosmos_calls = 0
+        self.cosmos_ms = 0.0
+        self.request_charge = 0.0
+        self.retries = 0
+
+    def add_phase(self, name, duration_ms):
+        self.phases.append((name, duration_ms))
+
+    def add_cosmos_call(self, duration_ms, request_charge, retries):
+        self.cosmos_calls += 1
+        self.cosmos_ms += duration_ms
+        self.request_charge += request_charge
+        self.retries += retries
+
+    def server_timing(self, total_ms):
+        """Valeur de l'en-tête Server-Timing"""
+        entries = [f"total;dur={total_ms:.1f}"]
+        if self.cosmos_calls:
+            entries.append(
+                f'cosmos;dur={self.cosmos_ms:.1f};desc="{self.cosmos_calls} calls, '
+                f'{self.request_charge:.2f} RU, {self.retries} retries"'
+            )
+        entries.extend(f"{name};dur={duration_ms:.1f}" for name, duration_ms in self.phases)
+        return ", ".join(entries)
+
+
+# Relevé de la requête en cours (None hors d'un handler instrumenté)
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Mesure une phase du traitement de la requête en cours"""
+    start = time.perf_counter()
+    with _span(name):
+        try:
+            yield
+        finally:
+            metrics = current.get()
+            if metrics is not None:
+                metrics.add_phase(name, (time.perf_counter() - start) * 1000)
+
+
+def record_retry():
+    """Compte une nouvelle tentative d'appel Cosmos (après 429) dans le relevé de la requête"""
+    metrics = current.get()
+    if metrics is not None:
+        metrics.retries += 1
+
+
+def traced(handler):
+    """Décorateur des handlers HTTP : relevé, span racine, en-tête Server-Timing et résumé journalisé"""
+
+    @functools.wraps(handler)
+    async def wrapper(req):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with _span(handler.__name__) as span:
+                response = await handler(req)
+                if span is not None:
+                    span.set_attribute('http.status_code', response.status_code)
+                    span.set_attribute('cosmos.calls', metrics.cosmos_calls)
+                    span.set_attribute('cosmos.request_charge', metrics.request_charge)
+                    span.set_attribute('cosmos.retries', metrics.retries)
+        finally:
+            current.reset(token)
+
+        total_ms = (time.perf_counter() - start) * 1000
+        response.headers['Server-Timing'] = metrics.server_timing(total_ms)
+        logging.info(
+            f"{handler.__name__} {response.status_code} in {total_ms:.1f} ms, "
+            f"cosmos: {metrics.cosmos_calls} calls, {metrics.request_charge:.2f} RU, {metrics.retries} retries"
+        )
+        return response
+
+    return wrapper
+
+
+def _accumulate(stats, headers):
+    """Ajoute la charge et les tentatives d'une réponse Cosmos au relevé d'un appel"""
+    headers = headers or {}
+    stats['charge'] += float(headers.get(REQUEST_CHARGE_HEADER, 0) or 0)
+    stats['retries'] += int(headers.get(RETRY_COUNT_HEADER, 0) or 0)
+
+
+@contextlib.contextmanager
+def _cosmos_call(operation, container_id):
+    """Mesure un aller-retour Cosmos et l'ajoute au relevé de la requête"""
+    stats = {'charge': 0.0, 'retries': 0}
+    start = time.perf_counter()
+    completed = True
+    with _span(f"cosmos.{operation}", {'db.cosmosdb.container': container_id}) as span:
+        try:
+            yield stats
+        except StopAsyncIteration:
+            # Fin de pagination : aucun aller-retour
+            completed = False
+            raise
+        finally:
+            if span is not None:
+                span.set_attribute('db.cosmosdb.request_charge', stats['charge'])
+            metrics = current.get()
+            if completed and metrics is not None:
+                metrics.add_cosmos_call((time.perf_counter() - start) * 1000, stats['charge'], stats['retries'])
+
+
+class _InstrumentedPageIterator:
+    """Itérateur de pages dont chaque page est mesurée comme un aller-retour"""
+
+    def __init__(self, container_id, query_items, continuation_token, operation='query_items'):
+        self._container_id = container_id
+        self._query_items = query_items
+        self._continuation_token = continuation_token
+        self._operation = operation
+        self._pages = None
+        self._stats = None
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token if self._pages is not None else None
+
+    def _on_response(self, headers, result):
+        if self._stats is not None:
+            _accumulate(self._stats, headers)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        with _cosmos_call(self._operation, self._container_id) as stats:
+            self._stats = stats
+            if self._pages is None:
+                self._pages = self._query_items(self._on_response).by_page(self._continuation_token)
+            page = await self._pages.__anext__()
+            return _Page([item async for item in page])
+
+
+class _Page:
+    """Page de résultats déjà lue"""
+
+    def __init__(self, items):
+        self._items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _InstrumentedPaged:
+    """Résultat de requête mesuré page par page"""
+
+    def __init__(self, container_id, query_items, operation='query_items'):
+        self._container_id = container_id
+        self._query_items = query_items
+        self._operation = operation
+
+    def by_page(self, continuation_token=None):
+        return _InstrumentedPageIterator(self._container_id, self._query_items, continuation_token, self._operation)
+
+    async def _iterate(self):
+        async for page in self.by_page():
+            async for item in page:
+                yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class InstrumentedContainer:
+    """Container dont chaque appel est mesuré ; les autres attributs sont délégués"""
+
+    def __init__(self, container):
+        self._container = container
+
+    def __getattr__(self, name):
+        return getattr(self._container, name)
+
+    async def _call(self, operation, *args, **kwargs):
+        chained = kwargs.get('response_hook')
+        with _cosmos_call(operation, self.id) as stats:
+
+            def hook(headers, result):
+                _accumulate(stats, headers)
+                if chained is not None:
+                    chained(headers, result)
+
+            kwargs['response_hook'] = hook
+            return await getattr(self._container, operation)(*args, **kwargs)
+
+    async def read_item(self, *args, **kwargs):
+        return await self._call('read_item', *args, **kwargs)
+
+    async def create_item(self, *args, **kwargs):
+        return await self._call('create_item', *args, **kwargs)
+
+    async def upsert_item(self, *args, **kwargs):
+        return await self._call('upsert_item', *args, **kwargs)
+
+    async def replace_item(self, *args, **kwargs):
+        return await self._call('replace_item', *args, **kwargs)
+
+    async def patch_item(self, *args, **kwargs):
+        return await self._call('patch_item', *args, **kwargs)
+
+    async def delete_item(self, *args, **kwargs):
+        return await self._call('delete_item', *args, **kwargs)
+
+    async def execute_item_batch(self, *args, **kwargs):
+        return await self._call('execute_item_batch', *args, **kwargs)
+
+    def _paged(self, operation, *args, **kwargs):
+        chained = kwargs.pop('response_hook', None)
+
+        def run(response_hook):
+            def hook(headers, result):
+                response_hook(headers, result)
+                if chained is not None:
+                    chained(headers, result)
+
+            return getattr(self._container, operation)(*args, **{**kwargs, 'response_hook': hook})
+
+        return _InstrumentedPaged(self.id, run, operation)
+
+    def query_items(self, *args, **kwargs):
+        return self._paged('query_items', *args, **kwargs)
+
+    def query_items_change_feed(self, *args, **kwargs):
+        return self._paged('query_items_change_feed', *args, **kwargs)
@@ -0,0 +1,95 @@
+"""
+Jointure votes → utilisateurs en lot.
+
+Au lieu d'un `read_item` par vote, les `user_id` distincts sont regroupés en
+paquets et résolus par des requêtes `ARRAY_CONTAINS` lancées simultanément,
+dans la limite d'un nombre de requêtes en vol : un appel à GET /votes coûte
+quelques allers-retours au lieu d'un par vote.
+
+Les votes portent désormais le pseudo de leur auteur, recopié à l'écriture :
+seuls les votes antérieurs, pas encore complétés par
+`scripts.backfill_vote_pseudos`, passent par cette jointure.
+"""
+
+import asyncio
+import os
+
+# Pseudo affiché quand l'utilisateur d'un vote n'existe plus
+DELETED_USER_PSEUDO = "Utilisateur supprimé"
+
+# Nombre d'identifiants par requête et requêtes simultanées maximum
+JOIN_CHUNK_SIZE = int(os.environ.get('USER_JOIN_CHUNK_SIZE', '100'))
+JOIN_MAX_CONCURRENCY = int(os.environ.get('USER_JOIN_MAX_CONCURRENCY', '4'))
+
+PSEUDOS_QUERY = "SELECT c.id, c.pseudo FROM c WHERE ARRAY_CONTAINS(@ids, c.id)"
+
+
+def unique_ids(user_ids):
+    """Dédoublonne les identifiants en conservant leur ordre d'apparition"""
+    return list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+
+
+def chunked(items, size):
+    """Découpe une liste en paquets de `size` éléments"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def _query_pseudos(users_container, ids, semaphore):
+    """Résout un paquet d'identifiants en une seule requête"""
+    async with semaphore:
+        rows = users_container.query_items(
+            query=PSEUDOS_QUERY,
+            parameters=[{"name": "@ids", "value": ids}],
+            enable_cross_partition_query=True
+        )
+        return {row['id']: row['pseudo'] async for row in rows}
+
+
+async def fetch_pseudos(users_container, user_ids, chunk_size=None, max_concurrency=None):
+    """Retourne un dictionnaire `user_id → pseudo` pour les utilisateurs existants"""
+    chunks = chunked(unique_ids(user_ids), chunk_size or JOIN_CHUNK_SIZE)
+    semaphore = asyncio.Semaphore(max_concurrency or JOIN_MAX_CONCURRENCY)
+
+    results = await asyncio.gather(*(_query_pseudos(users_container, ids, semaphore) for ids in chunks))
+
+    pseudos = {}
+    for result in results:
+        pseudos.update(result)
+    return pseudos
+
+
+def missing_pseudos(votes):
+    """Auteurs des votes qui ne portent pas encore leur pseudo"""
+    return unique_ids(vote['user_id'] for vote in votes if vote.get('pseudo') is None)
+
+
+def pseudo_for(pseudos, user_id):
+    """Pseudo d'un utilisateur, ou le libellé des utilisateurs supprimés"""
+    return pseudos.get(user_id, DELETED_USER_PSEUDO)
+
+
+def enrich_votes(votes, pseudos, question):
+    """Votes projetés au format de l'API, avec le pseudo du vote ou, à défaut, celui de `pseudos`"""
+    return [
+        {
+            "id": vote['id'],
+            "user": {
+                "id": vote['user_id'],
+                "pseudo": vote.get('pseudo') or pseudo_for(pseudos, vote['user_id'])
+            },
+            "choice": vote['choice'],
+            "question": question,
+            "created_at": vote['created_at']
+        }
+        for vote in votes
+    ]
+
+
+def columnar_votes(votes, pseudos):
+    """Votes en tableaux parallèles (format colonnes) ; l'identifiant d'un vote est celui de son auteur"""
+    return {
+        "ids": [vote['id'] for vote in votes],
+        "pseudos": [vote.get('pseudo') or pseudo_for(pseudos, vote['user_id']) for vote in votes],
+        "choices": [vote['choice'] for vote in votes],
+        "created_at": [vote['created_at'] for vote in votes]
+    }
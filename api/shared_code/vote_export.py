@@ -0,0 +1,195 @@
+"""
+Export en colonnes et recomptage complet des votes d'un sondage, hors de l'API.
+
+Les votes du sondage sont lus page par page (préfixe de partition du
+sondage, champs utiles seulement) : la mémoire reste bornée à une page,
+quel que soit le nombre de votes. Le SDK renvoie des documents JSON : les
+colonnes de la page sont remplies en Python au fil de la lecture. Chaque
+page est ensuite décomptée par choix et par jour, avec NumPy s'il est
+installé (validation et conversion des dates en entiers sur leurs codes de
+caractères, un seul `np.bincount` par page), sinon en Python avec un
+résultat identique. Un vote sans date valide (AAAA-MM-JJ en tête de
+`created_at`, absente de certains votes migrés) est compté dans son choix
+mais pas dans un jour. Avec `pyarrow`, chaque page est aussi écrite en lot
+de colonnes dans un fichier Parquet (`.parquet`) ou Arrow IPC (`.arrow`).
+
+Le recomptage ne lit ni le compteur ni les utilisateurs : il sert à auditer
+le compteur et les statistiques servies par `GET /votes`.
+"""
+
+import collections
+import os
+import re
+
+from shared_code.tally import compute_stats
+from shared_code.votes import poll_partition
+
+try:
+    import numpy
+except ImportError:  # numpy est optionnel
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow est optionnel (nécessaire seulement pour écrire un fichier)
+    pyarrow = None
+
+# Moteur du décompte : `auto` (NumPy s'il est installé), `numpy` ou `python`
+EXPORT_ENGINE = os.environ.get('EXPORT_ENGINE', 'auto').lower()
+
+# Votes lus (et gardés en mémoire) par page
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', '10000'))
+
+EXPORT_QUERY = "SELECT c.id, c.user_id, c.pseudo, c.choice, c.created_at FROM c"
+
+# Colonnes exportées, dans l'ordre du fichier
+COLUMNS = ('id', 'user_id', 'pseudo', 'choice', 'created_at')
+
+# Jour en tête d'une date ISO
+DAY_PATTERN = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}')
+
+# Positions des chiffres et des tirets dans AAAA-MM-JJ
+DIGITS = [0, 1, 2, 3, 5, 6, 8, 9]
+DASHES = [4, 7]
+
+# Format de fichier selon l'extension
+FORMATS = {
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.ipc': 'arrow',
+}
+
+
+def engine():
+    """Moteur du décompte : `numpy` ou `python`"""
+    if EXPORT_ENGINE == 'python' or numpy is None:
+        return 'python'
+    return 'numpy'
+
+
+def file_format(path):
+    """Format (`parquet` ou `arrow`) d'un fichier d'export selon son extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported export format: {extension or path} (expected {', '.join(FORMATS)})")
+    return FORMATS[extension]
+
+
+def _day_of(date):
+    """Jour AAAA-MM-JJ d'une date ISO ; None si la date est absente ou invalide"""
+    if isinstance(date, str) and DAY_PATTERN.fullmatch(date[:10]):
+        return date[:10]
+    return None
+
+
+def count_page(choices, created_at):
+    """Votes d'une page par (jour, choix), jour None pour une date absente ou invalide.
+
+    `choices` et `created_at` sont les colonnes de la page.
+    """
+    if not choices:
+        return {}
+    if engine() == 'python':
+        return dict(collections.Counter(zip(map(_day_of, created_at), choices)))
+
+    # Jours : codes des 10 premiers caractères, validés puis convertis en entiers AAAAMMJJ sans tri de chaînes
+    dates = numpy.array([date if isinstance(date, str) else '' for date in created_at], dtype='U10')
+    codes = dates.view(numpy.uint32).reshape(-1, 10).astype(numpy.int64)
+    digits = codes - ord('0')
+    valid = ((digits[:, DIGITS] >= 0) & (digits[:, DIGITS] <= 9)).all(axis=1) & (codes[:, DASHES] == ord('-')).all(axis=1)
+    day_numbers = digits[:, :4] @ [1000, 100, 10, 1] * 10000 + digits[:, 5:7] @ [10, 1] * 100 + digits[:, 8:10] @ [10, 1]
+    days, day_codes = numpy.unique(numpy.where(valid, day_numbers, 0), return_inverse=True)
+
+    # Choix : quelques valeurs distinctes, codées par un dictionnaire
+    values = {}
+    choice_codes = numpy.fromiter((values.setdefault(choice, len(values)) for choice in choices), numpy.int64, len(choices))
+    counts = numpy.bincount(day_codes * len(values) + choice_codes, minlength=len(days) * len(values))
+    names = list(values)
+    return {
+        (_day(days[index // len(names)]), names[index % len(names)]): int(counts[index])
+        for index in numpy.flatnonzero(counts)
+    }
+
+
+def _day(number):
+    """Jour AAAA-MM-JJ d'un entier AAAAMMJJ ; None pour 0 (date invalide)"""
+    number = int(number)
+    if not number:
+        return None
+    return f"{number // 10000:04d}-{number // 100 % 100:02d}-{number % 100:02d}"
+
+
+class ColumnarWriter:
+    """Écriture des pages de votes en lots de colonnes dans un fichier Parquet ou Arrow IPC"""
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise RuntimeError("pyarrow is required to write Parquet or Arrow files")
+        self.path = path
+        self.format = file_format(path)
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in COLUMNS])
+        if self.format == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, columns):
+        self._writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(columns[column], pyarrow.string()) for column in COLUMNS],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self._writer.close()
+
+
+async def export_votes(votes_container, poll_id, choices, path=None, page_size=None):
+    """Recompte les votes d'un sondage par choix et par jour, et les écrit dans `path` si demandé"""
+    writer = ColumnarWriter(path) if path else None
+    by_day_and_choice = collections.Counter()
+    pages = 0
+    try:
+        pager = votes_container.query_items(
+            query=EXPORT_QUERY,
+            partition_key=poll_partition(poll_id),
+            max_item_count=page_size or EXPORT_PAGE_SIZE
+        ).by_page()
+        async for page in pager:
+            columns = {column: [] for column in COLUMNS}
+            async for row in page:
+                for column, values in columns.items():
+                    values.append(row.get(column))
+            if not columns['choice']:
+                continue
+            by_day_and_choice.update(count_page(columns['choice'], columns['created_at']))
+            if writer is not None:
+                writer.write(columns)
+            pages += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+    counts = collections.Counter()
+    undated = collections.Counter()
+    days = {}
+    for (day, choice), count in sorted(by_day_and_choice.items(), key=lambda item: (item[0][0] or '', item[0][1])):
+        counts[choice] += count
+        if day is None:
+            undated[choice] += count
+            continue
+        day_counts = days.setdefault(day, {name: 0 for name in choices} | {"total": 0})
+        day_counts[choice] = day_counts.get(choice, 0) + count
+        day_counts["total"] += count
+
+    return {
+        "poll_id": poll_id,
+        "engine": engine(),
+        "pages": pages,
+        "stats": compute_stats({**counts, "total": sum(counts.values())}, choices),
+        "days": days,
+        "undated": dict(undated),
+        "output": path,
+        "format": writer.format if writer is not None else None,
+    }
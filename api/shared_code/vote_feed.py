@@ -0,0 +1,199 @@
+"""
+Flux des nouveaux votes pour le long-poll `GET /votes/changes`.
+
+Chaque worker garde en mémoire, pour chaque sondage suivi, les derniers votes
+(déjà joints aux pseudos) et les statistiques du compteur. Un seul rafraîchissement est en vol à la
+fois et au plus un par intervalle : une lecture ponctuelle du compteur, et
+une requête sur les votes récents seulement quand le total a changé. Le coût
+pour Cosmos suit donc le nombre de nouveaux votes, pas le nombre de clients
+en attente. Un vote écrit par le worker réveille aussitôt ses clients.
+
+Le curseur est la date `created_at` du dernier vote reçu : n'importe quel
+worker peut le servir. Un client trop en retard pour le tampon est servi par
+une requête directe.
+"""
+
+import asyncio
+import bisect
+import datetime
+import os
+import time
+
+from shared_code import tally, user_join
+from shared_code.votes import poll_partition
+
+# Intervalle minimum entre deux rafraîchissements, votes gardés en mémoire,
+# attente maximum d'un long-poll (secondes)
+FEED_POLL_INTERVAL = float(os.environ.get('VOTES_FEED_POLL_INTERVAL', '1'))
+FEED_BUFFER_SIZE = int(os.environ.get('VOTES_FEED_BUFFER_SIZE', '500'))
+FEED_MAX_WAIT = float(os.environ.get('VOTES_FEED_MAX_WAIT', '25'))
+
+# Clients en attente simultanés par worker (ils partagent les rafraîchissements)
+FEED_MAX_CLIENTS = int(os.environ.get('VOTES_FEED_MAX_CLIENTS', '1000'))
+
+# Recouvrement des requêtes incrémentales, pour les votes écrits avec un léger
+# décalage d'horloge entre workers (secondes). Les votes en écriture différée
+# sont datés à leur écriture par `vote_queue.flush`, pas à leur dépôt.
+FEED_OVERLAP = float(os.environ.get('VOTES_FEED_OVERLAP', '5'))
+
+# Votes renvoyés au plus par une requête directe (client en retard)
+FEED_CATCH_UP_LIMIT = int(os.environ.get('VOTES_MAX_LIMIT', '1000'))
+
+SINCE_QUERY = (
+    "SELECT c.id, c.user_id, c.pseudo, c.choice, c.created_at FROM c "
+    "WHERE c.created_at > @since ORDER BY c.created_at ASC"
+)
+LATEST_QUERY = "SELECT c.id, c.user_id, c.pseudo, c.choice, c.created_at FROM c ORDER BY c.created_at DESC OFFSET 0 LIMIT {limit}"
+
+
+def shift(timestamp, seconds):
+    """Décale un horodatage ISO de `seconds` secondes"""
+    if not timestamp:
+        return timestamp
+    return (datetime.datetime.fromisoformat(timestamp) + datetime.timedelta(seconds=seconds)).isoformat()
+
+
+async def _query(votes_container, poll_id, query, parameters=None, limit=None):
+    rows = votes_container.query_items(
+        query=query,
+        parameters=parameters or [],
+        partition_key=poll_partition(poll_id),
+        max_item_count=limit
+    )
+    if limit is None:
+        return [row async for row in rows]
+    page = await anext(rows.by_page(), None)
+    return [row async for row in page] if page is not None else []
+
+
+async def _enrich(users_container, poll, votes):
+    missing = user_join.missing_pseudos(votes)
+    pseudos = await user_join.fetch_pseudos(users_container, missing) if missing else {}
+    return user_join.enrich_votes(votes, pseudos, poll['question'])
+
+
+async def fetch_since(votes_container, users_container, poll, since, limit=FEED_CATCH_UP_LIMIT):
+    """Votes d'un sondage postérieurs au curseur lus directement dans Cosmos (client en retard)"""
+    votes = await _query(votes_container, poll['id'], SINCE_QUERY, [{"name": "@since", "value": since}], limit)
+    return await _enrich(users_container, poll, votes)
+
+
+class VoteFeed:
+    """Tampon des derniers votes et des statistiques d'un sondage, partagé par les long-polls du worker"""
+
+    def __init__(self, poll, poll_interval=FEED_POLL_INTERVAL, buffer_size=FEED_BUFFER_SIZE):
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.votes = []
+        self.stats = None
+        self.complete = False
+        self.refreshed_at = None
+        self._ids = set()
+        self._loop = None
+        self._lock = None
+        self._changed = None
+
+    def _bind(self):
+        """(Re)crée les primitives asyncio pour la boucle d'événements courante"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop, self._lock, self._changed = loop, asyncio.Lock(), asyncio.Event()
+
+    @property
+    def cursor(self):
+        """Curseur du vote le plus récent connu"""
+        return self.votes[-1]['created_at'] if self.votes else ''
+
+    def notify(self):
+        """Signale un vote écrit par ce worker : rafraîchit au prochain passage et réveille les clients"""
+        self.refreshed_at = None
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    def _merge(self, votes):
+        fresh = [vote for vote in votes if vote['id'] not in self._ids]
+        for vote in fresh:
+            bisect.insort(self.votes, vote, key=lambda v: v['created_at'])
+            self._ids.add(vote['id'])
+        if len(self.votes) > self.buffer_size:
+            for vote in self.votes[:-self.buffer_size]:
+                self._ids.discard(vote['id'])
+            self.votes = self.votes[-self.buffer_size:]
+            self.complete = False
+        return fresh
+
+    async def refresh(self, votes_container, users_container, tallies_container):
+        """Met à jour le tampon si l'intervalle est écoulé (un seul rafraîchissement à la fois)"""
+        self._bind()
+        async with self._lock:
+            if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.poll_interval:
+                return
+
+            poll_id, choices = self.poll['id'], self.poll['choices']
+            stats = tally.compute_stats(
+                await tally.read_tally(tallies_container, votes_container, poll_id, choices), choices
+            )
+
+            if self.stats is None:
+                # Premier passage : charger les derniers votes
+                latest = await _query(votes_container, poll_id, LATEST_QUERY.format(limit=self.buffer_size))
+                self.complete = len(latest) < self.buffer_size
+                fresh = self._merge(await _enrich(users_container, self.poll, list(reversed(latest))))
+            elif stats != self.stats:
+                # Le total a changé : ne lire que les votes récents
+                since = shift(self.cursor, -FEED_OVERLAP)
+                recent = await _query(votes_container, poll_id, SINCE_QUERY, [{"name": "@since", "value": since}])
+                recent = [vote for vote in recent if vote['id'] not in self._ids]
+                fresh = self._merge(await _enrich(users_container, self.poll, recent)) if recent else []
+            else:
+                fresh = []
+
+            changed = bool(fresh) or stats != self.stats
+            self.stats = stats
+            self.refreshed_at = time.monotonic()
+            if changed:
+                self._changed.set()
+                self._changed = asyncio.Event()
+
+    def changes_since(self, since):
+        """Votes du tampon postérieurs au curseur, ou None s'il ne remonte pas jusque-là"""
+        if self.votes and not self.complete and since < self.votes[0]['created_at']:
+            return None
+        start = bisect.bisect_right(self.votes, since, key=lambda v: v['created_at'])
+        return self.votes[start:]
+
+    async def wait(self, timeout):
+        """Attend un changement du tampon ou l'expiration du délai"""
+        self._bind()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class FeedRegistry:
+    """Flux des sondages suivis par le worker, créés à la première demande"""
+
+    def __init__(self, poll_interval=FEED_POLL_INTERVAL, buffer_size=FEED_BUFFER_SIZE):
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self._feeds = {}
+
+    def get(self, poll):
+        """Flux du sondage, créé s'il n'est pas encore suivi"""
+        feed = self._feeds.get(poll['id'])
+        if feed is None:
+            feed = self._feeds[poll['id']] = VoteFeed(poll, self.poll_interval, self.buffer_size)
+        return feed
+
+    def notify(self, poll_id):
+        """Signale un vote écrit par ce worker dans le sondage `poll_id`"""
+        feed = self._feeds.get(poll_id)
+        if feed is not None:
+            feed.notify()
+
+
+# Flux partagés par les invocations du worker
+feeds = FeedRegistry()
@@ -0,0 +1,429 @@
+"""
+Écriture différée des votes.
+
+Avec VOTE_WRITE_BEHIND=1, POST /vote valide la requête (sondage mémorisé et
+choix, sans aller-retour Cosmos), dépose le vote dans une file durable et
+répond 202. `flush` vide ensuite la file par lots :
+- les auteurs du lot sont vérifiés (et leurs pseudos lus) en quelques requêtes groupées ;
+- les votes sont écrits par écritures simultanées (`bulk.create_many`),
+  datés de leur écriture et non de leur dépôt : un vote vidé en retard ne
+  tombe pas derrière le curseur des lecteurs de `GET /votes/changes` ;
+- le compteur de chaque sondage reçoit une seule mise à jour par lot.
+
+Les écritures limitées par Cosmos (429) sont rejouées avec un délai croissant.
+Un message qui n'a pas pu être traité redevient visible après
+VOTE_QUEUE_VISIBILITY_TIMEOUT et part dans la file `<nom>-poison` au-delà de
+VOTE_QUEUE_MAX_DEQUEUE remises. Un vote en double ou d'un utilisateur inconnu
+est écarté (et journalisé) : le client a déjà reçu son 202.
+
+Seule la tâche planifiée `flushVoteQueue` vide la file, sur une seule instance :
+la file doit être partagée par toutes les instances. En production, c'est une
+file Azure Storage (`StorageQueue`, VOTE_QUEUE_CONNECTION, paquet optionnel
+`azure-storage-queue`). `LocalQueue` (fichier SQLite) en reprend l'interface
+et la sémantique (visibilité, nombre de remises, accusé par reçu, file poison)
+pour le développement local et les tests seulement : SQLite en WAL ne
+supporte pas un fichier partagé par plusieurs machines (partage SMB). Dans
+Azure, sans VOTE_QUEUE_CONNECTION, l'écriture différée reste désactivée : un
+vote déposé sur le disque d'une instance ne serait jamais écrit.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.cosmos import exceptions
+
+try:
+    from azure.storage.queue import QueueClient
+except ImportError:  # azure-storage-queue est optionnel (nécessaire seulement pour la file de production)
+    QueueClient = None
+
+from shared_code import bulk, rollups, tally, user_join, votes
+
+# Compte de stockage de la file partagée par toutes les instances (obligatoire dans Azure), et nom de la file
+VOTE_QUEUE_CONNECTION = os.environ.get('VOTE_QUEUE_CONNECTION', '')
+VOTE_QUEUE_NAME = os.environ.get('VOTE_QUEUE_NAME', 'votes')
+
+# Fichier SQLite de la file locale (développement, scripts et tests)
+VOTE_QUEUE_PATH = os.environ.get('VOTE_QUEUE_PATH', '')
+DEFAULT_QUEUE_PATH = os.path.join(tempfile.gettempdir(), 'bayrou-vote-queue.sqlite3')
+
+# Messages au plus par lecture d'une file Azure Storage, et délai de visibilité minimum (secondes)
+STORAGE_QUEUE_PAGE_SIZE = 32
+STORAGE_QUEUE_MIN_VISIBILITY = 1
+
+# Messages lus par lot, délai avant nouvelle remise (secondes) et remises avant la file poison
+VOTE_QUEUE_BATCH_SIZE = int(os.environ.get('VOTE_QUEUE_BATCH_SIZE', '100'))
+VOTE_QUEUE_VISIBILITY_TIMEOUT = float(os.environ.get('VOTE_QUEUE_VISIBILITY_TIMEOUT', '30'))
+VOTE_QUEUE_MAX_DEQUEUE = int(os.environ.get('VOTE_QUEUE_MAX_DEQUEUE', '5'))
+
+# Tentatives après 429 et délai de base (secondes, doublé à chaque tentative)
+VOTE_FLUSH_MAX_RETRIES = int(os.environ.get('VOTE_FLUSH_MAX_RETRIES', '5'))
+VOTE_FLUSH_BACKOFF = float(os.environ.get('VOTE_FLUSH_BACKOFF', '0.1'))
+VOTE_FLUSH_MAX_BACKOFF = 5.0
+
+# Durée maximum d'un vidage de la file par la tâche planifiée (secondes)
+VOTE_FLUSH_TIME_BUDGET = float(os.environ.get('VOTE_FLUSH_TIME_BUDGET', '60'))
+
+THROTTLED = 429
+
+
+def write_behind_enabled():
+    """Écriture différée demandée (VOTE_WRITE_BEHIND) et file utilisable : Azure Storage dans Azure, SQLite en local"""
+    if os.environ.get('VOTE_WRITE_BEHIND', '0').lower() not in ('1', 'true', 'yes'):
+        return False
+    if VOTE_QUEUE_CONNECTION:
+        if QueueClient is None:
+            logging.error("VOTE_WRITE_BEHIND ignored: VOTE_QUEUE_CONNECTION requires the azure-storage-queue package")
+            return False
+        return True
+    if os.environ.get('WEBSITE_INSTANCE_ID'):
+        logging.error("VOTE_WRITE_BEHIND ignored: VOTE_QUEUE_CONNECTION must name the storage account of a queue shared by every instance")
+        return False
+    return True
+
+
+# Écriture différée des votes (POST /vote répond 202)
+WRITE_BEHIND = write_behind_enabled()
+
+# Vidage toutes les 5 secondes ; sans écriture différée, la tâche ne se réveille qu'une fois par heure
+VOTE_FLUSH_SCHEDULE = "*/5 * * * * *" if WRITE_BEHIND else "0 0 * * * *"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    content TEXT NOT NULL,
+    dequeue_count INTEGER NOT NULL DEFAULT 0,
+    pop_receipt TEXT,
+    visible_at REAL NOT NULL,
+    inserted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_visible ON messages (queue, visible_at, id);
+"""
+
+
+class QueueMessage:
+    """Message reçu : contenu, nombre de remises et reçu nécessaire à sa suppression"""
+
+    __slots__ = ('id', 'content', 'dequeue_count', 'pop_receipt')
+
+    def __init__(self, id, content, dequeue_count, pop_receipt):
+        self.id = id
+        self.content = content
+        self.dequeue_count = dequeue_count
+        self.pop_receipt = pop_receipt
+
+
+class LocalQueue:
+    """File durable dans un fichier SQLite, à la manière d'une file Azure Storage (local et tests)"""
+
+    def __init__(self, path=None, name=VOTE_QUEUE_NAME):
+        self.path = path or VOTE_QUEUE_PATH or DEFAULT_QUEUE_PATH
+        self.name = name
+        self._ready = False
+
+    @property
+    def poison(self):
+        """File des messages abandonnés"""
+        return LocalQueue(self.path, f"{self.name}-poison")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Une connexion par opération : utilisable depuis plusieurs threads et processus
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                self._ready = True
+            yield connection
+        finally:
+            connection.close()
+
+    def put(self, content):
+        """Dépose un message (objet JSON) et retourne son identifiant"""
+        now = time.time()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO messages (queue, content, visible_at, inserted_at) VALUES (?, ?, ?, ?)",
+                (self.name, json.dumps(content), now, now)
+            )
+            return cursor.lastrowid
+
+    def receive(self, max_messages=VOTE_QUEUE_BATCH_SIZE, visibility_timeout=VOTE_QUEUE_VISIBILITY_TIMEOUT):
+        """Lit jusqu'à `max_messages` messages visibles et les masque pendant `visibility_timeout`"""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    "SELECT id, content, dequeue_count FROM messages WHERE queue = ? AND visible_at <= ? ORDER BY id LIMIT ?",
+                    (self.name, now, max_messages)
+                ).fetchall()
+                messages = []
+                for message_id, content, dequeue_count in rows:
+                    pop_receipt = uuid.uuid4().hex
+                    connection.execute(
+                        "UPDATE messages SET dequeue_count = ?, pop_receipt = ?, visible_at = ? WHERE id = ?",
+                        (dequeue_count + 1, pop_receipt, now + visibility_timeout, message_id)
+                    )
+                    messages.append(QueueMessage(message_id, json.loads(content), dequeue_count + 1, pop_receipt))
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return messages
+
+    def delete(self, message):
+        """Supprime un message reçu ; sans effet si le message a été remis depuis à un autre consommateur"""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM messages WHERE id = ? AND pop_receipt = ?", (message.id, message.pop_receipt))
+
+    def dead_letter(self, message):
+        """Déplace un message reçu vers la file poison"""
+        with self._connect() as connection:
+            updated = connection.execute(
+                "UPDATE messages SET queue = ?, visible_at = ? WHERE id = ? AND pop_receipt = ?",
+                (self.poison.name, time.time(), message.id, message.pop_receipt)
+            )
+            return updated.rowcount == 1
+
+    def count(self):
+        """Nombre de messages de la file, visibles ou non"""
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM messages WHERE queue = ?", (self.name,)).fetchone()[0]
+
+
+def _storage_client(connection, name):
+    """Client de la file Azure Storage `name`"""
+    if QueueClient is None:
+        raise RuntimeError("azure-storage-queue is required with VOTE_QUEUE_CONNECTION")
+    return QueueClient.from_connection_string(connection, queue_name=name)
+
+
+class StorageQueue:
+    """File Azure Storage partagée par toutes les instances, avec l'interface de `LocalQueue`"""
+
+    def __init__(self, connection=None, name=VOTE_QUEUE_NAME, client_factory=None):
+        self.connection = connection or VOTE_QUEUE_CONNECTION
+        self.name = name
+        self._client_factory = client_factory or _storage_client
+        self._client = None
+
+    @property
+    def poison(self):
+        """File des messages abandonnés"""
+        return StorageQueue(self.connection, f"{self.name}-poison", self._client_factory)
+
+    def _queue(self):
+        # File créée au premier accès (idempotent)
+        if self._client is None:
+            client = self._client_factory(self.connection, self.name)
+            try:
+                client.create_queue()
+            except ResourceExistsError:
+                pass
+            self._client = client
+        return self._client
+
+    def put(self, content):
+        """Dépose un message (objet JSON) et retourne son identifiant"""
+        return self._queue().send_message(json.dumps(content)).id
+
+    def receive(self, max_messages=VOTE_QUEUE_BATCH_SIZE, visibility_timeout=VOTE_QUEUE_VISIBILITY_TIMEOUT):
+        """Lit jusqu'à `max_messages` messages visibles et les masque pendant `visibility_timeout`"""
+        received = self._queue().receive_messages(
+            messages_per_page=min(max_messages, STORAGE_QUEUE_PAGE_SIZE),
+            visibility_timeout=max(STORAGE_QUEUE_MIN_VISIBILITY, math.ceil(visibility_timeout)),
+            max_messages=max_messages
+        )
+        return [
+            QueueMessage(message.id, json.loads(message.content), message.dequeue_count, message.pop_receipt)
+            for message in received
+        ]
+
+    def _delete(self, message):
+        """Supprime un message reçu ; False s'il a été remis depuis à un autre consommateur (ou supprimé)"""
+        try:
+            self._queue().delete_message(message.id, message.pop_receipt)
+        except ResourceNotFoundError:
+            return False
+        except HttpResponseError as e:
+            if getattr(e, 'error_code', None) != 'PopReceiptMismatch':
+                raise
+            return False
+        return True
+
+    def delete(self, message):
+        """Supprime un message reçu ; sans effet si le message a été remis depuis à un autre consommateur"""
+        self._delete(message)
+
+    def dead_letter(self, message):
+        """Déplace un message reçu vers la file poison (copie puis suppression)"""
+        self.poison.put(message.content)
+        return self._delete(message)
+
+    def count(self):
+        """Nombre approximatif de messages de la file, visibles ou non"""
+        return self._queue().get_queue_properties().approximate_message_count
+
+
+def make_queue():
+    """File du worker : Azure Storage avec VOTE_QUEUE_CONNECTION, sinon fichier SQLite local"""
+    if VOTE_QUEUE_CONNECTION:
+        return StorageQueue()
+    return LocalQueue()
+
+
+# File du worker (remplacée dans les tests)
+queue = make_queue()
+
+
+def vote_message(poll_id, user_id, choice):
+    """Contenu du message d'un vote en attente d'écriture (daté à son écriture par `flush`)"""
+    return {"poll_id": poll_id, "user_id": user_id, "choice": choice}
+
+
+async def enqueue(message):
+    """Dépose un vote dans la file du worker sans bloquer la boucle d'événements"""
+    return await asyncio.to_thread(queue.put, message)
+
+
+def _backoff(attempt):
+    """Délai avant la tentative suivante : exponentiel, plafonné, avec gigue"""
+    return random.uniform(0.5, 1.0) * min(VOTE_FLUSH_MAX_BACKOFF, VOTE_FLUSH_BACKOFF * 2 ** attempt)
+
+
+async def _create_votes(votes_container, documents, max_retries):
+    """Écrit les votes par écritures simultanées ; les 429 sont rejoués avec un délai croissant"""
+    statuses = [None] * len(documents)
+    pending = list(range(len(documents)))
+    for attempt in range(max_retries + 1):
+        if attempt:
+            await asyncio.sleep(_backoff(attempt - 1))
+        results = await bulk.create_many(votes_container, [documents[index] for index in pending])
+        for index, status in zip(pending, results):
+            statuses[index] = status
+        pending = [index for index in pending if statuses[index] == THROTTLED]
+        if not pending:
+            break
+    return statuses
+
+
+async def _record_votes(tallies_container, counts, poll_id, max_retries):
+    """Mise à jour du compteur d'un sondage ; les 429 sont rejoués avec un délai croissant"""
+    for attempt in range(max_retries + 1):
+        try:
+            return await tally.record_votes(tallies_container, counts, tally_id=poll_id)
+        except exceptions.CosmosHttpResponseError as e:
+            if e.status_code != THROTTLED or attempt == max_retries:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+
+
+async def flush(votes_container, users_container, tallies_container, vote_queue=None,
+                batch_size=None, max_retries=None, max_dequeue=None, rollups_container=None):
+    """Traite un lot de la file et retourne son bilan (messages lus, votes écrits, écartés, laissés en file).
+
+    Sans `tallies_container` ni `rollups_container` (flux de modifications), seuls les votes sont écrits.
+    """
+    vote_queue = vote_queue or queue
+    max_retries = VOTE_FLUSH_MAX_RETRIES if max_retries is None else max_retries
+    max_dequeue = max_dequeue or VOTE_QUEUE_MAX_DEQUEUE
+    messages = await asyncio.to_thread(
+        vote_queue.receive, batch_size or VOTE_QUEUE_BATCH_SIZE, VOTE_QUEUE_VISIBILITY_TIMEOUT
+    )
+    result = {"received": len(messages), "created": 0, "duplicates": 0, "unknown_users": 0,
+              "failed": 0, "poisoned": 0, "polls": []}
+
+    # Messages déjà remis trop souvent : file poison
+    live = []
+    for message in messages:
+        if message.dequeue_count > max_dequeue:
+            logging.error(f"Vote message {message.id} moved to poison queue after {max_dequeue} attempts")
+            await asyncio.to_thread(vote_queue.dead_letter, message)
+            result["poisoned"] += 1
+        else:
+            live.append(message)
+    if not live:
+        return result
+
+    # Auteurs du lot résolus en quelques requêtes groupées
+    existing = await user_join.fetch_pseudos(users_container, [message.content['user_id'] for message in live])
+    done, accepted = [], []
+    for message in live:
+        if message.content['user_id'] in existing:
+            accepted.append(message)
+        else:
+            logging.warning(f"Dropping queued vote of unknown user {message.content['user_id']}")
+            result["unknown_users"] += 1
+            done.append(message)
+
+    # Votes datés de leur écriture : visibles au-delà du curseur des lecteurs du flux
+    created_at = datetime.datetime.utcnow().isoformat()
+    documents = [
+        votes.vote_document(vote['poll_id'], vote['user_id'], vote['choice'], created_at, existing[vote['user_id']])
+        for vote in (message.content for message in accepted)
+    ]
+    statuses = await _create_votes(votes_container, documents, max_retries)
+
+    # Une seule mise à jour du compteur par sondage et par lot
+    counts, created = {}, {}
+    for message, document, status in zip(accepted, documents, statuses):
+        if status == 201:
+            poll_counts = counts.setdefault(document['poll_id'], {})
+            poll_counts[document['choice']] = poll_counts.get(document['choice'], 0) + 1
+            created.setdefault(document['poll_id'], []).append(document)
+            result["created"] += 1
+            done.append(message)
+        elif status == 409:
+            result["duplicates"] += 1
+            done.append(message)
+        else:
+            # Laissé en file : nouvelle remise après le délai de visibilité
+            logging.warning(f"Queued vote of {document['user_id']} not written (HTTP {status}), will be retried")
+            result["failed"] += 1
+
+    for poll_id, poll_counts in counts.items():
+        if tallies_container is not None:
+            try:
+                await _record_votes(tallies_container, poll_counts, poll_id, max_retries)
+            except Exception as e:
+                # Une dérive éventuelle est corrigée par la réconciliation
+                logging.error(f"Error updating vote tally: {str(e)}")
+        if rollups_container is not None:
+            try:
+                await rollups.record_votes(rollups_container, poll_id, created[poll_id])
+            except Exception as e:
+                # Une dérive éventuelle est corrigée par scripts.rebuild_vote_rollups
+                logging.error(f"Error updating vote rollups: {str(e)}")
+
+    for message in done:
+        await asyncio.to_thread(vote_queue.delete, message)
+    result["polls"] = sorted(counts)
+    return result
+
+
+async def drain(votes_container, users_container, tallies_container, vote_queue=None, time_budget=None,
+                rollups_container=None):
+    """Traite la file lot après lot jusqu'à ce qu'elle soit vide ou que `time_budget` (secondes) soit écoulé"""
+    deadline = time.monotonic() + time_budget if time_budget else None
+    totals = {}
+    while True:
+        result = await flush(votes_container, users_container, tallies_container, vote_queue,
+                             rollups_container=rollups_container)
+        for key, value in result.items():
+            totals[key] = sorted(set(totals.get(key, [])) | set(value)) if key == "polls" else totals.get(key, 0) + value
+        if not result["received"] or result["failed"] or (deadline and time.monotonic() >= deadline):
+            return totals
@@ -0,0 +1,219 @@
+"""
+Documents de vote.
+
+Un vote ne contient que l'identifiant de son sondage, celui de son auteur,
+le choix et la date : la question est lue dans le sondage. Le container est
+partitionné par la clé hiérarchique (`/poll_id`, `/user_id`) : chaque sondage
+occupe ses propres partitions logiques et les requêtes d'un sondage ciblent
+le préfixe `[poll_id]` sans balayer les votes des autres sondages.
+
+Le vote porte aussi le pseudo de son auteur, recopié à l'écriture : les
+lectures n'ont pas à joindre les votes aux utilisateurs. `backfill_pseudos`
+complète les votes écrits avant cette dénormalisation.
+
+L'identifiant d'un vote est celui de son auteur : un vote par utilisateur et
+par sondage correspond à un seul document possible. Un second vote est refusé
+par Cosmos lui-même (409 sur `create_item`), sans requête préalable ni fenêtre
+de concurrence entre vérification et insertion.
+"""
+
+import asyncio
+import datetime
+import os
+import time
+
+from azure.cosmos import exceptions
+
+from shared_code import telemetry, user_join
+from shared_code.polls import DEFAULT_POLL_ID
+
+# Votes lus par page et écritures simultanées de la migration et du remplissage des pseudos
+BACKFILL_PAGE_SIZE = int(os.environ.get('BACKFILL_PAGE_SIZE', '100'))
+BACKFILL_MAX_CONCURRENCY = int(os.environ.get('BACKFILL_MAX_CONCURRENCY', '8'))
+
+BACKFILL_SCAN_QUERY = "SELECT c.id, c.poll_id, c.user_id, c.pseudo FROM c"
+MIGRATION_SCAN_QUERY = "SELECT c.user_id, c.choice, c.created_at FROM c ORDER BY c.created_at ASC"
+
+
+def vote_id(user_id):
+    """Identifiant du vote d'un utilisateur (unique dans la partition du sondage et de l'utilisateur)"""
+    return user_id
+
+
+def partition_key(poll_id, user_id):
+    """Clé de partition hiérarchique d'un vote"""
+    return [poll_id, user_id]
+
+
+def poll_partition(poll_id):
+    """Préfixe de clé de partition couvrant tous les votes d'un sondage"""
+    return [poll_id]
+
+
+def vote_document(poll_id, user_id, choice, created_at, pseudo=None):
+    """Document stocké pour un vote (sans pseudo s'il n'est pas connu, à compléter par `backfill_pseudos`)"""
+    document = {
+        "id": vote_id(user_id),
+        "poll_id": poll_id,
+        "user_id": user_id,
+        "choice": choice,
+        "created_at": created_at
+    }
+    if pseudo is not None:
+        document["pseudo"] = pseudo
+    return document
+
+
+async def create_vote(votes_container, document, budget, semaphore):
+    """Recopie un vote ; False s'il existe déjà (doublon ou vote recopié par une exécution précédente)"""
+    async with semaphore:
+        try:
+            await votes_container.create_item(body=document, response_hook=budget.hook)
+        except exceptions.CosmosResourceExistsError:
+            return False
+    return True
+
+
+async def migrate_to_polls(legacy_container, votes_container, poll_id=DEFAULT_POLL_ID, apply=False,
+                           checkpoint=None, save=None, page_size=None, ru_per_second=None):
+    """Recopie les votes de l'ancien container `votes` dans le container partitionné par sondage.
+
+    Les votes sont rattachés au sondage `poll_id` et réduits aux champs utiles.
+    L'ancien container est parcouru page par page, du plus ancien vote au plus
+    récent : en cas de doublon (anciens identifiants aléatoires), le premier
+    vote de l'utilisateur est conservé. Un vote déjà présent (409) est compté
+    dans `duplicates` : c'est un doublon ou un vote recopié par une exécution
+    précédente. Après chaque page, l'état est passé à `save`, comme pour
+    `backfill_pseudos`. L'ancien container n'est pas modifié. Sans `apply`, se
+    contente de compter.
+    """
+    state = {"continuation": None, "legacy": 0, "migrated": 0, "duplicates": 0,
+             **(checkpoint or {}), "done": False, "applied": apply}
+    budget = RequestUnitBudget(ru_per_second)
+    semaphore = asyncio.Semaphore(BACKFILL_MAX_CONCURRENCY)
+
+    pager = legacy_container.query_items(
+        query=MIGRATION_SCAN_QUERY,
+        enable_cross_partition_query=True,
+        max_item_count=page_size or BACKFILL_PAGE_SIZE,
+        response_hook=budget.hook
+    ).by_page(state["continuation"])
+
+    async for page in pager:
+        rows = [row async for row in page]
+        state["legacy"] += len(rows)
+
+        if apply:
+            # Premier vote de chaque utilisateur dans la page ; les pages précédentes sont déjà écrites
+            first = {}
+            for row in rows:
+                first.setdefault(row['user_id'], row)
+            created = await asyncio.gather(*(
+                create_vote(votes_container, vote_document(poll_id, row['user_id'], row['choice'], row['created_at']),
+                            budget, semaphore)
+                for row in first.values()
+            ))
+            state["migrated"] += sum(created)
+            state["duplicates"] += len(rows) - sum(created)
+
+        state["continuation"] = pager.continuation_token
+        if save is not None:
+            save(dict(state))
+        await budget.spend()
+
+    state["done"] = True
+    if save is not None:
+        save(dict(state))
+    return state
+
+
+class RequestUnitBudget:
+    """Débit maximum de RU d'une tâche de fond : `spend` attend avant de dépasser `per_second`"""
+
+    def __init__(self, per_second=None, clock=time.monotonic, sleep=asyncio.sleep):
+        self.per_second = per_second
+        self.spent = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._started = clock()
+
+    def hook(self, headers, result):
+        """`response_hook` Cosmos qui décompte la charge de chaque réponse"""
+        self.spent += float((headers or {}).get(telemetry.REQUEST_CHARGE_HEADER, 0) or 0)
+
+    async def spend(self, charge=0.0):
+        """Ajoute une charge et attend le temps nécessaire pour rester sous le débit"""
+        self.spent += charge
+        if not self.per_second:
+            return
+        ahead = self.spent / self.per_second - (self._clock() - self._started)
+        if ahead > 0:
+            await self._sleep(ahead)
+
+
+async def patch_pseudo(votes_container, vote, pseudo, budget, semaphore):
+    """Recopie le pseudo sur un vote par une mise à jour partielle (datée par `updated_at`) ; False si le vote n'existe plus"""
+    async with semaphore:
+        try:
+            await votes_container.patch_item(
+                item=vote['id'],
+                partition_key=partition_key(vote['poll_id'], vote['user_id']),
+                patch_operations=[
+                    {"op": "set", "path": "/pseudo", "value": pseudo},
+                    {"op": "set", "path": "/updated_at", "value": datetime.datetime.utcnow().isoformat()}
+                ],
+                response_hook=budget.hook
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return False
+    return True
+
+
+async def backfill_pseudos(votes_container, users_container, apply=False, checkpoint=None, save=None,
+                           page_size=None, ru_per_second=None):
+    """Recopie le pseudo de leur auteur sur les votes qui n'en ont pas.
+
+    Le container est parcouru page par page ; les pseudos manquants d'une page
+    sont lus en quelques requêtes groupées puis écrits par mises à jour
+    partielles (`patch_item`). Les auteurs supprimés reçoivent le libellé
+    `DELETED_USER_PSEUDO`. Après chaque page, l'état (jeton de continuation
+    et compteurs) est passé à `save` : une exécution interrompue reprend avec
+    `checkpoint=<dernier état>`. `ru_per_second` borne le débit de RU
+    consommées. Sans `apply`, se contente de compter.
+    """
+    state = {"continuation": None, "scanned": 0, "missing": 0, "patched": 0, "deleted_users": 0,
+             **(checkpoint or {}), "done": False, "applied": apply}
+    budget = RequestUnitBudget(ru_per_second)
+    semaphore = asyncio.Semaphore(BACKFILL_MAX_CONCURRENCY)
+
+    pager = votes_container.query_items(
+        query=BACKFILL_SCAN_QUERY,
+        enable_cross_partition_query=True,
+        max_item_count=page_size or BACKFILL_PAGE_SIZE,
+        response_hook=budget.hook
+    ).by_page(state["continuation"])
+
+    async for page in pager:
+        rows = [row async for row in page]
+        missing = [row for row in rows if row.get('pseudo') is None]
+        state["scanned"] += len(rows)
+        state["missing"] += len(missing)
+
+        if apply and missing:
+            pseudos = await user_join.fetch_pseudos(users_container, [row['user_id'] for row in missing])
+            patched = await asyncio.gather(*(
+                patch_pseudo(votes_container, row, user_join.pseudo_for(pseudos, row['user_id']), budget, semaphore)
+                for row in missing
+            ))
+            state["patched"] += sum(patched)
+            state["deleted_users"] += sum(1 for row in missing if row['user_id'] not in pseudos)
+
+        state["continuation"] = pager.continuation_token
+        if save is not None:
+            save(dict(state))
+        await budget.spend()
+
+    state["done"] = True
+    if save is not None:
+        save(dict(state))
+    return state
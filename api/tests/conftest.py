@@ -0,0 +1,89 @@
+"""
+Fixtures partagées des tests unitaires de l'API
+"""
+
+import asyncio
+import inspect
+import json
+
+import azure.functions as func
+import pytest
+
+from shared_code import cosmos_pool, password_hashing, polls, resilience, snapshots, vote_feed, vote_queue
+from shared_code.response_cache import votes_cache
+from tests.fake_cosmos import FakeCosmosClient
+
+
+@pytest.fixture(autouse=True)
+def fast_hasher(monkeypatch):
+    """Utilise le coût bcrypt minimal pour garder les tests rapides"""
+    hasher = password_hashing.PasswordHasher(rounds=4, workers=2, queue_limit=4)
+    monkeypatch.setattr(password_hashing, 'hasher', hasher)
+    return hasher
+
+
+@pytest.fixture(autouse=True)
+def circuit_breaker(monkeypatch):
+    """Donne à chaque test un disjoncteur fermé"""
+    breaker = resilience.CircuitBreaker()
+    monkeypatch.setattr(resilience, 'breaker', breaker)
+    return breaker
+
+
+@pytest.fixture
+def fake_cosmos(monkeypatch):
+    """Remplace le pool Cosmos partagé par un faux client en mémoire, containers déjà créés"""
+    client = FakeCosmosClient()
+    for name, path in cosmos_pool.CONTAINERS.items():
+        client.container(cosmos_pool.DATABASE_NAME, name, path)
+    monkeypatch.setattr(cosmos_pool, 'pool', cosmos_pool.CosmosPool(client_factory=lambda: client))
+    monkeypatch.setattr(vote_feed, 'feeds', vote_feed.FeedRegistry(poll_interval=0.05))
+    polls.clear_cache()
+    votes_cache.invalidate()
+    return client
+
+
+@pytest.fixture
+def local_queue(monkeypatch, tmp_path):
+    """Remplace la file des votes du worker par une file SQLite temporaire"""
+    queue = vote_queue.LocalQueue(str(tmp_path / 'votes.sqlite3'))
+    monkeypatch.setattr(vote_queue, 'queue', queue)
+    return queue
+
+
+@pytest.fixture
+def snapshot_store(monkeypatch, tmp_path):
+    """Active les instantanés de GET /votes dans un dossier temporaire, calculés sans délai"""
+    store = snapshots.LocalBlobStore(str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(snapshots, 'SNAPSHOTS_ENABLED', True)
+    monkeypatch.setattr(snapshots, 'store', store)
+    monkeypatch.setattr(snapshots, 'publisher', snapshots.SnapshotPublisher(debounce=0))
+    return store
+
+
+@pytest.fixture
+def container(fake_cosmos):
+    """Retourne un container du faux Cosmos, créé avec la clé de partition de l'API"""
+
+    def _container(name):
+        return fake_cosmos.container(cosmos_pool.DATABASE_NAME, name, cosmos_pool.CONTAINERS[name])
+
+    return _container
+
+
+@pytest.fixture
+def call():
+    """Appelle un handler HTTP comme le runtime Azure Functions"""
+
+    def _call(handler, method='GET', route='', body=None, params=None, headers=None):
+        request = func.HttpRequest(
+            method=method,
+            url=f'http://localhost:7071/api/{route}',
+            body=body if isinstance(body, bytes) else json.dumps(body).encode('utf-8') if body is not None else b'',
+            params=params or {},
+            headers=headers or {}
+        )
+        response = handler.build().get_user_function()(request)
+        return asyncio.run(response) if inspect.iscoroutine(response) else response
+
+    return _call
@@ -0,0 +1,459 @@
+"""
+Faux Cosmos DB en mémoire pour les tests unitaires.
+
+Reproduit le sous-ensemble de l'API azure.cosmos.aio utilisé par l'API
+(client, base, containers, requêtes SQL simples, pagination) sans réseau.
+Les méthodes `seed` et `get` des containers permettent aux tests de préparer
+et vérifier les données de façon synchrone ; `fail_next` simule une saturation
+(429 avec `x-ms-retry-after-ms`, 503...) sur les appels suivants. Le flux de
+modifications (dernière version de chaque document, par ordre de `_lsn`) est
+réparti en `FEED_RANGES` plages selon la clé de partition.
+"""
+
+import copy
+import itertools
+import json
+import re
+import time
+import uuid
+import zlib
+
+from azure.cosmos import exceptions
+
+_lsn_counter = itertools.count(1)
+
+_QUERY_RE = re.compile(
+    r"^SELECT\s+(?P<value>VALUE\s+)?(?P<projection>.+?)\s+FROM\s+c"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>c\.[\w.]+))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>c\.[\w.]+)(?:\s+(?P<direction>ASC|DESC))?)?"
+    r"(?:\s+OFFSET\s+(?P<offset>\d+)\s+LIMIT\s+(?P<limit>\d+))?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+_COMPARISON_RE = re.compile(r"^(c\.[\w.]+)\s*(=|!=|<>|>=|<=|>|<)\s*(.+)$")
+_ARRAY_CONTAINS_RE = re.compile(r"^ARRAY_CONTAINS\((.+?),\s*(c\.[\w.]+)\)$", re.IGNORECASE)
+_IS_DEFINED_RE = re.compile(r"^(NOT\s+)?IS_DEFINED\((c\.[\w.]+)\)$", re.IGNORECASE)
+_COUNT_RE = re.compile(r"^COUNT\(1\)(?:\s+AS\s+(\w+))?$", re.IGNORECASE)
+
+_MISSING = object()
+
+
+def _get_path(doc, path):
+    """Lit un champ `c.a.b` dans un document"""
+    value = doc
+    for key in path.split('.')[1:]:
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+def _literal(token, parameters):
+    """Résout un paramètre `@x` ou une constante SQL"""
+    token = token.strip()
+    if token.startswith('@'):
+        return parameters[token]
+    if token.startswith("'") and token.endswith("'"):
+        return token[1:-1]
+    if token.lower() in ('true', 'false'):
+        return token.lower() == 'true'
+    if token.lower() == 'null':
+        return None
+    return float(token) if '.' in token else int(token)
+
+
+def _compare(left, operator, right):
+    if left is _MISSING:
+        return False
+    try:
+        if operator == '=':
+            return left == right
+        if operator in ('!=', '<>'):
+            return left != right
+        if operator == '>':
+            return left > right
+        if operator == '>=':
+            return left >= right
+        if operator == '<':
+            return left < right
+        return left <= right
+    except TypeError:
+        return False
+
+
+def _build_predicate(where, parameters):
+    """Compile une clause WHERE composée de termes reliés par AND"""
+    if not where:
+        return lambda doc: True
+
+    predicates = []
+    for term in re.split(r"\s+AND\s+", where.strip(), flags=re.IGNORECASE):
+        term = term.strip()
+        while term.startswith('(') and term.endswith(')'):
+            term = term[1:-1].strip()
+
+        match = _ARRAY_CONTAINS_RE.match(term)
+        if match:
+            values, path = _literal(match.group(1), parameters), match.group(2)
+            predicates.append(lambda doc, v=values, p=path: _get_path(doc, p) in v)
+            continue
+
+        match = _IS_DEFINED_RE.match(term)
+        if match:
+            negate, path = bool(match.group(1)), match.group(2)
+            predicates.append(lambda doc, n=negate, p=path: (_get_path(doc, p) is _MISSING) == n)
+            continue
+
+        match = _COMPARISON_RE.match(term)
+        if not match:
+            raise ValueError(f"Unsupported query term in fake Cosmos: {term}")
+        path, operator, value = match.group(1), match.group(2), _literal(match.group(3), parameters)
+        predicates.append(lambda doc, p=path, o=operator, v=value: _compare(_get_path(doc, p), o, v))
+
+    return lambda doc: all(predicate(doc) for predicate in predicates)
+
+
+def run_query(documents, query, parameters=None):
+    """Exécute une requête SQL Cosmos simple sur une liste de documents"""
+    parameters = {p['name']: p['value'] for p in (parameters or [])}
+    match = _QUERY_RE.match(' '.join(query.split()))
+    if not match:
+        raise ValueError(f"Unsupported query in fake Cosmos: {query}")
+
+    predicate = _build_predicate(match.group('where'), parameters)
+    results = [doc for doc in documents if predicate(doc)]
+
+    if match.group('order'):
+        path = match.group('order')
+        descending = (match.group('direction') or '').upper() == 'DESC'
+
+        def sort_key(doc):
+            value = _get_path(doc, path)
+            return (value is not _MISSING, value if value is not _MISSING else '')
+
+        results.sort(key=sort_key, reverse=descending)
+
+    projection = match.group('projection').strip()
+    fields = [field.strip() for field in projection.split(',')]
+
+    if match.group('group'):
+        group_path = match.group('group')
+        groups = {}
+        for doc in results:
+            groups.setdefault(_get_path(doc, group_path), []).append(doc)
+        rows = []
+        for key, docs in groups.items():
+            row = {}
+            for field in fields:
+                count = _COUNT_RE.match(field)
+                if count:
+                    row[count.group(1) or '$1'] = len(docs)
+                else:
+                    row[field.split('.')[-1]] = key
+            rows.append(row)
+        return rows
+
+    count = _COUNT_RE.match(projection)
+    if count:
+        return [len(results)] if match.group('value') else [{count.group(1) or '$1': len(results)}]
+
+    if match.group('offset'):
+        start = int(match.group('offset'))
+        results = results[start:start + int(match.group('limit'))]
+
+    if projection == '*':
+        return [copy.deepcopy(doc) for doc in results]
+    if match.group('value'):
+        return [copy.deepcopy(_get_path(doc, fields[0])) for doc in results]
+    return [
+        {field.split('.')[-1]: copy.deepcopy(_get_path(doc, field))
+         for field in fields if _get_path(doc, field) is not _MISSING}
+        for doc in results
+    ]
+
+
+class _AsyncPage:
+    """Page de résultats itérable avec `async for`"""
+
+    def __init__(self, items):
+        self._items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakePageIterator:
+    """Itérateur de pages exposant `continuation_token` comme AsyncItemPaged.by_page"""
+
+    def __init__(self, results, page_size, continuation_token=None, before_page=None):
+        self._before_page = before_page
+        self._results = results
+        self._page_size = page_size
+        self._start = int(continuation_token) if continuation_token else 0
+        self._done = False
+        self.continuation_token = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        if self._before_page is not None:
+            self._before_page()
+        end = self._start + self._page_size
+        page = self._results[self._start:end]
+        self.continuation_token = str(end) if end < len(self._results) else None
+        self._done = self.continuation_token is None
+        self._start = end
+        return _AsyncPage(page)
+
+
+class FakeItemPaged:
+    """Résultat de requête itérable avec `async for`, paginable comme AsyncItemPaged"""
+
+    def __init__(self, results, page_size=None, before_page=None):
+        self._results = results
+        self._page_size = page_size or len(results) or 1
+        self._before_page = before_page
+
+    def __aiter__(self):
+        if self._before_page is not None:
+            self._before_page()
+        return _AsyncPage(self._results)
+
+    def by_page(self, continuation_token=None):
+        return FakePageIterator(self._results, self._page_size, continuation_token, self._before_page)
+
+
+class FakeChangeFeedPageIterator:
+    """Pages du flux de modifications d'une plage ; le jeton de continuation porte la plage et le dernier `_lsn`"""
+
+    def __init__(self, container, feed_range, lsn, page_size):
+        self._container = container
+        self._feed_range = feed_range
+        self._lsn = lsn
+        self._page_size = page_size
+        self._started = False
+        self._done = False
+        self.continuation_token = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # La première page est renvoyée même vide (avec son jeton) ; la lecture s'arrête ensuite au premier lot vide
+        if self._done:
+            raise StopAsyncIteration
+        self._container._call()
+        changes = sorted(
+            (doc for doc in self._container.items.values()
+             if self._container._feed_range(doc) == self._feed_range and doc['_lsn'] > self._lsn),
+            key=lambda doc: doc['_lsn']
+        )[:self._page_size]
+        if changes:
+            self._lsn = changes[-1]['_lsn']
+        elif self._started:
+            self._done = True
+            raise StopAsyncIteration
+        self._started = True
+        self.continuation_token = json.dumps({"range": self._feed_range, "lsn": self._lsn})
+        return _AsyncPage(copy.deepcopy(changes))
+
+
+class FakeChangeFeed:
+    """Résultat de `query_items_change_feed`, lu avec `by_page`"""
+
+    def __init__(self, container, feed_range, lsn, page_size):
+        self._args = container, feed_range, lsn, page_size
+
+    def by_page(self, continuation_token=None):
+        return FakeChangeFeedPageIterator(*self._args)
+
+
+class FakeContainer:
+    """Container en mémoire indexé par (clé de partition, id), avec l'API de azure.cosmos.aio"""
+
+    # Plages du flux de modifications (partitions physiques simulées)
+    FEED_RANGES = 4
+
+    def __init__(self, id, partition_key_path):
+        self.id = id
+        self.partition_key_path = partition_key_path
+        self.items = {}
+        self.calls = 0
+        self._failures = []
+
+    def fail_next(self, count, status_code=429, retry_after_ms=10):
+        """Fait échouer les `count` appels suivants (429 par défaut, avec son délai demandé)"""
+        self._failures.extend([(status_code, retry_after_ms)] * count)
+
+    def _call(self):
+        """Compte un appel et lève l'échec simulé éventuel"""
+        self.calls += 1
+        if self._failures:
+            status_code, retry_after_ms = self._failures.pop(0)
+            error = exceptions.CosmosHttpResponseError(status_code=status_code, message="Simulated failure")
+            error.headers = {"x-ms-retry-after-ms": str(retry_after_ms)} if retry_after_ms is not None else {}
+            raise error
+
+    def _partition_key(self, doc):
+        paths = self.partition_key_path if isinstance(self.partition_key_path, list) else [self.partition_key_path]
+        values = tuple(_get_path(doc, 'c' + path.replace('/', '.')) for path in paths)
+        return values if len(values) > 1 else values[0]
+
+    @staticmethod
+    def _normalize_key(partition_key):
+        return tuple(partition_key) if isinstance(partition_key, list) else partition_key
+
+    def _in_partition(self, doc, key):
+        """Appartenance à une clé de partition, ou à un préfixe de clé hiérarchique"""
+        value = self._partition_key(doc)
+        if isinstance(value, tuple) and isinstance(key, tuple) and len(key) < len(value):
+            return value[:len(key)] == key
+        return value == key
+
+    def _store(self, body):
+        doc = copy.deepcopy(body)
+        doc['_etag'] = f'"{uuid.uuid4()}"'
+        doc['_ts'] = int(time.time())
+        doc['_lsn'] = next(_lsn_counter)
+        self.items[(self._partition_key(doc), doc['id'])] = doc
+        return copy.deepcopy(doc)
+
+    def seed(self, *bodies):
+        """Insère des documents de test sans passer par l'API asynchrone"""
+        for body in bodies:
+            self._store(body)
+
+    def get(self, item, partition_key):
+        """Lit un document de test sans passer par l'API asynchrone"""
+        doc = self.items.get((self._normalize_key(partition_key), item))
+        if doc is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {item} not found")
+        return copy.deepcopy(doc)
+
+    async def read_item(self, item, partition_key, **kwargs):
+        self._call()
+        return self.get(item, partition_key)
+
+    async def create_item(self, body, **kwargs):
+        self._call()
+        if (self._partition_key(body), body['id']) in self.items:
+            raise exceptions.CosmosResourceExistsError(status_code=409, message=f"Item {body['id']} already exists")
+        return self._store(body)
+
+    async def upsert_item(self, body, **kwargs):
+        self._call()
+        return self._store(body)
+
+    async def replace_item(self, item, body, etag=None, match_condition=None, **kwargs):
+        self._call()
+        key = (self._partition_key(body), item)
+        current = self.items.get(key)
+        if current is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {item} not found")
+        if etag is not None and current['_etag'] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(message="Precondition failed")
+        return self._store(body)
+
+    async def patch_item(self, item, partition_key, patch_operations, **kwargs):
+        self._call()
+        doc = self.get(item, partition_key)
+        for operation in patch_operations:
+            keys = operation['path'].strip('/').split('/')
+            target = doc
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            if operation['op'] in ('set', 'add', 'replace'):
+                target[keys[-1]] = operation['value']
+            elif operation['op'] == 'incr':
+                target[keys[-1]] = target.get(keys[-1], 0) + operation['value']
+            elif operation['op'] == 'remove':
+                target.pop(keys[-1], None)
+        return self._store(doc)
+
+    async def delete_item(self, item, partition_key, **kwargs):
+        self._call()
+        key = (self._normalize_key(partition_key), item)
+        if key not in self.items:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {item} not found")
+        del self.items[key]
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None, **kwargs):
+        documents = list(self.items.values())
+        if partition_key is not None:
+            key = self._normalize_key(partition_key)
+            documents = [doc for doc in documents if self._in_partition(doc, key)]
+        return FakeItemPaged(run_query(documents, query, parameters), max_item_count, self._call)
+
+
+    def _feed_range(self, doc):
+        return zlib.crc32(repr(self._partition_key(doc)).encode('utf-8')) % self.FEED_RANGES
+
+    def read_feed_ranges(self, **kwargs):
+        return _AsyncPage([{"Range": {"min": index, "max": index + 1}} for index in range(self.FEED_RANGES)])
+
+    def query_items_change_feed(self, feed_range=None, continuation=None, start_time=None, max_item_count=None,
+                                **kwargs):
+        """Flux d'une plage depuis un jeton de continuation, ou depuis `Beginning` / `Now` (par défaut)"""
+        if continuation is not None:
+            state = json.loads(continuation)
+            index, lsn = state["range"], state["lsn"]
+        else:
+            index = feed_range["Range"]["min"]
+            lsn = 0 if start_time == 'Beginning' else max((doc['_lsn'] for doc in self.items.values()), default=0)
+        return FakeChangeFeed(self, index, lsn, max_item_count or 100)
+
+
+class FakeDatabase:
+    """Base de données en mémoire"""
+
+    def __init__(self, id):
+        self.id = id
+        self.containers = {}
+
+    def _container(self, id, partition_key):
+        if id not in self.containers:
+            paths = partition_key['paths']
+            self.containers[id] = FakeContainer(id, paths if partition_key.get('kind') == 'MultiHash' else paths[0])
+        return self.containers[id]
+
+    async def create_container_if_not_exists(self, id, partition_key, **kwargs):
+        return self._container(id, partition_key)
+
+    def get_container_client(self, container):
+        return self.containers[container]
+
+    async def read(self):
+        return {"id": self.id}
+
+
+class FakeCosmosClient:
+    """Client en mémoire remplaçant azure.cosmos.aio.CosmosClient"""
+
+    def __init__(self, *args, **kwargs):
+        self.databases = {}
+
+    async def create_database_if_not_exists(self, id, **kwargs):
+        return self.get_database_client(id)
+
+    def get_database_client(self, database):
+        return self.databases.setdefault(database, FakeDatabase(database))
+
+    def container(self, database, id, partition_key_path):
+        """Crée ou retourne un container de test sans passer par l'API asynchrone"""
+        if isinstance(partition_key_path, list):
+            partition_key = {"paths": partition_key_path, "kind": "MultiHash"}
+        else:
+            partition_key = {"paths": [partition_key_path], "kind": "Hash"}
+        return self.get_database_client(database)._container(id, partition_key)
+
+    async def close(self):
+        pass
@@ -0,0 +1,104 @@
+"""
+Tests unitaires des jetons d'authentification signés
+"""
+
+import pytest
+
+from shared_code import auth_tokens
+from shared_code.auth_tokens import InvalidToken, bearer_token, issue, verify
+
+
+@pytest.mark.unit
+class TestAuthTokens:
+    """Tests de la délivrance et de la vérification des jetons"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(auth_tokens, 'AUTH_TOKEN_SECRET', 'test-secret')
+        self.user = {"id": "u1", "pseudo": "alice", "email": "alice@example.com"}
+
+    def test_round_trip(self):
+        """Un jeton délivré porte l'identifiant et le pseudo de l'utilisateur"""
+        claims = verify(issue(self.user, ttl=60, now=1000), now=1030)
+
+        assert (claims["sub"], claims["pseudo"], claims["exp"]) == ("u1", "alice", 1060)
+
+    def test_expired(self):
+        """Un jeton expiré est refusé"""
+        with pytest.raises(InvalidToken, match="expired"):
+            verify(issue(self.user, ttl=60, now=1000), now=1060)
+
+    def test_tampered_or_foreign_token(self, monkeypatch):
+        """Un contenu modifié ou une autre clé de signature invalident le jeton"""
+        header, claims, signature = issue(self.user).split('.')
+        forged = issue({"id": "u2", "pseudo": "mallory"}).split('.')[1]
+        with pytest.raises(InvalidToken, match="signature"):
+            verify(f"{header}.{forged}.{signature}")
+
+        token = issue(self.user)
+        monkeypatch.setattr(auth_tokens, 'AUTH_TOKEN_SECRET', 'other-secret')
+        with pytest.raises(InvalidToken):
+            verify(token)
+
+    @pytest.mark.parametrize("token", [None, "", "abc", "a.b", "a.b.c.d", "a.b.é", "é.b.c", 42])
+    def test_malformed(self, token):
+        """Un jeton mal formé est refusé"""
+        with pytest.raises(InvalidToken):
+            verify(token)
+
+    def test_bearer_token(self):
+        """Le jeton est extrait d'un en-tête Authorization de type Bearer"""
+        assert bearer_token("Bearer abc.def.ghi") == "abc.def.ghi"
+        assert bearer_token("bearer  abc ") == "abc"
+        assert bearer_token("Basic dXNlcjpwYXNz") is None
+        assert bearer_token(None) is None
+
+    def test_non_json_object_header_is_refused(self):
+        """Un en-tête signé qui n'est pas un objet JSON est refusé sans erreur interne"""
+        header = auth_tokens._encode(b'[1]')
+        claims = issue(self.user).split('.')[1]
+        signature = auth_tokens._sign(f"{header}.{claims}".encode('ascii')).decode('ascii')
+
+        with pytest.raises(InvalidToken, match="Malformed"):
+            verify(f"{header}.{claims}.{signature}")
+
+
+@pytest.mark.unit
+class TestSigningSecret:
+    """Tests de l'obligation de la clé de signature dans Azure"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(auth_tokens, 'AUTH_TOKEN_SECRET', '')
+        monkeypatch.setattr(auth_tokens, '_generated_secret', None)
+        monkeypatch.delenv('AZURE_FUNCTIONS_ENVIRONMENT', raising=False)
+        self.user = {"id": "u1", "pseudo": "alice"}
+
+    def test_missing_secret_fails_closed_in_azure(self, monkeypatch):
+        """Dans Azure, sans AUTH_TOKEN_SECRET, aucun jeton n'est délivré ni vérifié"""
+        token = issue(self.user)
+        monkeypatch.setenv('WEBSITE_INSTANCE_ID', 'instance-1')
+
+        with pytest.raises(RuntimeError, match="AUTH_TOKEN_SECRET"):
+            issue(self.user)
+        with pytest.raises(RuntimeError, match="AUTH_TOKEN_SECRET"):
+            verify(token)
+
+    def test_configuration_checked_at_startup(self, monkeypatch, caplog):
+        """L'absence de clé dans Azure est signalée dès le démarrage du worker"""
+        assert auth_tokens.check_configuration()
+
+        monkeypatch.setenv('WEBSITE_INSTANCE_ID', 'instance-1')
+        assert not auth_tokens.check_configuration()
+        assert "AUTH_TOKEN_SECRET" in caplog.text
+
+        monkeypatch.setattr(auth_tokens, 'AUTH_TOKEN_SECRET', 'test-secret')
+        assert auth_tokens.configured()
+
+    def test_worker_secret_in_development(self, monkeypatch):
+        """Hors d'Azure ou sous Core Tools, une clé propre au worker est tirée"""
+        assert verify(issue(self.user))["sub"] == "u1"
+
+        monkeypatch.setenv('WEBSITE_INSTANCE_ID', 'instance-1')
+        monkeypatch.setenv('AZURE_FUNCTIONS_ENVIRONMENT', 'Development')
+        assert verify(issue(self.user))["sub"] == "u1"
@@ -0,0 +1,108 @@
+"""
+Tests unitaires du banc de charge local
+"""
+
+import asyncio
+
+import pytest
+
+from benchmarks import capacity, cost_model, serialization, startup
+from benchmarks.run import compare, percentile, run_workload
+from benchmarks.workloads import WORKLOADS
+
+
+@pytest.mark.unit
+class TestBenchmarks:
+    """Tests des mesures et des charges du banc"""
+
+    def test_percentile(self):
+        """Les percentiles suivent le rang le plus proche"""
+        values = list(range(1, 101))
+        assert (percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)) == (50, 95, 99)
+        assert percentile([], 0.5) == 0.0
+
+    @pytest.mark.parametrize("name", sorted(WORKLOADS))
+    def test_workloads_report_costs(self, name):
+        """Chaque charge s'exécute et rapporte latences, appels et RU"""
+        report = asyncio.run(run_workload(name, clients=3, requests=2, latency_ms=0, seed_votes=10))
+
+        assert report["requests"] == 6
+        if name == "snapshot":
+            # Servies depuis l'instantané : aucun appel Cosmos
+            assert report["cosmos_calls_per_request"] == report["ru_per_request"] == 0
+        else:
+            assert report["cosmos_calls_per_request"] > 0
+            assert report["ru_per_request"] > 0
+        assert all(status.startswith(('2', '3')) for status in report["statuses"])
+
+    def test_compare_to_baseline(self):
+        """L'écart à la référence est exprimé en pourcentage"""
+        baseline = {"results": {"vote": {"p50_ms": 10.0, "ru_per_request": 20.0}}}
+        deltas = compare({"vote": {"p50_ms": 12.0, "ru_per_request": 10.0}}, baseline)
+
+        assert deltas == {"vote": {"p50_ms": 20.0, "ru_per_request": -50.0}}
+
+    def test_cost_model_scales_with_size(self):
+        """Le coût d'une écriture croît par tranche d'1 Ko"""
+        assert cost_model.write_ru('create_item', {"a": "x"}) == cost_model.CREATE_RU
+        assert cost_model.write_ru('create_item', {"a": "x" * 3000}) == 3 * cost_model.CREATE_RU
+
+    def test_startup_measures_a_cold_worker(self):
+        """Un démarrage à froid mesure l'import et la première requête sans créer les containers"""
+        report = startup.measure("health", runs=1, latency_ms=0)
+
+        assert report["statuses"] == [200]
+        assert report["import_ms"] > 0
+        assert report["first_request_round_trips"] == 1
+
+    def test_serialization_formats(self):
+        """Le format colonnes est le plus petit ; les trois formats portent les mêmes votes"""
+        report = serialization.measure(200, repeat=1)
+
+        assert report["colonnes"]["bytes"] < report["objets"]["bytes"] < report["objets-json"]["bytes"]
+        assert all(result["cpu_ms"] >= 0 and result["gzip_bytes"] > 0 for result in report.values())
+
+    def test_cost_model_can_be_configured(self):
+        """Les coûts unitaires relevés sur le compte remplacent ceux par défaut ; une entrée inconnue est refusée"""
+        previous = cost_model.configure({"CREATE_RU": 8})
+        try:
+            assert cost_model.write_ru('create_item', {"a": "x"}) == 8.0
+        finally:
+            cost_model.configure(previous)
+
+        assert cost_model.write_ru('create_item', {"a": "x"}) == 5.7
+        with pytest.raises(ValueError):
+            cost_model.configure({"UNKNOWN_RU": 1})
+
+    def test_capacity_measures_every_endpoint_per_size(self):
+        """Chaque endpoint est mesuré à chaque taille ; au-delà d'une page, le coût de GET /votes ne dépend pas des votes en base"""
+        results = {size: asyncio.run(capacity.measure_size(size, requests=2, latency_ms=0)) for size in (200, 2_000)}
+
+        for reports in results.values():
+            assert set(reports) == set(capacity.ENDPOINTS)
+            assert all(report["requests"] == 2 and report["ru_per_request"] > 0 for report in reports.values())
+            assert all(status.startswith('2') for report in reports.values() for status in report["statuses"])
+        scaling = capacity.scaling(results)
+        assert scaling["getVotes"] == {"elasticity": 0.0, "cliff": False}
+
+    def test_capacity_flags_cost_growing_with_data(self):
+        """Un coût proportionnel aux données a une élasticité de 1 et est signalé"""
+        assert capacity.elasticity({1_000: 10.0, 100_000: 1_000.0}) == pytest.approx(1.0)
+        assert capacity.elasticity({1_000: 10.0, 100_000: 10.0}) == 0.0
+
+    def test_capacity_projection_of_a_mix(self):
+        """La projection pondère les coûts par les parts du mélange et arrondit le débit à provisionner"""
+        reports = {
+            "getVotes": {"ru_per_request": 10.0, "p50_ms": 10.0, "p95_ms": 20.0},
+            "submitVote": {"ru_per_request": 30.0, "p50_ms": 30.0, "p95_ms": 50.0},
+        }
+        mix = capacity.parse_mix("getVotes=3,submitVote=1")
+
+        projection = capacity.project(reports, mix, rps=100, headroom=1.5)
+
+        assert mix == {"getVotes": 0.75, "submitVote": 0.25}
+        assert (projection["ru_per_request"], projection["ru_per_second"]) == (15.0, 1500.0)
+        assert (projection["provisioned_ru"], projection["autoscale_max_ru"]) == (2300, 3000)
+        assert (projection["p50_ms"], projection["p95_ms"]) == (15.0, 50.0)
+        with pytest.raises(ValueError):
+            capacity.parse_mix("deleteEverything=1")
@@ -0,0 +1,47 @@
+"""
+Tests unitaires de l'import en masse
+"""
+
+import asyncio
+
+import pytest
+
+from shared_code import bulk
+from tests.fake_cosmos import FakeContainer
+
+
+@pytest.mark.unit
+class TestBulk:
+    """Tests de la lecture NDJSON et des écritures simultanées"""
+
+    def test_iter_ndjson(self):
+        """Chaque ligne non vide donne un objet ou une erreur, avec son numéro"""
+        body = b'{"a": 1}\n\nnot json\n[1, 2]\n{"b": 2}'
+
+        assert list(bulk.iter_ndjson(body)) == [
+            (1, {"a": 1}, None),
+            (3, None, "Invalid JSON"),
+            (4, None, "Each line must be a JSON object"),
+            (5, {"b": 2}, None),
+        ]
+        assert bulk.count_items(body) == 4
+
+    def test_each_document_gets_its_status(self):
+        """Chaque document est écrit séparément : un conflit n'écarte que le document fautif"""
+        container = FakeContainer('items', '/id')
+        container.seed({"id": "d1"})
+        documents = [{"id": f"d{i}"} for i in range(3)]
+
+        statuses = asyncio.run(bulk.create_many(container, documents, max_concurrency=2))
+
+        assert statuses == [201, 409, 201]
+        assert len(container.items) == 3
+
+    def test_size_error(self, monkeypatch):
+        """Le corps, gardé en mémoire, est plafonné en octets puis en lignes"""
+        monkeypatch.setattr(bulk, 'BULK_MAX_BYTES', 10)
+        monkeypatch.setattr(bulk, 'BULK_MAX_ITEMS', 2)
+
+        assert bulk.size_error(b'{}\n{}') is None
+        assert "lines" in bulk.size_error(b'{}\n{}\n{}')
+        assert "bytes" in bulk.size_error(b'{"a": "bcdefgh"}')
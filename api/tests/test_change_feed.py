@@ -0,0 +1,194 @@
+"""
+Tests unitaires du flux de modifications et des vues dérivées qu'il met à jour
+"""
+
+import asyncio
+import datetime
+
+import pytest
+
+from shared_code import change_feed
+from tests.fake_cosmos import FakeContainer
+
+
+def vote(user_id, choice, poll_id="p1", created_at="2025-01-01T10:05:00"):
+    return {"id": user_id, "poll_id": poll_id, "user_id": user_id, "choice": choice, "created_at": created_at}
+
+
+class Clock:
+    """Horloge manuelle des baux"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.unit
+class TestChangeFeedProcessor:
+    """Tests de la lecture du flux par plages, sous bail, avec points de reprise"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(change_feed, 'CHANGE_FEED_START', 'beginning')
+        self.source = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        self.leases = FakeContainer('leases', '/id')
+        self.clock = Clock()
+        self.received = []
+
+    async def _collect(self, changes, lease):
+        self.received.extend(change['id'] for change in changes)
+
+    def _processor(self, handler=None, worker_id="w1"):
+        return change_feed.ChangeFeedProcessor(
+            'votes', handler or self._collect, batch_size=2, worker_id=worker_id, clock=self.clock
+        )
+
+    def _run(self, processor):
+        return asyncio.run(processor.run(self.source, self.leases, time_budget=60))
+
+    def test_ranges_are_processed_and_checkpointed(self):
+        """Chaque plage est lue sous son bail ; une exécution suivante ne relit que les nouveaux changements"""
+        self.source.seed(*(vote(f"u{i}", "oui") for i in range(7)))
+
+        result = self._run(self._processor())
+
+        assert (result["ranges"], result["leased"], result["changes"]) == (4, 4, 7)
+        assert sorted(self.received) == [f"u{i}" for i in range(7)]
+        assert all(lease["owner"] is None and lease["continuation"] for lease in self.leases.items.values())
+
+        self.received.clear()
+        self.source.seed(vote("u7", "non"))
+        assert self._run(self._processor())["changes"] == 1
+        assert self.received == ["u7"]
+
+    def test_new_ranges_start_now(self, monkeypatch):
+        """Par défaut, une plage sans bail commence aux changements à venir (vues déjà à jour)"""
+        monkeypatch.setattr(change_feed, 'CHANGE_FEED_START', 'now')
+        self.source.seed(vote("u1", "oui"))
+
+        assert self._run(self._processor())["changes"] == 0
+        self.source.seed(vote("u2", "non"))
+        self._run(self._processor())
+
+        assert self.received == ["u2"]
+        assert all(lease["started_at"] for lease in self.leases.items.values())
+
+    def test_leases_of_other_workers_are_respected_until_expiry(self):
+        """Une plage sous le bail valide d'un autre worker est laissée ; un bail expiré est repris"""
+        self.source.seed(*(vote(f"u{i}", "oui") for i in range(7)))
+        self._run(self._processor())
+        for lease in list(self.leases.items.values()):
+            self.leases.seed({**lease, "owner": "w2", "expires_at": self.clock.now + 30})
+        self.source.seed(vote("u7", "non"))
+
+        assert self._run(self._processor())["leased"] == 0
+
+        self.clock.now += 31
+        assert self._run(self._processor())["changes"] == 1
+
+    def test_failed_batch_is_read_again(self):
+        """Un lot dont le traitement échoue n'avance pas le point de reprise : il est relu"""
+        self.source.seed(vote("u1", "oui"))
+
+        async def failing(changes, lease):
+            raise RuntimeError("projection failed")
+
+        assert self._run(self._processor(failing))["failed"] == 1
+
+        assert self._run(self._processor())["changes"] == 1
+        assert self.received == ["u1"]
+
+
+@pytest.mark.unit
+class TestProjections:
+    """Tests des vues dérivées mises à jour depuis les changements des votes et utilisateurs"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        self.tallies = FakeContainer('tallies', '/id')
+        self.rollups = FakeContainer('vote_rollups', '/poll_id')
+        self.markers = FakeContainer('leases', '/id')
+
+    def _changes(self, *documents):
+        self.votes.seed(*documents)
+        return sorted(self.votes.items.values(), key=lambda doc: doc['_lsn'])
+
+    def _project(self, changes, source="votes.r0", started_at=None, now=datetime.datetime(2025, 1, 1, 12)):
+        lease = {"id": source, "created_at": "2025-01-01T09:00:00", "started_at": started_at}
+        return asyncio.run(change_feed.project_votes(changes, lease, self.tallies, self.rollups, self.markers, now))
+
+    def test_replayed_batch_is_counted_once(self):
+        """Un lot relu après une reprise, même complété de nouveaux votes, ne compte chaque vote qu'une fois"""
+        changes = self._changes(vote("u1", "oui"), vote("u2", "non"), vote("u3", "oui", poll_id="p2"))
+
+        assert self._project(changes[:2]) == ["p1"]
+        self._project(changes)
+        self._project(changes)
+
+        tally = self.tallies.get("p1", partition_key="p1")
+        assert (tally["oui"], tally["non"], tally["total"]) == (1, 1, 2)
+        assert self.tallies.get("p2", partition_key="p2")["total"] == 1
+        assert self.rollups.get("minute:2025-01-01T10:05:00", partition_key="p1")["counts"] == {"oui": 1, "non": 1, "total": 2}
+
+    def test_ranges_are_tracked_separately(self):
+        """Les changements de plages différentes s'ajoutent au même compteur"""
+        first, second = self._changes(vote("u1", "oui"), vote("u2", "oui"))
+
+        self._project([second], source="votes.r1")
+        self._project([first], source="votes.r0")
+
+        assert self.tallies.get("p1", partition_key="p1")["oui"] == 2
+
+    def test_pseudo_changes_are_propagated_without_recount(self):
+        """Un pseudo modifié est recopié sur les votes de l'utilisateur, modifications non recomptées"""
+        self._project(self._changes(vote("u1", "oui") | {"pseudo": "alice"}, vote("u2", "non") | {"pseudo": "bob"}))
+        users = [{"id": "u1", "pseudo": "alice2", "_lsn": 1}, {"id": "u2", "pseudo": "bob", "_lsn": 2}]
+
+        patched = asyncio.run(change_feed.propagate_pseudos(users, "users.r0", self.votes))
+        self._project(sorted(self.votes.items.values(), key=lambda doc: doc['_lsn']), source="votes.r0")
+
+        assert patched == 1
+        assert self.votes.get("u1", partition_key=["p1", "u1"])["pseudo"] == "alice2"
+        assert self.tallies.get("p1", partition_key="p1")["total"] == 2
+
+    def test_vote_modified_before_it_is_read_is_counted_once(self):
+        """Un vote dont le pseudo est recopié avant sa lecture est compté, et ses versions suivantes ignorées"""
+        self._changes(vote("u1", "oui") | {"pseudo": "alice"}, vote("u2", "non") | {"pseudo": "bob"})
+        asyncio.run(change_feed.propagate_pseudos([{"id": "u1", "pseudo": "alice2", "_lsn": 1}], "users.r0", self.votes))
+        first_read = sorted(self.votes.items.values(), key=lambda doc: doc['_lsn'])
+
+        self._project(first_read)
+        asyncio.run(change_feed.propagate_pseudos([{"id": "u1", "pseudo": "alice3", "_lsn": 2}], "users.r0", self.votes))
+        self._project([self.votes.get("u1", partition_key=["p1", "u1"])])
+
+        assert "updated_at" in first_read[-1]
+        tally = self.tallies.get("p1", partition_key="p1")
+        assert (tally["oui"], tally["non"], tally["total"]) == (1, 1, 2)
+        assert self.rollups.get("minute:2025-01-01T10:05:00", partition_key="p1")["counts"]["total"] == 2
+
+    def test_votes_created_before_the_lease_are_not_counted(self):
+        """Avec un départ `now`, un vote antérieur au bail, modifié ensuite, est déjà compté par les vues"""
+        changes = self._changes(vote("u1", "oui", created_at="2025-01-01T09:59:00"), vote("u2", "non"))
+
+        assert self._project(changes, started_at="2025-01-01T10:00:00") == ["p1"]
+
+        assert self.tallies.get("p1", partition_key="p1")["total"] == 1
+        marker = self.markers.get(change_feed.marker_id(changes[1]), partition_key=change_feed.marker_id(changes[1]))
+        assert (marker["source"], marker["lsn"]) == ("votes.r0", changes[1]['_lsn'])
+
+    def test_markers_expire_after_the_votes_are_settled(self):
+        """Les marqueurs expirent ; un vote lu après leur durée de vie est déjà compté et ignoré"""
+        changes = self._changes(vote("u1", "oui"))
+        self._project(changes)
+        marker = self.markers.get(change_feed.marker_id(changes[0]), partition_key=change_feed.marker_id(changes[0]))
+        self.markers.items.clear()
+
+        later = datetime.datetime(2025, 1, 1, 10, 5) + datetime.timedelta(seconds=change_feed.CHANGE_FEED_MARKER_TTL + 1)
+        self._project(self._changes(vote("u1", "oui") | {"pseudo": "alice"}), now=later)
+
+        assert marker["ttl"] == change_feed.CHANGE_FEED_MARKER_TTL
+        assert self.tallies.get("p1", partition_key="p1")["total"] == 1
+        assert not self.markers.items
@@ -0,0 +1,161 @@
+"""
+Tests unitaires du pool de connexions Cosmos DB partagé
+"""
+
+import asyncio
+
+import pytest
+from azure.core.exceptions import ServiceRequestError
+from azure.cosmos import exceptions
+
+from shared_code.cosmos_pool import CONTAINERS, CosmosPool, LEASES_CONTAINER, USERS_CONTAINER, VOTES_CONTAINER
+
+
+class StubContainer:
+    """Container minimal dont les propriétés sont lues au provisionnement"""
+
+    def __init__(self, id, properties):
+        self.id = id
+        self.properties = properties
+
+    async def read(self):
+        return {"id": self.id, **self.properties}
+
+
+class StubDatabase:
+    """Base de données minimale comptant les résolutions et créations de containers"""
+
+    def __init__(self):
+        self.resolved_containers = []
+        self.created_containers = []
+        self.existing_containers = {}
+        self.replaced_containers = {}
+        self.read_error = None
+
+    def get_container_client(self, container):
+        self.resolved_containers.append(container)
+        return object()
+
+    async def create_container_if_not_exists(self, id, partition_key, default_ttl=None):
+        self.created_containers.append(id)
+        properties = {"defaultTtl": default_ttl} if default_ttl is not None else {}
+        return StubContainer(id, self.existing_containers.get(id, properties))
+
+    async def replace_container(self, container, partition_key, default_ttl=None):
+        self.replaced_containers[container.id] = default_ttl
+
+    async def read(self):
+        if self.read_error:
+            raise self.read_error
+        return {"id": "BayrouMeterDB"}
+
+
+class StubClient:
+    """Client minimal qui remplace le CosmosClient asynchrone"""
+
+    def __init__(self):
+        self.database = StubDatabase()
+        self.created_database = False
+        self.closed = False
+
+    def get_database_client(self, name):
+        return self.database
+
+    async def create_database_if_not_exists(self, name):
+        self.created_database = True
+        return self.database
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.unit
+class TestCosmosPool:
+    """Tests du registre partagé de client et de containers"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.clients = []
+
+        def factory():
+            client = StubClient()
+            self.clients.append(client)
+            return client
+
+        self.factory = factory
+        self.pool = CosmosPool(client_factory=factory, auto_provision=False)
+
+    def test_client_is_created_once(self):
+        """Le client est créé au premier appel puis réutilisé"""
+        assert self.pool.get_client() is self.pool.get_client()
+        assert len(self.clients) == 1
+
+    def test_containers_are_cached(self):
+        """Chaque container n'est résolu qu'une fois, même sous appels concurrents, sans être créé"""
+
+        async def scenario():
+            users = await asyncio.gather(*(self.pool.get_container(USERS_CONTAINER) for _ in range(5)))
+            await self.pool.get_container(VOTES_CONTAINER)
+            return users
+
+        users = asyncio.run(scenario())
+        assert all(container is users[0] for container in users)
+        assert self.clients[0].database.resolved_containers == [USERS_CONTAINER, VOTES_CONTAINER]
+        assert not self.clients[0].database.created_containers
+        assert not self.clients[0].created_database
+
+    def test_auto_provision_creates_on_first_access(self):
+        """Avec COSMOS_AUTO_PROVISION, la base et le container sont créés au premier accès"""
+        pool = CosmosPool(client_factory=self.factory, auto_provision=True)
+        asyncio.run(pool.get_container(USERS_CONTAINER))
+
+        assert self.clients[0].created_database
+        assert self.clients[0].database.created_containers == [USERS_CONTAINER]
+
+    def test_provision_creates_every_container(self):
+        """L'étape de déploiement crée la base et tous les containers"""
+        assert asyncio.run(self.pool.provision()) == sorted(CONTAINERS)
+        assert self.clients[0].database.created_containers == list(CONTAINERS)
+        assert not self.clients[0].database.replaced_containers
+
+    def test_provision_enables_lease_expiry_on_existing_container(self):
+        """Un container `leases` créé sans expiration des documents est mis à jour au provisionnement"""
+        database = self.pool.get_client().database
+        database.existing_containers[LEASES_CONTAINER] = {}
+
+        asyncio.run(self.pool.provision())
+
+        assert database.replaced_containers == {LEASES_CONTAINER: -1}
+
+    def test_auth_error_resets_client(self):
+        """Une erreur d'authentification force la recréation du client"""
+        asyncio.run(self.pool.get_container(USERS_CONTAINER))
+        error = exceptions.CosmosHttpResponseError(status_code=401, message="Unauthorized")
+
+        assert asyncio.run(self.pool.handle_error(error)) is True
+        assert self.clients[0].closed
+
+        asyncio.run(self.pool.get_container(USERS_CONTAINER))
+        assert len(self.clients) == 2
+
+    def test_endpoint_error_resets_client(self):
+        """Une erreur réseau vers l'endpoint force la recréation du client"""
+        self.pool.get_client()
+        assert asyncio.run(self.pool.handle_error(ServiceRequestError("DNS failure"))) is True
+        self.pool.get_client()
+        assert len(self.clients) == 2
+
+    def test_business_error_keeps_client(self):
+        """Une erreur métier (404, 409) conserve le client"""
+        self.pool.get_client()
+        assert asyncio.run(self.pool.handle_error(exceptions.CosmosResourceNotFoundError())) is False
+        assert asyncio.run(self.pool.handle_error(ValueError("bad input"))) is False
+        assert len(self.clients) == 1
+
+    def test_health_check(self):
+        """Le health check reflète l'état de la connexion"""
+        assert asyncio.run(self.pool.health_check())["status"] == "healthy"
+
+        self.clients[0].database.read_error = ServiceRequestError("timeout on https://account.documents.azure.com")
+        assert asyncio.run(self.pool.health_check()) == {"status": "unhealthy"}
+        assert self.clients[0].closed
@@ -0,0 +1,56 @@
+"""
+Tests unitaires de l'index des emails
+"""
+
+import asyncio
+
+import pytest
+
+from shared_code import email_index
+from tests.fake_cosmos import FakeContainer
+
+
+@pytest.mark.unit
+class TestEmailIndex:
+    """Tests de la réservation, de la recherche et du remplissage de l'index"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.users = FakeContainer('users', '/id')
+        self.emails = FakeContainer('emails', '/id')
+
+    def test_key_is_normalized_and_escaped(self):
+        """La clé ignore la casse et les espaces et échappe les caractères interdits"""
+        assert email_index.email_key("  Alice@Example.COM ") == "alice@example.com"
+        assert "/" not in email_index.email_key("a/b?c#d@example.com")
+
+    def test_reserve_is_unique(self):
+        """Un email normalisé ne peut être réservé qu'une fois"""
+        assert asyncio.run(email_index.reserve(self.emails, self.users, "a@example.com", "u1"))
+        assert not asyncio.run(email_index.reserve(self.emails, self.users, "A@example.com ", "u2"))
+        assert asyncio.run(email_index.lookup_user_id(self.emails, self.users, "A@EXAMPLE.com")) == "u1"
+
+    def test_legacy_users(self, monkeypatch):
+        """Les comptes absents de l'index sont trouvés par le repli, puis indexés par le backfill"""
+        monkeypatch.setattr(email_index, 'LEGACY_FALLBACK', True)
+        self.users.seed({"id": "u1", "email": "old@example.com", "created_at": "2025-01-01"})
+
+        assert not asyncio.run(email_index.reserve(self.emails, self.users, "old@example.com", "u2"))
+        assert not self.emails.items
+        assert asyncio.run(email_index.lookup_user_id(self.emails, self.users, "old@example.com")) == "u1"
+
+        result = asyncio.run(email_index.backfill(self.users, self.emails, apply=True))
+        assert (result["missing"], result["indexed"], result["conflicts"]) == (1, 1, [])
+
+        monkeypatch.setattr(email_index, 'LEGACY_FALLBACK', False)
+        assert asyncio.run(email_index.lookup_user_id(self.emails, self.users, "old@example.com")) == "u1"
+        assert asyncio.run(email_index.lookup_user_id(self.emails, self.users, "new@example.com")) is None
+
+    def test_no_users_scan_by_default(self):
+        """Sans repli (par défaut), inscription et connexion ne lisent que l'index"""
+        self.users.seed({"id": "u1", "email": "old@example.com", "created_at": "2025-01-01"})
+        calls = self.users.calls
+
+        assert asyncio.run(email_index.lookup_user_id(self.emails, self.users, "old@example.com")) is None
+        assert asyncio.run(email_index.reserve(self.emails, self.users, "new@example.com", "u2"))
+        assert self.users.calls == calls
@@ -0,0 +1,810 @@
+"""
+Tests unitaires des handlers HTTP contre un faux Cosmos DB en mémoire
+"""
+
+import asyncio
+import gzip
+import json
+import threading
+
+import azure.functions as func
+import bcrypt
+import pytest
+from azure.cosmos import exceptions
+
+import function_app
+from shared_code import auth_tokens, bulk, change_feed, password_hashing, snapshots, tally, vote_queue
+from shared_code.cosmos_pool import EMAILS_CONTAINER, LEASES_CONTAINER, ROLLUPS_CONTAINER, TALLIES_CONTAINER, USERS_CONTAINER, VOTES_CONTAINER
+from shared_code.response_cache import votes_cache
+
+
+@pytest.mark.unit
+class TestGetVotes:
+    """Tests de l'endpoint GET /votes"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.users = container(USERS_CONTAINER)
+        self.votes = container(VOTES_CONTAINER)
+
+    def _add_vote(self, vote_id, user_id, choice, created_at, **fields):
+        self.votes.seed({
+            "id": vote_id,
+            "poll_id": "bayrou",
+            "user_id": user_id,
+            "choice": choice,
+            "created_at": created_at,
+            **fields
+        })
+
+    def test_denormalized_pseudos_need_no_join(self):
+        """Les votes qui portent leur pseudo sont servis sans lecture des utilisateurs"""
+        self._add_vote("v1", "u1", "oui", "2025-01-01T10:00:00", pseudo="alice")
+
+        response = self.call(function_app.getVotes, route='votes')
+
+        assert json.loads(response.get_body())["votes"][0]["user"]["pseudo"] == "alice"
+        assert "pseudos;dur=" not in response.headers["Server-Timing"]
+
+    def test_votes_are_enriched_with_pseudos(self):
+        """Les votes antérieurs à la dénormalisation sont joints aux pseudos, avec repli pour les utilisateurs supprimés"""
+        self.users.seed({"id": "u1", "pseudo": "alice"})
+        self.users.seed({"id": "u2", "pseudo": "bob"})
+        self._add_vote("v1", "u1", "oui", "2025-01-01T10:00:00")
+        self._add_vote("v2", "u2", "non", "2025-01-01T11:00:00")
+        self._add_vote("v3", "ghost", "oui", "2025-01-01T12:00:00")
+
+        response = self.call(function_app.getVotes, route='votes')
+        data = json.loads(response.get_body())
+
+        assert response.status_code == 200
+        assert [vote["id"] for vote in data["votes"]] == ["v3", "v2", "v1"]
+        assert [vote["user"]["pseudo"] for vote in data["votes"]] == ["Utilisateur supprimé", "bob", "alice"]
+        assert data["stats"]["total"] == 3
+        assert data["continuation"] is None
+
+    def test_columnar_format(self):
+        """Avec Accept, les votes sont servis en tableaux parallèles, représentation distincte du JSON par objets"""
+        self._add_vote("u1", "u1", "oui", "2025-01-01T10:00:00", pseudo="alice")
+        self._add_vote("u2", "u2", "non", "2025-01-01T11:00:00")
+
+        objects = self.call(function_app.getVotes, route='votes')
+        columns = self.call(function_app.getVotes, route='votes',
+                            headers={"Accept": "application/vnd.bayrou.columnar+json"})
+        data = json.loads(columns.get_body())
+
+        assert columns.mimetype == "application/vnd.bayrou.columnar+json"
+        assert columns.headers["Vary"] == "Accept"
+        assert columns.headers["ETag"] != objects.headers["ETag"]
+        assert data["votes"] == {
+            "ids": ["u2", "u1"],
+            "pseudos": ["Utilisateur supprimé", "alice"],
+            "choices": ["non", "oui"],
+            "created_at": ["2025-01-01T11:00:00", "2025-01-01T10:00:00"]
+        }
+        assert data["stats"] == json.loads(objects.get_body())["stats"]
+
+    def test_votes_are_paginated(self):
+        """Les votes sont servis par pages avec un curseur de continuation"""
+        for i in range(5):
+            self._add_vote(f"v{i}", f"u{i}", "oui", f"2025-01-01T1{i}:00:00")
+
+        first = json.loads(self.call(function_app.getVotes, route='votes', params={"limit": "2"}).get_body())
+        assert [vote["id"] for vote in first["votes"]] == ["v4", "v3"]
+        assert first["continuation"]
+
+        second = json.loads(self.call(
+            function_app.getVotes, route='votes',
+            params={"limit": "2", "continuation": first["continuation"]}
+        ).get_body())
+        assert [vote["id"] for vote in second["votes"]] == ["v2", "v1"]
+
+    def test_cached_response_and_not_modified(self):
+        """Les sondages répétés sont servis depuis le cache avec ETag et 304"""
+        self._add_vote("v1", "u1", "oui", "2025-01-01T10:00:00")
+
+        first = self.call(function_app.getVotes, route='votes')
+        etag = first.headers["ETag"]
+        assert first.headers["Cache-Control"].startswith("public, max-age=")
+
+        # Un vote écrit directement dans Cosmos n'est pas visible tant que l'entrée est valide
+        self._add_vote("v2", "u2", "non", "2025-01-01T11:00:00")
+        assert self.call(function_app.getVotes, route='votes').get_body() == first.get_body()
+
+        not_modified = self.call(function_app.getVotes, route='votes', headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.get_body() == b''
+
+    def test_submit_vote_invalidates_cache(self):
+        """Un vote soumis via l'API invalide le cache du worker"""
+        self.users.seed({"id": "u1", "pseudo": "alice"})
+        first = self.call(function_app.getVotes, route='votes')
+
+        self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "u1", "choice": "oui"})
+
+        second = self.call(function_app.getVotes, route='votes', headers={"If-None-Match": first.headers["ETag"]})
+        assert second.status_code == 200
+        assert len(json.loads(second.get_body())["votes"]) == 1
+
+    def test_invalid_limit(self):
+        """Une taille de page invalide est refusée"""
+        for limit in ("0", "abc", "100000"):
+            response = self.call(function_app.getVotes, route='votes', params={"limit": limit})
+            assert response.status_code == 400
+
+
+@pytest.mark.unit
+class TestSubmitVote:
+    """Tests de l'endpoint POST /vote"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.users = container(USERS_CONTAINER)
+        self.votes = container(VOTES_CONTAINER)
+        self.users.seed({"id": "u1", "pseudo": "alice"})
+
+    def test_vote_id_is_deterministic(self):
+        """Le vote est stocké sous l'identifiant de son auteur"""
+        response = self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "u1", "choice": "Oui"})
+
+        assert response.status_code == 201
+        assert json.loads(response.get_body())["vote"]["id"] == "u1"
+        assert "user_check;dur=" in response.headers["Server-Timing"]
+        assert self.votes.get("u1", partition_key=["bayrou", "u1"])["choice"] == "oui"
+
+    def test_second_vote_is_rejected(self):
+        """Un second vote, même simultané, est refusé par le conflit de création"""
+        handler = function_app.submitVote.build().get_user_function()
+        request = func.HttpRequest(
+            method='POST', url='http://localhost:7071/api/vote',
+            body=json.dumps({"user_id": "u1", "choice": "oui"}).encode('utf-8')
+        )
+
+        async def scenario():
+            return await asyncio.gather(*(handler(request) for _ in range(5)))
+
+        statuses = sorted(response.status_code for response in asyncio.run(scenario()))
+
+        assert statuses == [201, 409, 409, 409, 409]
+        assert len(self.votes.items) == 1
+
+    def test_unknown_user(self):
+        """Un vote d'un utilisateur inconnu est refusé sans être écrit"""
+        response = self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "ghost", "choice": "non"})
+
+        assert response.status_code == 404
+        assert not self.votes.items
+
+    def test_signed_token_skips_user_read(self):
+        """Avec un jeton signé, l'utilisateur n'est pas relu dans Cosmos"""
+        token = auth_tokens.issue({"id": "u1", "pseudo": "alice"})
+        response = self.call(function_app.submitVote, 'POST', 'vote', {"choice": "oui"},
+                             headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 201
+        assert json.loads(response.get_body())["vote"]["user_id"] == "u1"
+        assert "user_check" not in response.headers["Server-Timing"]
+        assert "cosmos;dur=" in response.headers["Server-Timing"]
+        assert self.votes.get("u1", partition_key=["bayrou", "u1"])["pseudo"] == "alice"
+
+    def test_invalid_or_foreign_token(self, monkeypatch):
+        """Un jeton invalide est refusé (401), comme un jeton d'un autre utilisateur que `user_id` (403)"""
+        token = auth_tokens.issue({"id": "u1", "pseudo": "alice"})
+
+        forged = self.call(function_app.submitVote, 'POST', 'vote', {"choice": "oui"},
+                           headers={"Authorization": f"Bearer {token}x"})
+        mismatch = self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "u2", "choice": "oui"},
+                             headers={"Authorization": f"Bearer {token}"})
+        monkeypatch.setattr(auth_tokens, 'AUTH_REQUIRE_TOKEN', True)
+        anonymous = self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "u1", "choice": "oui"})
+
+        assert (forged.status_code, mismatch.status_code, anonymous.status_code) == (401, 403, 401)
+        assert forged.headers["WWW-Authenticate"] == "Bearer"
+        assert not self.votes.items
+
+    def test_non_ascii_token_is_unauthorized(self):
+        """Un jeton contenant des caractères non ASCII est refusé (401), sans erreur interne"""
+        response = self.call(function_app.submitVote, 'POST', 'vote', {"choice": "oui"},
+                             headers={"Authorization": "Bearer a.b.é"})
+
+        assert response.status_code == 401
+        assert not self.votes.items
+
+    def test_write_behind(self, monkeypatch, local_queue):
+        """En écriture différée, le vote est accepté (202) puis écrit par la tâche planifiée"""
+        monkeypatch.setattr(vote_queue, 'WRITE_BEHIND', True)
+        response = self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "u1", "choice": "non"})
+
+        assert response.status_code == 202
+        assert json.loads(response.get_body())["status"] == "accepted"
+        assert "enqueue;dur=" in response.headers["Server-Timing"]
+        assert local_queue.count() == 1 and not self.votes.items
+
+        asyncio.run(function_app.flushVoteQueue.build().get_user_function()(None))
+
+        assert local_queue.count() == 0
+        assert self.votes.get("u1", partition_key=["bayrou", "u1"])["choice"] == "non"
+
+
+@pytest.mark.unit
+class TestVoteSnapshots:
+    """Tests des instantanés précompressés de GET /votes"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, container, snapshot_store):
+        self.users = container(USERS_CONTAINER)
+        self.votes = container(VOTES_CONTAINER)
+        self.tallies = container(TALLIES_CONTAINER)
+        self.users.seed({"id": "u1", "pseudo": "alice"}, {"id": "u2", "pseudo": "bob"})
+        self.get_votes = function_app.getVotes.build().get_user_function()
+        self.submit = function_app.submitVote.build().get_user_function()
+
+    def _get(self, headers=None, params=None):
+        return self.get_votes(func.HttpRequest(method='GET', url='http://localhost:7071/api/votes', body=b'',
+                                               params=params or {}, headers=headers or {}))
+
+    def _vote(self, user_id):
+        return self.submit(func.HttpRequest(method='POST', url='http://localhost:7071/api/vote',
+                                            body=json.dumps({"user_id": user_id, "choice": "oui"}).encode('utf-8')))
+
+    def test_first_page_is_served_from_snapshot(self):
+        """Après le premier calcul, la première page est servie compressée depuis l'instantané, sans Cosmos"""
+        async def scenario():
+            await self._vote("u1")
+            await snapshots.publisher.wait()
+            computed = await self._get()
+            calls = self.votes.calls + self.tallies.calls
+            served = await self._get({"Accept-Encoding": "gzip, deflate"})
+            return computed, served, self.votes.calls + self.tallies.calls - calls
+
+        computed, served, cosmos_calls = asyncio.run(scenario())
+
+        assert served.headers["Content-Encoding"] == "gzip"
+        assert served.headers["Vary"] == "Accept, Accept-Encoding"
+        assert json.loads(gzip.decompress(served.get_body())) == json.loads(computed.get_body())
+        assert cosmos_calls == 0
+
+        not_modified = asyncio.run(self._get({"Accept-Encoding": "gzip", "If-None-Match": served.headers["ETag"]}))
+        assert not_modified.status_code == 304
+
+    def test_snapshot_follows_votes(self):
+        """Un vote du worker fait recalculer l'instantané ; les autres pages ne passent pas par lui"""
+        async def scenario():
+            await self._get()
+            await snapshots.publisher.wait()
+            await self._vote("u2")
+            await snapshots.publisher.wait()
+            return await self._get(), await self._get(params={"limit": "1"})
+
+        snapshot, page = asyncio.run(scenario())
+
+        assert json.loads(snapshot.get_body())["stats"]["total"] == 1
+        assert page.headers["Vary"] == "Accept"
+
+    def test_refresh_catches_up_with_other_workers(self, call):
+        """La tâche planifiée recalcule l'instantané quand le compteur a changé ailleurs"""
+        async def scenario():
+            await self._get()
+            await snapshots.publisher.wait()
+
+        asyncio.run(scenario())
+        # Vote écrit par un autre worker : le compteur change sans passer par ce worker
+        self.votes.seed({"id": "u2", "poll_id": "bayrou", "user_id": "u2", "pseudo": "bob",
+                         "choice": "non", "created_at": "2025-01-01T10:00:00"})
+        self.tallies.seed({"id": "bayrou", "oui": 0, "non": 1, "total": 1})
+
+        asyncio.run(function_app.refreshVoteSnapshots.build().get_user_function()(None))
+
+        data = json.loads(asyncio.run(self._get()).get_body())
+        assert data["stats"]["total"] == 1
+        assert [vote["user"]["pseudo"] for vote in data["votes"]] == ["bob"]
+
+
+@pytest.mark.unit
+class TestBulkImport:
+    """Tests des imports NDJSON POST /votes/bulk et POST /users/bulk"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.users = container(USERS_CONTAINER)
+        self.votes = container(VOTES_CONTAINER)
+        self.emails = container(EMAILS_CONTAINER)
+
+    def test_votes_bulk(self):
+        """Chaque ligne reçoit son résultat et le compteur est mis à jour"""
+        self.users.seed({"id": "u1", "pseudo": "alice"}, {"id": "u2", "pseudo": "bob"})
+        body = "\n".join([
+            '{"user_id": "u1", "choice": "oui"}',
+            '{"user_id": "u1", "choice": "non"}',
+            '{"user_id": "ghost", "choice": "oui"}',
+            '{"user_id": "u2", "choice": "peut-être"}',
+            '{"user_id": "u2", "choice": "NON"}',
+        ]).encode('utf-8')
+
+        response = self.call(function_app.submitVotesBulk, 'POST', 'votes/bulk', body)
+        data = json.loads(response.get_body())
+
+        assert response.status_code == 200
+        assert [item["status"] for item in data["results"]] == [201, 409, 404, 400, 201]
+        assert data["summary"] == {"201": 2, "409": 1, "404": 1, "400": 1}
+
+        stats = json.loads(self.call(function_app.getVoteStats, route='votes/stats').get_body())["stats"]
+        assert (stats["oui"], stats["non"]) == (1, 1)
+
+    def test_users_bulk(self):
+        """Les utilisateurs sont créés et indexés, les emails déjà pris refusés"""
+        legacy_hash = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=4)).decode()
+        body = "\n".join([
+            json.dumps({"pseudo": "alice", "email": "alice@example.com", "password": "secret"}),
+            json.dumps({"pseudo": "alice2", "email": "ALICE@example.com", "password": "secret"}),
+            json.dumps({"pseudo": "bob", "email": "bob@example.com", "password_hash": legacy_hash}),
+            json.dumps({"pseudo": "eve", "email": "eve@example.com", "password_hash": "plain"}),
+        ]).encode('utf-8')
+
+        data = json.loads(self.call(function_app.createUsersBulk, 'POST', 'users/bulk', body).get_body())
+
+        assert [item["status"] for item in data["results"]] == [201, 409, 201, 400]
+        assert len(self.users.items) == len(self.emails.items) == 2
+
+        login = self.call(function_app.loginUser, 'POST', 'login', {"email": "bob@example.com", "password": "secret"})
+        assert login.status_code == 200
+
+    def test_bulk_routes_require_the_master_key(self):
+        """Les imports ne sont pas ouverts aux clients anonymes"""
+        for handler in (function_app.submitVotesBulk, function_app.createUsersBulk):
+            assert handler.build().get_trigger().auth_level == func.AuthLevel.ADMIN
+
+    def test_malformed_vote_lines_are_rejected(self):
+        """Champs de type inattendu ou date fournie par le client : la ligne est refusée, pas la requête"""
+        self.users.seed({"id": "u1", "pseudo": "alice"})
+        body = "\n".join([
+            '{"user_id": ["u1"], "choice": "oui"}',
+            '{"user_id": {"id": "u1"}, "choice": "oui"}',
+            '{"user_id": "u1", "choice": 1}',
+            '{"user_id": "u1", "choice": "oui", "created_at": "2020-01-01T00:00:00"}',
+            '{"user_id": "u1", "choice": "oui"}',
+        ]).encode('utf-8')
+
+        response = self.call(function_app.submitVotesBulk, 'POST', 'votes/bulk', body)
+
+        assert response.status_code == 200
+        assert [item["status"] for item in json.loads(response.get_body())["results"]] == [400, 400, 400, 400, 201]
+        assert self.votes.get("u1", partition_key=["bayrou", "u1"])["created_at"] > "2020-01-01T00:00:00"
+
+    def test_malformed_user_lines_do_not_hold_emails(self):
+        """Un mot de passe qui n'est pas une chaîne est refusé sans réserver l'email"""
+        body = "\n".join([
+            json.dumps({"pseudo": "alice", "email": "alice@example.com", "password": ["secret"]}),
+            json.dumps({"pseudo": "bob", "email": {"a": 1}, "password": "secret"}),
+        ]).encode('utf-8')
+
+        data = json.loads(self.call(function_app.createUsersBulk, 'POST', 'users/bulk', body).get_body())
+
+        assert [item["status"] for item in data["results"]] == [400, 400]
+        assert self.emails.items == {}
+
+    def test_failed_hashing_releases_reserved_emails(self, monkeypatch):
+        """Une erreur inattendue pendant le hachage libère les emails réservés du lot"""
+        async def broken(password):
+            raise RuntimeError("hashing failed")
+
+        monkeypatch.setattr(password_hashing.hasher, 'hash_password', broken)
+        body = json.dumps({"pseudo": "alice", "email": "alice@example.com", "password": "secret"}).encode('utf-8')
+
+        response = self.call(function_app.createUsersBulk, 'POST', 'users/bulk', body)
+
+        assert response.status_code == 500
+        assert self.emails.items == {}
+
+    def test_too_many_lines(self, monkeypatch):
+        """Un import dépassant la limite de lignes est refusé d'emblée"""
+        monkeypatch.setattr(bulk, 'BULK_MAX_ITEMS', 1)
+        response = self.call(function_app.submitVotesBulk, 'POST', 'votes/bulk', b'{}\n{}')
+
+        assert response.status_code == 413
+
+    def test_body_too_large(self, monkeypatch):
+        """Un corps dépassant la taille maximum est refusé avant toute lecture de ses lignes"""
+        monkeypatch.setattr(bulk, 'BULK_MAX_BYTES', 4)
+        response = self.call(function_app.createUsersBulk, 'POST', 'users/bulk', b'{}\n{}\n')
+
+        assert response.status_code == 413
+        assert "bytes" in json.loads(response.get_body())["error"]
+
+
+@pytest.mark.unit
+class TestVoteStats:
+    """Tests du compteur alimenté par POST /vote et servi par GET /votes/stats"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.users = container(USERS_CONTAINER)
+        for user_id in ("u1", "u2", "u3"):
+            self.users.seed({"id": user_id, "pseudo": user_id})
+
+    def test_votes_update_stats(self):
+        """Chaque vote met à jour le compteur lu par GET /votes/stats"""
+        for user_id, choice in (("u1", "oui"), ("u2", "oui"), ("u3", "non")):
+            response = self.call(function_app.submitVote, 'POST', 'vote', {"user_id": user_id, "choice": choice})
+            assert response.status_code == 201
+
+        response = self.call(function_app.getVoteStats, route='votes/stats')
+        stats = json.loads(response.get_body())["stats"]
+
+        assert response.status_code == 200
+        assert (stats["oui"], stats["non"], stats["total"]) == (2, 1, 3)
+        assert stats["oui_percentage"] == 66.7
+
+
+    def test_reconciliation_continues_after_a_failed_poll(self, monkeypatch):
+        """Un sondage dont la réconciliation échoue n'empêche pas celle des suivants"""
+        self.call(function_app.createPoll, 'POST', 'polls', {"question": "Autre ?"})
+        reconciled = []
+        reconcile = tally.reconcile
+
+        async def failing_first(votes_container, tallies_container, tally_id, **kwargs):
+            reconciled.append(tally_id)
+            if len(reconciled) == 1:
+                raise exceptions.CosmosHttpResponseError(status_code=412, message="Precondition failed")
+            return await reconcile(votes_container, tallies_container, tally_id, **kwargs)
+
+        monkeypatch.setattr(tally, 'reconcile', failing_first)
+        asyncio.run(function_app.reconcileTally.build().get_user_function()(None))
+
+        assert len(reconciled) == 2
+
+
+@pytest.mark.unit
+class TestVoteTimeseries:
+    """Tests de l'historique GET /votes/timeseries, lu dans les tranches agrégées"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.rollups = container(ROLLUPS_CONTAINER)
+        self.users = container(USERS_CONTAINER)
+        for user_id in ("u1", "u2", "u3", "u4"):
+            self.users.seed({"id": user_id, "pseudo": user_id})
+
+    def _series(self, **params):
+        response = self.call(function_app.getVoteTimeseries, route='votes/timeseries', params=params)
+        assert response.status_code == 200
+        return {row["start"]: (row["oui"], row["non"]) for row in json.loads(response.get_body())["series"] if row["total"]}
+
+    def test_vote_updates_current_minute(self):
+        """Un vote est compté dans la minute en cours, sans lire les votes"""
+        assert self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "u1", "choice": "non"}).status_code == 201
+
+        response = self.call(function_app.getVoteTimeseries, route='votes/timeseries', params={"bucket": "minute"})
+        data = json.loads(response.get_body())
+
+        assert (data["bucket"], len(data["series"])) == ("minute", 60)
+        assert data["series"][-1] | {"start": None} == {"start": None, "oui": 0, "non": 1, "total": 1}
+
+    def test_imported_votes_survive_compaction(self, monkeypatch):
+        """Les votes d'un import sont comptés dans leurs tranches, puis agrégés par la compaction"""
+        for user_id, choice, created_at in (
+            ("u1", "oui", "2024-05-01T08:00:00"),
+            ("u2", "non", "2024-05-01T08:59:59"),
+            ("u3", "oui", "2024-05-01T09:10:00"),
+            ("u4", "oui", "2024-05-02T10:00:00"),
+        ):
+            monkeypatch.setattr(bulk, '_now', lambda: created_at)
+            body = json.dumps({"user_id": user_id, "choice": choice}).encode('utf-8')
+            self.call(function_app.submitVotesBulk, 'POST', 'votes/bulk', body)
+        hours = {"2024-05-01T08:00:00": (1, 1), "2024-05-01T09:00:00": (1, 0)}
+        assert self._series(bucket="hour", since="2024-05-01T00:00", until="2024-05-01T23:00") == hours
+
+        asyncio.run(function_app.compactVoteRollups.build().get_user_function()(None))
+        votes_cache.invalidate()
+
+        # Minutes et heures agrégées puis purgées au-delà de leur rétention : restent les jours
+        assert {doc["granularity"] for doc in self.rollups.items.values() if "granularity" in doc} == {"day"}
+        assert self._series(bucket="day", since="2024-05-01", until="2024-05-02") == {
+            "2024-05-01T00:00:00": (2, 1), "2024-05-02T00:00:00": (1, 0)
+        }
+
+    @pytest.mark.parametrize("params", [{"bucket": "week"}, {"since": "hier"}])
+    def test_invalid_parameters(self, params):
+        """Granularité ou date invalide : 400"""
+        response = self.call(function_app.getVoteTimeseries, route='votes/timeseries', params=params)
+
+        assert response.status_code == 400
+
+
+@pytest.mark.unit
+class TestChangeFeed:
+    """Tests des vues dérivées mises à jour par le flux de modifications (CHANGE_FEED=1)"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container, monkeypatch):
+        monkeypatch.setattr(change_feed, 'CHANGE_FEED', True)
+        self.call = call
+        self.votes = container(VOTES_CONTAINER)
+        self.tallies = container(TALLIES_CONTAINER)
+        self.rollups = container(ROLLUPS_CONTAINER)
+        self.leases = container(LEASES_CONTAINER)
+        self.users = container(USERS_CONTAINER)
+        for user_id in ("u1", "u2"):
+            self.users.seed({"id": user_id, "pseudo": user_id})
+
+    def _process(self):
+        asyncio.run(function_app.processChangeFeed.build().get_user_function()(None))
+
+    def _stats(self):
+        votes_cache.invalidate()
+        stats = json.loads(self.call(function_app.getVoteStats, route='votes/stats').get_body())["stats"]
+        return stats["oui"], stats["non"], stats["total"]
+
+    def test_vote_is_a_single_insert(self):
+        """Le vote n'écrit que son document ; compteur et historique suivent au passage de la tâche"""
+        self._process()
+        calls = self.votes.calls
+
+        for user_id, choice in (("u1", "oui"), ("u2", "non")):
+            assert self.call(function_app.submitVote, 'POST', 'vote', {"user_id": user_id, "choice": choice}).status_code == 201
+
+        assert self.votes.calls - calls == 2
+        assert not self.tallies.items and not self.rollups.items
+
+        self._process()
+        self._process()
+
+        assert self._stats() == (1, 1, 2)
+        assert sum(doc["counts"]["total"] for doc in self.rollups.items.values()) == 2
+        leases = [doc for doc in self.leases.items.values() if "processor" in doc]
+        assert {lease["processor"] for lease in leases} == {"votes", "users"}
+        assert len(self.leases.items) - len(leases) == 2
+
+
+@pytest.mark.unit
+class TestVoteChanges:
+    """Tests du long-poll GET /votes/changes"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.users = container(USERS_CONTAINER)
+        self.users.seed({"id": "u1", "pseudo": "alice"})
+
+    def test_without_cursor_returns_current_cursor(self):
+        """Sans curseur, la réponse est immédiate et donne le curseur courant"""
+        response = self.call(function_app.getVoteChanges, route='votes/changes')
+        data = json.loads(response.get_body())
+
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "no-store"
+        assert data == {"votes": [], "stats": data["stats"], "cursor": ""}
+
+    def test_vote_wakes_up_waiting_client(self):
+        """Un vote écrit par le worker est renvoyé aux clients en attente sans attendre le délai"""
+        changes = function_app.getVoteChanges.build().get_user_function()
+        submit = function_app.submitVote.build().get_user_function()
+
+        async def vote_later():
+            await asyncio.sleep(0.1)
+            return await submit(func.HttpRequest(
+                method='POST', url='http://localhost:7071/api/vote',
+                body=json.dumps({"user_id": "u1", "choice": "oui"}).encode('utf-8')
+            ))
+
+        async def scenario():
+            request = func.HttpRequest(method='GET', url='http://localhost:7071/api/votes/changes',
+                                       body=b'', params={"since": "", "wait": "10"})
+            return await asyncio.wait_for(asyncio.gather(changes(request), vote_later()), timeout=5)
+
+        response, _ = asyncio.run(scenario())
+        data = json.loads(response.get_body())
+
+        assert [vote["user"]["pseudo"] for vote in data["votes"]] == ["alice"]
+        assert data["cursor"] == data["votes"][0]["created_at"]
+        assert data["stats"]["total"] == 1
+
+    def test_timeout_keeps_cursor(self):
+        """Sans nouveau vote, la réponse arrive au terme du délai avec le même curseur"""
+        response = self.call(function_app.getVoteChanges, route='votes/changes',
+                             params={"since": "2025-01-01T10:00:00", "wait": "0.1"})
+
+        assert json.loads(response.get_body())["votes"] == []
+        assert json.loads(response.get_body())["cursor"] == "2025-01-01T10:00:00"
+
+    @pytest.mark.parametrize("wait", ["nan", "inf", "-inf", "soon"])
+    def test_invalid_wait(self, wait):
+        """Une durée d'attente non finie ou non numérique est refusée (400) au lieu d'une attente sans fin"""
+        response = self.call(function_app.getVoteChanges, route='votes/changes',
+                             params={"since": "2025-01-01T10:00:00", "wait": wait})
+
+        assert response.status_code == 400
+
+
+@pytest.mark.unit
+class TestPolls:
+    """Tests des sondages : POST /polls, GET /polls et votes par sondage"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.users = container(USERS_CONTAINER)
+        self.votes = container(VOTES_CONTAINER)
+        self.users.seed({"id": "u1", "pseudo": "alice"}, {"id": "u2", "pseudo": "bob"})
+
+    def test_poll_creation_requires_the_master_key(self):
+        """Seuls les administrateurs créent des sondages ; la liste reste publique"""
+        assert function_app.createPoll.build().get_trigger().auth_level == func.AuthLevel.ADMIN
+        assert function_app.listPolls.build().get_trigger().auth_level == func.AuthLevel.ANONYMOUS
+
+    def _create_poll(self, **body):
+        response = self.call(function_app.createPoll, 'POST', 'polls', body)
+        return response.status_code, json.loads(response.get_body())
+
+    def test_votes_are_counted_per_poll(self):
+        """Un utilisateur vote une fois par sondage, chaque sondage a ses votes et ses statistiques"""
+        status, data = self._create_poll(question="Quelle couleur ?", choices=["Rouge", "bleu", "vert"])
+        poll_id = data["poll"]["id"]
+        assert status == 201
+        assert data["poll"]["choices"] == ["rouge", "bleu", "vert"]
+
+        for body in ({"user_id": "u1", "choice": "oui"},
+                     {"user_id": "u1", "choice": "rouge", "poll_id": poll_id},
+                     {"user_id": "u2", "choice": "BLEU", "poll_id": poll_id}):
+            assert self.call(function_app.submitVote, 'POST', 'vote', body).status_code == 201
+
+        vote = self.votes.get("u1", partition_key=[poll_id, "u1"])
+        assert set(vote) - {"_etag", "_ts", "_lsn"} == {"id", "poll_id", "user_id", "pseudo", "choice", "created_at"}
+
+        data = json.loads(self.call(function_app.getVotes, route='votes', params={"poll_id": poll_id}).get_body())
+        assert data["question"] == "Quelle couleur ?"
+        assert [vote["user"]["pseudo"] for vote in data["votes"]] == ["bob", "alice"]
+        assert (data["stats"]["rouge"], data["stats"]["bleu"], data["stats"]["vert"]) == (1, 1, 0)
+
+        stats = json.loads(self.call(function_app.getVoteStats, route='votes/stats').get_body())["stats"]
+        assert (stats["oui"], stats["total"]) == (1, 1)
+
+    def test_invalid_choice_and_unknown_poll(self):
+        """Un choix absent du sondage est refusé, un sondage inconnu donne 404"""
+        _, data = self._create_poll(question="Quelle couleur ?", choices=["rouge", "bleu"])
+
+        response = self.call(function_app.submitVote, 'POST', 'vote',
+                             {"user_id": "u1", "choice": "oui", "poll_id": data["poll"]["id"]})
+        assert response.status_code == 400
+
+        response = self.call(function_app.submitVote, 'POST', 'vote',
+                             {"user_id": "u1", "choice": "oui", "poll_id": "ghost"})
+        assert response.status_code == 404
+        assert self.call(function_app.getVotes, route='votes', params={"poll_id": "ghost"}).status_code == 404
+        assert not self.votes.items
+
+    def test_list_polls(self):
+        """La liste contient le sondage historique et les sondages créés"""
+        self._create_poll(question="Quelle couleur ?")
+        data = json.loads(self.call(function_app.listPolls, route='polls').get_body())
+
+        assert [poll["question"] for poll in data["polls"]] == ["Quelle couleur ?", "Est-ce que François Bayrou nous manque ?"]
+        assert data["polls"][0]["choices"] == ["oui", "non"]
+
+    @pytest.mark.parametrize("body", [
+        {"question": ""},
+        {"question": "Q ?", "choices": ["seul"]},
+        {"question": "Q ?", "choices": ["a", "A"]},
+        {"question": "Q ?", "choices": ["a", "total"]},
+        {"question": "Q ?", "choices": ["_a", "b"]},
+    ])
+    def test_invalid_poll(self, body):
+        """Une question vide ou des choix invalides sont refusés"""
+        assert self._create_poll(**body)[0] == 400
+
+
+@pytest.mark.unit
+class TestEmailIndex:
+    """Tests de l'index des emails dans POST /user et POST /login"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container):
+        self.call = call
+        self.users = container(USERS_CONTAINER)
+        self.emails = container(EMAILS_CONTAINER)
+
+    def test_signup_then_login(self):
+        """L'inscription indexe l'email, utilisé ensuite par la connexion"""
+        created = self.call(function_app.createUser, 'POST', 'user',
+                            {"pseudo": "alice", "email": "Alice@example.com", "password": "secret"})
+        user_id = json.loads(created.get_body())["user"]["id"]
+
+        assert created.status_code == 201
+        assert self.emails.get("alice@example.com", partition_key="alice@example.com")["user_id"] == user_id
+
+        duplicate = self.call(function_app.createUser, 'POST', 'user',
+                              {"pseudo": "eve", "email": "alice@EXAMPLE.com", "password": "other"})
+        assert duplicate.status_code == 409
+
+        login = self.call(function_app.loginUser, 'POST', 'login',
+                          {"email": "alice@example.com", "password": "secret"})
+        assert login.status_code == 200
+        assert json.loads(login.get_body())["user"]["id"] == user_id
+        assert auth_tokens.verify(json.loads(login.get_body())["token"])["pseudo"] == "alice"
+        assert auth_tokens.verify(json.loads(created.get_body())["token"])["sub"] == user_id
+
+    def test_failed_signup_releases_email(self, fast_hasher):
+        """Un échec après la réservation libère l'email"""
+        release = threading.Event()
+        blocked = [fast_hasher.submit(release.wait) for _ in range(4)]
+
+        response = self.call(function_app.createUser, 'POST', 'user',
+                             {"pseudo": "bob", "email": "b@example.com", "password": "secret"})
+        release.set()
+        for future in blocked:
+            future.result(timeout=5)
+
+        assert response.status_code == 503
+        assert not self.emails.items
+        assert not self.users.items
+
+    @pytest.mark.parametrize("email", [42, None, ["a@example.com"], {"a": 1}])
+    def test_email_must_be_a_string(self, email):
+        """Un email qui n'est pas une chaîne est refusé (400) à l'inscription comme à la connexion"""
+        signup = self.call(function_app.createUser, 'POST', 'user',
+                           {"pseudo": "alice", "email": email, "password": "secret"})
+        login = self.call(function_app.loginUser, 'POST', 'login', {"email": email, "password": "secret"})
+
+        assert (signup.status_code, login.status_code) == (400, 400)
+        assert not self.emails.items
+
+    def test_missing_signing_secret_creates_nothing(self, monkeypatch):
+        """Dans Azure sans AUTH_TOKEN_SECRET, l'inscription et la connexion répondent 503 sans écrire"""
+        monkeypatch.setattr(auth_tokens, 'AUTH_TOKEN_SECRET', '')
+        monkeypatch.setenv('WEBSITE_INSTANCE_ID', 'instance-1')
+        monkeypatch.delenv('AZURE_FUNCTIONS_ENVIRONMENT', raising=False)
+
+        signup = self.call(function_app.createUser, 'POST', 'user',
+                           {"pseudo": "alice", "email": "a@example.com", "password": "secret"})
+        login = self.call(function_app.loginUser, 'POST', 'login',
+                          {"email": "a@example.com", "password": "secret"})
+
+        assert (signup.status_code, login.status_code) == (503, 503)
+        assert not self.users.items
+        assert not self.emails.items
+
+
+@pytest.mark.unit
+class TestPasswordHashing:
+    """Tests du hachage bcrypt dans POST /user et POST /login"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container, fast_hasher):
+        self.call = call
+        self.hasher = fast_hasher
+        self.users = container(USERS_CONTAINER)
+        self.emails = container(EMAILS_CONTAINER)
+
+    def test_login_upgrades_hash_cost(self):
+        """Une connexion réussie recalcule un hachage d'un ancien coût"""
+        legacy_hash = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=5)).decode()
+        self.users.seed({"id": "u1", "pseudo": "alice", "email": "a@example.com",
+                                "password_hash": legacy_hash})
+        self.emails.seed({"id": "a@example.com", "email": "a@example.com", "user_id": "u1"})
+
+        response = self.call(function_app.loginUser, 'POST', 'login',
+                             {"email": "a@example.com", "password": "secret"})
+
+        assert response.status_code == 200
+        upgraded = self.users.get("u1", partition_key="u1")["password_hash"]
+        assert upgraded.startswith("$2b$04$")
+        assert bcrypt.checkpw(b"secret", upgraded.encode())
+
+    def test_saturated_pool_returns_503(self):
+        """Une inscription est refusée avec 503 quand le pool est saturé"""
+        release = threading.Event()
+        blocked = [self.hasher.submit(release.wait) for _ in range(4)]
+
+        response = self.call(function_app.createUser, 'POST', 'user',
+                             {"pseudo": "bob", "email": "b@example.com", "password": "secret"})
+        release.set()
+        for future in blocked:
+            future.result(timeout=5)
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
@@ -45,10 +45,10 @@ class TestUserVoteIntegration:
             # Supprimer le vote si créé
             if self.created_vote_id and self.created_user_id:
                 try:
-                    votes_container = database.get_container_client('votes')
+                    votes_container = database.get_container_client('poll_votes')
                     votes_container.delete_item(
                         item=self.created_vote_id, 
-                        partition_key=self.created_user_id
+                        partition_key=['bayrou', self.created_user_id]
                     )
                     print(f"✅ Vote {self.created_vote_id} supprimé")
                 except exceptions.CosmosResourceNotFoundError:
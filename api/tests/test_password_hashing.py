@@ -0,0 +1,46 @@
+"""
+Tests unitaires du pool de hachage bcrypt borné
+"""
+
+import asyncio
+import threading
+
+import bcrypt
+import pytest
+
+from shared_code.password_hashing import HashingPoolSaturated, PasswordHasher
+
+
+@pytest.mark.unit
+class TestPasswordHasher:
+    """Tests du hachage, de la vérification et de la contre-pression"""
+
+    def test_hash_and_verify(self):
+        """Un hachage se vérifie avec le bon mot de passe uniquement"""
+        hasher = PasswordHasher(rounds=4, workers=1, queue_limit=2)
+        password_hash = asyncio.run(hasher.hash_password("secret"))
+
+        assert password_hash.startswith("$2b$04$")
+        assert asyncio.run(hasher.verify_password("secret", password_hash))
+        assert not asyncio.run(hasher.verify_password("wrong", password_hash))
+
+    def test_needs_rehash(self):
+        """Un hachage d'un autre coût doit être recalculé"""
+        hasher = PasswordHasher(rounds=5, workers=1, queue_limit=1)
+
+        assert hasher.needs_rehash(bcrypt.hashpw(b"x", bcrypt.gensalt(rounds=4)).decode())
+        assert not hasher.needs_rehash(bcrypt.hashpw(b"x", bcrypt.gensalt(rounds=5)).decode())
+
+    def test_saturated_pool_rejects_work(self):
+        """Au-delà de la limite de file, les tâches sont refusées immédiatement"""
+        hasher = PasswordHasher(rounds=4, workers=1, queue_limit=2)
+        release = threading.Event()
+        blocked = [hasher.submit(release.wait) for _ in range(2)]
+
+        with pytest.raises(HashingPoolSaturated):
+            asyncio.run(hasher.hash_password("secret"))
+
+        release.set()
+        for future in blocked:
+            future.result(timeout=5)
+        assert asyncio.run(hasher.verify_password("secret", asyncio.run(hasher.hash_password("secret"))))
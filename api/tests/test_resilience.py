@@ -0,0 +1,257 @@
+"""
+Tests unitaires de la résilience face à la saturation de Cosmos DB (429, disjoncteur, limites des handlers)
+"""
+
+import asyncio
+import json
+
+import pytest
+from azure.cosmos import exceptions
+
+import function_app
+from shared_code import resilience, telemetry
+from shared_code.cosmos_pool import USERS_CONTAINER, VOTES_CONTAINER
+from tests.fake_cosmos import FakeContainer
+
+
+def throttled(retry_after_ms=None):
+    error = exceptions.CosmosHttpResponseError(status_code=429, message="Too many requests")
+    error.headers = {"x-ms-retry-after-ms": str(retry_after_ms)} if retry_after_ms is not None else {}
+    return error
+
+
+class Clock:
+    """Horloge manuelle"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.unit
+class TestThrottleDelay:
+    """Tests du délai avant de rejouer un 429"""
+
+    def test_honors_retry_after_with_jitter(self):
+        """Le délai demandé par Cosmos est respecté, augmenté d'une gigue bornée"""
+        for _ in range(20):
+            delay = resilience.throttle_delay(throttled(200), attempt=0)
+            assert 0.2 <= delay <= 0.2 * (1 + resilience.THROTTLE_JITTER)
+
+    def test_exponential_backoff_without_hint(self, monkeypatch):
+        """Sans indication, le délai double à chaque tentative"""
+        monkeypatch.setattr(resilience, 'THROTTLE_JITTER', 0)
+        delays = [resilience.throttle_delay(throttled(), attempt) for attempt in range(3)]
+        assert delays == [resilience.THROTTLE_BASE_DELAY * 2 ** attempt for attempt in range(3)]
+
+    def test_gives_up(self):
+        """Pas de nouvelle tentative au-delà du maximum, pour un délai trop long ou une autre erreur"""
+        assert resilience.throttle_delay(throttled(10), attempt=resilience.THROTTLE_MAX_RETRIES) is None
+        assert resilience.throttle_delay(throttled(int(resilience.THROTTLE_MAX_DELAY * 1000) + 1), attempt=0) is None
+        assert resilience.throttle_delay(exceptions.CosmosResourceNotFoundError(status_code=404), attempt=0) is None
+
+
+@pytest.mark.unit
+class TestCircuitBreaker:
+    """Tests du disjoncteur"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.clock = Clock()
+        self.breaker = resilience.CircuitBreaker(threshold=3, open_seconds=5, clock=self.clock)
+
+    def _fail(self, count):
+        for _ in range(count):
+            self.breaker.release(self.breaker.acquire(), False)
+
+    def test_opens_after_consecutive_failures(self):
+        """Le disjoncteur s'ouvre après `threshold` échecs consécutifs ; un succès remet le compte à zéro"""
+        self._fail(2)
+        self.breaker.release(self.breaker.acquire(), True)
+        self._fail(2)
+        assert self.breaker.state == 'closed'
+
+        self._fail(1)
+        assert self.breaker.state == 'open'
+        with pytest.raises(resilience.CircuitOpen) as raised:
+            self.breaker.acquire()
+        assert raised.value.retry_after == 5
+
+    def test_half_open_lets_a_single_probe_through(self):
+        """Après l'ouverture, un seul appel d'essai passe ; son issue ferme ou rouvre le disjoncteur"""
+        self._fail(3)
+        self.clock.now = 5
+
+        assert self.breaker.acquire() is True
+        with pytest.raises(resilience.CircuitOpen):
+            self.breaker.acquire()
+        self.breaker.release(True, False)
+        assert self.breaker.state == 'open'
+
+        self.clock.now = 10
+        self.breaker.release(self.breaker.acquire(), True)
+        assert self.breaker.state == 'closed'
+        assert self.breaker.acquire() is False
+
+
+@pytest.mark.unit
+class TestTokenBucket:
+    """Tests du seau à jetons"""
+
+    def test_burst_then_refill(self):
+        """La réserve absorbe une rafale, puis les jetons reviennent au débit configuré"""
+        clock = Clock()
+        bucket = resilience.TokenBucket(rate=2, burst=3, clock=clock)
+
+        assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+        assert bucket.take() == 0.5
+
+        clock.now = 0.5
+        assert bucket.take() == 0
+        assert bucket.take() > 0
+
+    def test_parse_limits(self):
+        """ENDPOINT_LIMITS associe à un handler sa simultanéité et, éventuellement, son débit"""
+        assert resilience.parse_limits("submitVote=32:100, getVotes=256,") == {
+            "submitVote": (32, 100.0),
+            "getVotes": (256, None)
+        }
+
+
+@pytest.mark.unit
+class TestResilientContainer:
+    """Tests des appels Cosmos contre un faux container qui renvoie des 429"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, circuit_breaker):
+        self.breaker = circuit_breaker
+        self.raw = FakeContainer('users', '/id')
+        self.raw.seed({"id": "u1", "pseudo": "alice"}, {"id": "u2", "pseudo": "bob"})
+        self.container = resilience.ResilientContainer(telemetry.InstrumentedContainer(self.raw))
+
+    def _traced(self, coroutine_function):
+        async def run():
+            metrics = telemetry.RequestMetrics()
+            token = telemetry.current.set(metrics)
+            try:
+                return await coroutine_function(), metrics
+            finally:
+                telemetry.current.reset(token)
+        return asyncio.run(run())
+
+    def test_throttled_call_is_retried(self):
+        """Un 429 est rejoué après le délai demandé, chaque tentative étant relevée"""
+        self.raw.fail_next(2, retry_after_ms=5)
+
+        user, metrics = self._traced(lambda: self.container.read_item(item="u1", partition_key="u1"))
+
+        assert user["pseudo"] == "alice"
+        assert (self.raw.calls, metrics.cosmos_calls, metrics.retries) == (3, 3, 2)
+        assert self.breaker.state == 'closed'
+
+    def test_query_page_is_retried(self):
+        """Une page refusée est relue sans perdre le curseur"""
+        self.raw.fail_next(1, retry_after_ms=5)
+
+        async def read_pages():
+            pages = self.container.query_items(query="SELECT * FROM c", max_item_count=1).by_page()
+            return [[item["id"] async for item in page] async for page in pages]
+
+        pages, metrics = self._traced(read_pages)
+
+        assert sorted(pages) == [["u1"], ["u2"]]
+        assert metrics.retries == 1
+
+    def test_persistent_throttling_opens_the_breaker(self):
+        """Les 429 persistants remontent et ouvrent le disjoncteur, qui refuse ensuite les appels sans Cosmos"""
+        self.raw.fail_next(100, retry_after_ms=1)
+
+        for _ in range(resilience.BREAKER_THRESHOLD):
+            with pytest.raises(exceptions.CosmosHttpResponseError):
+                asyncio.run(self.container.read_item(item="u1", partition_key="u1"))
+        assert self.breaker.state == 'open'
+
+        calls = self.raw.calls
+        with pytest.raises(resilience.CircuitOpen):
+            asyncio.run(self.container.read_item(item="u1", partition_key="u1"))
+        assert self.raw.calls == calls
+
+    def test_business_errors_do_not_trip_the_breaker(self):
+        """Un 404 est une réponse de Cosmos : il n'est ni rejoué ni compté comme saturation"""
+        for _ in range(resilience.BREAKER_THRESHOLD + 1):
+            with pytest.raises(exceptions.CosmosResourceNotFoundError):
+                asyncio.run(self.container.read_item(item="missing", partition_key="missing"))
+        assert self.breaker.state == 'closed'
+        assert self.raw.calls == resilience.BREAKER_THRESHOLD + 1
+
+
+@pytest.mark.unit
+class TestGuardedHandlers:
+    """Tests des réponses des handlers HTTP quand Cosmos est saturé"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, call, container, circuit_breaker):
+        self.call = call
+        self.breaker = circuit_breaker
+        self.users = container(USERS_CONTAINER)
+        self.votes = container(VOTES_CONTAINER)
+        self.users.seed({"id": "u1", "pseudo": "alice"})
+
+    def _vote(self):
+        return self.call(function_app.submitVote, 'POST', 'vote', {"user_id": "u1", "choice": "oui"})
+
+    def test_throttled_vote_succeeds_after_retry(self):
+        """Un 429 passager est absorbé : le vote aboutit"""
+        self.votes.fail_next(1, retry_after_ms=5)
+
+        assert self._vote().status_code == 201
+
+    def test_long_throttling_returns_503_with_retry_after(self):
+        """Un délai demandé trop long n'est pas attendu : 503 avec Retry-After arrondi à la seconde"""
+        self.users.fail_next(1, retry_after_ms=3500)
+
+        response = self._vote()
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "4"
+        assert json.loads(response.get_body()) == {"error": "Service temporarily overloaded, please retry"}
+
+    def test_open_breaker_returns_fast_503(self):
+        """Disjoncteur ouvert : 503 immédiat, sans appel à Cosmos, puis reprise après l'essai"""
+        self.users.fail_next(resilience.BREAKER_THRESHOLD, status_code=503, retry_after_ms=None)
+        for _ in range(resilience.BREAKER_THRESHOLD):
+            assert self._vote().status_code == 503
+        assert self.breaker.state == 'open'
+
+        calls = self.users.calls + self.votes.calls
+        response = self._vote()
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) == resilience.BREAKER_OPEN_SECONDS
+        assert self.users.calls + self.votes.calls == calls
+
+        self.breaker._opened_at -= resilience.BREAKER_OPEN_SECONDS
+        assert self._vote().status_code == 201
+        assert self.breaker.state == 'closed'
+
+    def test_concurrency_limit_sheds_requests(self, monkeypatch):
+        """Au-delà des requêtes simultanées permises, la requête est refusée (503) sans être traitée"""
+        guard = resilience.guards["submitVote"]
+        monkeypatch.setattr(guard, 'active', guard.max_concurrency)
+
+        response = self._vote()
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert not self.votes.items
+
+    def test_rate_limit_returns_429(self, monkeypatch):
+        """Le seau à jetons vide répond 429 avec le délai avant le prochain jeton"""
+        monkeypatch.setattr(resilience.guards["getVotes"], 'bucket', resilience.TokenBucket(rate=0.5, burst=1))
+
+        assert self.call(function_app.getVotes, 'GET', 'votes').status_code == 200
+        response = self.call(function_app.getVotes, 'GET', 'votes')
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
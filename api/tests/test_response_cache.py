@@ -0,0 +1,76 @@
+"""
+Tests unitaires du cache de réponses à durée de vie courte
+"""
+
+import time
+
+import pytest
+
+from shared_code.response_cache import ResponseCache, etag_matches, make_etag
+
+
+@pytest.mark.unit
+class TestResponseCache:
+    """Tests du cache, de l'invalidation et des ETags"""
+
+    def test_entries_expire(self):
+        """Une entrée n'est plus servie après son TTL"""
+        cache = ResponseCache(ttl=0.05)
+        cache.set("votes", b'{"votes": []}')
+        assert cache.get("votes").body == b'{"votes": []}'
+
+        time.sleep(0.06)
+        assert cache.get("votes") is None
+
+    def test_invalidate_clears_entries(self):
+        """Une écriture vide le cache"""
+        cache = ResponseCache(ttl=60)
+        cache.set("votes", b'{}')
+        cache.invalidate()
+        assert cache.get("votes") is None
+
+    def test_stale_generation_is_not_stored(self):
+        """Une réponse calculée avant une invalidation n'est pas conservée"""
+        cache = ResponseCache(ttl=60)
+        generation = cache.generation
+        cache.invalidate()
+
+        entry = cache.set("votes", b'{}', generation)
+        assert entry.body == b'{}'
+        assert cache.get("votes") is None
+
+    def test_size_is_bounded_by_least_recent_use(self):
+        """Au-delà du nombre maximum d'entrées, la moins récemment utilisée est évincée"""
+        cache = ResponseCache(ttl=60, max_entries=2)
+        cache.set("a", b'{}')
+        cache.set("b", b'{}')
+        cache.get("a")
+        cache.set("c", b'{}')
+
+        assert len(cache) == 2
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+
+    def test_expired_entries_are_dropped(self):
+        """Les entrées expirées sont retirées à la lecture et à l'écriture, pas seulement ignorées"""
+        cache = ResponseCache(ttl=0.05)
+        for continuation in range(50):
+            cache.set(("votes", continuation), b'{}')
+        time.sleep(0.06)
+
+        assert cache.get(("votes", 0)) is None
+        cache.set("fresh", b'{}')
+        assert len(cache) == 1
+
+    def test_etags(self):
+        """L'ETag est fort, stable et reconnu dans If-None-Match"""
+        etag = make_etag(b'{"a": 1}')
+        assert etag == make_etag(b'{"a": 1}')
+        assert etag != make_etag(b'{"a": 2}')
+        assert etag.startswith('"') and etag.endswith('"')
+
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches('*', etag)
+        assert not etag_matches(None, etag)
+        assert not etag_matches('"other"', etag)
@@ -0,0 +1,184 @@
+"""
+Tests unitaires de l'historique des votes agrégé par tranches de temps
+"""
+
+import asyncio
+import datetime
+
+import pytest
+
+from shared_code import rollups
+from tests.fake_cosmos import FakeContainer
+
+NOW = datetime.datetime(2025, 1, 1, 12, 0)
+
+
+def vote(choice, created_at):
+    return {"choice": choice, "created_at": created_at}
+
+
+@pytest.mark.unit
+class TestSeriesRange:
+    """Tests des bornes d'une série"""
+
+    def test_defaults_end_with_current_bucket(self):
+        """Sans bornes, la série finit par la tranche en cours"""
+        start, end = rollups.series_range('hour', now=datetime.datetime(2025, 1, 1, 12, 34))
+
+        assert end == datetime.datetime(2025, 1, 1, 13, 0)
+        assert end - start == rollups.TIMESERIES_DEFAULT_BUCKETS * datetime.timedelta(hours=1)
+
+    def test_bounds_are_aligned_and_converted_to_utc(self):
+        """Les bornes sont ramenées au début de leur tranche, en UTC ; `until` est inclus"""
+        start, end = rollups.series_range('day', since="2025-01-02T01:30:00+02:00", until="2025-01-03T10:00:00Z")
+
+        assert (start, end) == (datetime.datetime(2025, 1, 1), datetime.datetime(2025, 1, 4))
+
+    @pytest.mark.parametrize("granularity, since, until", [
+        ("week", None, None),
+        ("hour", "hier", None),
+        ("hour", "2025-01-02T00:00:00", "2025-01-01T00:00:00"),
+        ("minute", "2024-01-01T00:00:00", "2025-01-01T00:00:00"),
+    ])
+    def test_invalid_ranges(self, granularity, since, until):
+        """Granularité inconnue, date invalide, bornes inversées ou série trop longue : ValueError"""
+        with pytest.raises(ValueError):
+            rollups.series_range(granularity, since, until)
+
+
+@pytest.mark.unit
+class TestRecordVotes:
+    """Tests de la mise à jour des minutes à chaque vote"""
+
+    def test_votes_increment_their_minute(self):
+        """Un vote crée sa minute, les suivants l'incrémentent : une mise à jour partielle par minute"""
+        container = FakeContainer('vote_rollups', '/poll_id')
+
+        asyncio.run(rollups.record_votes(container, "p1", [vote("oui", "2025-01-01T10:05:12")]))
+        calls = container.calls
+        asyncio.run(rollups.record_votes(container, "p1", [
+            vote("non", "2025-01-01T10:05:40"),
+            vote("oui", "2025-01-01T10:05:59.500000"),
+            vote("oui", "2025-01-01T10:06:00"),
+        ]))
+
+        # 10 h 05 incrémentée d'un appel, 10 h 06 absente puis créée
+        assert container.calls - calls == 3
+        assert container.get("minute:2025-01-01T10:05:00", partition_key="p1")["counts"] == {"oui": 2, "non": 1, "total": 3}
+        assert container.get("minute:2025-01-01T10:06:00", partition_key="p1")["counts"] == {"oui": 1, "total": 1}
+
+
+@pytest.mark.unit
+class TestCompaction:
+    """Tests de l'agrégation des tranches et de la lecture des séries"""
+
+    CHOICES = ["oui", "non"]
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.container = FakeContainer('vote_rollups', '/poll_id')
+        self._record(
+            vote("oui", "2024-12-31T23:59:00"),
+            vote("oui", "2025-01-01T09:00:10"),
+            vote("non", "2025-01-01T09:45:00"),
+            vote("oui", "2025-01-01T10:30:00"),
+            vote("oui", "2025-01-01T11:58:00"),
+        )
+
+    def _record(self, *documents):
+        asyncio.run(rollups.record_votes(self.container, "p1", documents))
+
+    def _compact(self, now=NOW):
+        return asyncio.run(rollups.compact(self.container, "p1", now=now))
+
+    def _series(self, granularity, since, until):
+        start, end = rollups.series_range(granularity, since, until)
+        return {
+            row["start"]: (row["oui"], row["non"])
+            for row in asyncio.run(rollups.timeseries(self.container, "p1", granularity, start, end, self.CHOICES))
+            if row["total"]
+        }
+
+    def _granularities(self):
+        return sorted({doc.get("granularity") for doc in self.container.items.values() if "granularity" in doc})
+
+    def test_series_are_unchanged_by_compaction(self):
+        """Minutes terminées agrégées en heures : les séries restent identiques, sans double compte"""
+        hours = {
+            "2024-12-31T23:00:00": (1, 0),
+            "2025-01-01T09:00:00": (1, 1),
+            "2025-01-01T10:00:00": (1, 0),
+            "2025-01-01T11:00:00": (1, 0),
+        }
+        days = {"2024-12-31T00:00:00": (1, 0), "2025-01-01T00:00:00": (3, 1)}
+        assert self._series('hour', "2024-12-31T20:00", "2025-01-01T12:00") == hours
+
+        result = self._compact()
+
+        # Heure en cours (11 h) et jour en cours laissés en minutes
+        assert result["folded"] == {"hour": 3, "day": 1}
+        assert self.container.get("compaction", partition_key="p1")["folded_until"] == {
+            "hour": "2025-01-01T11:00:00", "day": "2025-01-01T00:00:00"
+        }
+        assert self._series('hour', "2024-12-31T20:00", "2025-01-01T12:00") == hours
+        assert self._series('day', "2024-12-30", "2025-01-01") == days
+        assert self._series('minute', "2025-01-01T09:00", "2025-01-01T09:00")["2025-01-01T09:00:00"] == (1, 0)
+
+    def test_late_vote_is_folded_at_next_compaction(self):
+        """Une minute modifiée après son agrégation est repérée et son heure recalculée"""
+        self._compact()
+        self._record(vote("non", "2025-01-01T09:10:00"))
+
+        self._compact()
+
+        assert self._series('hour', "2025-01-01T09:00", "2025-01-01T09:00") == {"2025-01-01T09:00:00": (1, 2)}
+
+    def test_expired_buckets_are_purged(self):
+        """Au-delà de leur rétention, les minutes sont purgées ; les heures et jours gardent les votes"""
+        self._compact(now=datetime.datetime(2025, 1, 5))
+
+        assert self._granularities() == ["day", "hour"]
+        assert self._series('minute', "2025-01-01T09:00", "2025-01-01T09:59") == {}
+        assert self._series('day', "2024-12-31", "2025-01-04") == {
+            "2024-12-31T00:00:00": (1, 0), "2025-01-01T00:00:00": (3, 1)
+        }
+
+        # Vote daté d'une minute déjà purgée : ajouté à son heure, puis à son jour
+        self._record(vote("non", "2025-01-01T09:10:00"))
+        self._compact(now=datetime.datetime(2025, 1, 5))
+
+        assert self._granularities() == ["day", "hour"]
+        assert self._series('hour', "2025-01-01T09:00", "2025-01-01T09:00") == {"2025-01-01T09:00:00": (1, 2)}
+        assert self._series('day', "2025-01-01", "2025-01-01") == {"2025-01-01T00:00:00": (3, 2)}
+
+
+@pytest.mark.unit
+class TestRebuild:
+    """Tests de la reconstruction de l'historique depuis les votes"""
+
+    def test_rebuild_replaces_drifted_buckets(self):
+        """Les minutes sont recomptées depuis les votes ; les anciennes tranches et l'état sont remplacés"""
+        votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        votes.seed(*(
+            {"id": f"u{i}", "poll_id": "p1", "user_id": f"u{i}", "choice": "oui" if i % 2 else "non",
+             "created_at": f"2025-01-01T09:0{i}:00"}
+            for i in range(4)
+        ))
+        container = FakeContainer('vote_rollups', '/poll_id')
+        container.seed(
+            rollups.rollup_document("p1", "minute", "2025-01-01T08:00:00", {"oui": 5, "total": 5}),
+            rollups.rollup_document("p1", "hour", "2025-01-01T08:00:00", {"oui": 5, "total": 5}),
+            {"id": "compaction", "poll_id": "p1", "folded_until": {"hour": "2025-01-01T09:00:00"},
+             "purged_until": {}, "compacted_at": 0},
+        )
+
+        dry_run = asyncio.run(rollups.rebuild(votes, container, "p1"))
+        assert (dry_run["votes"], dry_run["minutes"], dry_run["replaced"]) == (4, 4, 2)
+        assert len(container.items) == 3
+
+        asyncio.run(rollups.rebuild(votes, container, "p1", apply=True))
+        asyncio.run(rollups.compact(container, "p1", now=NOW))
+
+        start, end = rollups.series_range('hour', "2025-01-01T08:00", "2025-01-01T09:00")
+        series = asyncio.run(rollups.timeseries(container, "p1", 'hour', start, end, ["oui", "non"]))
+        assert [(row["oui"], row["non"]) for row in series] == [(0, 0), (2, 2)]
@@ -0,0 +1,51 @@
+"""
+Tests unitaires de la sérialisation des réponses
+"""
+
+import json
+
+import pytest
+
+from shared_code import serialization
+
+
+@pytest.mark.unit
+class TestDumps:
+    """Tests du sérialiseur JSON"""
+
+    VALUE = {"question": "Est-ce que François Bayrou nous manque ?", "stats": {"oui": 2, "oui_percentage": 66.7},
+             "continuation": None, "votes": [{"id": "u1", "choice": "oui"}]}
+
+    @pytest.mark.parametrize("serializer", ["json", "orjson"])
+    def test_backends_produce_the_same_bytes(self, monkeypatch, serializer):
+        """orjson et le module json produisent le même corps compact, en UTF-8"""
+        if serializer == "orjson" and serialization.orjson is None:
+            pytest.skip("orjson n'est pas installé")
+        monkeypatch.setattr(serialization, 'JSON_SERIALIZER', serializer)
+
+        body = serialization.dumps(self.VALUE)
+
+        assert serialization.backend() == serializer
+        assert body == json.dumps(self.VALUE, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        assert serialization.loads(body) == self.VALUE
+
+    def test_non_string_keys(self):
+        """Les clés numériques sont sérialisées en chaînes, comme avec le module json"""
+        assert serialization.loads(serialization.dumps({201: 1})) == {"201": 1}
+
+
+@pytest.mark.unit
+class TestAcceptsColumnar:
+    """Tests du choix du format colonnes selon Accept"""
+
+    @pytest.mark.parametrize("accept, expected", [
+        ("application/vnd.bayrou.columnar+json", True),
+        ("application/vnd.bayrou.columnar+json, application/json;q=0.5", True),
+        ("application/json, application/vnd.bayrou.columnar+json;q=0.5", False),
+        ("application/vnd.bayrou.columnar+json;q=0", False),
+        ("*/*", False),
+        (None, False),
+    ])
+    def test_accepts_columnar(self, accept, expected):
+        """Le format colonnes n'est servi que sur demande explicite, préférée au JSON par objets"""
+        assert serialization.accepts_columnar(accept) is expected
@@ -0,0 +1,234 @@
+"""
+Tests unitaires des instantanés précompressés de GET /votes
+"""
+
+import asyncio
+import gzip
+import types
+
+import pytest
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+from shared_code import snapshots
+
+
+class FakeContainerClient:
+    """Faux `ContainerClient` Azure Blob Storage en mémoire (métadonnées en chaînes)"""
+
+    def __init__(self):
+        self.created = False
+        self.blobs = {}
+
+    def create_container(self):
+        if self.created:
+            raise ResourceExistsError("The specified container already exists.")
+        self.created = True
+
+    def upload_blob(self, name, data, overwrite=False, metadata=None):
+        assert overwrite and all(isinstance(value, str) for value in (metadata or {}).values())
+        self.blobs[name] = (bytes(data), dict(metadata or {}))
+
+    def download_blob(self, name):
+        if name not in self.blobs:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        data, metadata = self.blobs[name]
+        return types.SimpleNamespace(readall=lambda: data, properties=types.SimpleNamespace(metadata=metadata))
+
+    def list_blobs(self, name_starts_with=None):
+        return [types.SimpleNamespace(name=name) for name in self.blobs if name.startswith(name_starts_with or '')]
+
+
+@pytest.mark.unit
+class TestNegotiate:
+    """Tests du choix de l'encodage selon Accept-Encoding"""
+
+    AVAILABLE = ('br', 'gzip', 'identity')
+
+    @pytest.mark.parametrize("accept_encoding, expected", [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0.5, gzip;q=0.8", "gzip"),
+        ("*", "br"),
+        (None, "identity"),
+        ("deflate", "identity"),
+        ("gzip;q=0, br;q=0", "identity"),
+        ("identity;q=0", None),
+        ("*;q=0", None),
+    ])
+    def test_negotiate(self, accept_encoding, expected):
+        """L'encodage préféré du serveur parmi ceux acceptés, identity sauf refus explicite"""
+        assert snapshots.negotiate(accept_encoding, self.AVAILABLE) == expected
+
+    def test_without_brotli(self):
+        """Sans le paquet brotli, un client qui accepte br reçoit du gzip"""
+        assert snapshots.negotiate("br, gzip", ('gzip', 'identity')) == "gzip"
+
+
+@pytest.mark.unit
+class TestLocalBlobStore:
+    """Tests du stockage de blobs local"""
+
+    def test_put_get_list(self, tmp_path):
+        """Un blob est relu avec son encodage et ses métadonnées"""
+        store = snapshots.LocalBlobStore(str(tmp_path))
+        store.put("votes/p1.json.gz", b"\x1f\x8b data\n", content_encoding="gzip", metadata={"etag": '"e"'})
+        store.put("votes/p1.json", b"{}")
+
+        blob = store.get("votes/p1.json.gz")
+        assert (blob.data, blob.content_encoding, blob.metadata) == (b"\x1f\x8b data\n", "gzip", {"etag": '"e"'})
+        assert store.get("votes/p2.json") is None
+        assert store.list("votes/") == ["votes/p1.json", "votes/p1.json.gz"]
+
+    def test_rejects_unsafe_names(self, tmp_path):
+        """Ni les noms de blobs ni les identifiants de sondages ne sortent du dossier"""
+        store = snapshots.LocalBlobStore(str(tmp_path))
+        with pytest.raises(ValueError):
+            store.get("../secrets")
+        with pytest.raises(ValueError):
+            snapshots.blob_name("../../etc/passwd")
+
+
+@pytest.mark.unit
+class TestAzureBlobStore:
+    """Tests du stockage Blob Storage partagé, derrière l'interface de `LocalBlobStore`"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.client = FakeContainerClient()
+        self.store = snapshots.AzureBlobStore("UseDevelopmentStorage=true", client_factory=lambda *args: self.client)
+
+    def test_put_get_list(self):
+        """Un blob est relu avec son encodage et ses métadonnées ; le conteneur est créé au premier accès"""
+        self.store.put("votes/p1.json.gz", b"\x1f\x8b data\n", content_encoding="gzip", metadata={"etag": '"e"'})
+        self.store.put("votes/p1.json", b"{}", metadata={"etag": '"e"', "source_etag": None})
+
+        blob = self.store.get("votes/p1.json.gz")
+        assert (blob.data, blob.content_encoding, blob.metadata) == (b"\x1f\x8b data\n", "gzip", {"etag": '"e"'})
+        assert self.store.get("votes/p1.json").content_encoding is None
+        assert self.store.get("votes/p2.json") is None
+        assert self.store.list("votes/") == ["votes/p1.json", "votes/p1.json.gz"]
+        assert self.client.created
+
+    def test_publish_then_read(self, monkeypatch):
+        """Les instantanés publiés dans Blob Storage sont servis par toutes les instances"""
+        monkeypatch.setattr(snapshots, 'store', self.store)
+        body = b'{"votes": []}' * 10
+        etag = asyncio.run(snapshots.publish("p1", body, source_etag=None))
+
+        gzipped, encoding, _ = asyncio.run(snapshots.read("p1", "gzip"))
+        assert (gzip.decompress(gzipped), encoding) == (body, "gzip")
+        assert asyncio.run(snapshots.read("p1", None)) == (body, "identity", etag)
+        assert snapshots.source_etag("p1") is None
+        assert snapshots.snapshot_polls() == ["p1"]
+
+
+@pytest.mark.unit
+class TestSnapshotsSetting:
+    """Tests de l'activation des instantanés"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setenv('VOTES_SNAPSHOTS', '1')
+        monkeypatch.setattr(snapshots, 'VOTES_SNAPSHOT_CONNECTION', '')
+        monkeypatch.delenv('WEBSITE_INSTANCE_ID', raising=False)
+
+    def test_requires_shared_storage_in_azure(self, monkeypatch):
+        """Dans Azure, sans stockage Blob partagé, les instantanés demandés restent désactivés"""
+        monkeypatch.setenv('WEBSITE_INSTANCE_ID', 'instance-1')
+        assert snapshots.snapshots_enabled() is False
+
+        monkeypatch.setattr(snapshots, 'VOTES_SNAPSHOT_CONNECTION', 'DefaultEndpointsProtocol=https;AccountName=bayrou')
+        monkeypatch.setattr(snapshots, 'ContainerClient', object())
+        assert snapshots.snapshots_enabled() is True
+        assert isinstance(snapshots.make_store(), snapshots.AzureBlobStore)
+
+        monkeypatch.setattr(snapshots, 'ContainerClient', None)
+        assert snapshots.snapshots_enabled() is False
+
+    def test_local_store_outside_azure(self, monkeypatch):
+        """Hors d'Azure, le dossier local suffit"""
+        assert snapshots.snapshots_enabled() is True
+        assert isinstance(snapshots.make_store(), snapshots.LocalBlobStore)
+        monkeypatch.setenv('VOTES_SNAPSHOTS', '0')
+        assert snapshots.snapshots_enabled() is False
+
+
+@pytest.mark.unit
+class TestPublish:
+    """Tests de l'écriture et de la relecture des instantanés"""
+
+    def test_publish_then_read_each_encoding(self, snapshot_store):
+        """Chaque encodage est précompressé et porte son propre ETag"""
+        body = b'{"votes": [], "stats": {"total": 0}}' * 10
+        etag = asyncio.run(snapshots.publish("p1", body, source_etag='"t1"'))
+
+        gzipped, encoding, gzip_etag = asyncio.run(snapshots.read("p1", "gzip"))
+        assert (gzip.decompress(gzipped), encoding, gzip_etag) == (body, "gzip", etag[:-1] + '-gzip"')
+        assert asyncio.run(snapshots.read("p1", None)) == (body, "identity", etag)
+        assert snapshots.source_etag("p1") == '"t1"'
+        assert snapshots.snapshot_polls() == ["p1"]
+        assert asyncio.run(snapshots.read("p2", "gzip")) is None
+
+    def test_expired_snapshot_is_not_served(self, snapshot_store, monkeypatch):
+        """Un instantané plus vieux que l'âge maximum n'est plus servi ; il est recalculé avant d'expirer"""
+        asyncio.run(snapshots.publish("p1", b'{}', source_etag='"t1"'))
+        assert not snapshots.needs_refresh("p1", '"t1"')
+        assert snapshots.needs_refresh("p1", '"t2"')
+
+        now = snapshots.time.time()
+        monkeypatch.setattr(snapshots.time, 'time', lambda: now + snapshots.VOTES_SNAPSHOT_MAX_AGE - 1)
+        assert asyncio.run(snapshots.read("p1", None)) is not None
+        assert snapshots.needs_refresh("p1", '"t1"')
+
+        monkeypatch.setattr(snapshots.time, 'time', lambda: now + snapshots.VOTES_SNAPSHOT_MAX_AGE + 1)
+        assert asyncio.run(snapshots.read("p1", None)) is None
+
+    def test_snapshot_without_date_is_not_served(self, snapshot_store):
+        """Un instantané écrit sans date de calcul (version précédente) est ignoré"""
+        snapshot_store.put(snapshots.blob_name("p1"), b'{}', metadata={"etag": '"e"', "source_etag": '"t1"'})
+
+        assert asyncio.run(snapshots.read("p1", None)) is None
+
+    def test_publisher_debounces_writes(self, snapshot_store):
+        """Des votes rapprochés ne donnent qu'un calcul ; un vote pendant le calcul en déclenche un autre"""
+        publisher = snapshots.SnapshotPublisher(debounce=0.01)
+        renders = []
+
+        async def render():
+            renders.append(len(renders))
+            if len(renders) == 1:
+                # Vote reçu pendant le premier calcul
+                publisher.schedule("p1", render)
+            await asyncio.sleep(0)
+            return f'{{"render": {len(renders)}}}'.encode('utf-8'), None
+
+        async def scenario():
+            for _ in range(5):
+                publisher.schedule("p1", render)
+            await publisher.wait()
+
+        asyncio.run(scenario())
+
+        assert renders == [0, 1]
+        assert asyncio.run(snapshots.read("p1", None))[0] == b'{"render": 2}'
+
+    def test_publisher_logs_errors_and_recovers(self, snapshot_store, caplog):
+        """Une erreur de calcul en tâche de fond est journalisée, et le vote suivant republie l'instantané"""
+        publisher = snapshots.SnapshotPublisher(debounce=0)
+        renders = []
+
+        async def render():
+            renders.append(len(renders))
+            if len(renders) == 1:
+                publisher.schedule("p1", render)
+                raise RuntimeError("Cosmos unavailable")
+            return b'{"render": 2}', None
+
+        async def scenario():
+            publisher.schedule("p1", render)
+            await publisher.wait()
+
+        asyncio.run(scenario())
+
+        assert "Cosmos unavailable" in caplog.text
+        assert asyncio.run(snapshots.read("p1", None))[0] == b'{"render": 2}'
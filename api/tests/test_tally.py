@@ -0,0 +1,215 @@
+"""
+Tests unitaires du compteur de votes matérialisé
+"""
+
+import asyncio
+
+import pytest
+
+from shared_code import tally
+from tests.fake_cosmos import FakeContainer
+
+
+class RecordingContainer(FakeContainer):
+    """Container des compteurs qui enregistre les mises à jour partielles et laisse les créations se croiser"""
+
+    def __init__(self):
+        super().__init__('tallies', '/id')
+        self.patches = []
+
+    async def patch_item(self, item, partition_key, patch_operations, **kwargs):
+        self.patches.append(patch_operations)
+        return await super().patch_item(item, partition_key, patch_operations, **kwargs)
+
+    async def create_item(self, body, **kwargs):
+        # Créations concurrentes de plusieurs workers : toutes voient le compteur absent
+        await asyncio.sleep(0)
+        return await super().create_item(body, **kwargs)
+
+
+@pytest.mark.unit
+class TestTally:
+    """Tests des compteurs et de la réconciliation"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(tally, 'RECONCILE_CONFIRM_DELAY', 0)
+        self.tallies = FakeContainer('tallies', '/id')
+        self.votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+
+    def _add_vote(self, user_id, choice, poll_id="bayrou"):
+        self.votes.seed({"id": user_id, "poll_id": poll_id, "user_id": user_id, "choice": choice})
+
+    def test_record_vote_creates_then_increments(self):
+        """Le compteur est créé au premier vote puis incrémenté"""
+        asyncio.run(tally.record_vote(self.tallies, 'oui'))
+        asyncio.run(tally.record_vote(self.tallies, 'oui'))
+        asyncio.run(tally.record_vote(self.tallies, 'non'))
+
+        doc = self.tallies.get('bayrou', partition_key='bayrou')
+        assert (doc['oui'], doc['non'], doc['total']) == (2, 1, 3)
+
+    def test_votes_are_atomic_increments(self):
+        """Un vote est une seule mise à jour partielle `incr`, sans lecture ni remplacement"""
+        container = RecordingContainer()
+        asyncio.run(tally.record_vote(container, 'oui'))
+        calls = container.calls
+
+        asyncio.run(tally.record_votes(container, {"oui": 2, "non": 1}))
+
+        assert container.calls - calls == 1
+        increments = {op["path"]: op["value"] for op in container.patches[-1] if op["op"] == "incr"}
+        assert increments == {"/oui": 2, "/non": 1, "/total": 3}
+        doc = container.get('bayrou', partition_key='bayrou')
+        assert (doc['oui'], doc['non'], doc['total']) == (3, 1, 4)
+
+    def test_concurrent_first_votes_are_all_counted(self):
+        """Des votes simultanés sur un compteur absent le créent une fois et sont tous comptés"""
+        container = RecordingContainer()
+
+        async def scenario():
+            await asyncio.gather(*(tally.record_vote(container, 'non') for _ in range(20)))
+
+        asyncio.run(scenario())
+
+        doc = container.get('bayrou', partition_key='bayrou')
+        assert (doc['non'], doc['total']) == (20, 20)
+
+    def test_many_choices_are_split_in_several_patches(self):
+        """Au-delà de PATCH_MAX_OPERATIONS opérations, l'incrément passe en plusieurs mises à jour partielles"""
+        container = RecordingContainer()
+        counts = {f"c{i}": 1 for i in range(10)}
+        asyncio.run(tally.record_votes(container, {"c0": 1}))
+
+        asyncio.run(tally.record_votes(container, counts))
+
+        assert [len(operations) for operations in container.patches[-2:]] == [10, 2]
+        assert container.get('bayrou', partition_key='bayrou')['total'] == 11
+
+    def test_compute_stats(self):
+        """Les pourcentages sont calculés à partir du compteur"""
+        stats = tally.compute_stats({"oui": 2, "non": 1, "total": 3})
+        assert stats == {"oui": 2, "non": 1, "total": 3, "oui_percentage": 66.7, "non_percentage": 33.3}
+
+        assert tally.compute_stats({})["oui_percentage"] == 0
+
+    def test_reconcile_detects_and_fixes_drift(self):
+        """La réconciliation détecte puis corrige un compteur faux"""
+        for i in range(3):
+            self._add_vote(f"u{i}", 'oui')
+        self._add_vote("u3", 'non')
+        asyncio.run(tally.record_vote(self.tallies, 'oui'))
+
+        result = asyncio.run(tally.reconcile(self.votes, self.tallies))
+        assert result["drift"] == {"oui": 2, "non": 1, "total": 3}
+        assert not result["fixed"]
+
+        result = asyncio.run(tally.reconcile(self.votes, self.tallies, fix=True))
+        assert result["fixed"]
+        assert asyncio.run(tally.reconcile(self.votes, self.tallies))["drift"] == {}
+
+    def test_missing_tally_is_seeded(self):
+        """Un compteur absent est initialisé par un recomptage"""
+        self._add_vote("u1", 'non')
+
+        doc = asyncio.run(tally.read_tally(self.tallies, self.votes))
+        assert (doc['oui'], doc['non'], doc['total']) == (0, 1, 1)
+
+    def test_seeding_never_waits_for_a_confirmation(self, monkeypatch):
+        """Un compteur créé par un vote pendant l'initialisation est lu tel quel, sans attente ni correction"""
+        monkeypatch.setattr(tally, 'RECONCILE_CONFIRM_DELAY', 60)
+        self._add_vote("u1", 'oui')
+        query_items = self.votes.query_items
+
+        def query_during_vote(*args, **kwargs):
+            if not self.tallies.items:
+                self._add_vote("u2", 'non')
+                asyncio.get_running_loop().create_task(tally.record_vote(self.tallies, 'non'))
+            return query_items(*args, **kwargs)
+
+        self.votes.query_items = query_during_vote
+
+        async def scenario():
+            return await asyncio.wait_for(tally.read_tally(self.tallies, self.votes), timeout=1)
+
+        doc = asyncio.run(scenario())
+
+        assert doc['total'] >= 1
+
+    def test_concurrent_seeding_counts_once(self):
+        """Des lectures simultanées d'un compteur absent ne le recomptent qu'une fois"""
+        self._add_vote("u1", 'oui')
+        creates = []
+        create_item = self.tallies.create_item
+
+        async def counting_create(body, **kwargs):
+            creates.append(body)
+            return await create_item(body, **kwargs)
+
+        self.tallies.create_item = counting_create
+
+        async def scenario():
+            return await asyncio.gather(*(tally.read_tally(self.tallies, self.votes) for _ in range(10)))
+
+        docs = asyncio.run(scenario())
+
+        assert len(creates) == 1
+        assert {doc['total'] for doc in docs} == {1}
+
+    def test_reconcile_counts_only_its_poll(self):
+        """Chaque sondage a son compteur, recompté sur ses seuls votes et avec ses propres choix"""
+        self._add_vote("u1", 'oui')
+        self._add_vote("u1", 'rouge', poll_id="couleurs")
+        self._add_vote("u2", 'bleu', poll_id="couleurs")
+
+        result = asyncio.run(tally.reconcile(
+            self.votes, self.tallies, tally_id="couleurs", choices=('rouge', 'bleu', 'vert'), fix=True
+        ))
+
+        assert result["expected"] == {"rouge": 1, "bleu": 1, "vert": 0, "total": 2}
+        assert tally.compute_stats(result["tally"], ('rouge', 'bleu', 'vert'))["vert_percentage"] == 0
+        assert asyncio.run(tally.reconcile(self.votes, self.tallies))["expected"]["total"] == 1
+
+    def test_vote_recorded_during_the_count_is_kept(self):
+        """Un vote compté par le compteur pendant le recomptage n'est pas écrasé"""
+        self._add_vote("u1", 'oui')
+        asyncio.run(tally.record_vote(self.tallies, 'oui'))
+        query_items = self.votes.query_items
+        arrivals = []
+
+        def query_during_vote(*args, **kwargs):
+            # Vote écrit et compté juste après le recomptage
+            if not arrivals:
+                arrivals.append(True)
+                self._add_vote("u2", 'non')
+                asyncio.get_running_loop().create_task(tally.record_vote(self.tallies, 'non'))
+            return query_items(*args, **kwargs)
+
+        self.votes.query_items = query_during_vote
+        result = asyncio.run(tally.reconcile(self.votes, self.tallies, fix=True))
+        self.votes.query_items = query_items
+
+        assert not result["fixed"]
+        doc = self.tallies.get("bayrou", partition_key="bayrou")
+        assert (doc['oui'], doc['non'], doc['total']) == (1, 1, 2)
+
+    def test_drift_is_corrected_as_an_increment(self):
+        """La correction s'ajoute au compteur au lieu de le remplacer"""
+        self._add_vote("u1", 'oui')
+        self._add_vote("u2", 'non')
+        asyncio.run(tally.record_vote(self.tallies, 'oui'))
+        patch_item = self.tallies.patch_item
+        operations = []
+
+        async def recording_patch(*args, **kwargs):
+            operations.append(kwargs['patch_operations'])
+            return await patch_item(*args, **kwargs)
+
+        self.tallies.patch_item = recording_patch
+        result = asyncio.run(tally.reconcile(self.votes, self.tallies, fix=True))
+
+        assert result["fixed"] and result["drift"] == {"non": 1, "total": 1}
+        assert [op for op in operations[-1] if op["op"] == "incr"] == [
+            {"op": "incr", "path": "/non", "value": 1}, {"op": "incr", "path": "/total", "value": 1}
+        ]
+        assert (result["tally"]['oui'], result["tally"]['non'], result["tally"]['total']) == (1, 1, 2)
@@ -0,0 +1,67 @@
+"""
+Tests unitaires de l'instrumentation des requêtes
+"""
+
+import asyncio
+
+import azure.functions as func
+import pytest
+
+from shared_code import telemetry
+from tests.fake_cosmos import FakeContainer
+
+
+class ChargingContainer(FakeContainer):
+    """Container renvoyant une charge et des tentatives comme azure-cosmos"""
+
+    def _respond(self, kwargs, result):
+        kwargs['response_hook']({"x-ms-request-charge": "2.5", "x-ms-throttle-retry-count": "1"}, result)
+        return result
+
+    async def read_item(self, item, partition_key, **kwargs):
+        return self._respond(kwargs, await super().read_item(item, partition_key))
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None, **kwargs):
+        paged = super().query_items(query, parameters, partition_key, max_item_count)
+        kwargs['response_hook']({"x-ms-request-charge": "3"}, None)
+        return paged
+
+
+@pytest.mark.unit
+class TestTelemetry:
+    """Tests du relevé par requête et de l'en-tête Server-Timing"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.raw = ChargingContainer('users', '/id')
+        self.raw.seed({"id": "u1"}, {"id": "u2"})
+        self.container = telemetry.InstrumentedContainer(self.raw)
+
+    def _handler(self):
+        container = self.container
+
+        @telemetry.traced
+        async def handler(req):
+            with telemetry.phase('lookup'):
+                await container.read_item(item="u1", partition_key="u1")
+            rows = [row async for row in container.query_items(query="SELECT * FROM c")]
+            return func.HttpResponse(str(len(rows)), status_code=200)
+
+        return handler
+
+    def test_server_timing_reports_cosmos_calls(self):
+        """Chaque aller-retour Cosmos est compté avec sa charge et ses tentatives"""
+        request = func.HttpRequest(method='GET', url='http://localhost/api/x', body=b'')
+        response = asyncio.run(self._handler()(request))
+
+        timing = response.headers["Server-Timing"]
+        assert timing.startswith("total;dur=")
+        assert 'desc="2 calls, 5.50 RU, 1 retries"' in timing
+        assert "lookup;dur=" in timing
+        assert response.get_body() == b"2"
+
+    def test_calls_outside_requests_are_not_recorded(self):
+        """Hors d'un handler instrumenté, les appels passent sans relevé"""
+        assert asyncio.run(self.container.read_item(item="u2", partition_key="u2"))["id"] == "u2"
+        assert self.container.seed is not None
+        assert telemetry.current.get() is None
@@ -0,0 +1,101 @@
+"""
+Tests unitaires de la jointure votes → utilisateurs en lot
+"""
+
+import asyncio
+
+import pytest
+
+from shared_code import user_join
+from tests.fake_cosmos import FakeContainer
+
+
+class CountingContainer(FakeContainer):
+    """Container en mémoire qui compte les requêtes et lectures ponctuelles"""
+
+    def __init__(self):
+        super().__init__('users', '/id')
+        self.queries = 0
+        self.point_reads = 0
+
+    def query_items(self, *args, **kwargs):
+        self.queries += 1
+        return super().query_items(*args, **kwargs)
+
+    async def read_item(self, *args, **kwargs):
+        self.point_reads += 1
+        return await super().read_item(*args, **kwargs)
+
+
+@pytest.mark.unit
+class TestUserJoin:
+    """Tests de la résolution groupée des pseudos"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.users = CountingContainer()
+        for i in range(250):
+            self.users.seed({"id": f"user-{i}", "pseudo": f"pseudo-{i}"})
+
+    def test_repeated_ids_are_deduplicated(self):
+        """Les identifiants répétés ne sont résolus qu'une fois"""
+        assert user_join.unique_ids(["a", "b", "a", None, "b", "c"]) == ["a", "b", "c"]
+
+    def test_pseudos_are_resolved_in_chunks(self):
+        """250 utilisateurs distincts coûtent 3 requêtes et aucune lecture ponctuelle"""
+        user_ids = [f"user-{i % 250}" for i in range(1000)]
+        pseudos = asyncio.run(user_join.fetch_pseudos(self.users, user_ids, chunk_size=100))
+
+        assert len(pseudos) == 250
+        assert pseudos["user-42"] == "pseudo-42"
+        assert self.users.queries == 3
+        assert self.users.point_reads == 0
+
+    def test_deleted_user_fallback(self):
+        """Un utilisateur supprimé garde le libellé de repli"""
+        pseudos = asyncio.run(user_join.fetch_pseudos(self.users, ["user-1", "ghost"]))
+
+        assert user_join.pseudo_for(pseudos, "user-1") == "pseudo-1"
+        assert user_join.pseudo_for(pseudos, "ghost") == "Utilisateur supprimé"
+
+    def test_no_votes_means_no_query(self):
+        """Aucune requête n'est émise sans votes"""
+        assert asyncio.run(user_join.fetch_pseudos(self.users, [])) == {}
+        assert self.users.queries == 0
+
+
+class SlowContainer(FakeContainer):
+    """Container dont les requêtes rendent la main, pour observer la concurrence"""
+
+    def __init__(self):
+        super().__init__('users', '/id')
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def query_items(self, *args, **kwargs):
+        results = super().query_items(*args, **kwargs)
+        container = self
+
+        async def rows():
+            container.in_flight += 1
+            container.max_in_flight = max(container.max_in_flight, container.in_flight)
+            await asyncio.sleep(0.01)
+            container.in_flight -= 1
+            async for row in results:
+                yield row
+
+        return rows()
+
+
+@pytest.mark.unit
+def test_fan_out_is_bounded():
+    """Les paquets sont résolus simultanément dans la limite fixée"""
+    users = SlowContainer()
+    users.seed(*({"id": f"user-{i}", "pseudo": f"pseudo-{i}"} for i in range(100)))
+
+    pseudos = asyncio.run(user_join.fetch_pseudos(
+        users, [f"user-{i}" for i in range(100)], chunk_size=10, max_concurrency=3
+    ))
+
+    assert len(pseudos) == 100
+    assert users.max_in_flight == 3
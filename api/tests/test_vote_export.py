@@ -0,0 +1,109 @@
+"""
+Tests unitaires du recomptage et de l'export en colonnes des votes
+"""
+
+import asyncio
+
+import pytest
+
+from shared_code import vote_export
+from tests.fake_cosmos import FakeContainer
+
+CHOICES = ["oui", "non"]
+
+
+def vote(user_id, choice, created_at, poll_id="p1"):
+    return {"id": user_id, "poll_id": poll_id, "user_id": user_id, "pseudo": user_id, "choice": choice,
+            "created_at": created_at}
+
+
+@pytest.mark.unit
+class TestVoteExport:
+    """Tests du recomptage page par page, par choix et par jour"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch, request):
+        engine = getattr(request, 'param', 'python')
+        if engine == 'numpy' and vote_export.numpy is None:
+            pytest.skip("numpy n'est pas installé")
+        monkeypatch.setattr(vote_export, 'EXPORT_ENGINE', engine)
+        self.votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        self.votes.seed(
+            vote("u1", "oui", "2025-01-01T10:00:00.123456"),
+            vote("u2", "non", "2025-01-01T23:59:59"),
+            vote("u3", "oui", "2025-01-02T00:00:00"),
+            vote("u4", "oui", "2025-01-03T08:30:00"),
+            vote("u5", "non", "2025-01-03T09:00:00"),
+            vote("u6", "oui", "2025-01-01T10:00:00", poll_id="p2"),
+        )
+
+    def _export(self, **kwargs):
+        return asyncio.run(vote_export.export_votes(self.votes, "p1", CHOICES, **kwargs))
+
+    @pytest.mark.parametrize("setup", ["python", "numpy"], indirect=True)
+    def test_recount_by_choice_and_day(self, setup):
+        """Les votes du sondage sont recomptés par choix et par jour, page par page"""
+        result = self._export(page_size=2)
+
+        assert result["pages"] == 3
+        assert result["stats"] == {"oui": 3, "non": 2, "total": 5, "oui_percentage": 60.0, "non_percentage": 40.0}
+        assert result["days"] == {
+            "2025-01-01": {"oui": 1, "non": 1, "total": 2},
+            "2025-01-02": {"oui": 1, "non": 0, "total": 1},
+            "2025-01-03": {"oui": 1, "non": 1, "total": 2},
+        }
+
+    @pytest.mark.parametrize("setup", ["python", "numpy"], indirect=True)
+    def test_votes_without_a_valid_date(self, setup):
+        """Un vote sans date valide est compté dans son choix, sans jour"""
+        self.votes.seed(vote("u7", "oui", None), vote("u8", "non", "hier"), vote("u9", "oui", 20250101))
+
+        result = self._export(page_size=3)
+
+        assert result["stats"]["total"] == 8
+        assert result["undated"] == {"oui": 2, "non": 1}
+        assert sum(day["total"] for day in result["days"].values()) == 5
+
+    def test_engines_agree_on_a_page(self, monkeypatch):
+        """NumPy et Python donnent le même décompte d'une page, dates invalides comprises"""
+        if vote_export.numpy is None:
+            pytest.skip("numpy n'est pas installé")
+        choices = ["oui" if i % 3 else "non" for i in range(1000)]
+        created_at = [f"2025-01-{1 + i % 28:02d}T{i % 24:02d}:00:00" for i in range(1000)]
+        created_at[::97] = [None, "", "None", "2025-1-01", "2025/01/01", "é" * 12, 42, "2025-01-0x", "20250101", "x",
+                            "2025-01-01"]
+
+        expected = vote_export.count_page(choices, created_at)
+        monkeypatch.setattr(vote_export, 'EXPORT_ENGINE', 'numpy')
+        assert vote_export.count_page(choices, created_at) == expected
+
+    def test_file_format_follows_extension(self):
+        """Le format du fichier suit son extension ; une extension inconnue est refusée"""
+        assert vote_export.file_format("export/votes.parquet") == "parquet"
+        assert vote_export.file_format("votes.ARROW") == "arrow"
+        with pytest.raises(ValueError):
+            vote_export.file_format("votes.csv")
+
+    def test_export_without_pyarrow(self, monkeypatch):
+        """Sans pyarrow, le recomptage fonctionne mais l'écriture d'un fichier est refusée"""
+        monkeypatch.setattr(vote_export, 'pyarrow', None)
+
+        assert self._export()["stats"]["total"] == 5
+        with pytest.raises(RuntimeError):
+            self._export(path="votes.parquet")
+
+    @pytest.mark.parametrize("name", ["votes.parquet", "votes.arrow"])
+    def test_columnar_file(self, tmp_path, name):
+        """Le fichier contient une ligne par vote du sondage, dans les colonnes exportées"""
+        if vote_export.pyarrow is None:
+            pytest.skip("pyarrow n'est pas installé")
+        path = str(tmp_path / name)
+
+        result = self._export(path=path, page_size=2)
+
+        if result["format"] == "parquet":
+            table = vote_export.pyarrow.parquet.read_table(path)
+        else:
+            table = vote_export.pyarrow.ipc.open_file(path).read_all()
+        assert table.column_names == list(vote_export.COLUMNS)
+        assert sorted(table.column("user_id").to_pylist()) == ["u1", "u2", "u3", "u4", "u5"]
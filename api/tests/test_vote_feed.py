@@ -0,0 +1,78 @@
+"""
+Tests unitaires du flux des nouveaux votes
+"""
+
+import asyncio
+
+import pytest
+
+from shared_code import polls, tally
+from shared_code.vote_feed import VoteFeed
+from tests.fake_cosmos import FakeContainer
+
+
+class CountingContainer(FakeContainer):
+    """Container comptant les requêtes exécutées"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.queries = 0
+
+    def query_items(self, *args, **kwargs):
+        self.queries += 1
+        return super().query_items(*args, **kwargs)
+
+
+@pytest.mark.unit
+class TestVoteFeed:
+    """Tests du tampon partagé par les long-polls"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.votes = CountingContainer('poll_votes', ['/poll_id', '/user_id'])
+        self.users = FakeContainer('users', '/id')
+        self.tallies = FakeContainer('tallies', '/id')
+        self.users.seed({"id": "u1", "pseudo": "alice"})
+        for i in range(3):
+            self._vote(f"u{i}", f"2025-01-01T10:00:0{i}")
+
+    def _vote(self, user_id, created_at):
+        self.votes.seed({"id": user_id, "poll_id": "bayrou", "user_id": user_id, "choice": "oui", "created_at": created_at})
+        self.tallies.seed({"id": tally.DEFAULT_TALLY_ID, "oui": len(self.votes.items), "non": 0,
+                           "total": len(self.votes.items)})
+
+    def _refresh(self, feed):
+        asyncio.run(feed.refresh(self.votes, self.users, self.tallies))
+
+    def test_changes_since_cursor(self):
+        """Les votes postérieurs au curseur sont servis depuis le tampon, joints aux pseudos"""
+        feed = VoteFeed(polls.default_poll(), poll_interval=0)
+        self._refresh(feed)
+
+        assert feed.cursor == "2025-01-01T10:00:02"
+        assert [vote["id"] for vote in feed.changes_since("2025-01-01T10:00:00")] == ["u1", "u2"]
+        assert feed.changes_since("2025-01-01T10:00:00")[0]["user"]["pseudo"] == "alice"
+        assert feed.changes_since(feed.cursor) == []
+
+    def test_votes_are_queried_only_when_total_changes(self):
+        """Sans nouveau vote, un rafraîchissement se limite à la lecture du compteur"""
+        feed = VoteFeed(polls.default_poll(), poll_interval=0)
+        self._refresh(feed)
+        queries = self.votes.queries
+
+        self._refresh(feed)
+        assert self.votes.queries == queries
+
+        self._vote("u3", "2025-01-01T10:00:03")
+        self._refresh(feed)
+        assert self.votes.queries == queries + 1
+        assert [vote["id"] for vote in feed.changes_since("2025-01-01T10:00:02")] == ["u3"]
+
+    def test_lagging_cursor_is_not_served_from_buffer(self):
+        """Un curseur plus ancien que le tampon tronqué doit être servi par Cosmos"""
+        feed = VoteFeed(polls.default_poll(), poll_interval=0, buffer_size=2)
+        self._refresh(feed)
+
+        assert [vote["id"] for vote in feed.votes] == ["u1", "u2"]
+        assert feed.changes_since("2025-01-01T09:00:00") is None
+        assert [vote["id"] for vote in feed.changes_since("2025-01-01T10:00:01")] == ["u2"]
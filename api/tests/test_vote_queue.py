@@ -0,0 +1,310 @@
+"""
+Tests unitaires de la file d'écriture différée des votes
+"""
+
+import asyncio
+import datetime
+import time
+import types
+import uuid
+
+import pytest
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.cosmos import exceptions
+
+from shared_code import vote_queue
+from shared_code.vote_queue import LocalQueue, StorageQueue, vote_message
+from tests.fake_cosmos import FakeContainer
+
+
+class FakeQueueClient:
+    """Faux `QueueClient` Azure Storage en mémoire : visibilité, remises et reçus"""
+
+    def __init__(self):
+        self.created = False
+        self.messages = {}
+        self.visibility_timeouts = []
+
+    def create_queue(self):
+        if self.created:
+            raise ResourceExistsError("The specified queue already exists.")
+        self.created = True
+
+    def send_message(self, content):
+        message_id = uuid.uuid4().hex
+        self.messages[message_id] = {"content": content, "dequeue_count": 0, "pop_receipt": None, "visible_at": 0}
+        return types.SimpleNamespace(id=message_id)
+
+    def receive_messages(self, messages_per_page=None, visibility_timeout=None, max_messages=None):
+        self.visibility_timeouts.append(visibility_timeout)
+        now = time.time()
+        received = []
+        for message_id, message in list(self.messages.items()):
+            if len(received) == max_messages or message["visible_at"] > now:
+                continue
+            message.update(dequeue_count=message["dequeue_count"] + 1, pop_receipt=uuid.uuid4().hex,
+                           visible_at=now + visibility_timeout)
+            received.append(types.SimpleNamespace(id=message_id, **{k: message[k] for k in ("content", "dequeue_count", "pop_receipt")}))
+        return received
+
+    def delete_message(self, message_id, pop_receipt):
+        message = self.messages.get(message_id)
+        if message is None:
+            raise ResourceNotFoundError("The specified message does not exist.")
+        if message["pop_receipt"] != pop_receipt:
+            error = HttpResponseError("The specified pop receipt did not match the pop receipt for a dequeued message.")
+            error.error_code = "PopReceiptMismatch"
+            raise error
+        del self.messages[message_id]
+
+    def get_queue_properties(self):
+        return types.SimpleNamespace(approximate_message_count=len(self.messages))
+
+
+class FakeStorageAccount:
+    """Compte de stockage en mémoire : un faux client par file"""
+
+    def __init__(self):
+        self.queues = {}
+
+    def client(self, connection, name):
+        return self.queues.setdefault(name, FakeQueueClient())
+
+
+class ThrottledContainer(FakeContainer):
+    """Container dont les premières créations sont limitées (429)"""
+
+    def __init__(self, throttles):
+        super().__init__('poll_votes', ['/poll_id', '/user_id'])
+        self.throttles = throttles
+
+    async def create_item(self, body, **kwargs):
+        if self.throttles:
+            self.throttles -= 1
+            raise exceptions.CosmosHttpResponseError(status_code=429, message="Request rate is large")
+        return await super().create_item(body, **kwargs)
+
+
+class CountingTallies(FakeContainer):
+    """Container des compteurs qui compte les mises à jour"""
+
+    def __init__(self):
+        super().__init__('tallies', '/id')
+        self.writes = 0
+
+    async def create_item(self, body, **kwargs):
+        self.writes += 1
+        return await super().create_item(body, **kwargs)
+
+    async def patch_item(self, *args, **kwargs):
+        doc = await super().patch_item(*args, **kwargs)
+        self.writes += 1
+        return doc
+
+
+@pytest.mark.unit
+class TestLocalQueue:
+    """Tests de la file SQLite"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        self.queue = LocalQueue(str(tmp_path / 'queue.sqlite3'))
+
+    def test_received_messages_are_hidden_until_deleted(self):
+        """Un message reçu est masqué, puis supprimé avec son reçu"""
+        self.queue.put({"n": 1})
+        self.queue.put({"n": 2})
+
+        messages = self.queue.receive(max_messages=10)
+        assert [message.content for message in messages] == [{"n": 1}, {"n": 2}]
+        assert self.queue.receive() == []
+
+        for message in messages:
+            self.queue.delete(message)
+        assert self.queue.count() == 0
+
+    def test_expired_visibility_redelivers(self):
+        """Un message non supprimé redevient visible et son ancien reçu ne vaut plus"""
+        self.queue.put({"n": 1})
+        first, = self.queue.receive(visibility_timeout=0)
+        second, = self.queue.receive(visibility_timeout=0)
+
+        assert second.dequeue_count == 2
+        self.queue.delete(first)
+        assert self.queue.count() == 1
+
+    def test_dead_letter(self):
+        """Un message abandonné passe dans la file poison"""
+        self.queue.put({"n": 1})
+        message, = self.queue.receive()
+
+        assert self.queue.dead_letter(message)
+        assert (self.queue.count(), self.queue.poison.count()) == (0, 1)
+
+
+@pytest.mark.unit
+class TestStorageQueue:
+    """Tests de la file Azure Storage derrière l'interface de `LocalQueue`"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.account = FakeStorageAccount()
+        self.queue = StorageQueue("UseDevelopmentStorage=true", "votes", client_factory=self.account.client)
+
+    def test_received_messages_are_hidden_until_deleted(self):
+        """Un message reçu est masqué, puis supprimé avec son reçu ; la file est créée au premier accès"""
+        self.queue.put({"n": 1})
+        self.queue.put({"n": 2})
+
+        messages = self.queue.receive(max_messages=10, visibility_timeout=0.2)
+        assert [message.content for message in messages] == [{"n": 1}, {"n": 2}]
+        assert self.queue.receive() == []
+        assert self.account.queues["votes"].visibility_timeouts[0] == 1
+
+        for message in messages:
+            self.queue.delete(message)
+        assert self.queue.count() == 0
+
+    def test_stale_receipt_is_ignored(self):
+        """La suppression avec un reçu périmé (message remis depuis) ou d'un message supprimé est sans effet"""
+        self.queue.put({"n": 1})
+        first, = self.queue.receive()
+        self.account.queues["votes"].messages[first.id]["pop_receipt"] = "redelivered"
+
+        self.queue.delete(first)
+        assert self.queue.count() == 1
+
+        del self.account.queues["votes"].messages[first.id]
+        self.queue.delete(first)
+
+    def test_dead_letter(self):
+        """Un message abandonné passe dans la file poison"""
+        self.queue.put({"n": 1})
+        message, = self.queue.receive()
+
+        assert self.queue.dead_letter(message)
+        assert (self.queue.count(), self.queue.poison.count()) == (0, 1)
+        assert self.queue.poison.receive()[0].content == {"n": 1}
+
+    def test_flush(self):
+        """La file Azure Storage est vidée par `flush` comme la file locale"""
+        users = FakeContainer('users', '/id')
+        votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        users.seed({"id": "u1", "pseudo": "alice"})
+        self.queue.put(vote_message("bayrou", "u1", "oui"))
+
+        result = asyncio.run(vote_queue.flush(votes, users, None, self.queue))
+
+        assert (result["created"], self.queue.count()) == (1, 0)
+
+
+@pytest.mark.unit
+class TestWriteBehindSetting:
+    """Tests de l'activation de l'écriture différée"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setenv('VOTE_WRITE_BEHIND', '1')
+        monkeypatch.setattr(vote_queue, 'VOTE_QUEUE_CONNECTION', '')
+        monkeypatch.delenv('WEBSITE_INSTANCE_ID', raising=False)
+
+    def test_requires_a_storage_queue_in_azure(self, monkeypatch):
+        """Dans Azure, sans file Azure Storage, l'écriture différée demandée reste désactivée"""
+        monkeypatch.setenv('WEBSITE_INSTANCE_ID', 'instance-1')
+        monkeypatch.setattr(vote_queue, 'VOTE_QUEUE_PATH', '/mnt/shared/votes.sqlite3')
+
+        assert vote_queue.write_behind_enabled() is False
+
+    def test_enabled_with_a_storage_queue(self, monkeypatch):
+        """Demandée avec une file Azure Storage (et son paquet), l'écriture différée est activée"""
+        monkeypatch.setenv('WEBSITE_INSTANCE_ID', 'instance-1')
+        monkeypatch.setattr(vote_queue, 'VOTE_QUEUE_CONNECTION', 'DefaultEndpointsProtocol=https;AccountName=bayrou')
+        monkeypatch.setattr(vote_queue, 'QueueClient', object())
+
+        assert vote_queue.write_behind_enabled() is True
+        assert isinstance(vote_queue.make_queue(), StorageQueue)
+        monkeypatch.setattr(vote_queue, 'QueueClient', None)
+        assert vote_queue.write_behind_enabled() is False
+        monkeypatch.setenv('VOTE_WRITE_BEHIND', '0')
+        assert vote_queue.write_behind_enabled() is False
+
+    def test_local_queue_outside_azure(self):
+        """Hors d'Azure (développement, tests), la file SQLite locale suffit"""
+        assert vote_queue.write_behind_enabled() is True
+        assert isinstance(vote_queue.make_queue(), LocalQueue)
+
+
+@pytest.mark.unit
+class TestFlush:
+    """Tests du vidage de la file vers Cosmos"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(vote_queue, 'VOTE_FLUSH_BACKOFF', 0)
+        self.queue = LocalQueue(str(tmp_path / 'queue.sqlite3'))
+        self.users = FakeContainer('users', '/id')
+        self.tallies = CountingTallies()
+        self.users.seed(*({"id": f"u{i}", "pseudo": f"user{i}"} for i in range(4)))
+
+    def _flush(self, votes, **kwargs):
+        return asyncio.run(vote_queue.flush(votes, self.users, self.tallies, self.queue, **kwargs))
+
+    def test_batch_writes_votes_and_one_tally_update_per_poll(self):
+        """Les votes du lot sont écrits et chaque compteur n'est mis à jour qu'une fois"""
+        votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        for i, choice in enumerate(("oui", "oui", "non")):
+            self.queue.put(vote_message("bayrou", f"u{i}", choice))
+        self.queue.put(vote_message("autre", "u3", "b"))
+
+        result = self._flush(votes)
+
+        assert (result["created"], result["polls"]) == (4, ["autre", "bayrou"])
+        assert self.tallies.writes == 2
+        tally = self.tallies.get("bayrou", partition_key="bayrou")
+        assert (tally["oui"], tally["non"], tally["total"]) == (2, 1, 3)
+        assert self.queue.count() == 0
+
+    def test_votes_are_dated_when_written(self):
+        """Un vote vidé en retard est daté de son écriture : il reste après le curseur des lecteurs du flux"""
+        votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        self.queue.put(vote_message("bayrou", "u1", "oui"))
+        cursor = datetime.datetime.utcnow().isoformat()
+
+        self._flush(votes)
+
+        assert votes.get("u1", partition_key=["bayrou", "u1"])["created_at"] >= cursor
+
+    def test_duplicates_and_unknown_users_are_dropped(self):
+        """Un vote en double ou d'un inconnu est retiré de la file sans être compté"""
+        votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        votes.seed({"id": "u0", "poll_id": "bayrou", "user_id": "u0", "choice": "oui"})
+        self.queue.put(vote_message("bayrou", "u0", "non"))
+        self.queue.put(vote_message("bayrou", "ghost", "non"))
+
+        result = self._flush(votes)
+
+        assert (result["created"], result["duplicates"], result["unknown_users"]) == (0, 1, 1)
+        assert self.tallies.writes == 0
+        assert self.queue.count() == 0
+
+    def test_throttled_writes_are_retried(self):
+        """Les créations limitées (429) sont rejouées"""
+        votes = ThrottledContainer(throttles=3)
+        self.queue.put(vote_message("bayrou", "u1", "oui"))
+
+        result = self._flush(votes)
+
+        assert (result["created"], result["failed"]) == (1, 0)
+        assert votes.get("u1", partition_key=["bayrou", "u1"])["choice"] == "oui"
+
+    def test_persistent_throttling_ends_in_poison_queue(self, monkeypatch):
+        """Un vote toujours limité reste en file puis part dans la file poison"""
+        monkeypatch.setattr(vote_queue, 'VOTE_QUEUE_VISIBILITY_TIMEOUT', 0)
+        votes = ThrottledContainer(throttles=1000)
+        self.queue.put(vote_message("bayrou", "u1", "oui"))
+
+        assert self._flush(votes, max_retries=1, max_dequeue=1)["failed"] == 1
+        assert self.queue.count() == 1
+        assert self._flush(votes, max_retries=1, max_dequeue=1)["poisoned"] == 1
+
+        assert (self.queue.count(), self.queue.poison.count()) == (0, 1)
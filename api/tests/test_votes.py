@@ -0,0 +1,141 @@
+"""
+Tests unitaires des migrations des votes (container par sondage, pseudos dénormalisés)
+"""
+
+import asyncio
+
+import pytest
+
+from shared_code.votes import RequestUnitBudget, backfill_pseudos, migrate_to_polls
+from tests.fake_cosmos import FakeContainer
+
+
+@pytest.mark.unit
+class TestMigrateToPolls:
+    """Tests de la recopie des votes de l'ancien container `votes`"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.legacy = FakeContainer('votes', '/user_id')
+        self.votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        question = "Est-ce que François Bayrou nous manque ?"
+        self.legacy.seed(
+            {"id": "u1", "user_id": "u1", "choice": "oui", "question": question, "created_at": "2025-01-01T09:00:00"},
+            {"id": "a", "user_id": "u2", "choice": "non", "question": question, "created_at": "2025-01-01T10:00:00"},
+            {"id": "b", "user_id": "u2", "choice": "oui", "question": question, "created_at": "2025-01-01T11:00:00"},
+            {"id": "c", "user_id": "u3", "choice": "oui", "question": question, "created_at": "2025-01-01T12:00:00"},
+        )
+
+    def test_dry_run_only_counts(self):
+        """Sans --apply, les votes sont comptés mais pas recopiés"""
+        result = asyncio.run(migrate_to_polls(self.legacy, self.votes, page_size=3))
+
+        assert (result["legacy"], result["migrated"], result["duplicates"], result["done"]) == (4, 0, 0, True)
+        assert not self.votes.items
+
+    def test_apply_keeps_first_vote(self):
+        """Les votes sont recopiés sans la question et seul le premier vote d'un utilisateur est conservé"""
+        result = asyncio.run(migrate_to_polls(self.legacy, self.votes, apply=True))
+
+        assert (result["migrated"], result["duplicates"]) == (3, 1)
+        assert self.votes.get("u2", partition_key=["bayrou", "u2"]) | {"_etag": None, "_ts": None, "_lsn": None} == {
+            "id": "u2", "poll_id": "bayrou", "user_id": "u2", "choice": "non",
+            "created_at": "2025-01-01T10:00:00", "_etag": None, "_ts": None, "_lsn": None
+        }
+        assert len(self.legacy.items) == 4
+
+        # Une seconde exécution ne recopie rien : les votes déjà présents (409) sont comptés comme doublons
+        again = asyncio.run(migrate_to_polls(self.legacy, self.votes, apply=True))
+        assert (again["migrated"], again["duplicates"]) == (0, 4)
+
+    def test_resume_from_checkpoint(self):
+        """Une exécution interrompue reprend après la dernière page, sans écraser le premier vote"""
+        checkpoints = []
+
+        class Interrupted(Exception):
+            pass
+
+        def save(state):
+            checkpoints.append(state)
+            if len(checkpoints) == 1:
+                raise Interrupted
+
+        with pytest.raises(Interrupted):
+            asyncio.run(migrate_to_polls(self.legacy, self.votes, apply=True, save=save, page_size=2))
+        assert (checkpoints[0]["legacy"], checkpoints[0]["migrated"]) == (2, 2)
+
+        result = asyncio.run(migrate_to_polls(self.legacy, self.votes, apply=True, checkpoint=checkpoints[0],
+                                              page_size=2))
+
+        assert (result["legacy"], result["migrated"], result["duplicates"], result["done"]) == (4, 3, 1, True)
+        assert self.votes.get("u2", partition_key=["bayrou", "u2"])["choice"] == "non"
+
+
+@pytest.mark.unit
+class TestBackfillPseudos:
+    """Tests de la recopie des pseudos sur les votes existants"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.users = FakeContainer('users', '/id')
+        self.votes = FakeContainer('poll_votes', ['/poll_id', '/user_id'])
+        self.users.seed(*({"id": f"u{i}", "pseudo": f"user{i}"} for i in range(5)))
+        self.votes.seed(*(
+            {"id": f"u{i}", "poll_id": "bayrou", "user_id": f"u{i}", "choice": "oui"} for i in range(6)
+        ))
+        self.votes.seed({"id": "u0", "poll_id": "autre", "user_id": "u0", "choice": "a", "pseudo": "user0"})
+
+    def _pseudos(self):
+        return {(doc["poll_id"], doc["id"]): doc.get("pseudo") for doc in self.votes.items.values()}
+
+    def test_dry_run_only_counts(self):
+        """Sans --apply, les votes sans pseudo sont comptés mais pas modifiés"""
+        result = asyncio.run(backfill_pseudos(self.votes, self.users, page_size=3))
+
+        assert (result["scanned"], result["missing"], result["patched"], result["done"]) == (7, 6, 0, True)
+        assert self._pseudos()[("bayrou", "u1")] is None
+
+    def test_apply_patches_missing_pseudos(self):
+        """Les pseudos manquants sont recopiés, avec le libellé des utilisateurs supprimés"""
+        result = asyncio.run(backfill_pseudos(self.votes, self.users, apply=True, page_size=3))
+
+        assert (result["patched"], result["deleted_users"]) == (6, 1)
+        assert self._pseudos()[("bayrou", "u1")] == "user1"
+        assert self._pseudos()[("bayrou", "u5")] == "Utilisateur supprimé"
+        assert asyncio.run(backfill_pseudos(self.votes, self.users))["missing"] == 0
+
+    def test_resume_from_checkpoint(self):
+        """Une exécution interrompue reprend après la dernière page enregistrée"""
+        checkpoints = []
+
+        class Interrupted(Exception):
+            pass
+
+        def save(state):
+            checkpoints.append(state)
+            if len(checkpoints) == 1:
+                raise Interrupted
+
+        with pytest.raises(Interrupted):
+            asyncio.run(backfill_pseudos(self.votes, self.users, apply=True, save=save, page_size=3))
+        assert checkpoints[0]["patched"] == 3
+
+        result = asyncio.run(backfill_pseudos(self.votes, self.users, apply=True, checkpoint=checkpoints[0], page_size=3))
+
+        assert (result["scanned"], result["patched"], result["done"]) == (7, 6, True)
+        assert None not in self._pseudos().values()
+
+    def test_request_unit_budget(self):
+        """Le budget attend le temps nécessaire pour rester sous le débit de RU"""
+        now, sleeps = [0.0], []
+
+        async def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        budget = RequestUnitBudget(per_second=100, clock=lambda: now[0], sleep=sleep)
+        budget.hook({"x-ms-request-charge": "150"}, None)
+        asyncio.run(budget.spend(50))
+
+        assert budget.spent == 200
+        assert sleeps == [2.0]
@@ -1,12 +1,16 @@
 import { useQuery } from '@tanstack/react-query'
 import { ThumbsDownIcon, ThumbsUpIcon } from 'lucide-react'
 import { apiQueries } from '../lib/api'
+import { useLiveVotes } from '../lib/useLiveVotes'
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card'
 import { Badge } from '@/components/ui/badge'
 
 export default function VoteResults() {
   const { data, isLoading, error } = useQuery(apiQueries.votes())
 
+  // Curseur initial : date du vote le plus récent de la première page
+  useLiveVotes(data ? (data.votes[0]?.created_at ?? '') : undefined)
+
   if (isLoading) {
     return (
       <Card className="max-w-4xl mx-auto">
@@ -1,7 +1,13 @@
 import type {
   ApiError,
+  CreatePollRequest,
+  CreatePollResponse,
   CreateUserRequest,
   CreateUserResponse,
+  GetPollsResponse,
+  GetVoteChangesParams,
+  GetVoteChangesResponse,
+  GetVotesParams,
   GetVotesResponse,
   LoginUserRequest,
   LoginUserResponse,
@@ -14,11 +20,18 @@ const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:7071/api'
 
 class ApiClient {
   private baseUrl: string
+  // Jeton signé reçu à l'inscription ou à la connexion, envoyé avec les votes
+  private token: string | null = null
 
   constructor(baseUrl: string) {
     this.baseUrl = baseUrl
   }
 
+  // Oublier le jeton de l'utilisateur courant
+  clearToken() {
+    this.token = null
+  }
+
   private async request<T>(
     endpoint: string,
     options: RequestInit = {}
@@ -28,6 +41,7 @@ class ApiClient {
     const config: RequestInit = {
       headers: {
         'Content-Type': 'application/json',
+        ...(this.token ? { Authorization: `Bearer ${this.token}` } : {}),
         ...options.headers,
       },
       ...options,
@@ -52,18 +66,22 @@ class ApiClient {
 
   // Créer un utilisateur
   async createUser(userData: CreateUserRequest): Promise<CreateUserResponse> {
-    return this.request<CreateUserResponse>('/user', {
+    const data = await this.request<CreateUserResponse>('/user', {
       method: 'POST',
       body: JSON.stringify(userData),
     })
+    this.token = data.token
+    return data
   }
 
   // Connecter un utilisateur existant
   async loginUser(loginData: LoginUserRequest): Promise<LoginUserResponse> {
-    return this.request<LoginUserResponse>('/login', {
+    const data = await this.request<LoginUserResponse>('/login', {
       method: 'POST',
       body: JSON.stringify(loginData),
     })
+    this.token = data.token
+    return data
   }
 
   // Soumettre un vote
@@ -74,10 +92,43 @@ class ApiClient {
     })
   }
 
-  // Récupérer tous les votes avec statistiques
-  async getVotes(): Promise<GetVotesResponse> {
-    return this.request<GetVotesResponse>('/votes', {
+  // Lister les sondages
+  async getPolls(): Promise<GetPollsResponse> {
+    return this.request<GetPollsResponse>('/polls', {
+      method: 'GET',
+    })
+  }
+
+  // Créer un sondage (réservé aux administrateurs : clé maître en en-tête x-functions-key)
+  async createPoll(pollData: CreatePollRequest): Promise<CreatePollResponse> {
+    return this.request<CreatePollResponse>('/polls', {
+      method: 'POST',
+      body: JSON.stringify(pollData),
+    })
+  }
+
+  // Récupérer une page de votes avec statistiques
+  async getVotes(params: GetVotesParams = {}): Promise<GetVotesResponse> {
+    const searchParams = new URLSearchParams()
+    if (params.limit) searchParams.set('limit', String(params.limit))
+    if (params.continuation) searchParams.set('continuation', params.continuation)
+    if (params.poll_id) searchParams.set('poll_id', params.poll_id)
+    const query = searchParams.toString()
+
+    return this.request<GetVotesResponse>(`/votes${query ? `?${query}` : ''}`, {
+      method: 'GET',
+    })
+  }
+
+  // Attendre les votes postérieurs au curseur (long-poll)
+  async getVoteChanges(params: GetVoteChangesParams, signal?: AbortSignal): Promise<GetVoteChangesResponse> {
+    const searchParams = new URLSearchParams({ since: params.since })
+    if (params.wait !== undefined) searchParams.set('wait', String(params.wait))
+    if (params.poll_id) searchParams.set('poll_id', params.poll_id)
+
+    return this.request<GetVoteChangesResponse>(`/votes/changes?${searchParams.toString()}`, {
       method: 'GET',
+      signal,
     })
   }
 }
@@ -90,7 +141,8 @@ export const apiQueries = {
   votes: () => ({
     queryKey: ['votes'],
     queryFn: () => apiClient.getVotes(),
-    refetchInterval: 5000, // Actualisation toutes les 5 secondes pour les résultats en temps réel
+    // Les nouveaux votes arrivent par le long-poll de useLiveVotes
+    staleTime: Infinity,
   }),
 }
 
@@ -0,0 +1,45 @@
+import { useEffect } from 'react'
+import { useQueryClient } from '@tanstack/react-query'
+import { apiClient } from './api'
+import type { GetVotesResponse } from '../types/api'
+
+// Durée maximum d'une requête de long-poll (secondes) et pause après une erreur (ms)
+const LONG_POLL_WAIT = 20
+const RETRY_DELAY = 5000
+
+// Maintient la liste des votes à jour en ne recevant que les nouveaux votes
+export function useLiveVotes(initialCursor: string | undefined) {
+  const queryClient = useQueryClient()
+
+  useEffect(() => {
+    if (initialCursor === undefined) return
+
+    const controller = new AbortController()
+    let cursor = initialCursor
+
+    const loop = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          const changes = await apiClient.getVoteChanges(
+            { since: cursor, wait: LONG_POLL_WAIT },
+            controller.signal
+          )
+          cursor = changes.cursor
+
+          queryClient.setQueryData<GetVotesResponse>(['votes'], (previous) => {
+            if (!previous) return previous
+            const known = new Set(previous.votes.map((vote) => vote.id))
+            const added = changes.votes.filter((vote) => !known.has(vote.id)).reverse()
+            return { ...previous, votes: [...added, ...previous.votes], stats: changes.stats }
+          })
+        } catch {
+          if (controller.signal.aborted) return
+          await new Promise((resolve) => setTimeout(resolve, RETRY_DELAY))
+        }
+      }
+    }
+
+    loop()
+    return () => controller.abort()
+  }, [initialCursor, queryClient])
+}
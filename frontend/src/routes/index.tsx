@@ -3,6 +3,7 @@ import { createFileRoute } from '@tanstack/react-router'
 import Header from '../components/Header'
 import VoteForm from '../components/VoteForm'
 import VoteResults from '../components/VoteResults'
+import { apiClient } from '../lib/api'
 import type { User } from '../types/api'
 import { Button } from '@/components/ui/button'
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card'
@@ -25,11 +26,13 @@ function BayrouMeterApp() {
   }
 
   const handleNewUser = () => {
+    apiClient.clearToken()
     setCurrentUser(null)
     setHasVoted(false)
   }
 
   const handleLogout = () => {
+    apiClient.clearToken()
     setCurrentUser(null)
     setHasVoted(false)
   }
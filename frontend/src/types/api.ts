@@ -15,6 +15,7 @@ export interface CreateUserRequest {
 export interface CreateUserResponse {
   status: 'success';
   user: User;
+  token: string;
 }
 
 export interface LoginUserRequest {
@@ -25,6 +26,7 @@ export interface LoginUserRequest {
 export interface LoginUserResponse {
   status: 'success';
   user: User;
+  token: string;
 }
 
 export interface Vote {
@@ -38,15 +40,40 @@ export interface Vote {
   created_at: string;
 }
 
+export interface Poll {
+  id: string;
+  question: string;
+  choices: Array<string>;
+  created_at: string;
+}
+
+export interface CreatePollRequest {
+  question: string;
+  choices?: Array<string>;
+}
+
+export interface CreatePollResponse {
+  status: 'success';
+  poll: Poll;
+}
+
+export interface GetPollsResponse {
+  polls: Array<Poll>;
+}
+
 export interface SubmitVoteRequest {
-  user_id: string;
+  // Facultatif avec un jeton (en-tête Authorization)
+  user_id?: string;
   choice: 'oui' | 'non';
+  poll_id?: string;
 }
 
 export interface SubmitVoteResponse {
-  status: 'success';
+  // 'accepted' : écriture différée, le vote sera enregistré sous quelques secondes
+  status: 'success' | 'accepted';
   vote: {
     id: string;
+    poll_id: string;
     user_id: string;
     choice: 'oui' | 'non';
     question: string;
@@ -64,7 +91,27 @@ export interface VoteStats {
 export interface GetVotesResponse {
   votes: Array<Vote>;
   stats: VoteStats;
+  poll_id: string;
   question: string;
+  continuation: string | null;
+}
+
+export interface GetVotesParams {
+  limit?: number;
+  continuation?: string;
+  poll_id?: string;
+}
+
+export interface GetVoteChangesParams {
+  since: string;
+  wait?: number;
+  poll_id?: string;
+}
+
+export interface GetVoteChangesResponse {
+  votes: Array<Vote>;
+  stats: VoteStats;
+  cursor: string;
 }
 
 export interface ApiError {